@@ -16,7 +16,8 @@ analyzer = MultiLanguageQuillAnalyzer(cache_size=200)
 def analyze():
     """
     Endpoint principal
-    Entrada: { "text": "Tu texto aquí" }
+    Entrada: { "text": "Tu texto aquí", "doc_id": opcional }
+    Con doc_id el análisis es incremental (sólo los párrafos modificados).
     Salida: JSON con corrección, HTML, errores, idioma, etc.
     """
     try:
@@ -24,12 +25,16 @@ def analyze():
         if not data or 'text' not in data:
             return jsonify({"error": "Falta el campo 'text'"}), 400
 
-        text = data['text'].strip()
-        if not text:
+        text = data['text']
+        if not text.strip():
             return jsonify({"error": "El texto está vacío"}), 400
 
         # Analizar con el modelo correcto
-        result = analyzer.analyze(text)
+        if data.get('doc_id'):
+            # Sin strip(): los offsets de las ediciones son posiciones Quill
+            result = analyzer.analyze_incremental(text, doc_id=str(data['doc_id']))
+        else:
+            result = analyzer.analyze(text.strip())
 
         return jsonify(result)
 
@@ -303,6 +303,21 @@ if os.environ.get('WERKZEUG_RUN_MAIN') == 'true' or not app.config.get('DEBUG'):
         StorageSyncWorker.start(app)
     except Exception as e:
         logger.info(f"SyncWorker not started: {e}")
+    try:
+        from services.search_index import SearchIndexWorker
+        SearchIndexWorker.start(app)
+    except Exception as e:
+        logger.info(f"SearchIndexWorker not started: {e}")
+    try:
+        from services.notification_service import NotificationFanoutWorker
+        NotificationFanoutWorker.start(app)
+    except Exception as e:
+        logger.info(f"NotificationFanoutWorker not started: {e}")
+    try:
+        from services.contributions import ContributionFlushWorker
+        ContributionFlushWorker.start(app)
+    except Exception as e:
+        logger.info(f"ContributionFlushWorker not started: {e}")
 
 if __name__ == '__main__':
     # socketio.run() reemplaza app.run() para que eventlet maneje WebSockets.
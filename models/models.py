@@ -143,6 +143,11 @@ class Folder(db.Model):
     files = db.relationship('File', backref='folder', lazy='dynamic')
     children = db.relationship('Folder', backref=db.backref('parent', remote_side=[id]))
 
+    # Keyset pagination de /api/folders: (created_at, id) por usuario
+    __table_args__ = (
+        Index('idx_folder_user_created', 'user_id', 'created_at', 'id'),
+    )
+
     shares = db.relationship('FolderShare', backref='folder', cascade='all, delete-orphan')
 
     def to_dict(self):
@@ -188,6 +193,67 @@ class File(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+class CloudFileIndex(db.Model):
+    """
+    Índice local de los documentos de un usuario en un proveedor cloud
+    (google_drive, dropbox, onedrive). Se construye una vez con el listado
+    completo y se mantiene con el feed de cambios del proveedor
+    (services/cloud_index.py); /storage/files lee de aquí, filtrado y
+    paginado en SQL. Sólo se guardan archivos que pasan is_document().
+    """
+    __tablename__ = 'cloud_file_index'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    user_id      = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    provider     = db.Column(db.String(20), nullable=False)
+    file_id      = db.Column(db.String(255), nullable=False)     # id del proveedor
+    name         = db.Column(db.String(255), nullable=False)
+    extension    = db.Column(db.String(16), nullable=True)       # 'docx', 'pdf'… (minúsculas)
+    mime_type    = db.Column(db.String(255), nullable=True)
+    size         = db.Column(db.BigInteger, default=0)
+    modified     = db.Column(db.String(40), nullable=True)       # tal como lo da el proveedor
+    modified_at  = db.Column(db.DateTime, nullable=False)        # parseado, para ordenar
+    path_lower   = db.Column(db.String(1024), nullable=True)     # Dropbox: los borrados llegan por ruta
+    path_display = db.Column(db.String(1024), nullable=True)
+    web_url      = db.Column(db.String(1024), nullable=True)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'provider', 'file_id', name='uq_cloud_file'),
+        Index('idx_cloud_file_listing', 'user_id', 'provider', 'modified_at', 'id'),
+    )
+
+    def to_dict(self) -> dict:
+        """Mismo formato que devolvía fetch_files_from_provider."""
+        data = {
+            'id':       self.file_id,
+            'name':     self.name,
+            'size':     self.size or 0,
+            'modified': self.modified,
+            'type':     self.mime_type,
+            'provider': self.provider,
+        }
+        if self.web_url:
+            data['download_url'] = self.web_url
+        if self.path_display:
+            data['path'] = self.path_display
+        return data
+
+
+class CloudIndexState(db.Model):
+    """Estado del índice por (usuario, proveedor): cursor del feed de cambios."""
+    __tablename__ = 'cloud_index_state'
+
+    user_id     = db.Column(db.Integer, db.ForeignKey('users.id', ondelete='CASCADE'), primary_key=True)
+    provider    = db.Column(db.String(20), primary_key=True)
+    cursor      = db.Column(db.Text, nullable=True)   # Drive pageToken | Dropbox cursor | Graph deltaLink
+    file_count  = db.Column(db.Integer, default=0)
+    built_at    = db.Column(db.DateTime, nullable=True)
+    synced_at   = db.Column(db.DateTime, nullable=True)
+    attempted_at = db.Column(db.DateTime, nullable=True)  # último sync fallido
+    error_count = db.Column(db.Integer, default=0, nullable=False)  # fallos seguidos (backoff)
+    last_error  = db.Column(db.String(500), nullable=True)
+
+
 # ============================================================================
 # LOGIN / LOGOUT TRACKING
 # ============================================================================
@@ -525,21 +591,49 @@ class User(db.Model, UserMixin):
         return max(0, self._get_analysis_limit() - usage.analysis_count)
 
     def increment_analysis_count(self):
-        """Increment today's counter. Returns True on success."""
+        """
+        Increment today's counter. Returns True on success. The check and the
+        increment are one conditional UPDATE, so concurrent requests cannot
+        take the counter past the limit.
+        """
         try:
             usage = self._get_today_usage()
             limit = self._get_analysis_limit()
-            if usage.analysis_count >= limit:
+            counter = UserAnalysisUsage.analysis_count
+            taken = UserAnalysisUsage.query.filter(
+                UserAnalysisUsage.id == usage.id, counter < limit,
+            ).update({counter: counter + 1}, synchronize_session=False)
+            if not taken:
+                db.session.rollback()
                 return False
-            usage.analysis_count += 1
-            if usage.analysis_count >= limit:
-                usage.limit_reached_at = datetime.utcnow()
+            UserAnalysisUsage.query.filter(
+                UserAnalysisUsage.id == usage.id, counter >= limit,
+                UserAnalysisUsage.limit_reached_at.is_(None),
+            ).update({UserAnalysisUsage.limit_reached_at: datetime.utcnow()}, synchronize_session=False)
             db.session.commit()
             return True
         except Exception:
             db.session.rollback()
             return False
 
+    def release_analysis_count(self):
+        """Give back one analysis reserved by increment_analysis_count() (failed job)."""
+        try:
+            usage = self._get_today_usage()
+            limit = self._get_analysis_limit()
+            counter = UserAnalysisUsage.analysis_count
+            released = UserAnalysisUsage.query.filter(
+                UserAnalysisUsage.id == usage.id, counter > 0,
+            ).update({counter: counter - 1}, synchronize_session=False)
+            UserAnalysisUsage.query.filter(
+                UserAnalysisUsage.id == usage.id, counter < limit,
+            ).update({UserAnalysisUsage.limit_reached_at: None}, synchronize_session=False)
+            db.session.commit()
+            return bool(released)
+        except Exception:
+            db.session.rollback()
+            return False
+
     def get_analysis_stats(self):
         """Return a stats dict consumed by analysis_tracker.js."""
         from datetime import datetime as dt
@@ -663,6 +757,10 @@ class Document(db.Model):
     minio_path = db.Column(db.String(255), nullable=True)
     storage_type = db.Column(db.String(20), default='database')
     size_bytes = db.Column(db.Integer, default=0)
+    # sha256 del delta serializado: versión base del autosave por parches
+    content_hash = db.Column(db.String(64), nullable=True)
+    # content_html / html del blob anterior a los últimos parches (autosave sin html)
+    html_stale = db.Column(db.Boolean, default=False, nullable=False)
     
     # Metadata
     document_type = db.Column(db.String(50), default='created')
@@ -689,6 +787,12 @@ class Document(db.Model):
     # Yjs CRDT collaborative state (binary, stored as BLOB)
     # Populated by services/yjs_state_service.py when ≥2 collaborators are active
     yjs_state = db.Column(db.LargeBinary, nullable=True)
+
+    # Keyset pagination: listado principal (updated_at, id) y papelera (deleted_at, id)
+    __table_args__ = (
+        Index('idx_doc_owner_updated', 'owner_id', 'updated_at', 'id'),
+        Index('idx_doc_owner_trash', 'owner_id', 'is_deleted', 'deleted_at', 'id'),
+    )
     
     # Relationships
     versions = db.relationship('DocumentVersion', backref='document', cascade='all, delete-orphan')
@@ -746,6 +850,10 @@ class DocumentVersion(db.Model):
     change_summary = db.Column(db.String(255), nullable=True)
     created_by = db.Column(db.String(100), nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_docver_doc_created', 'document_id', 'created_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -759,6 +867,67 @@ class DocumentVersion(db.Model):
         }
 
 
+class StoredImage(db.Model):
+    """
+    Imagen almacenada por contenido (content-addressed) en el bucket 'images'.
+
+    sha256: hash de los bytes ORIGINALES subidos → detecta duplicados antes
+    de optimizar/subir. filename = '{sha256}.{ext}' (inmutable).
+    Las variantes (WebP responsive + thumbnail) se derivan del hash, ver
+    services/image_store.py.
+    """
+    __tablename__ = 'stored_images'
+
+    sha256     = db.Column(db.String(64), primary_key=True)
+    file_ext   = db.Column(db.String(10), nullable=False)
+    size_bytes = db.Column(db.Integer, default=0)        # tamaño optimizado almacenado
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+    @property
+    def filename(self) -> str:
+        return f"{self.sha256}.{self.file_ext}"
+
+
+class DocumentImageRef(db.Model):
+    """
+    Referencia documento → imagen. El conteo de referencias de una imagen es
+    el número de filas; se eliminan al borrar permanentemente el documento y
+    las imágenes sin referencias las recoge ImageStore.collect_garbage().
+    """
+    __tablename__ = 'document_image_refs'
+
+    document_id  = db.Column(db.Integer, db.ForeignKey('marktrack_documents.id', ondelete='CASCADE'), primary_key=True)
+    image_sha256 = db.Column(db.String(64), db.ForeignKey('stored_images.sha256'), primary_key=True)
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_imgref_image', 'image_sha256'),
+    )
+
+
+class DocumentSearchIndex(db.Model):
+    """
+    Índice de búsqueda de texto completo (tabla sombra, FULLTEXT de MySQL).
+    Una fila por documento con el texto plano extraído del delta; la
+    mantiene services/search_index.py de forma incremental. Permisos y
+    estado (owner_id, is_deleted…) se leen de marktrack_documents al buscar.
+    """
+    __tablename__ = 'document_search_index'
+
+    document_id  = db.Column(db.Integer, db.ForeignKey('marktrack_documents.id', ondelete='CASCADE'), primary_key=True)
+    workspace_id = db.Column(db.Integer, nullable=True)      # workspace de la entrega (si la hay)
+    title        = db.Column(db.String(255), nullable=False, default='')
+    body         = db.Column(db.Text(16777215), nullable=True)   # MEDIUMTEXT
+    content_hash = db.Column(db.String(64), nullable=True)   # sha256 del texto indexado
+    indexed_at   = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ft_docsearch_title', 'title', mysql_prefix='FULLTEXT'),
+        Index('ft_docsearch_text', 'title', 'body', mysql_prefix='FULLTEXT'),
+        Index('idx_docsearch_workspace', 'workspace_id'),
+    )
+
+
 class DocumentShare(db.Model):
     """Document sharing"""
     __tablename__ = 'marktrack_document_shares'
@@ -884,6 +1053,10 @@ class DocumentActivity(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     document = db.relationship('Document', backref='activities')
+
+    __table_args__ = (
+        Index('idx_docact_doc_created', 'document_id', 'created_at', 'id'),
+    )
     
     def to_dict(self):
         return {
@@ -946,6 +1119,7 @@ class EssaySubmissionMetrics(db.Model):
     __table_args__ = (
         Index('idx_esm_invitation_id', 'invitation_id'),
         Index('idx_esm_workspace_id', 'workspace_id'),
+        Index('idx_esm_workspace_submitted', 'workspace_id', 'submitted_at', 'id'),
     )
 
     # Relaciones
@@ -1198,6 +1372,7 @@ class Notification(db.Model):
     priority   = db.Column(db.Integer, default=2)               # 1=crítica, 2=normal, 3=info
     metadata_  = db.Column('metadata', db.JSON, nullable=True)  # datos extra (document_id, etc.)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    batch_id   = db.Column(db.String(32), nullable=True, index=True)  # fan-out de create_bulk
 
     user    = db.relationship('User', backref=db.backref('notifications', lazy='dynamic'))
     student = db.relationship('StudentWorkspaceUser', backref=db.backref('notifications', lazy='dynamic'))
@@ -1206,6 +1381,7 @@ class Notification(db.Model):
         Index('idx_notif_user_read', 'user_id', 'read'),
         Index('idx_notif_student_read', 'student_id', 'read'),
         Index('idx_notif_created', 'created_at'),
+        Index('idx_notif_user_created', 'user_id', 'created_at', 'id'),
     )
 
     def to_dict(self) -> dict:
@@ -1309,6 +1485,10 @@ class DocumentComment(db.Model):
     replies  = db.relationship('DocumentComment', backref=db.backref('parent', remote_side='DocumentComment.id'), lazy='dynamic')
     document = db.relationship('Document', backref=db.backref('comments', lazy='dynamic', cascade='all, delete-orphan'))
 
+    __table_args__ = (
+        Index('idx_comment_doc_thread', 'document_id', 'parent_id', 'created_at', 'id'),
+    )
+
     def to_dict(self) -> dict:
         return {
             'id':             self.id,
@@ -1453,6 +1633,50 @@ class ContributionSnapshot(db.Model):
         }
 
 
+class ContributionRollup(db.Model):
+    """
+    Totales de contribución por (documento, usuario), mantenidos de forma
+    incremental por services/contributions.py al volcar cada lote de
+    snapshots (en la misma transacción). El resumen del panel Activity se
+    lee de aquí en una query, sin re-agregar contribution_snapshots.
+
+    words_removed se guarda en positivo.
+    """
+    __tablename__ = 'contribution_rollups'
+
+    document_id   = db.Column(db.Integer, db.ForeignKey('marktrack_documents.id', ondelete='CASCADE'), primary_key=True)
+    user_id       = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    words_added   = db.Column(db.Integer, nullable=False, default=0)
+    words_removed = db.Column(db.Integer, nullable=False, default=0)
+    snapshots     = db.Column(db.Integer, nullable=False, default=0)
+    last_active   = db.Column(db.DateTime, nullable=True)
+
+
+class ContributionArchive(db.Model):
+    """
+    Snapshots de contribución antiguos, retirados de contribution_snapshots
+    y guardados comprimidos (JSON lines, zstd o zlib según `codec`), un
+    bloque por documento y tramo de ids. Los totales ya están en
+    contribution_rollups; esto es sólo historial.
+    """
+    __tablename__ = 'contribution_archives'
+
+    id           = db.Column(db.Integer, primary_key=True)
+    document_id  = db.Column(db.Integer, db.ForeignKey('marktrack_documents.id', ondelete='CASCADE'), nullable=False)
+    first_id     = db.Column(db.Integer, nullable=False)     # ids de snapshot incluidos
+    last_id      = db.Column(db.Integer, nullable=False)
+    period_start = db.Column(db.DateTime, nullable=False)    # created_at del primero / último
+    period_end   = db.Column(db.DateTime, nullable=False)
+    row_count    = db.Column(db.Integer, nullable=False)
+    codec        = db.Column(db.String(8), nullable=False)   # 'zstd' | 'zlib'
+    payload      = db.Column(db.LargeBinary(16777215), nullable=False)   # MEDIUMBLOB
+    created_at   = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index('idx_contrib_archive_doc', 'document_id', 'first_id'),
+    )
+
+
 # ============================================================================
 # STUDENT WORKSPACE USERS — Isolated auth domain (never mixed with User)
 # ============================================================================
@@ -16,6 +16,7 @@ CREATE TABLE IF NOT EXISTS pasted_internet_content (
     clipboard_html      TEXT,
     internet_copy_score SMALLINT      NOT NULL DEFAULT 0,
     char_count          INTEGER       NOT NULL DEFAULT 0,
+    presence_coverage   SMALLINT,
     is_active           TINYINT(1)    NOT NULL DEFAULT 1,
     is_removed          TINYINT(1)    NOT NULL DEFAULT 0,
     created_at          DATETIME      NOT NULL DEFAULT CURRENT_TIMESTAMP,
@@ -60,6 +61,8 @@ class PastedInternetContent(db.Model):
     # Heuristic internet-copy score: 0–100
     internet_copy_score = db.Column(db.SmallInteger, nullable=False, default=0)
     char_count          = db.Column(db.Integer, nullable=False, default=0)
+    # % of the pasted text still found in the document at the last save (services/paste_presence.py)
+    presence_coverage   = db.Column(db.SmallInteger, nullable=True)
     # Lifecycle flags — never delete, just deactivate
     is_active           = db.Column(db.Boolean, nullable=False, default=True)
     is_removed          = db.Column(db.Boolean, nullable=False, default=False)
@@ -84,6 +87,7 @@ class PastedInternetContent(db.Model):
             'source_domain':        self.source_domain,
             'internet_copy_score':  self.internet_copy_score,
             'char_count':           self.char_count,
+            'presence_coverage':    self.presence_coverage,
             'is_active':            self.is_active,
             'is_removed':           self.is_removed,
             'created_at':           self.created_at.isoformat() if self.created_at else None,
@@ -1,7 +1,7 @@
-from flask import Blueprint, jsonify, request, render_template
+from flask import Blueprint, jsonify, request, render_template, current_app
 from flask_login import current_user, login_required
-import requests
 from models.models import AnalysisLimit, UserAnalysisUsage, StoragePlan
+from services.analysis_gateway import AnalysisGateway
 
 x_analysiscounter = Blueprint('x_analysiscounter', __name__)
 
@@ -33,34 +33,28 @@ def validate_and_analyze():
                 'error': 'No texts provided'
             }), 400
         
-        # 3. Hacer una llamada interna al endpoint de análisis
-        response = requests.post(
-            'https://xplagiax.ca/x_aitestpro/api/analyze-batch', #'http://127.0.0.1:5000/x_aitestpro/api/analyze-batch',
-            json=data,
-            headers={'Content-Type': 'application/json'},
-            timeout=300
-        )
-        
-        if response.status_code == 200:
-            result_data = response.json()
-            
-            # 4. Incrementar contador SOLO si el análisis fue exitoso
-            current_user.increment_analysis_count()
-            
-            # 5. Obtener stats actualizados
+        # 3. Reservar el análisis del cupo diario al enviarlo (no al entregarlo):
+        #    los envíos ?async=1 en paralelo no pueden superar el límite
+        if not current_user.increment_analysis_count():
             stats = current_user.get_analysis_stats()
-
-            return jsonify({
-                'success': True,
-                'result': result_data,
-                'stats': stats
-            }), 200   
-        else:
             return jsonify({
                 'success': False,
-                'error': 'Analysis service failed',
-                'details': response.text
-            }), response.status_code
+                'error': 'Daily analysis limit reached',
+                'stats': stats,
+                'limit_reached': True,
+                'reset_at': stats.get('reset_at'),
+                'limit_reached_at': stats.get('limit_reached_at')
+            }), 403
+        
+        # 4. Análisis vía AnalysisGateway (caché por contenido, peticiones idénticas coalescidas)
+        try:
+            job = AnalysisGateway.submit('batch', data, current_user.id)
+        except Exception:
+            current_user.release_analysis_count()
+            raise
+        if job['status'] == 'pending' and not request.args.get('async'):
+            job = AnalysisGateway.wait(job['job_id'], current_app.config.get('ANALYSIS_BATCH_SYNC_WAIT_SECONDS', 300))
+        return _batch_reply(job)
                 
     except Exception as e:
         return jsonify({
@@ -68,6 +62,45 @@ def validate_and_analyze():
             'error': f'Validation failed: {str(e)}'
         }), 500
 
+
+@x_analysiscounter.route('/api/analysis/jobs/<job_id>', methods=['GET'])
+@login_required
+def batch_job_status(job_id):
+    """Estado de un análisis batch lanzado por validate-and-analyze (202 mientras sigue en curso)"""
+    job = AnalysisGateway.get_job(job_id)
+    if not job or job['kind'] != 'batch' or job['user_id'] != current_user.id:
+        return jsonify({'success': False, 'error': 'Analysis job not found'}), 404
+    return _batch_reply(job)
+
+
+def _batch_reply(job):
+    if job['status'] == 'pending':
+        return jsonify({
+            'success': True,
+            'status': 'pending',
+            'job_id': job['job_id'],
+            'status_url': f"/x_analysiscounter/api/analysis/jobs/{job['job_id']}"
+        }), 202
+
+    if job['status'] == 'done':
+        # 5. Obtener stats actualizados (el análisis ya se contó al enviarlo)
+        stats = current_user.get_analysis_stats()
+
+        return jsonify({
+            'success': True,
+            'result': job['result'],
+            'stats': stats
+        }), 200   
+    else:
+        # Análisis fallido: se devuelve la reserva (una sola vez por job)
+        if AnalysisGateway.first_delivery(job['job_id']):
+            current_user.release_analysis_count()
+        return jsonify({
+            'success': False,
+            'error': 'Analysis service failed',
+            'details': job.get('details') or job['error']
+        }), job.get('http_status', 500)
+
 @x_analysiscounter.route('/api/analysis/stats', methods=['GET'])
 @login_required
 def get_analysis_stats():
@@ -24,3 +24,23 @@ def cache_metrics():
     metrics = cache.get_metrics()
     return jsonify(metrics)
 
+
+
+@cache_bp.route('/api/cache/documents', methods=['GET'])
+def document_cache_metrics():
+    """Document cache codec, hit rate and compression ratio."""
+    from services.document_cache import DocumentCache
+    try:
+        return jsonify(DocumentCache.stats())
+    except Exception:
+        return jsonify({'status': 'unavailable'})
+
+
+@cache_bp.route('/api/cache/autosave', methods=['GET'])
+def autosave_metrics():
+    """save_document fast path: written vs. skipped (unchanged) saves."""
+    from services.autosave_stats import AutosaveStats
+    try:
+        return jsonify(AutosaveStats.stats())
+    except Exception:
+        return jsonify({'status': 'unavailable'})
@@ -10,7 +10,7 @@ Endpoints:
 SocketIO:
   doc:join  → une al usuario a la sala doc_{doc_id}, emite doc:user_joined
   doc:leave → sale de la sala, emite doc:user_left
-  doc:cursor → retransmite posición de cursor al resto de la sala
+  doc:cursor → acumula posición de cursor; se emite en lote por tick (doc:cursor_batch)
 """
 from __future__ import annotations
 
@@ -476,16 +476,15 @@ def _check_and_notify_team_formed(doc_id: int):
     doc_title = document.title if document else 'the document'
     collab_ids = {c.user_id for c in collabs}
 
-    for collab in collabs:
-        NotificationService.create(
-            user_id=collab.user_id,
-            type=NotificationType.TEAM_FORMED,
-            title='The team is complete!',
-            message=f'All collaborators have accepted on "{doc_title}".',
-            url=f'/review/{_get_review_token(doc_id)}',
-            priority=2,
-            metadata={'document_id': doc_id},
-        )
+    NotificationService.create_bulk(
+        [collab.user_id for collab in collabs],
+        type=NotificationType.TEAM_FORMED,
+        title='The team is complete!',
+        message=f'All collaborators have accepted on "{doc_title}".',
+        url=f'/review/{_get_review_token(doc_id)}',
+        priority=2,
+        metadata={'document_id': doc_id},
+    )
 
     # Notificar también al invitador si no es colaborador
     invited_bys = {c.invited_by for c in collabs if c.invited_by}
@@ -554,19 +553,25 @@ def register_doc_socketio_events(sio):
     Eventos del cliente → servidor:
       doc:join            {doc_id}                 → une al usuario, emite doc:user_joined al resto
       doc:leave           {doc_id}                 → sale, emite doc:user_left al resto
-      doc:cursor          {doc_id, index, length}  → retransmite posición de cursor
+      doc:cursor          {doc_id, index, length}  → coalescido por sid (PresenceCoalescer)
       yjs:update          {doc_id, update}         → broadcast Yjs update binario (base64)
       yjs:sync_request    {doc_id}                 → devuelve state completo al solicitante
-      yjs:awareness       {doc_id, awareness}      → broadcast awareness state
+      yjs:awareness       {doc_id, awareness}      → coalescido por sid (PresenceCoalescer)
 
     Eventos servidor → sala:
       doc:user_joined     {user_id, user_name, initials, doc_id}
       doc:user_left       {user_id, doc_id}
-      doc:cursor_moved    {user_id, index, length}
+      doc:cursor_batch    {items: [{sid, user_id, index, length}]}  → un lote por tick
       yjs:update          {update}                → broadcast al resto de peers
       yjs:sync            {state, doc_id}         → estado completo para el nuevo peer
-      yjs:awareness       {awareness}             → awareness broadcast
+      yjs:awareness_batch {items: [{sid, user_id, awareness}]}      → un lote por tick
+
+    Los estados de presencia se coalescen en el servidor: solo el último
+    estado de cada sid se emite, una vez por tick y por sala, con un
+    token bucket por sid (ver services/presence_coalescer.py).
     """
+    from services.presence_coalescer import PresenceCoalescer
+    PresenceCoalescer.init(sio)
 
     @sio.on('doc:join')
     def on_doc_join(data: dict):
@@ -616,6 +621,7 @@ def register_doc_socketio_events(sio):
             return
         room = f'doc_{doc_id}'
         leave_room(room)
+        PresenceCoalescer.forget(request.sid, room=room)
         sio.emit('doc:user_left', {
             'user_id': current_user.id,
             'doc_id':  doc_id,
@@ -629,11 +635,15 @@ def register_doc_socketio_events(sio):
         doc_id = data.get('doc_id')
         if not doc_id:
             return
-        sio.emit('doc:cursor_moved', {
+        PresenceCoalescer.submit(f'doc_{doc_id}', request.sid, 'cursor', {
             'user_id': current_user.id,
             'index':   data.get('index', 0),
             'length':  data.get('length', 0),
-        }, room=f'doc_{doc_id}', skip_sid=True)
+        })
+
+    @sio.on('disconnect')
+    def on_disconnect():
+        PresenceCoalescer.forget(request.sid)
 
     # ── Yjs CRDT Sync Events ────────────────────────────────────────────────
 
@@ -688,7 +698,8 @@ def register_doc_socketio_events(sio):
     @sio.on('yjs:awareness')
     def on_yjs_awareness(data: dict):
         """
-        Broadcast awareness state (cursors, selection, user presence).
+        Awareness state (cursors, selection, user presence). Only the latest
+        state per sid is kept and flushed to the room as yjs:awareness_batch.
         """
         from flask_login import current_user
         if not current_user.is_authenticated:
@@ -697,7 +708,7 @@ def register_doc_socketio_events(sio):
         awareness = data.get('awareness')
         if not doc_id or not awareness:
             return
-        sio.emit('yjs:awareness', {
+        PresenceCoalescer.submit(f'doc_{doc_id}', request.sid, 'awareness', {
             'awareness': awareness,
             'user_id':   current_user.id,
-        }, room=f'doc_{doc_id}', skip_sid=True)
+        })
@@ -12,6 +12,9 @@ Seguridad:
   - GET: verifica que current_user es dueño del workspace O es el estudiante del documento.
   - POST: verifica que current_user es dueño del workspace (rol profesor).
   - DELETE: verifica que current_user es el autor del comentario.
+
+El GET sirve el árbol de services/comment_tree.CommentTree (una query,
+cacheado por documento); toda escritura llama a CommentTree.invalidate.
 """
 
 from __future__ import annotations
@@ -25,7 +28,9 @@ from models.models import (
     Document, DocumentComment, WorkspaceInvitation,
     NotificationType, User
 )
+from services.comment_tree import CommentTree
 from services.notification_service import NotificationService
+from services.pagination import LEGACY_LIST_LIMIT, InvalidCursor, Paginator
 from settings.extensions import db, limiter
 
 comments_bp = Blueprint('comments', __name__)
@@ -74,21 +79,19 @@ def list_comments(doc_id: int):
     if document is None:
         return jsonify({'error': 'Unauthorized'}), 403
 
-    comments = (
-        DocumentComment.query
-        .filter_by(document_id=doc_id, parent_id=None)
-        .order_by(DocumentComment.created_at.asc())
-        .all()
-    )
-
-    result = []
-    for c in comments:
-        c_dict = c.to_dict()
-        # Agregar replies
-        c_dict['replies'] = [r.to_dict() for r in c.replies.order_by(DocumentComment.created_at.asc()).all()]
-        result.append(c_dict)
+    # Árbol completo en una query (autores por JOIN), cacheado por documento
+    try:
+        comments = Paginator.paginate_list(
+            CommentTree.get(doc_id), CommentTree.sort_key,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', LEGACY_LIST_LIMIT, type=int),
+            descending=False, scope=f'comments:{doc_id}', max_per_page=LEGACY_LIST_LIMIT,
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
 
-    return jsonify({'comments': result, 'total': len(result)})
+    return jsonify({'comments': comments.items, **comments.meta()})
 
 
 # ---------------------------------------------------------------------------
@@ -149,6 +152,7 @@ def create_comment(doc_id: int):
         db.session.rollback()
         current_app.logger.error(f"[comments] Error al crear comentario doc={doc_id}: {exc}")
         return jsonify({'error': 'Internal error'}), 500
+    CommentTree.invalidate(doc_id)
 
     # ── Disparar notificación ──────────────────────────────
     if invitation:
@@ -260,6 +264,7 @@ def reply_comment(comment_id: int):
         db.session.rollback()
         current_app.logger.error(f"[comments] Error al crear reply comment={comment_id}: {exc}")
         return jsonify({'error': 'Internal error'}), 500
+    CommentTree.invalidate(parent.document_id)
 
     # Notificar al autor del comentario padre (si es diferente del que responde)
     if parent.author_id != current_user.id:
@@ -316,6 +321,7 @@ def resolve_comment(comment_id: int):
         db.session.rollback()
         current_app.logger.error(f"[comments] Error al resolver comment={comment_id}: {exc}")
         return jsonify({'error': 'Internal error'}), 500
+    CommentTree.invalidate(comment.document_id)
 
     # Notificar al autor del comentario (o al profesor)
     from flask import session as flask_session
@@ -383,6 +389,7 @@ def update_comment(comment_id: int):
         db.session.rollback()
         current_app.logger.error(f"[comments] Error al actualizar comment={comment_id}: {exc}")
         return jsonify({'error': 'Internal error'}), 500
+    CommentTree.invalidate(comment.document_id)
 
     return jsonify({'success': True, 'comment': comment.to_dict()})
 
@@ -403,6 +410,7 @@ def delete_comment(comment_id: int):
     if comment.author_id != current_user.id:
         return jsonify({'error': 'Only the author can delete this comment'}), 403
 
+    doc_id = comment.document_id
     try:
         db.session.delete(comment)
         db.session.commit()
@@ -410,5 +418,6 @@ def delete_comment(comment_id: int):
         db.session.rollback()
         current_app.logger.error(f"[comments] Error al eliminar comment={comment_id}: {exc}")
         return jsonify({'error': 'Internal error'}), 500
+    CommentTree.invalidate(doc_id)
 
     return jsonify({'success': True})
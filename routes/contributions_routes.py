@@ -4,28 +4,22 @@ Blueprint de tracking de contribuciones de escritura.
 Endpoints:
   POST /api/documents/<doc_id>/contributions          → registrar snapshot de contribución
   GET  /api/documents/<doc_id>/contributions/summary  → resumen por usuario (panel Activity)
+
+Los snapshots se encolan y se vuelcan por lotes; el resumen se lee de los
+totales mantenidos por services/contributions.py.
 """
 from __future__ import annotations
 
-from sqlalchemy import func
 from flask import Blueprint, jsonify, request, current_app
 from flask_login import current_user, login_required
 
-from models.models import (
-    Document, ContributionSnapshot, WorkspaceInvitation,
-    NotificationType, User
-)
+from models.models import Document, WorkspaceInvitation, NotificationType
+from services.contributions import ContributionStore
 from services.notification_service import NotificationService
-from settings.extensions import db, limiter
+from settings.extensions import limiter
 
 contributions_bp = Blueprint('contributions', __name__)
 
-# Colores asignados por orden de aparición (hasta 8 colaboradores)
-CONTRIBUTOR_COLORS = [
-    '#6366f1', '#22c55e', '#f59e0b', '#ef4444',
-    '#3b82f6', '#ec4899', '#14b8a6', '#f97316',
-]
-
 
 def _check_document_access(doc_id: int):
     """
@@ -80,20 +74,17 @@ def record_contribution(doc_id: int):
     position_to      = data.get('position_to')
     word_count_delta = int(data.get('word_count_delta', 0))
 
-    snapshot = ContributionSnapshot(
-        document_id=doc_id,
-        user_id=current_user.id,
-        action=action,
-        content=content,
-        position_from=position_from,
-        position_to=position_to,
-        word_count_delta=word_count_delta,
-    )
     try:
-        db.session.add(snapshot)
-        db.session.commit()
+        ContributionStore.record(
+            document_id=doc_id,
+            user_id=current_user.id,
+            action=action,
+            content=content,
+            position_from=position_from,
+            position_to=position_to,
+            word_count_delta=word_count_delta,
+        )
     except Exception as exc:
-        db.session.rollback()
         current_app.logger.error(f"[contributions] Error saving snapshot doc={doc_id}: {exc}")
         return jsonify({'error': 'Error interno'}), 500
 
@@ -165,63 +156,4 @@ def get_contributions_summary(doc_id: int):
     if document is None:
         return jsonify({'error': 'No autorizado'}), 403
 
-    rows = (
-        db.session.query(
-            ContributionSnapshot.user_id,
-            func.sum(
-                db.case(
-                    (ContributionSnapshot.word_count_delta > 0, ContributionSnapshot.word_count_delta),
-                    else_=0
-                )
-            ).label('words_added'),
-            func.sum(
-                db.case(
-                    (ContributionSnapshot.word_count_delta < 0, ContributionSnapshot.word_count_delta),
-                    else_=0
-                )
-            ).label('words_removed'),
-            func.max(ContributionSnapshot.created_at).label('last_active'),
-        )
-        .filter(ContributionSnapshot.document_id == doc_id)
-        .group_by(ContributionSnapshot.user_id)
-        .all()
-    )
-
-    total_words_added = sum(max(int(r.words_added or 0), 0) for r in rows)
-
-    contributors = []
-    for i, row in enumerate(rows):
-        user = User.query.get(row.user_id)
-        if not user:
-            continue
-        words_added   = int(row.words_added or 0)
-        words_removed = abs(int(row.words_removed or 0))
-        net_words     = words_added - words_removed
-        percentage    = round(
-            (words_added / total_words_added * 100) if total_words_added > 0 else 0, 1
-        )
-        contributors.append({
-            'user_id':       row.user_id,
-            'user_name':     f"{user.name or ''} {user.lastname or ''}".strip() or user.email,
-            'words_added':   words_added,
-            'words_removed': words_removed,
-            'net_words':     net_words,
-            'percentage':    percentage,
-            'color':         CONTRIBUTOR_COLORS[i % len(CONTRIBUTOR_COLORS)],
-            'last_active':   row.last_active.isoformat() if row.last_active else None,
-        })
-
-    contributors.sort(key=lambda x: x['words_added'], reverse=True)
-
-    last_snapshot = (
-        ContributionSnapshot.query
-        .filter_by(document_id=doc_id)
-        .order_by(ContributionSnapshot.created_at.desc())
-        .first()
-    )
-
-    return jsonify({
-        'contributors':      contributors,
-        'total_words_added': total_words_added,
-        'last_updated':      last_snapshot.created_at.isoformat() if last_snapshot else None,
-    })
+    return jsonify(ContributionStore.summary(doc_id))
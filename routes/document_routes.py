@@ -1,8 +1,7 @@
-from flask import Blueprint, request, jsonify, send_file, current_app
+from flask import Blueprint, request, jsonify, send_file, current_app, make_response
 from flask_login import login_required, current_user
-from datetime import datetime, timedelta
+from datetime import datetime
 import json
-import uuid
 import os
 from io import BytesIO
 
@@ -11,10 +10,18 @@ from models.models import Document, DocumentVersion, User, DocumentActivity
 from settings.utils import (
     validate_delta, get_content_size, extract_and_upload_images,
     save_to_minio_compressed, load_from_minio_compressed,
-    create_version_backup, export_to_pdf, export_to_docx,
+    create_version_backup,
     cache_document, get_cached_document, invalidate_document_cache,
-    set_autosave_lock, get_autosave_lock
+    acquire_autosave_lock,
+    document_etag, page_etag, not_modified_response, with_etag,
+    serialize_delta, apply_delta_change
 )
+from services.quill_delta import BaseMismatch, DeltaError
+from services.image_store import ImageStore
+from services.autosave_stats import AutosaveStats
+from services.search_index import SearchIndex
+from services.paste_presence import PastePresence
+from services.pagination import LEGACY_LIST_LIMIT, InvalidCursor, Paginator
 
 document_bp = Blueprint('document_bp', __name__)
 
@@ -42,6 +49,7 @@ def create_document():
     )
     db.session.add(doc)
     db.session.commit()
+    SearchIndex.mark_dirty(doc.id)
     
     logger.info(f"Documento creado: ID {doc.id}, título: {title}, owner: {current_user.id}")
     
@@ -60,7 +68,16 @@ def create_document():
 @login_required
 @limiter.limit("20/minute")
 def export_document(doc_id, format_type):
-    """Exportar documento a PDF o DOCX"""
+    """
+    Exportar documento a PDF o DOCX.
+
+    El render corre en el pool de procesos de ExportService y el resultado se
+    cachea por contenido: una exportación repetida responde al instante.
+    Si el render no termina en EXPORT_SYNC_WAIT_SECONDS se devuelve 202 con
+    un job_id consultable en /api/export/<job_id>.
+    """
+    from services.export_service import ExportService
+
     if format_type not in ['pdf', 'docx']:
         return jsonify({'error': 'Formato no soportado'}), 400
     
@@ -73,6 +90,14 @@ def export_document(doc_id, format_type):
     if doc.is_deleted:
         return jsonify({'error': 'Documento no encontrado'}), 404
     
+    # El html guardado no incluye los últimos parches: el editor lo reenvía
+    # (flushHtml) antes de exportar
+    if doc.html_stale:
+        return jsonify({
+            'error': 'El documento tiene cambios sin sincronizar; guárdalo e inténtalo de nuevo',
+            'code': 'html_stale'
+        }), 409
+    
     # Cargar contenido
     if doc.storage_type == 'database':
         html = doc.content_html or ''
@@ -81,113 +106,125 @@ def export_document(doc_id, format_type):
         if html is None:
             return jsonify({'error': 'Error cargando documento'}), 500
     
-    # Generar archivo
-    if format_type == 'pdf':
-        file_buffer = export_to_pdf(html, doc.title)
-        mimetype = 'application/pdf'
-        filename = f"{doc.title}.pdf"
-    else:  # docx
-        file_buffer = export_to_docx(html, doc.title)
-        mimetype = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        filename = f"{doc.title}.docx"
-    
-    if not file_buffer:
-        return jsonify({'error': 'Error generando archivo'}), 500
-    
     try:
-        from settings.extensions import minio_client
-        
-        # Guardar en Minio para descarga
-        export_filename = f"{doc_id}_{uuid.uuid4().hex}.{format_type}"
-        
-        minio_client.put_object(
-            bucket_name='exports',
-            object_name=export_filename,
-            data=file_buffer,
-            length=file_buffer.getbuffer().nbytes,
-            content_type=mimetype
-        )
-        
-        # Generar URL de descarga temporal
-        download_url = minio_client.presigned_get_object(
-            'exports', 
-            export_filename, 
-            expires=timedelta(hours=1)
-        )
-        
+        job = ExportService.submit(doc, html, format_type, current_user.id)
+        if job['status'] == 'pending':
+            job = ExportService.wait(
+                job['job_id'], current_app.config.get('EXPORT_SYNC_WAIT_SECONDS', 5)
+            )
+
+        if job['status'] == 'error':
+            return jsonify({'error': 'Error generando archivo'}), 500
+
         # Registrar actividad
         DocumentActivity.log_activity(
             doc_id, current_user.email, 'exported', 
             f'Documento exportado a {format_type.upper()}', request
         )
-        
-        logger.info(f"Documento {doc_id} exportado a {format_type} por {current_user.email}")
+
+        if job['status'] == 'pending':
+            return jsonify({
+                'job_id': job['job_id'],
+                'status': 'pending',
+                'status_url': f"/api/export/{job['job_id']}",
+                'filename': job['filename'],
+                'format': format_type
+            }), 202
+
+        logger.info(f"Documento {doc_id} exportado a {format_type} por {current_user.email} (cache={job['cached']})")
         
         return jsonify({
-            'download_url': download_url,
-            'filename': filename,
+            'download_url': ExportService.download_url(job),
+            'filename': job['filename'],
             'format': format_type,
+            'cached': job['cached'],
             'expires_in': '1 hora'
         })
         
     except Exception as e:
         logger.error(f"Error exportando documento: {e}")
         return jsonify({'error': 'Error generando exportación'}), 500
-        
-    #except Exception as e:
-    #    logger.error(f"Error en exportación: {e}")
-    #    return jsonify({'error': 'Error en exportación'}), 500
+
+
+@document_bp.route('/api/export/<job_id>', methods=['GET'])
+@login_required
+def export_status(job_id):
+    """Estado de un job de exportación (pending | done | error)"""
+    from services.export_service import ExportService
+
+    job = ExportService.get_job(job_id)
+    if not job or job['user_id'] != current_user.id:
+        return jsonify({'error': 'Exportación no encontrada'}), 404
+
+    response = {
+        'job_id': job_id,
+        'status': job['status'],
+        'filename': job['filename'],
+        'format': job['format']
+    }
+    if job['status'] == 'done':
+        response['download_url'] = ExportService.download_url(job)
+        response['expires_in'] = '1 hora'
+    elif job['status'] == 'error':
+        response['error'] = 'Error generando archivo'
+    return jsonify(response)
 
 @document_bp.route('/api/image/<filename>')
 def serve_image(filename):
-    """Servir imágenes desde Minio"""
+    """
+    Servir imágenes: caché local en disco (LRU) → SeaweedFS → índice local.
+    Nombres por contenido ('{sha256}.{ext}') son inmutables: ETag fuerte y
+    304 sin tocar almacenamiento. Range/If-None-Match los resuelve send_file.
+    """
+    from services.image_cache import (
+        HotImageCache, LocalImageIndex, immutable_etag, image_mimetype,
+        IMMUTABLE_CACHE_CONTROL, LEGACY_CACHE_CONTROL,
+    )
+
+    if filename.startswith('.') or os.path.basename(filename) != filename:
+        return jsonify({'error': 'Imagen no encontrada'}), 404
+
+    etag = immutable_etag(filename)
+    cache_control = IMMUTABLE_CACHE_CONTROL if etag else LEGACY_CACHE_CONTROL
+
+    # 304 antes de cualquier lectura (SeaweedFS, disco)
+    if etag and request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = cache_control
+        return response
+
     try:
-        from settings.extensions import minio_client
-        
-        try:
-            response = minio_client.get_object('images', filename)
-            data = response.read()
-            logger.info(f"[ServeImage] Serving {filename} from Minio")
-        except Exception as minio_err:
-            logger.warning(f"[ServeImage] Minio error for {filename}, checking local: {minio_err}")
-            
-            # Fallback local paths
-            fallback_paths = [
-                os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'images', filename),
-                os.path.join(os.path.dirname(os.path.dirname(__file__)), 'uploads', 'images', filename),
-                os.path.join(os.getcwd(), 'uploads', 'images', filename),
-                os.path.join(os.getcwd(), 'static', 'uploads', 'images', filename)
-            ]
-            
-            data = None
-            for p in fallback_paths:
-                if os.path.exists(p):
-                    logger.info(f"[ServeImage] Found {filename} at {p}")
-                    try:
-                        with open(p, 'rb') as f:
-                            data = f.read()
-                        break
-                    except Exception as e:
-                        logger.error(f"[ServeImage] Error reading {p}: {e}")
+        data = None
+        path = HotImageCache.get(filename)
+        if path is None:
+            try:
+                from settings.extensions import minio_client
+                data = minio_client.get_object('images', filename).read()
+                path = HotImageCache.put(filename, data)
+                logger.info(f"[ServeImage] Fetched {filename} from SeaweedFS")
+            except Exception as minio_err:
+                logger.warning(f"[ServeImage] SeaweedFS error for {filename}, checking local: {minio_err}")
+                path = LocalImageIndex.lookup(filename)
+                if path is None:
+                    logger.error(f"[ServeImage] Image {filename} not found in any location.")
+                    return jsonify({'error': 'Image not found'}), 404
 
-            if data is None:
-                logger.error(f"[ServeImage] Image {filename} not found in any location.")
-                return jsonify({'error': 'Image not found'}), 404
-        
-        # Determinar tipo de contenido
-        content_type = 'image/png'  # por defecto
-        if filename.lower().endswith(('.jpg', '.jpeg')):
-            content_type = 'image/jpeg'
-        elif filename.lower().endswith('.gif'):
-            content_type = 'image/gif'
-        elif filename.lower().endswith('.webp'):
-            content_type = 'image/webp'
-        
-        return send_file(
-            BytesIO(data),
-            mimetype=content_type,
-            as_attachment=False
-        )
+        mimetype = image_mimetype(filename)
+        accel_prefix = current_app.config.get('IMAGE_ACCEL_REDIRECT_PREFIX')
+        if accel_prefix and path and os.path.dirname(path) == HotImageCache.directory():
+            # nginx sirve el fichero (sendfile, Range, condicionales)
+            response = current_app.response_class(mimetype=mimetype)
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + filename
+            if etag:
+                response.set_etag(etag)
+        elif path:
+            response = send_file(path, mimetype=mimetype, conditional=True, etag=etag or True)
+        else:
+            # Caché en disco no disponible: servir desde memoria
+            response = send_file(BytesIO(data), mimetype=mimetype, conditional=True, etag=etag or False)
+        response.headers['Cache-Control'] = cache_control
+        return response
         
     except Exception as e:
         logger.error(f"Error sirviendo imagen {filename}: {e}")
@@ -228,18 +265,17 @@ def list_documents():
         # Excluir documentos de workspace (solo se ven en el detalle del workspace)
         query = query.filter(Document.document_type != 'workspace')
         
-        # Búsqueda por título
+        # Búsqueda full-text (título + contenido); LIKE por título si no hay índice
         if search:
-            query = query.filter(Document.title.contains(search))
-        
-        # Ordenar por fecha de actualización
-        query = query.order_by(Document.updated_at.desc())
-        
-        # Paginar
-        docs = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+            match_clause = SearchIndex.matching_ids_clause(current_user.id, search)
+            query = query.filter(match_clause if match_clause is not None
+                                 else Document.title.contains(search))
+        
+        # Ordenar por fecha de actualización (keyset: updated_at, id)
+        docs = Paginator.paginate(
+            query, Document.updated_at, Document.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            scope='documents',
         )
         
         # Convertir a dict
@@ -249,20 +285,33 @@ def list_documents():
             doc_data['can_restore'] = doc.is_deleted
             documents.append(doc_data)
         
-        return jsonify({
-            'documents': documents,
-            'total': docs.total,
-            'pages': docs.pages,
-            'current_page': page,
-            'per_page': per_page,
-            'has_next': docs.has_next,
-            'has_prev': docs.has_prev
-        })
+        return jsonify({'documents': documents, **docs.meta()})
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error listando documentos: {e}")
         return jsonify({'error': 'Error cargando documentos'}), 500
 
+@document_bp.route('/api/documents/search', methods=['GET'])
+@login_required
+@limiter.limit("60/minute")
+def search_documents():
+    """Búsqueda full-text en título y contenido — scoped to current_user"""
+    q = request.args.get('q', '').strip()
+    if len(q) > 200:
+        return jsonify({'error': 'Consulta demasiado larga'}), 400
+    try:
+        return jsonify(SearchIndex.search(
+            current_user.id, q,
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', 20, type=int),
+            workspace_id=request.args.get('workspace_id', type=int),
+        ))
+    except Exception as e:
+        logger.error(f"Error buscando documentos: {e}")
+        return jsonify({'error': 'Error en la búsqueda'}), 500
+
 @document_bp.route('/api/document/<int:doc_id>/versions', methods=['GET'])
 @login_required
 def list_document_versions(doc_id):
@@ -272,15 +321,25 @@ def list_document_versions(doc_id):
         if doc.owner_id != current_user.id:
             return jsonify({'error': 'No autorizado'}), 403
         
-        versions = DocumentVersion.query.filter_by(document_id=doc_id).order_by(DocumentVersion.created_at.desc()).all()
+        versions = Paginator.paginate(
+            DocumentVersion.query.filter_by(document_id=doc_id),
+            DocumentVersion.created_at, DocumentVersion.id,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', LEGACY_LIST_LIMIT, type=int),
+            scope=f'versions:{doc_id}', max_per_page=LEGACY_LIST_LIMIT,
+        )
         
         return jsonify({
             'document_id': doc_id,
             'document_title': doc.title,
             'current_version': doc.version_number,
-            'versions': [version.to_dict() for version in versions]
+            'versions': [version.to_dict() for version in versions.items],
+            **versions.meta()
         })
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error listando versiones: {e}")
         return jsonify({'error': 'Error cargando versiones'}), 500
@@ -310,9 +369,14 @@ def restore_document_version(doc_id, version_id):
             html = ''
         
         # Actualizar documento
-        content_size = get_content_size(delta, html)
-        doc.content_delta = json.dumps(delta)
+        # Nuevo content_hash: un parche de un editor abierto sobre el contenido
+        # anterior debe dar base_mismatch, no componerse sobre el restaurado
+        delta_json, content_hash = serialize_delta(delta)
+        content_size = get_content_size(delta, html, delta_json)
+        doc.content_delta = delta_json
+        doc.content_hash = content_hash
         doc.content_html = html
+        doc.html_stale = not html   # las versiones en DB no guardan html
         doc.storage_type = 'database'  # Restaurar a base de datos por simplicidad
         doc.size_bytes = content_size
         doc.version_number += 1
@@ -326,6 +390,7 @@ def restore_document_version(doc_id, version_id):
         
         # Invalidar cache
         invalidate_document_cache(doc_id)
+        SearchIndex.mark_dirty(doc_id)
         
         # Registrar actividad
         DocumentActivity.log_activity(
@@ -357,19 +422,22 @@ def get_document_activity(doc_id):
         if doc.owner_id != current_user.id:
             return jsonify({'error': 'No autorizado'}), 403
         
-        activities = DocumentActivity.query.filter_by(document_id=doc_id)\
-            .order_by(DocumentActivity.created_at.desc())\
-            .paginate(page=page, per_page=per_page, error_out=False)
+        activities = Paginator.paginate(
+            DocumentActivity.query.filter_by(document_id=doc_id),
+            DocumentActivity.created_at, DocumentActivity.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            scope=f'activity:{doc_id}',
+        )
         
         return jsonify({
             'document_id': doc_id,
             'document_title': doc.title,
             'activities': [activity.to_dict() for activity in activities.items],
-            'total': activities.total,
-            'pages': activities.pages,
-            'current_page': page
+            **activities.meta()
         })
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error obteniendo actividad: {e}")
         return jsonify({'error': 'Error cargando actividad'}), 500
@@ -470,61 +538,102 @@ def save_document(doc_id):
         }
         metrics_rec.submitted_at = datetime.utcnow()
     
-    if not delta:
-        return jsonify({'error': 'Delta requerido'}), 400
+    # Autosave por parches: {'change': delta de Quill, 'base_hash': content_hash}
+    change = data.get('change')
     
-    # Validar delta
-    is_valid, message = validate_delta(delta)
-    if not is_valid:
-        return jsonify({'error': message}), 400
+    if not delta and change is None:
+        return jsonify({'error': 'Delta requerido'}), 400
     
     # Buscar documento y verificar ownership
     doc = Document.query.get_or_404(doc_id)
     if doc.owner_id != current_user.id:
         return jsonify({'error': 'No autorizado'}), 403
     
-    # Verificar bloqueo de auto-guardado
+    # Verificar y establecer bloqueo de auto-guardado (atómico, un round-trip)
     if is_autosave:
-        existing_lock = get_autosave_lock(doc_id)
-        if existing_lock and existing_lock.get('user_email') != current_user.email:
+        acquired, locked_by = acquire_autosave_lock(doc_id, current_user.email)
+        if not acquired:
             return jsonify({
                 'error': 'Documento siendo editado por otro usuario',
-                'locked_by': existing_lock.get('user_email')
+                'locked_by': locked_by
             }), 409
-        
-        # Establecer bloqueo
-        set_autosave_lock(doc_id, current_user.email)
     
-    # Crear respaldo de versión antes de modificar (solo si no es auto-guardado)
-    if not is_autosave:
-        create_version_backup(doc)
+    if change is not None:
+        # Solo las imágenes del cambio; el resto ya se procesó en guardados anteriores
+        change = extract_and_upload_images(change)
+        ImageStore.add_refs(doc.id, change)
+        try:
+            delta, stored_html = apply_delta_change(doc, change, data.get('base_hash'))
+        except BaseMismatch:
+            return jsonify({
+                'error': 'Versión base desactualizada',
+                'code': 'base_mismatch',
+                'content_hash': doc.content_hash
+            }), 409
+        except DeltaError as e:
+            return jsonify({'error': str(e)}), 400
+        if html is None:
+            html = stored_html
+    else:
+        # Procesar imágenes (las data URI se reemplazan por URLs antes de medir)
+        delta = extract_and_upload_images(delta)
+    
+    # Una sola serialización: validación de tamaño, hash, size_bytes y persistencia
+    delta_json, content_hash = serialize_delta(delta)
+    is_valid, message = validate_delta(delta, delta_json)
+    if not is_valid:
+        return jsonify({'error': message}), 400
+    
+    # Sin cambios (mismo hash, título y HTML): sin UPDATE, sin invalidar cache,
+    # sin respaldo de versión y sin llamadas a SeaweedFS
+    html_stale = change is not None and 'html' not in data
+    if html_stale:
+        html_unchanged = True   # parche sin HTML: se conserva el guardado
+    else:
+        html_unchanged = (doc.storage_type == 'database' and not doc.html_stale
+                          and html == doc.content_html)
+    if content_hash == doc.content_hash and title == doc.title and html_unchanged:
+        if db.session.new or db.session.dirty:
+            # Métricas de escritura / refs de imágenes del parche
+            db.session.commit()
+        AutosaveStats.record(
+            doc_id, written=False, is_autosave=is_autosave,
+            mode='patch' if change is not None else 'full',
+            content_hash=content_hash, title=title, html=html,
+            size=doc.size_bytes or 0, has_metrics=bool(metrics_payload)
+        )
+        return jsonify({
+            'status': 'unchanged',
+            'storage_type': doc.storage_type,
+            'size_bytes': doc.size_bytes,
+            'content_hash': doc.content_hash,
+            'updated_at': doc.updated_at.isoformat(),
+            'is_autosave': is_autosave
+        })
     
-    # Procesar imágenes
-    delta = extract_and_upload_images(delta)
+    if change is None:
+        # Crear respaldo de versión antes de modificar (solo si no es auto-guardado)
+        if not is_autosave:
+            create_version_backup(doc)
+        ImageStore.add_refs(doc.id, delta)
     
     # Actualizar documento
     doc.title = title
-    content_size = get_content_size(delta, html)
+    content_size = get_content_size(delta, html, delta_json)
     doc.size_bytes = content_size
+    doc.content_hash = content_hash
+    doc.html_stale = html_stale
     doc.updated_at = datetime.utcnow()
     
     # Decidir almacenamiento basado en tamaño
-    from flask import current_app
-    
     if content_size <= current_app.config['MAX_DB_SIZE']:
         # Guardar en base de datos
-        doc.content_delta = json.dumps(delta)
+        doc.content_delta = delta_json
         doc.content_html = html
         doc.storage_type = 'database'
         
-        # Limpiar Minio si existía
-        if doc.minio_path:
-            try:
-                from settings.extensions import minio_client
-                minio_client.remove_object('documents', doc.minio_path)
-            except:
-                pass
-            doc.minio_path = None
+        # Soltar la referencia al blob (compartido con versiones; lo elimina el GC)
+        doc.minio_path = None
     else:
         # Guardar en Minio
         minio_path = save_to_minio_compressed(delta, html)
@@ -537,6 +646,15 @@ def save_document(doc_id):
     
     # Invalidar cache
     invalidate_document_cache(doc_id)
+    SearchIndex.mark_dirty(doc_id)
+    PastePresence.on_save(doc_id, delta, content_hash)
+    
+    AutosaveStats.record(
+        doc_id, written=True, is_autosave=is_autosave,
+        mode='patch' if change is not None else 'full',
+        content_hash=content_hash, title=title, html=html,
+        size=content_size, has_metrics=bool(metrics_payload)
+    )
     
     # Registrar actividad (solo si no es auto-guardado)
     if not is_autosave:
@@ -548,12 +666,14 @@ def save_document(doc_id):
             request
         )
     
-    logger.info(f"Documento {doc_id} guardado en {doc.storage_type}, tamaño: {content_size}")
+    logger.info(f"Documento {doc_id} guardado en {doc.storage_type}, tamaño: {content_size}"
+                f"{' (parche)' if change is not None else ''}")
     
     return jsonify({
         'status': 'saved',
         'storage_type': doc.storage_type,
         'size_bytes': content_size,
+        'content_hash': content_hash,
         'updated_at': doc.updated_at.isoformat(),
         'is_autosave': is_autosave
     })
@@ -562,6 +682,54 @@ def save_document(doc_id):
     #    logger.error(f"Error guardando documento {doc_id}: {e}")
     #    return jsonify({'error': 'Error guardando documento'}), 500
 
+def _load_document_payload(doc, fields=('delta', 'html')):
+    """
+    Payload de /load (metadatos + campos pedidos) desde el cache de Redis o,
+    si falla, desde DB/SeaweedFS. Retorna (payload, from_cache).
+    """
+    cached_doc = get_cached_document(doc.id, fields)
+    if cached_doc:
+        return cached_doc, True
+    
+    if doc.storage_type == 'database':
+        delta = json.loads(doc.content_delta) if doc.content_delta else {}
+        html  = doc.content_html or ''
+    else:
+        # Try minio / local file first
+        delta, html = load_from_minio_compressed(doc.minio_path)
+        if delta is None:
+            # File is missing from storage — fall back to DB content_delta
+            logger.warning(
+                f"[load_document] Storage file missing for doc {doc.id} "
+                f"(path={doc.minio_path}). Falling back to DB content."
+            )
+            delta = json.loads(doc.content_delta) if doc.content_delta else {"ops": [{"insert": "\n"}]}
+            html  = doc.content_html or ''
+    
+    response_data = {
+        'id': doc.id,
+        'title': doc.title,
+        'delta': delta,
+        'html': html,
+        'storage_type': doc.storage_type,
+        'size_bytes': doc.size_bytes,
+        'document_type': doc.document_type,
+        'original_filename': doc.original_filename,
+        'version_number': doc.version_number,
+        'content_hash': doc.content_hash,
+        'created_at': doc.created_at.isoformat(),
+        'updated_at': doc.updated_at.isoformat(),
+        'owner_email': doc.owner.email if doc.owner else None
+    }
+    
+    # Se cachean ambos campos; cada lector pide solo los suyos
+    cache_document(doc.id, response_data)
+    
+    for name in ('delta', 'html'):
+        if name not in fields:
+            response_data.pop(name)
+    return response_data, False
+
 @document_bp.route('/api/document/<int:doc_id>/load', methods=['GET'])
 @login_required
 def load_document(doc_id):
@@ -585,54 +753,27 @@ def load_document(doc_id):
         if doc.is_deleted:
             return jsonify({'error': 'Documento no encontrado'}), 404
         
-        # Verificar cache
-        cached_doc = get_cached_document(doc_id)
-        if cached_doc:
-            DocumentActivity.log_activity(
-                doc_id, current_user.email, 'viewed', 'Documento accedido (cache)', request
-            )
-            return jsonify(cached_doc)
+        # ?fields=delta (editor) | html (vista) — por defecto ambos
+        fields = tuple(
+            f for f in request.args.get('fields', 'delta,html').split(',')
+            if f in ('delta', 'html')
+        ) or ('delta', 'html')
         
-        if doc.storage_type == 'database':
-            delta = json.loads(doc.content_delta) if doc.content_delta else {}
-            html  = doc.content_html or ''
-        else:
-            # Try minio / local file first
-            delta, html = load_from_minio_compressed(doc.minio_path)
-            if delta is None:
-                # File is missing from storage — fall back to DB content_delta
-                logger.warning(
-                    f"[load_document] Storage file missing for doc {doc_id} "
-                    f"(path={doc.minio_path}). Falling back to DB content."
-                )
-                delta = json.loads(doc.content_delta) if doc.content_delta else {"ops": [{"insert": "\n"}]}
-                html  = doc.content_html or ''
-        
-        # Preparar respuesta
-        response_data = {
-            'id': doc.id,
-            'title': doc.title,
-            'delta': delta,
-            'html': html,
-            'storage_type': doc.storage_type,
-            'size_bytes': doc.size_bytes,
-            'document_type': doc.document_type,
-            'original_filename': doc.original_filename,
-            'version_number': doc.version_number,
-            'created_at': doc.created_at.isoformat(),
-            'updated_at': doc.updated_at.isoformat(),
-            'owner_email': doc.owner.email if doc.owner else None
-        }
+        # El cliente ya tiene esta versión: 304 sin tocar Redis ni SeaweedFS
+        etag = document_etag(doc, ','.join(fields))
+        not_modified = not_modified_response(etag)
+        if not_modified is not None:
+            return not_modified
         
-        # Cachear documento
-        cache_document(doc_id, response_data)
+        response_data, from_cache = _load_document_payload(doc, fields)
         
         # Registrar actividad
         DocumentActivity.log_activity(
-            doc_id, current_user.email, 'viewed', 'Documento cargado', request
+            doc_id, current_user.email, 'viewed',
+            'Documento accedido (cache)' if from_cache else 'Documento cargado', request
         )
         
-        return jsonify(response_data)
+        return with_etag(jsonify(response_data), etag)
         
     except Exception as e:
         logger.error(f"Error cargando documento {doc_id}: {e}")
@@ -665,6 +806,7 @@ def rename_document(doc_id):
         
         # Invalidar cache si existe
         invalidate_document_cache(doc_id)
+        SearchIndex.mark_dirty(doc_id)
         
         # Registrar actividad
         DocumentActivity.log_activity(
@@ -796,12 +938,17 @@ def list_trash():
         query = Document.query.filter(
             Document.owner_id == current_user.id,
             Document.is_deleted == True
-        ).order_by(Document.deleted_at.desc())
-        
-        documents = query.all()
+        )
+        documents = Paginator.paginate(
+            query, Document.deleted_at, Document.id,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', LEGACY_LIST_LIMIT, type=int),
+            scope='trash', max_per_page=LEGACY_LIST_LIMIT,
+        )
         
         trash_docs = []
-        for doc in documents:
+        for doc in documents.items:
             trash_docs.append({
                 'id': doc.id,
                 'title': doc.title or 'Untitled',
@@ -810,11 +957,10 @@ def list_trash():
                 'document_type': doc.document_type or 'created'
             })
         
-        return jsonify({
-            'documents': trash_docs,
-            'total': len(trash_docs)
-        })
+        return jsonify({'documents': trash_docs, **documents.meta()})
         
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         logger.error(f"Error listando trash: {e}")
         return jsonify({'error': 'Error cargando papelera'}), 500
@@ -934,6 +1080,9 @@ def delete_permanent(doc_id):
         from models.models import DocumentVersion
         DocumentVersion.query.filter_by(document_id=doc_id).delete()
         
+        # Liberar referencias a imágenes (el GC borra las huérfanas)
+        ImageStore.release_document(doc_id)
+        
         # Eliminar permanentemente de la base de datos
         db.session.delete(doc)
         db.session.commit()
@@ -999,6 +1148,7 @@ def delete_bulk():
                 
                 # Eliminar versiones
                 DocumentVersion.query.filter_by(document_id=doc_id).delete()
+                ImageStore.release_document(doc_id)
                 
                 # Eliminar documento
                 db.session.delete(doc)
@@ -1062,6 +1212,11 @@ def documentedit(token):
 
     metrics = EssaySubmissionMetrics.query.filter_by(document_id=document.id).first()
     
+    etag = page_etag(document, 'edit', current_user.id, metrics.submitted_at if metrics else '')
+    not_modified = not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+    
     metrics_data = {}
     if metrics:
         effective_sec = metrics.effective_time_seconds or 0
@@ -1082,32 +1237,18 @@ def documentedit(token):
             'activity_by_minute': (metrics.session_metadata or {}).get('activity_by_minute', {})
         }
 
-    # Extract real content (handling JSON and Minio)
-    content_delta_raw = None
-    content_html_raw = None
-    import json
-    if getattr(document, 'storage_type', 'database') == 'minio' and document.minio_path:
-        try:
-            from settings.utils import load_from_minio_compressed
-            delta, html = load_from_minio_compressed(document.minio_path)
-            content_delta_raw = delta
-            content_html_raw = html
-        except Exception as e:
-            logger.error(f"Error loading minio compressed file for document {document.id}: {e}")
-    else:
-        if document.content_delta:
-            try:
-                content_delta_raw = json.loads(document.content_delta)
-            except Exception:
-                content_delta_raw = document.content_delta
-        content_html_raw = document.content_html
+    # Extract real content (Redis cache → DB / SeaweedFS)
+    payload, _ = _load_document_payload(document)
+    content_delta_raw = payload['delta']
+    content_html_raw = payload['html']
 
-    return render_template('documentedit.html', 
+    response = make_response(render_template('documentedit.html', 
                          document=document,
                          content_delta_raw=content_delta_raw,
                          content_html_raw=content_html_raw,
                          metrics=metrics_data,
-                         now=datetime.now())
+                         now=datetime.now()))
+    return with_etag(response, etag)
 
 @document_bp.route('/documentview/<token>')
 @login_required
@@ -1131,6 +1272,11 @@ def documentview(token):
 
     metrics = EssaySubmissionMetrics.query.filter_by(document_id=document.id).first()
     
+    etag = page_etag(document, 'view', current_user.id, metrics.submitted_at if metrics else '')
+    not_modified = not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+    
     metrics_data = {}
     if metrics:
         effective_sec = metrics.effective_time_seconds or 0
@@ -1151,7 +1297,8 @@ def documentview(token):
             'activity_by_minute': (metrics.session_metadata or {}).get('activity_by_minute', {})
         }
 
-    return render_template('documentview.html', 
+    response = make_response(render_template('documentview.html', 
                          document=document,
                          metrics=metrics_data,
-                         now=datetime.now())
\ No newline at end of file
+                         now=datetime.now()))
+    return with_etag(response, etag)
\ No newline at end of file
@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from settings.extensions import db, csrf, limiter
 from models.models import Folder, Document, FolderShare, User
 from datetime import datetime
+from services.pagination import LEGACY_LIST_LIMIT, InvalidCursor, Paginator
 
 folder_bp = Blueprint('folders', __name__)
 csrf.exempt(folder_bp)
@@ -13,12 +14,22 @@ csrf.exempt(folder_bp)
 @login_required
 def list_folders():
     """Lista carpetas activas del usuario (no archivadas, no eliminadas)"""
-    folders = Folder.query.filter_by(
+    query = Folder.query.filter_by(
         user_id=current_user.id,
         is_deleted=False,
         is_archived=False
-    ).order_by(Folder.created_at.desc()).all()
-    return jsonify({'folders': [f.to_dict() for f in folders]})
+    )
+    try:
+        folders = Paginator.paginate(
+            query, Folder.created_at, Folder.id,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', LEGACY_LIST_LIMIT, type=int),
+            scope='folders', max_per_page=LEGACY_LIST_LIMIT,
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'folders': [f.to_dict() for f in folders.items], **folders.meta()})
 
 
 # ─── CREATE FOLDER ──────────────────────────────────────────
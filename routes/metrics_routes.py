@@ -3,6 +3,7 @@ from flask_login import login_required, current_user
 from models.models import EssaySubmissionMetrics, WorkspaceInvitation, Document, db
 from settings.extensions import csrf
 from services.cache_service import cache
+from services.pagination import LEGACY_LIST_LIMIT, InvalidCursor, Paginator
 import json
 import traceback
 
@@ -231,11 +232,21 @@ def get_task_submissions(workspace_id):
     (El profesor accede a la lista de estudiantes de este workspace)
     """
     try:
-        submissions = EssaySubmissionMetrics.query.filter_by(workspace_id=workspace_id).order_by(EssaySubmissionMetrics.submitted_at.desc()).all()
+        submissions = Paginator.paginate(
+            EssaySubmissionMetrics.query.filter_by(workspace_id=workspace_id),
+            EssaySubmissionMetrics.submitted_at, EssaySubmissionMetrics.id,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', LEGACY_LIST_LIMIT, type=int),
+            scope=f'submissions:{workspace_id}', max_per_page=LEGACY_LIST_LIMIT,
+        )
         return jsonify({
             'success': True,
-            'submissions': [sub.to_dict() for sub in submissions]
+            'submissions': [sub.to_dict() for sub in submissions.items],
+            **submissions.meta()
         }), 200
+    except InvalidCursor as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
     except Exception as e:
         current_app.logger.error(f"Error fetching submissions: {str(e)}")
         return jsonify({'success': False, 'error': 'Internal server error'}), 500
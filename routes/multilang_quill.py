@@ -1,188 +1,155 @@
 # multilang_quill.py
-from gramformer import Gramformer
-from transformers import T5ForConditionalGeneration, T5Tokenizer
-from langdetect import detect, DetectorFactory
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any
+import hashlib
 import logging
+import re
+
+from services.grammar_inference import MODEL_NAMES, GrammarClient, compute_stats, detect_language, empty_result
+from services.quill_delta import _u16len
+
+# Párrafos de Quill y los saltos de línea entre ellos, alternos: ''.join() devuelve el texto
+_PARAGRAPH_SPLIT = re.compile(r'(\n+)')
+# Se vuelve a detectar el idioma cuando el texto nuevo desde la última detección supera esta fracción
+_LANGUAGE_RECHECK_RATIO = 0.2
+
+
+def _quill_span(piece: str, edit: Dict[str, Any], base: int) -> Dict[str, int]:
+    """offset/length de una edición del párrafo en unidades UTF-16 (las de Quill) desde base"""
+    start = edit.get('offset', 0)
+    end = start + edit.get('length', 0)
+    return {'offset': base + _u16len(piece[:start]), 'length': _u16len(piece[start:end])}
 
-# Fijar semilla para detección de idioma
-DetectorFactory.seed = 0
 
 class MultiLanguageQuillAnalyzer:
     """
     Soporta: INGLÉS (Gramformer) + FRANCÉS (T5-fr)
     API idéntica a GramformerQuillAnalyzer
+
+    Los modelos viven en el servicio de inferencia (services/grammar_inference.py,
+    proceso aparte con micro-batching); aquí sólo se llama por HTTP, así que
+    importar esta clase ya no carga torch en el worker web.
+
+    analyze_incremental(): modo por párrafos para el editor, que reenvía el
+    documento entero en cada cambio pero sólo cambia un párrafo.
     """
-    
-    def __init__(self, cache_size: int = 100):
-        self.cache = {}
+
+    def __init__(self, cache_size: int = 100, url: str = None, unit_cache_size: int = 5000):
+        self.cache = OrderedDict()
         self.cache_size = cache_size
+        self.units = OrderedDict()          # sha1(idioma, párrafo) → resultado del párrafo
+        self.unit_cache_size = unit_cache_size
+        self.documents = OrderedDict()      # doc_id → idioma, hashes de párrafos, texto nuevo desde la detección
         self.logger = logging.getLogger(__name__)
-        
-        # Modelos
-        self.english_model = Gramformer(models=1, use_gpu=False)
-        self.french_model = T5ForConditionalGeneration.from_pretrained(
-            "olix3000/french-grammar-correction"
-        )
-        self.french_tokenizer = T5Tokenizer.from_pretrained(
-            "olix3000/french-grammar-correction"
-        )
-
-    def detect_language(self, text: str) -> str:
-        """Detecta idioma: 'en' o 'fr'"""
-        try:
-            lang = detect(text)
-            return 'en' if lang.startswith('en') else 'fr'
-        except:
-            return 'en'  # fallback
-
-    def correct_english(self, text: str) -> str:
-        try:
-            return list(self.english_model.correct(text))[0]
-        except:
-            return text
-
-    def correct_french(self, text: str) -> str:
-        try:
-            inputs = self.french_tokenizer(
-                f"corriger: {text}", return_tensors="pt", max_length=512, truncation=True
-            )
-            outputs = self.french_model.generate(
-                **inputs, max_length=512, num_beams=4, early_stopping=True
-            )
-            return self.french_tokenizer.decode(outputs[0], skip_special_tokens=True)
-        except Exception as e:
-            self.logger.error(f"Error francés: {e}")
-            return text
-
-    def highlight_english(self, original: str, corrected: str) -> str:
-        try:
-            return self.english_model.highlight(original, corrected)
-        except:
-            return original
-
-    def get_edits_english(self, original: str, corrected: str) -> List[Dict]:
-        try:
-            edits = self.english_model.get_edits(original, corrected)
-            return [
-                {
-                    "type": e.get("type", "UNKNOWN"),
-                    "original": e.get("original", ""),
-                    "corrected": e.get("corrected", ""),
-                    "start": e.get("start", 0),
-                    "end": e.get("end", 0),
-                    "explanation": self._explain_en(e.get("type", ""))
-                }
-                for e in edits
-            ]
-        except:
-            return []
-
-    def _explain_en(self, error_type: str) -> str:
-        explanations = {
-            "VERB:SVA": "Subject-verb agreement error",
-            "VERB:TENSE": "Wrong verb tense",
-            "PREP": "Wrong preposition",
-            "NOUN:NUM": "Singular/plural mismatch",
-            "ORTH": "Spelling error",
-            "PUNCT": "Punctuation error"
-        }
-        return explanations.get(error_type, "Grammar issue")
-
-    def _explain_fr(self, error_type: str) -> str:
-        explanations = {
-            "acc": "Accord sujet-verbe",
-            "temps": "Temps verbal incorrect",
-            "prep": "Préposition incorrecte",
-            "genre": "Erreur de genre",
-            "orth": "Faute d'orthographe",
-            "ponct": "Erreur de ponctuation"
-        }
-        return explanations.get(error_type.lower(), "Erreur grammaticale")
+        self.client = GrammarClient(url)
 
     def analyze(self, text: str) -> Dict[str, Any]:
         if not text.strip():
-            return self._empty_result()
+            return empty_result()
 
-        cache_key = hash(text)
+        cache_key = hashlib.sha1(text.encode('utf-8')).hexdigest()
         if cache_key in self.cache:
+            self.cache.move_to_end(cache_key)
             return self.cache[cache_key]
 
-        lang = self.detect_language(text)
-        original = text
-
-        if lang == 'en':
-            corrected = self.correct_english(text)
-            html = self.highlight_english(original, corrected)
-            edits = self.get_edits_english(original, corrected)
-            model_name = "Gramformer (EN)"
-        else:
-            corrected = self.correct_french(text)
-            html = self._highlight_french_simple(original, corrected)
-            edits = self._get_edits_french_simple(original, corrected)
-            model_name = "T5-French (FR)"
-
-        stats = self._compute_stats(edits, lang)
-        
-        result = {
-            "original": original,
-            "corrected": corrected,
-            "html": html,
-            "edits": edits,
-            "stats": stats,
-            "language": lang,
-            "model": model_name
-        }
+        result = self.client.analyze(text)
+        self._remember(cache_key, result)
+        return result
 
-        if len(self.cache) >= self.cache_size:
-            self.cache.pop(next(iter(self.cache)))
+    def analyze_many(self, texts: List[str]) -> List[Dict[str, Any]]:
+        """Varios textos en una sola llamada (el servicio los agrupa por frases)."""
+        results = self.client.analyze_many(texts)
+        for text, result in zip(texts, results):
+            if text.strip():
+                self._remember(hashlib.sha1(text.encode('utf-8')).hexdigest(), result)
+        return results
+
+    def _remember(self, cache_key: str, result: Dict[str, Any]) -> None:
         self.cache[cache_key] = result
-        
-        return result
+        self.cache.move_to_end(cache_key)
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    # ── Modo incremental ──────────────────────────────────────────────────────
+
+    def analyze_incremental(self, text: str, doc_id: str = None) -> Dict[str, Any]:
+        """
+        Igual que analyze(), pero por párrafos: sólo los párrafos cuyo hash no
+        está en caché van al servicio (en una sola llamada); el resto se
+        reutiliza. Las ediciones de cada párrafo se recolocan en el documento
+        actual: `offset` es la posición Quill, `paragraph` el índice del
+        párrafo (start/end siguen siendo relativos al párrafo).
+
+        Con doc_id el idioma del documento se recuerda y sólo se vuelve a
+        detectar cuando ha cambiado más de _LANGUAGE_RECHECK_RATIO del texto.
+        """
+        if not text.strip():
+            return empty_result()
+
+        pieces = _PARAGRAPH_SPLIT.split(text)
+        lang = self._document_language(text, pieces, doc_id)
+        keys = [hashlib.sha1(f'{lang}\0{piece}'.encode('utf-8')).hexdigest()
+                if i % 2 == 0 and piece.strip() else None for i, piece in enumerate(pieces)]
+
+        found, missing = {}, {}
+        for key, piece in zip(keys, pieces):
+            if key is None or key in found or key in missing:
+                continue
+            if key in self.units:
+                self.units.move_to_end(key)
+                found[key] = self.units[key]
+            else:
+                missing[key] = piece
+        if missing:
+            for key, result in zip(missing, self.client.analyze_many(list(missing.values()), language=lang)):
+                found[key] = result
+                self._remember_unit(key, result)
+
+        corrected, html, edits = [], [], []
+        offset = paragraph = 0
+        for key, piece in zip(keys, pieces):
+            if key is None:
+                corrected.append(piece)
+                html.append(piece)
+            else:
+                unit = found[key]
+                corrected.append(unit['corrected'])
+                html.append(unit['html'])
+                edits.extend({**edit, **_quill_span(piece, edit, offset), 'paragraph': paragraph}
+                             for edit in unit['edits'])
+            if not _PARAGRAPH_SPLIT.fullmatch(piece):
+                paragraph += 1
+            offset += _u16len(piece)
 
-    def _highlight_french_simple(self, original: str, corrected: str) -> str:
-        # Resaltado básico (palabras cambiadas)
-        import difflib
-        diff = difflib.ndiff(original.split(), corrected.split())
-        highlighted = []
-        for word in diff:
-            if word.startswith('- '):
-                highlighted.append(f'<c class="error">{word[2:]}</c>')
-            elif word.startswith('+ '):
-                highlighted.append(f'<span class="correction">{word[2:]}</span>')
-            elif not word.startswith('? '):
-                highlighted.append(word[2:] if word.startswith('  ') else word)
-        return ' '.join(highlighted)
-
-    def _get_edits_french_simple(self, original: str, corrected: str) -> List[Dict]:
-        # Ediciones básicas
-        import difflib
-        edits = []
-        matcher = difflib.SequenceMatcher(None, original.split(), corrected.split())
-        for tag, i1, i2, j1, j2 in matcher.get_opcodes():
-            if tag == 'replace':
-                for a, b in zip(original.split()[i1:i2], corrected.split()[j1:j2]):
-                    edits.append({
-                        "type": "MOD",
-                        "original": a,
-                        "corrected": b,
-                        "start": original.find(a),
-                        "explanation": "Modification suggérée"
-                    })
-        return edits
-
-    def _compute_stats(self, edits: List[Dict], lang: str) -> Dict:
-        total = len(edits)
-        severity = "excellent" if total == 0 else "bon" if total <= 2 else "moyen" if total <= 5 else "à améliorer"
-        if lang == 'en':
-            severity = {"excellent": "excellent", "bon": "good", "moyen": "fair", "à améliorer": "needs work"}.get(severity, severity)
         return {
-            "total_errors": total,
-            "severity": severity,
-            "language_detected": lang
+            "original": text,
+            "corrected": ''.join(corrected),
+            "html": ''.join(html),
+            "edits": edits,
+            "stats": compute_stats(edits, lang),
+            "language": lang,
+            "model": MODEL_NAMES[lang],
+            "units": {"total": sum(k is not None for k in keys), "analyzed": len(missing)},
         }
 
-    def _empty_result(self):
-        return {
-            "original": "", "corrected": "", "html": "", "edits": [], "stats": {}, "language": "", "model": ""
-        }
\ No newline at end of file
+    def _document_language(self, text: str, pieces: List[str], doc_id: str = None) -> str:
+        hashes = {hashlib.sha1(p.encode('utf-8')).hexdigest(): len(p) for p in pieces[::2] if p.strip()}
+        state = self.documents.get(doc_id) if doc_id else None
+        if state is not None:
+            state['drift'] += sum(n for h, n in hashes.items() if h not in state['hashes'])
+            state['hashes'] = hashes
+            self.documents.move_to_end(doc_id)
+            if state['drift'] <= _LANGUAGE_RECHECK_RATIO * len(text):
+                return state['lang']
+        lang = detect_language(text)
+        if doc_id:
+            self.documents[doc_id] = {'lang': lang, 'hashes': hashes, 'drift': 0}
+            while len(self.documents) > self.cache_size:
+                self.documents.popitem(last=False)
+        return lang
+
+    def _remember_unit(self, key: str, result: Dict[str, Any]) -> None:
+        self.units[key] = result
+        self.units.move_to_end(key)
+        while len(self.units) > self.unit_cache_size:
+            self.units.popitem(last=False)
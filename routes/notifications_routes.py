@@ -25,6 +25,7 @@ from flask_login import current_user, login_required
 
 from models.models import Notification, NotificationType, UserNotificationPreference
 from services.notification_service import NotificationService
+from services.pagination import InvalidCursor, Paginator
 from settings.extensions import db, limiter
 
 notifications_bp = Blueprint(
@@ -53,9 +54,14 @@ def index():
         except ValueError:
             pass
 
-    pagination = query.order_by(Notification.created_at.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
+    try:
+        pagination = Paginator.paginate(
+            query, Notification.created_at, Notification.id,
+            cursor=request.args.get('cursor'), page=page, per_page=per_page,
+            scope=f'notifications:{type_filter or ""}',
+        )
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
 
     notifications = [n.to_dict() for n in pagination.items]
     unread_count = NotificationService.get_unread_count(current_user.id)
@@ -65,9 +71,7 @@ def index():
         return jsonify({
             'notifications': notifications,
             'unread_count':  unread_count,
-            'total':         pagination.total,
-            'pages':         pagination.pages,
-            'current_page':  page,
+            **pagination.meta(),
         })
 
     return render_template(
@@ -3,17 +3,22 @@ plagiarism_routes.py — Blueprint for Internet Paste Detection API
 
 Endpoints:
     POST /api/plagiarism/register-paste   Accept paste evidence from student editor
+    POST /api/plagiarism/register-pastes  Same, for a batch of buffered paste events
     GET  /api/plagiarism/document/<id>    Fetch all active evidence for professor review
-    POST /api/plagiarism/revalidate       Mark fragments inactive when text removed from doc
+    POST /api/plagiarism/revalidate       Recompute which fragments are still in the stored document
 """
 
 import uuid
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from flask import Blueprint, request, jsonify, current_app
 from flask_login import current_user
 from settings.extensions import db, csrf
+from models.models import Document, DocumentCollaborator
 from models.paste_evidence import PastedInternetContent
-from services.paste_scorer import score_paste
+from services.paste_presence import PastePresence
+from services.paste_scorer import score_paste, score_pastes
 
 logger = logging.getLogger(__name__)
 
@@ -26,6 +31,12 @@ csrf.exempt(plagiarism_bp)
 _MIN_SCORE_TO_RECORD = 0      # Record all pastes >= MIN_PASTE_CHARS
 _MAX_TEXT_CHARS      = 10_000  # Truncate giant pastes before storage
 _MAX_HTML_CHARS      = 50_000  # Raw clipboard HTML cap
+_MAX_BATCH_EVENTS    = 50      # Paste events accepted per register-pastes call
+_LOOKUP_WORKERS      = 4       # Concurrent search-service lookups (all requests)
+_LOOKUP_TIMEOUT_S    = 5       # Overall budget for the lookups of one request
+
+_lookup_pool: ThreadPoolExecutor | None = None
+_lookup_pool_guard = threading.Lock()
 
 
 def _get_actor_ids():
@@ -46,6 +57,105 @@ def _get_actor_ids():
     return user_id, student_id
 
 
+def _normalize_paste(data: dict):
+    """
+    Clip one paste event from the editor to the storage limits.
+    Returns None for events without text.
+    """
+    pasted_text    = (data.get('pasted_text') or '').strip()
+    clipboard_html = (data.get('clipboard_html') or '')[:_MAX_HTML_CHARS]
+    source_url     = (data.get('source_url') or None)
+
+    if not pasted_text:
+        return None
+
+    return {
+        'pasted_text':    pasted_text[:_MAX_TEXT_CHARS],
+        'clipboard_html': clipboard_html or None,
+        'source_url':     source_url,
+        'paste_uuid':     _paste_uuid(data.get('paste_uuid')),
+    }
+
+
+def _lookup_source_url(pasted_text: str):
+    """
+    Autodetect the source URL of a paste via the search service.
+    (Resolves limitations on Mac/mobile browsers where clipboard data is stripped of SourceURL)
+    """
+    try:
+        from services.search_service import search_service
+        # Clean up query (take first non-empty line, max 100 characters, remove quotes)
+        lines = [l.strip() for l in pasted_text.split('\n') if l.strip()]
+        if not lines:
+            return None
+        query = lines[0].replace('"', '').strip()
+        # Only search for substantial text phrases to prevent API waste
+        if len(query) < 20:
+            return None
+        logger.info('[Plagiarism] Autodetecting source_url for: "%s"', query[:50])
+        organic = search_service.text_search(query[:100]).get('organic_results', [])
+        if organic and isinstance(organic, list):
+            source_url = organic[0].get('link')
+            logger.info('[Plagiarism] Successfully autodetected URL via search: %s', source_url)
+            return source_url
+    except Exception as search_err:
+        logger.warning('[Plagiarism] Failed to autodetect URL via SearchService: %s', search_err)
+    return None
+
+
+def _get_lookup_pool() -> ThreadPoolExecutor:
+    global _lookup_pool
+    with _lookup_pool_guard:
+        if _lookup_pool is None:
+            _lookup_pool = ThreadPoolExecutor(max_workers=_LOOKUP_WORKERS, thread_name_prefix='paste-lookup')
+        return _lookup_pool
+
+
+def _autodetect_sources(pastes: list) -> None:
+    """
+    Fill in source_url for the pastes that came without one. Lookups run
+    concurrently on a shared pool of _LOOKUP_WORKERS threads and the whole
+    set gets _LOOKUP_TIMEOUT_S: pastes still waiting then keep source_url=None.
+    """
+    todo = [p for p in pastes if not p['source_url']]
+    if not todo:
+        return
+    futures = {_get_lookup_pool().submit(_lookup_source_url, p['pasted_text']): p for p in todo}
+    done, pending = wait(futures, timeout=_LOOKUP_TIMEOUT_S)
+    for future in done:
+        futures[future]['source_url'] = future.result()
+    if pending:
+        for future in pending:
+            future.cancel()
+        logger.warning('[Plagiarism] Source lookup timed out for %d of %d pastes', len(pending), len(todo))
+
+
+def _paste_uuid(client_uuid) -> str:
+    """The editor's paste_uuid (what /revalidate reports back) when it is a valid UUID, else a new one."""
+    try:
+        return str(uuid.UUID(str(client_uuid)))
+    except (TypeError, ValueError):
+        return str(uuid.uuid4())
+
+
+def _evidence_row(document_id, paste: dict, result: dict, user_id, student_id) -> dict:
+    """Column values of the PastedInternetContent row for one scored paste."""
+    return {
+        'document_id':         document_id,
+        'user_id':             user_id,
+        'student_id':          student_id,
+        'paste_uuid':          paste['paste_uuid'],
+        'pasted_text':         paste['pasted_text'],
+        'source_url':          result['source_url'],
+        'source_domain':       result['source_domain'],
+        'clipboard_html':      result['clipboard_html_clean'],
+        'internet_copy_score': result['score'],
+        'char_count':          len(paste['pasted_text']),
+        'is_active':           True,
+        'is_removed':          False,
+    }
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # POST /api/plagiarism/register-paste
 # ─────────────────────────────────────────────────────────────────────────────
@@ -59,43 +169,20 @@ def register_paste():
     try:
         data = request.get_json(silent=True) or {}
 
-        document_id    = data.get('document_id')
-        pasted_text    = (data.get('pasted_text') or '').strip()
-        clipboard_html = (data.get('clipboard_html') or '')[:_MAX_HTML_CHARS]
-        source_url     = (data.get('source_url') or None)
+        document_id = data.get('document_id')
+        paste       = _normalize_paste(data) if document_id else None
 
         # Basic validation — fail silently
-        if not document_id or not pasted_text:
+        if paste is None:
             return jsonify({'ok': True}), 200
 
-        pasted_text = pasted_text[:_MAX_TEXT_CHARS]
-
-        # ── Autodetect Source URL via Search Service if not provided ──────────
-        # (Resolves limitations on Mac/mobile browsers where clipboard data is stripped of SourceURL)
-        if not source_url:
-            try:
-                from services.search_service import search_service
-                # Clean up query (take first non-empty line, max 100 characters, remove quotes)
-                lines = [l.strip() for l in pasted_text.split('\n') if l.strip()]
-                if lines:
-                    query = lines[0].replace('"', '').strip()
-                    # Only search for substantial text phrases to prevent API waste
-                    if len(query) >= 20:
-                        logger.info('[Plagiarism] Autodetecting source_url for: "%s"', query[:50])
-                        search_res = search_service.text_search(query[:100])
-                        organic = search_res.get('organic_results', [])
-                        if organic and isinstance(organic, list):
-                            first_match = organic[0]
-                            source_url = first_match.get('link')
-                            logger.info('[Plagiarism] Successfully autodetected URL via search: %s', source_url)
-            except Exception as search_err:
-                logger.warning('[Plagiarism] Failed to autodetect URL via SearchService: %s', search_err)
+        _autodetect_sources([paste])
 
         # ── Heuristic scoring ─────────────────────────────────────────────────
         result = score_paste(
-            pasted_text    = pasted_text,
-            clipboard_html = clipboard_html or None,
-            source_url     = source_url,
+            pasted_text    = paste['pasted_text'],
+            clipboard_html = paste['clipboard_html'],
+            source_url     = paste['source_url'],
         )
 
         if result['score'] < _MIN_SCORE_TO_RECORD:
@@ -105,26 +192,13 @@ def register_paste():
         user_id, student_id = _get_actor_ids()
 
         # ── Persist evidence ──────────────────────────────────────────────────
-        record = PastedInternetContent(
-            document_id         = document_id,
-            user_id             = user_id,
-            student_id          = student_id,
-            paste_uuid          = str(uuid.uuid4()),
-            pasted_text         = pasted_text,
-            source_url          = result['source_url'],
-            source_domain       = result['source_domain'],
-            clipboard_html      = result['clipboard_html_clean'],
-            internet_copy_score = result['score'],
-            char_count          = len(pasted_text),
-            is_active           = True,
-            is_removed          = False,
-        )
+        record = PastedInternetContent(**_evidence_row(document_id, paste, result, user_id, student_id))
         db.session.add(record)
         db.session.commit()
 
         logger.info(
             '[Plagiarism] Paste registered doc=%s score=%d domain=%s chars=%d',
-            document_id, result['score'], result['source_domain'], len(pasted_text)
+            document_id, result['score'], result['source_domain'], len(paste['pasted_text'])
         )
         return jsonify({'ok': True}), 200
 
@@ -134,6 +208,61 @@ def register_paste():
         return jsonify({'ok': True}), 200  # always 200 — stealth
 
 
+# ─────────────────────────────────────────────────────────────────────────────
+# POST /api/plagiarism/register-pastes
+# ─────────────────────────────────────────────────────────────────────────────
+@plagiarism_bp.route('/register-pastes', methods=['POST'])
+def register_pastes():
+    """
+    Batched register-paste: { document_id, events: [{pasted_text, clipboard_html,
+    source_url, paste_uuid}, ...] } as buffered by the student editor.
+    Every event is scored like register-paste; the batch is stored with one
+    multi-row INSERT and one commit. paste_uuids already stored for the
+    document (a retried batch) are skipped; source lookups for the rest run
+    concurrently (_autodetect_sources). Returns 200 regardless of outcome (stealth).
+    """
+    try:
+        data        = request.get_json(silent=True) or {}
+        document_id = data.get('document_id')
+        events      = data.get('events')
+
+        if not document_id or not isinstance(events, list):
+            return jsonify({'ok': True}), 200
+
+        pastes = {}
+        for event in events[:_MAX_BATCH_EVENTS]:
+            paste = _normalize_paste(event) if isinstance(event, dict) else None
+            if paste is not None:
+                pastes.setdefault(paste['paste_uuid'], paste)
+        if pastes:
+            stored = {u for (u,) in db.session.query(PastedInternetContent.paste_uuid)
+                      .filter(PastedInternetContent.document_id == document_id,
+                              PastedInternetContent.paste_uuid.in_(list(pastes)))}
+            pastes = [p for u, p in pastes.items() if u not in stored]
+        if not pastes:
+            return jsonify({'ok': True, 'recorded': 0}), 200
+
+        _autodetect_sources(pastes)
+
+        user_id, student_id = _get_actor_ids()
+        rows = [
+            _evidence_row(document_id, paste, result, user_id, student_id)
+            for paste, result in zip(pastes, score_pastes(pastes))
+            if result['score'] >= _MIN_SCORE_TO_RECORD
+        ]
+        if rows:
+            db.session.execute(db.insert(PastedInternetContent), rows)
+            db.session.commit()
+            logger.info('[Plagiarism] Batch registered doc=%s pastes=%d (of %d events)',
+                        document_id, len(rows), len(events))
+        return jsonify({'ok': True, 'recorded': len(rows)}), 200
+
+    except Exception as exc:
+        logger.exception('[Plagiarism] register-pastes error: %s', exc)
+        db.session.rollback()
+        return jsonify({'ok': True}), 200  # always 200 — stealth
+
+
 # ─────────────────────────────────────────────────────────────────────────────
 # GET /api/plagiarism/document/<doc_id>
 # ─────────────────────────────────────────────────────────────────────────────
@@ -185,38 +314,47 @@ def get_document_evidence(doc_id: int):
 @plagiarism_bp.route('/revalidate', methods=['POST'])
 def revalidate():
     """
-    Called by the student editor's DocumentSyncWatcher.
-    Receives the list of paste_uuids that are NO LONGER present in the document
-    and marks them is_active=False (soft-delete, preserves audit trail).
+    Recompute which pastes are still in the document, from its stored content
+    (services/paste_presence.py — the same check every save runs).
+    Only the document owner or an accepted collaborator may trigger it, and
+    only aggregate counts are returned (no per-paste coverage).
+    Client-reported removed_uuids / still_present are ignored: older editors
+    still send them, but presence is decided on the server.
     """
     try:
-        data             = request.get_json(silent=True) or {}
-        document_id      = data.get('document_id')
-        removed_uuids    = data.get('removed_uuids', [])   # list of paste_uuid strings
-        still_present    = data.get('still_present', [])   # list of paste_uuid strings
+        if not (current_user and current_user.is_authenticated):
+            return jsonify({'ok': False, 'error': 'Unauthorized'}), 401
 
-        if not document_id:
-            return jsonify({'ok': True}), 200
+        data        = request.get_json(silent=True) or {}
+        document_id = data.get('document_id')
 
-        deactivated = 0
-        if removed_uuids:
-            rows = PastedInternetContent.query.filter(
-                PastedInternetContent.document_id == document_id,
-                PastedInternetContent.paste_uuid.in_(removed_uuids),
-                PastedInternetContent.is_active == True,
-            ).all()
-            for row in rows:
-                row.is_active  = False
-                row.is_removed = True
-                deactivated   += 1
-
-        if deactivated:
-            db.session.commit()
-            logger.info('[Plagiarism] Revalidate doc=%s deactivated=%d', document_id, deactivated)
+        doc = db.session.get(Document, document_id) if document_id else None
+        if doc is None or not _can_access_document(doc):
+            return jsonify({'ok': False, 'error': 'Not found'}), 404
+
+        report = PastePresence.refresh_stored(doc)
+        if report is None:
+            return jsonify({'ok': True, 'deactivated': 0, 'reactivated': 0}), 200
 
-        return jsonify({'ok': True, 'deactivated': deactivated}), 200
+        return jsonify({
+            'ok':          True,
+            'checked':     report['checked'],
+            'deactivated': report['deactivated'],
+            'reactivated': report['reactivated'],
+        }), 200
 
     except Exception as exc:
         logger.exception('[Plagiarism] revalidate error: %s', exc)
         db.session.rollback()
         return jsonify({'ok': True}), 200
+
+
+def _can_access_document(doc) -> bool:
+    """Owner of the document or an accepted collaborator on it."""
+    if doc.owner_id == current_user.id:
+        return True
+    return db.session.query(
+        DocumentCollaborator.query.filter_by(
+            document_id=doc.id, user_id=current_user.id, accepted=True
+        ).exists()
+    ).scalar()
@@ -1,14 +1,15 @@
-from flask import Flask, request, session,Blueprint, redirect, url_for, jsonify, render_template
+from flask import Flask, request, session,Blueprint, redirect, url_for, jsonify, render_template, current_app
 import json
 import requests
 import secrets
 import hashlib
 import base64
-from urllib.parse import urlencode, quote
+from urllib.parse import urlencode, quote, unquote
 from datetime import datetime, timedelta
 from models.models import User as Users
 import os
 from functools import wraps
+from werkzeug.wsgi import get_input_stream
 from sqlalchemy import create_engine, Column, Integer, String, Text, DateTime
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, scoped_session
@@ -16,8 +17,6 @@ from sqlalchemy.exc import SQLAlchemyError
 import ssl
 import urllib3
 from settings.config import Config
-from requests.adapters import HTTPAdapter
-from requests.packages.urllib3.util.retry import Retry
 from settings.config import DevelopmentConfig 
 
 # Configurar SSL y requests para evitar problemas de handshake
@@ -30,6 +29,11 @@ x_integ = Blueprint('x_integ', __name__)
 from settings.extensions import csrf
 csrf.exempt(x_integ)
 
+from services.cloud_index import CloudIndex, is_document
+from services.cloud_transfer import CloudTransfer
+from services.oauth_tokens import TokenManager, provider_http
+from services.pagination import LEGACY_LIST_LIMIT, InvalidCursor
+
 # Configuración de base de datos SQLAlchemy
 DATABASE_URL = DevelopmentConfig.SQLALCHEMY_DATABASE_URI #'mysql+pymysql://root:@localhost/xplagiax_db'
 # Para SQLite: DATABASE_URL = 'sqlite:///storage_integration.db'
@@ -42,7 +46,8 @@ OAUTH_CONFIG = {
         'authorization_url': 'https://login.microsoftonline.com/common/oauth2/v2.0/authorize',
         'token_url': 'https://login.microsoftonline.com/common/oauth2/v2.0/token',
         'scope': 'https://graph.microsoft.com/Files.ReadWrite offline_access',
-        'api_base': 'https://graph.microsoft.com/v1.0'
+        'api_base': 'https://graph.microsoft.com/v1.0',
+        'content_base': 'https://graph.microsoft.com/v1.0'
     },
     'google_drive': {
         'client_id': '121671119534-92uo2m1vpju3m3msh74jcf389nqhif4r.apps.googleusercontent.com',
@@ -50,7 +55,8 @@ OAUTH_CONFIG = {
         'authorization_url': 'https://accounts.google.com/o/oauth2/v2/auth',
         'token_url': 'https://oauth2.googleapis.com/token',
         'scope': 'https://www.googleapis.com/auth/drive.file https://www.googleapis.com/auth/drive.metadata.readonly',
-        'api_base': 'https://www.googleapis.com/drive/v3'
+        'api_base': 'https://www.googleapis.com/drive/v3',
+        'content_base': 'https://www.googleapis.com/upload/drive/v3'
     },
     'dropbox': {
         'client_id': 'uksuctfs3bvxl9o',
@@ -58,7 +64,8 @@ OAUTH_CONFIG = {
         'authorization_url': 'https://www.dropbox.com/oauth2/authorize',
         'token_url': 'https://api.dropboxapi.com/oauth2/token',
         'scope': 'account_info.read files.metadata.read files.content.read files.content.write',
-        'api_base': 'https://api.dropboxapi.com/2'
+        'api_base': 'https://api.dropboxapi.com/2',
+        'content_base': 'https://content.dropboxapi.com/2'
     },
     'box': {
         'client_id': '2exf4vhqo7jozfhrxt3grl885ltm36c1',
@@ -66,7 +73,8 @@ OAUTH_CONFIG = {
         'authorization_url': 'https://account.box.com/api/oauth2/authorize',
         'token_url': 'https://api.box.com/oauth2/token',
         'scope': 'root_readwrite',
-        'api_base': 'https://api.box.com/2.0'
+        'api_base': 'https://api.box.com/2.0',
+        'content_base': 'https://upload.box.com/api/2.0'
     }
 }
 
@@ -75,31 +83,8 @@ engine = create_engine(DATABASE_URL, echo=False)
 db_session = scoped_session(sessionmaker(bind=engine))
 Base = declarative_base()
 
-# Configurar adaptador HTTP con reintentos y configuración SSL mejorada
-def create_requests_session():
-    """Crear sesión de requests con configuración SSL optimizada"""
-    sess = requests.Session()
-    
-    # Configurar reintentos
-    retry_strategy = Retry(
-        total=3,
-        backoff_factor=1,
-        status_forcelist=[429, 500, 502, 503, 504],
-    )
-    
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    sess.mount("http://", adapter)
-    sess.mount("https://", adapter)
-    
-    # Headers para evitar problemas de user-agent
-    sess.headers.update({
-        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
-    })
-    
-    return sess
-
-# Crear sesión global HTTP
-http_session = create_requests_session()
+# Sesión HTTP global, con pool, compartida con la renovación de tokens (services/oauth_tokens.py)
+http_session = provider_http
 
 def make_secure_request(method, url, **kwargs):
     """Realizar petición HTTP con manejo mejorado de SSL"""
@@ -127,35 +112,12 @@ def login_required(f):
     return decorated_function
 
 def get_user_tokens(user_id):
-    """Obtener tokens del usuario desde la base de datos"""
-    try:
-        user = db_session.query(Users).filter_by(id=user_id).first()
-        
-        if user and user.tokens:
-            return json.loads(user.tokens)
-        return {}
-    except SQLAlchemyError as e:
-        print(f"Error obteniendo tokens: {e}")
-        db_session.rollback()
-        return {}
+    """Obtener tokens del usuario (decodificados, de la caché del worker; ver services/oauth_tokens.py)"""
+    return TokenManager.get_all(user_id)
 
 def save_user_tokens(user_id, tokens):
-    """Guardar tokens del usuario en la base de datos"""
-    try:
-        user = db_session.query(Users).filter_by(id=user_id).first()
-        
-        if user:
-            user.tokens = json.dumps(tokens)
-            user.updated_at = datetime.utcnow()
-            db_session.commit()
-            return True
-        else:
-            print(f"Usuario con ID {user_id} no encontrado")
-            return False
-    except SQLAlchemyError as e:
-        print(f"Error guardando tokens: {e}")
-        db_session.rollback()
-        return False
+    """Guardar todos los tokens del usuario (para un solo proveedor: TokenManager.set / remove)"""
+    return TokenManager.replace_all(user_id, tokens)
 
 def create_user(username, email):
     """Crear un nuevo usuario"""
@@ -180,84 +142,7 @@ def get_user_by_id(user_id):
 # Función específica para cada proveedor
 def filter_documents_by_provider(files, provider):
     """Filtrar documentos considerando las particularidades de cada proveedor"""
-    
-    document_extensions = {'.pdf', '.doc', '.docx', '.txt', '.epub', '.ppt', '.pptx', '.rtf', '.mobi'}
-    
-    # MIME types específicos por proveedor
-    provider_mime_types = {
-        'google_drive': {
-            'application/pdf',
-            'application/msword',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'text/plain',
-            'application/vnd.ms-powerpoint',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'application/vnd.google-apps.document',  # Google Docs
-            'application/vnd.google-apps.presentation',  # Google Slides
-            'application/rtf',
-            'text/rtf'
-        },
-        'dropbox': {
-            'application/pdf',
-            'application/msword',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'text/plain',
-            'application/vnd.ms-powerpoint',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'application/rtf',
-            'text/rtf'
-        },
-        'box': {
-            'file',  # Box usa 'file' como tipo genérico
-            'application/pdf',
-            'application/msword',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'text/plain',
-            'application/vnd.ms-powerpoint',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation',
-            'application/rtf'
-        },
-        'onedrive': {
-             'file',  # Yandex usa 'file' como tipo genérico
-            'application/pdf',
-            'application/msword',
-            'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
-            'text/plain',
-            'application/vnd.ms-powerpoint',
-            'application/vnd.openxmlformats-officedocument.presentationml.presentation'
-        }
-    }
-    
-    allowed_mime_types = provider_mime_types.get(provider, set())
-    filtered_files = []
-    
-    for file in files:
-        is_document = False
-        
-        # Verificar por extensión (principal método para pCloud, Yandex, MEGA)
-        if 'name' in file and file['name']:
-            file_name = file['name'].lower()
-            if any(file_name.endswith(ext) for ext in document_extensions):
-                is_document = True
-        
-        # Verificar por MIME type (más preciso para Google Drive y Dropbox)
-        if 'type' in file and file['type']:
-            if file['type'] in allowed_mime_types:
-                is_document = True
-                
-        # Caso especial para proveedores que usan 'file' genérico
-        if provider in ['box', 'pcloud', 'yandex', 'mega']:
-            if 'type' in file and file['type'] == 'file':
-                # Para estos proveedores, si es 'file', verificar extensión
-                if 'name' in file and file['name']:
-                    file_name = file['name'].lower()
-                    if any(file_name.endswith(ext) for ext in document_extensions):
-                        is_document = True
-        
-        if is_document:
-            filtered_files.append(file)
-    
-    return filtered_files
+    return [file for file in files if is_document(file, provider)]
 
 @x_integ.route('/storage/connect/<provider>')
 @login_required
@@ -349,19 +234,15 @@ def oauth_callback(provider):
         if 'user_id' not in session:
             session['user_id'] = 1  # ID temporal para pruebas
         
-        # Obtener tokens existentes del usuario
-        user_tokens = get_user_tokens(session['user_id'])
-        
-        # Agregar nuevos tokens
-        user_tokens[provider] = {
+        # Guardar sólo la entrada de este proveedor (no pisa a los demás)
+        token_info = {
             'access_token': tokens['access_token'],
             'refresh_token': tokens.get('refresh_token'),
             'expires_at': (datetime.now() + timedelta(seconds=tokens.get('expires_in', 3600))).isoformat(),
             'connected_at': datetime.now().isoformat()
         }
         
-        # Guardar en base de datos
-        if save_user_tokens(session['user_id'], user_tokens):
+        if TokenManager.set(session['user_id'], provider, token_info):
             # Limpiar session
             session.pop(f'{provider}_state', None)
             session.pop(f'{provider}_provider', None)
@@ -388,9 +269,8 @@ def disconnect_storage(provider):
     user_tokens = get_user_tokens(session['user_id'])
     
     if provider in user_tokens:
-        del user_tokens[provider]
-        
-        if save_user_tokens(session['user_id'], user_tokens):
+        if TokenManager.remove(session['user_id'], provider):
+            CloudIndex.drop(session['user_id'], provider)
             return jsonify({'success': True, 'message': f'{provider} desconectado'})
         else:
             return jsonify({'error': 'Error desconectando proveedor'}), 500
@@ -961,18 +841,32 @@ def get_storage_files(provider):
         token_info = user_tokens[provider]
     
     try:
-        all_files = fetch_files_from_provider(provider, token_info['access_token'])
-        print(f"DEBUG - Total files from {provider}: {len(all_files)}")
-        
-        # Log some file info for debugging
-        for f in all_files[:5]:  # First 5 files
-            print(f"DEBUG - File: {f.get('name')} | Type: {f.get('type')}")
-        
-        # Filtrar solo documentos
-        document_files = filter_documents_by_provider(all_files, provider)
-        print(f"DEBUG - Filtered document files: {len(document_files)}")
-
-        return jsonify({'files': document_files})
+        if not CloudIndex.supports(provider):
+            # Box: sin feed de cambios implementado, listado en vivo
+            all_files = fetch_files_from_provider(provider, token_info['access_token'])
+            return jsonify({'files': filter_documents_by_provider(all_files, provider)})
+
+        # Índice local: se construye una vez y se mantiene con el feed de cambios
+        state = CloudIndex.ensure_fresh(
+            session['user_id'], provider, token_info['access_token'],
+            OAUTH_CONFIG[provider]['api_base'], force=request.args.get('refresh') == '1',
+        )
+        if state is None:
+            return jsonify({'error': 'Indexando archivos, reintente en unos segundos', 'indexing': True}), 503
+
+        extensions = [e for e in request.args.get('ext', '').split(',') if e.strip()]
+        files = CloudIndex.list_files(
+            session['user_id'], provider,
+            q=(request.args.get('q') or '').strip()[:200] or None,
+            extensions=extensions or None,
+            cursor=request.args.get('cursor'),
+            page=request.args.get('page', 1, type=int),
+            per_page=request.args.get('per_page', LEGACY_LIST_LIMIT, type=int),
+            max_per_page=LEGACY_LIST_LIMIT,
+        )
+        return jsonify({'files': [f.to_dict() for f in files.items], **files.meta()})
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error obteniendo archivos de {provider}: {e}")
         import traceback
@@ -1148,17 +1042,41 @@ def delete_cloud_folder(provider):
 @x_integ.route('/storage/file/upload/<provider>', methods=['POST'])
 @login_required
 def upload_cloud_file(provider):
-    """Subir archivo a cloud storage"""
+    """
+    Subir archivo a cloud storage.
+
+    Dos formatos: multipart/form-data (campo 'file', 'parent_id'), limitado
+    por MAX_CONTENT_LENGTH, o el archivo como cuerpo crudo
+    (application/octet-stream, nombre en X-File-Name codificado como URI,
+    ?parent_id=), que se reenvía al proveedor en streaming hasta
+    CLOUD_UPLOAD_MAX_BYTES sin pasar por disco ni por memoria.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Usuario no autenticado'}), 401
     
-    if 'file' not in request.files:
-        return jsonify({'error': 'Archivo no proporcionado'}), 400
-    
-    file = request.files['file']
-    parent_id = request.form.get('parent_id')  # None = root
-    
-    if not file.filename:
+    if request.mimetype == 'multipart/form-data':
+        if 'file' not in request.files:
+            return jsonify({'error': 'Archivo no proporcionado'}), 400
+        file = request.files['file']
+        parent_id = request.form.get('parent_id')  # None = root
+        filename = file.filename
+        stream = file.stream              # werkzeug lo vuelca a disco por encima de 500 KB
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+    else:
+        filename = unquote(request.headers.get('X-File-Name') or request.args.get('filename') or '')
+        parent_id = request.args.get('parent_id')  # None = root
+        size = request.content_length
+        if size is None:
+            return jsonify({'error': 'Content-Length requerido'}), 411
+        max_bytes = current_app.config.get('CLOUD_UPLOAD_MAX_BYTES')
+        if max_bytes and size > max_bytes:
+            return jsonify({'error': f'Archivo demasiado grande (máx. {max_bytes // (1024 * 1024)} MB)'}), 413
+        # No request.stream: aplicaría MAX_CONTENT_LENGTH (16 MB) a este cuerpo también
+        stream = get_input_stream(request.environ, max_content_length=max_bytes)
+    
+    if not filename:
         return jsonify({'error': 'Nombre de archivo vacío'}), 400
     
     user_tokens = get_user_tokens(session['user_id'])
@@ -1173,7 +1091,7 @@ def upload_cloud_file(provider):
         token_info = user_tokens[provider]
     
     try:
-        result = cloud_upload_file(provider, token_info['access_token'], file, parent_id)
+        result = cloud_upload_file(provider, token_info['access_token'], stream, size, filename, parent_id)
         return jsonify(result)
     except Exception as e:
         print(f"Error subiendo archivo a {provider}: {e}")
@@ -1330,51 +1248,18 @@ def move_cloud_file(provider):
         return jsonify({'error': str(e)}), 500
 
 def is_token_expired(token_info):
-    """Verificar si un token ha expirado"""
-    if 'expires_at' not in token_info:
-        return False
-    
-    expires_at = datetime.fromisoformat(token_info['expires_at'])
-    return datetime.now() >= expires_at
+    """Verificar si un token ha expirado o expira en los próximos minutos (se renueva antes)"""
+    return TokenManager.needs_refresh(token_info)
 
 def refresh_access_token(user_id, provider):
-    """Renovar access token usando refresh token"""
+    """
+    Renovar access token usando refresh token. Una sola renovación por
+    (usuario, proveedor) aunque lleguen muchas peticiones a la vez; True si
+    queda un token utilizable.
+    """
     if provider not in OAUTH_CONFIG:
         return False
-    
-    user_tokens = get_user_tokens(user_id)
-    if provider not in user_tokens or 'refresh_token' not in user_tokens[provider]:
-        return False
-    
-    config = OAUTH_CONFIG[provider]
-    refresh_token = user_tokens[provider]['refresh_token']
-    
-    token_data = {
-        'grant_type': 'refresh_token',
-        'refresh_token': refresh_token,
-        'client_id': config['client_id'],
-        'client_secret': config['client_secret']
-    }
-    
-    try:
-        response = make_secure_request('POST', config['token_url'], data=token_data)
-        response.raise_for_status()
-        tokens = response.json()
-        
-        # Actualizar tokens
-        user_tokens[provider]['access_token'] = tokens['access_token']
-        user_tokens[provider]['expires_at'] = (
-            datetime.now() + timedelta(seconds=tokens.get('expires_in', 3600))
-        ).isoformat()
-        
-        if 'refresh_token' in tokens:
-            user_tokens[provider]['refresh_token'] = tokens['refresh_token']
-        
-        return save_user_tokens(user_id, user_tokens)
-        
-    except requests.RequestException as e:
-        print(f"Error renovando token para {provider}: {e}")
-        return False
+    return TokenManager.refresh(user_id, provider, OAUTH_CONFIG[provider])
 
 # ============================================================
 # CLOUD STORAGE HELPER FUNCTIONS
@@ -1619,152 +1504,23 @@ def cloud_restore_item(provider, access_token, item_id):
     
     return {'error': 'Provider not supported'}
 
-def cloud_upload_file(provider, access_token, file, parent_id=None):
-    """Subir archivo a cloud storage"""
-    headers = {'Authorization': f'Bearer {access_token}'}
-    file_content = file.read()
-    filename = file.filename
-    
-    if provider == 'google_drive':
-        # Simple upload for files < 5MB
-        boundary = '-------314159265358979323846'
-        metadata = {'name': filename}
-        if parent_id:
-            metadata['parents'] = [parent_id]
-        
-        body = (
-            f'--{boundary}\r\n'
-            f'Content-Type: application/json; charset=UTF-8\r\n\r\n'
-            f'{json.dumps(metadata)}\r\n'
-            f'--{boundary}\r\n'
-            f'Content-Type: application/octet-stream\r\n\r\n'
-        ).encode('utf-8') + file_content + f'\r\n--{boundary}--'.encode('utf-8')
-        
-        url = 'https://www.googleapis.com/upload/drive/v3/files?uploadType=multipart'
-        response = requests.post(url, headers={
-            **headers,
-            'Content-Type': f'multipart/related; boundary={boundary}'
-        }, data=body)
-        response.raise_for_status()
-        data = response.json()
-        return {'success': True, 'file': {'id': data['id'], 'name': data.get('name', filename)}}
-    
-    elif provider == 'dropbox':
-        url = 'https://content.dropboxapi.com/2/files/upload'
-        path = f"{parent_id or ''}/{filename}"
-        if not path.startswith('/'):
-            path = '/' + path
-        
-        response = requests.post(url, headers={
-            **headers,
-            'Content-Type': 'application/octet-stream',
-            'Dropbox-API-Arg': json.dumps({'path': path, 'mode': 'add', 'autorename': True})
-        }, data=file_content)
-        response.raise_for_status()
-        data = response.json()
-        return {'success': True, 'file': {'id': data['id'], 'name': data['name']}}
-    
-    elif provider == 'box':
-        url = 'https://upload.box.com/api/2.0/files/content'
-        attributes = json.dumps({'name': filename, 'parent': {'id': parent_id or '0'}})
-        
-        response = requests.post(url, headers=headers, files={
-            'attributes': (None, attributes),
-            'file': (filename, file_content)
-        })
-        response.raise_for_status()
-        data = response.json()
-        entry = data['entries'][0] if data.get('entries') else {}
-        return {'success': True, 'file': {'id': entry.get('id'), 'name': entry.get('name', filename)}}
-    
-    elif provider == 'onedrive':
-        if parent_id:
-            url = f"{OAUTH_CONFIG[provider]['api_base']}/me/drive/items/{parent_id}:/{filename}:/content"
-        else:
-            url = f"{OAUTH_CONFIG[provider]['api_base']}/me/drive/root:/{filename}:/content"
-        
-        response = requests.put(url, headers={
-            **headers,
-            'Content-Type': 'application/octet-stream'
-        }, data=file_content)
-        response.raise_for_status()
-        data = response.json()
-        return {'success': True, 'file': {'id': data['id'], 'name': data.get('name', filename)}}
-    
-    return {'error': 'Provider not supported'}
+def cloud_upload_file(provider, access_token, stream, size, filename, parent_id=None):
+    """Subir archivo a cloud storage (en streaming; ver services/cloud_transfer.py)"""
+    if not CloudTransfer.supports(provider):
+        return {'error': 'Provider not supported'}
+    config = OAUTH_CONFIG[provider]
+    return CloudTransfer.upload(provider, access_token, stream, size, filename, parent_id,
+                                api_base=config['api_base'], content_base=config['content_base'])
 
 def cloud_download_file(provider, access_token, file_id):
-    """Descargar archivo de cloud storage"""
-    from flask import Response
-    headers = {'Authorization': f'Bearer {access_token}'}
-    
-    if provider == 'google_drive':
-        # Get file metadata first
-        meta_url = f"{OAUTH_CONFIG[provider]['api_base']}/files/{file_id}"
-        meta_response = make_secure_request('GET', meta_url, headers=headers, params={'fields': 'name,mimeType'})
-        meta_response.raise_for_status()
-        meta = meta_response.json()
-        
-        # Download content
-        url = f"{OAUTH_CONFIG[provider]['api_base']}/files/{file_id}?alt=media"
-        response = requests.get(url, headers=headers, stream=True)
-        response.raise_for_status()
-        
-        return Response(
-            response.iter_content(chunk_size=8192),
-            headers={
-                'Content-Disposition': f'attachment; filename="{meta.get("name", "download")}"',
-                'Content-Type': meta.get('mimeType', 'application/octet-stream')
-            }
-        )
-    
-    elif provider == 'dropbox':
-        url = 'https://content.dropboxapi.com/2/files/download'
-        response = requests.post(url, headers={
-            **headers,
-            'Dropbox-API-Arg': json.dumps({'path': file_id})
-        }, stream=True)
-        response.raise_for_status()
-        
-        # Get filename from API response header
-        api_result = json.loads(response.headers.get('Dropbox-API-Result', '{}'))
-        filename = api_result.get('name', 'download')
-        
-        return Response(
-            response.iter_content(chunk_size=8192),
-            headers={
-                'Content-Disposition': f'attachment; filename="{filename}"',
-                'Content-Type': 'application/octet-stream'
-            }
-        )
-    
-    elif provider == 'box':
-        url = f"{OAUTH_CONFIG[provider]['api_base']}/files/{file_id}/content"
-        response = requests.get(url, headers=headers, stream=True, allow_redirects=True)
-        response.raise_for_status()
-        
-        return Response(
-            response.iter_content(chunk_size=8192),
-            headers={
-                'Content-Disposition': 'attachment; filename="download"',
-                'Content-Type': 'application/octet-stream'
-            }
-        )
-    
-    elif provider == 'onedrive':
-        url = f"{OAUTH_CONFIG[provider]['api_base']}/me/drive/items/{file_id}/content"
-        response = requests.get(url, headers=headers, stream=True, allow_redirects=True)
-        response.raise_for_status()
-        
-        return Response(
-            response.iter_content(chunk_size=8192),
-            headers={
-                'Content-Disposition': 'attachment; filename="download"',
-                'Content-Type': 'application/octet-stream'
-            }
-        )
-    
-    return jsonify({'error': 'Provider not supported'}), 400
+    """Descargar archivo de cloud storage (en streaming, con Range)"""
+    if not CloudTransfer.supports(provider):
+        return jsonify({'error': 'Provider not supported'}), 400
+    config = OAUTH_CONFIG[provider]
+    return CloudTransfer.download(provider, access_token, file_id,
+                                  api_base=config['api_base'], content_base=config['content_base'],
+                                  range_header=request.headers.get('Range'),
+                                  if_range=request.headers.get('If-Range'))
 
 def fetch_folder_content(provider, access_token, folder_id=None):
     """Obtener contenido de una carpeta específica (carpetas y archivos filtrados)"""
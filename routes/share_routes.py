@@ -453,6 +453,7 @@ def get_shared_document_data(share_token):
             'title': doc.title,
             'delta': delta,
             'html': html,
+            'html_stale': doc.html_stale,   # html sin los últimos parches: usar delta
             'storage_type': doc.storage_type,
             'size_bytes': doc.size_bytes,
             'created_at': doc.created_at.isoformat(),
@@ -1,15 +1,14 @@
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 import os
-import uuid
 from datetime import datetime
 
 from settings.extensions import db, limiter, logger
 from flask_login import login_required, current_user
 from models.models import Document, User, DocumentActivity
 from settings.utils import (
-    allowed_file, generate_safe_filename, process_docx_upload,
-    get_content_size, validate_email
+    allowed_file, process_docx_upload,
+    get_content_size, serialize_delta, validate_email
 )
 
 upload_bp = Blueprint('upload', __name__)
@@ -63,100 +62,100 @@ def upload_document():
     
     # Generar nombre seguro para el archivo
     original_filename = secure_filename(file.filename)
-    safe_filename = generate_safe_filename(original_filename)
     
-    # Guardar archivo temporalmente
-    upload_folder = current_app.config['UPLOAD_FOLDER']
-    os.makedirs(upload_folder, exist_ok=True)
+    # El stream del upload se convierte directamente (sin archivo temporal);
+    # los archivos grandes se convierten fuera del hub de eventlet.
+    offload = file_size > current_app.config['DOCX_IMPORT_OFFLOAD_BYTES']
     
-    temp_file_path = os.path.join(upload_folder, safe_filename)
-    file.save(temp_file_path)
+    # Procesar archivo según extensión
+    file_ext = original_filename.rsplit('.', 1)[1].lower()
     
-    try:
-        # Procesar archivo según extensión
-        file_ext = original_filename.rsplit('.', 1)[1].lower()
-        
-        if file_ext in ['docx', 'doc']:
-            delta, html, error = process_docx_upload(temp_file_path)
-            
-            if error:
-                return jsonify({'error': f'Error procesando documento: {error}'}), 400
-            
-            if not delta or not html:
-                return jsonify({'error': 'No se pudo extraer contenido del documento'}), 400
-        
-        else:
-            return jsonify({'error': 'Formato de archivo no soportado'}), 400
-        
-        # Determinar título del documento
-        if custom_title:
-            doc_title = custom_title
-        else:
-            # Usar nombre del archivo sin extensión
-            doc_title = original_filename.rsplit('.', 1)[0]
-        
-        # Crear documento en la base de datos
-        doc = Document(
-            title=doc_title,
-            document_type='uploaded',
-            original_filename=original_filename,
-            mime_type=f'application/vnd.openxmlformats-officedocument.wordprocessingml.document' if file_ext == 'docx' else 'application/msword',
-            owner_id=current_user.id,
-            folder_id=folder_id
-        )
-        
-        # Calcular tamaño del contenido
-        content_size = get_content_size(delta, html)
-        doc.size_bytes = content_size
-        
-        # Decidir almacenamiento
-        if content_size <= current_app.config['MAX_DB_SIZE']:
-            # Guardar en base de datos
-            import json
-            doc.content_delta = json.dumps(delta)
-            doc.content_html = html
-            doc.storage_type = 'database'
-        else:
-            # Guardar en Minio
-            from settings.utils import save_to_minio_compressed
-            minio_path = save_to_minio_compressed(delta, html)
-            doc.minio_path = minio_path
-            doc.storage_type = 'minio'
-        
-        db.session.add(doc)
-        db.session.commit()
-        
-        # Registrar actividad
-        DocumentActivity.log_activity(
-            doc.id, 
-            current_user.email, 
-            'uploaded', 
-            f'Documento "{original_filename}" subido y convertido',
-            request
-        )
+    if file_ext in ['docx', 'doc']:
+        delta, html, error = process_docx_upload(file.stream, offload=offload)
         
-        logger.info(f"Documento subido: ID {doc.id}, archivo: {original_filename}, tamaño: {content_size}")
+        if error:
+            return jsonify({'error': f'Error procesando documento: {error}'}), 400
         
-        return jsonify({
-            'id': doc.id,
-            'title': doc.title,
-            'original_filename': original_filename,
-            'document_type': 'uploaded',
-            'storage_type': doc.storage_type,
-            'size_bytes': content_size,
-            'created_at': doc.created_at.isoformat(),
-            'owner_id': current_user.id,
-            'message': f'Documento "{original_filename}" subido y convertido exitosamente'
-        })
-        
-    finally:
-        # Limpiar archivo temporal
-        try:
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-        except:
-            pass
+        if not delta or not html:
+            return jsonify({'error': 'No se pudo extraer contenido del documento'}), 400
         
+        if offload:
+            # Las imágenes se guardaron en otra sesión: cerrar la transacción
+            # (snapshot REPEATABLE READ) para que add_refs las vea
+            db.session.commit()
+    
+    else:
+        return jsonify({'error': 'Formato de archivo no soportado'}), 400
+    
+    # Determinar título del documento
+    if custom_title:
+        doc_title = custom_title
+    else:
+        # Usar nombre del archivo sin extensión
+        doc_title = original_filename.rsplit('.', 1)[0]
+    
+    # Crear documento en la base de datos
+    doc = Document(
+        title=doc_title,
+        document_type='uploaded',
+        original_filename=original_filename,
+        mime_type=f'application/vnd.openxmlformats-officedocument.wordprocessingml.document' if file_ext == 'docx' else 'application/msword',
+        owner_id=current_user.id,
+        folder_id=folder_id
+    )
+    
+    # Calcular tamaño del contenido
+    delta_json, doc.content_hash = serialize_delta(delta)
+    content_size = get_content_size(delta, html, delta_json)
+    doc.size_bytes = content_size
+    
+    # Decidir almacenamiento
+    if content_size <= current_app.config['MAX_DB_SIZE']:
+        # Guardar en base de datos
+        doc.content_delta = delta_json
+        doc.content_html = html
+        doc.storage_type = 'database'
+    else:
+        # Guardar en Minio
+        from settings.utils import save_to_minio_compressed
+        minio_path = save_to_minio_compressed(delta, html)
+        doc.minio_path = minio_path
+        doc.storage_type = 'minio'
+    
+    db.session.add(doc)
+    db.session.flush()
+    # Refs de las imágenes importadas en la misma transacción: sin ellas el
+    # GC borra las imágenes de un documento que nunca se edita
+    from services.image_store import ImageStore
+    ImageStore.add_refs(doc.id, delta)
+    db.session.commit()
+
+    from services.search_index import SearchIndex
+    SearchIndex.mark_dirty(doc.id)
+    
+    # Registrar actividad
+    DocumentActivity.log_activity(
+        doc.id, 
+        current_user.email, 
+        'uploaded', 
+        f'Documento "{original_filename}" subido y convertido',
+        request
+    )
+    
+    logger.info(f"Documento subido: ID {doc.id}, archivo: {original_filename}, tamaño: {content_size}")
+    
+    return jsonify({
+        'id': doc.id,
+        'title': doc.title,
+        'original_filename': original_filename,
+        'document_type': 'uploaded',
+        'storage_type': doc.storage_type,
+        'size_bytes': content_size,
+        'created_at': doc.created_at.isoformat(),
+        'owner_id': current_user.id,
+        'message': f'Documento "{original_filename}" subido y convertido exitosamente'
+    })
+    
     #except Exception as e:
     #    logger.error(f"Error subiendo documento: {e}")
     #    return jsonify({'error': 'Error procesando archivo'}), 500
@@ -177,9 +176,7 @@ def upload_image():
         return jsonify({'error': 'Formato de imagen no soportado'}), 400
     
     try:
-        from settings.utils import optimize_image
-        from settings.extensions import minio_client
-        from io import BytesIO
+        from settings.utils import upload_image_bytes
         
         image_bytes = file.read()
         if not image_bytes:
@@ -187,43 +184,12 @@ def upload_image():
             
         file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'png'
         
-        # Generar nombre único
-        filename = f"{uuid.uuid4()}.{file_ext}"
-        
-        logger.info(f"[UploadImage] Procesando imagen: {filename}, tamaño: {len(image_bytes)}")
-        
-        # Optimizar imagen
-        try:
-            optimized_bytes = optimize_image(image_bytes, file_ext)
-        except Exception as opt_err:
-            logger.warning(f"Error optimizando imagen, usando original: {opt_err}")
-            optimized_bytes = image_bytes
+        logger.info(f"[UploadImage] Procesando imagen: {file.filename}, tamaño: {len(image_bytes)}")
         
-        # Intentar subir a SeaweedFS con timeout corto
-        try:
-            # Subir a SeaweedFS
-            minio_client.put_object(
-                bucket_name='images',
-                object_name=filename,
-                data=BytesIO(optimized_bytes),
-                length=len(optimized_bytes),
-                content_type=f'image/{file_ext}'
-            )
-            logger.info(f"[UploadImage] Imagen subida a SeaweedFS: {filename}")
-        except Exception as minio_err:
-            logger.warning(f"[UploadImage] SeaweedFS no disponible, usando almacenamiento local: {minio_err}")
-            
-            # Almacenamiento local fallback
-            from flask import current_app
-            upload_folder = current_app.config['UPLOAD_FOLDER']
-            images_dir = os.path.join(upload_folder, 'images')
-            os.makedirs(images_dir, exist_ok=True)
-            
-            local_path = os.path.join(images_dir, filename)
-            with open(local_path, 'wb') as f:
-                f.write(optimized_bytes)
-            
-            logger.info(f"[UploadImage] Imagen guardada localmente: {local_path}")
+        # Almacén por contenido: una imagen repetida reutiliza el mismo objeto
+        # (optimización + subida + fallback local dentro de ImageStore.store)
+        filename = upload_image_bytes(image_bytes, file_ext).rsplit('/', 1)[-1]
+        db.session.commit()
         
         # Retornar URL que apunta al serve_image en document_bp
         url = f"/api/image/{filename}"
@@ -236,6 +202,7 @@ def upload_image():
         })
         
     except Exception as e:
+        db.session.rollback()
         logger.exception(f"Error crítico en subida de imagen: {e}")
         return jsonify({'error': f'Error interno: {str(e)}'}), 500
 
@@ -284,109 +251,92 @@ def replace_document_content(doc_id):
                 'error': f'Archivo demasiado grande. Máximo {max_size_mb:.1f}MB'
             }), 400
         
+        # Procesar archivo (stream directo, sin archivo temporal)
+        original_filename = secure_filename(file.filename)
+        offload = file_size > current_app.config['DOCX_IMPORT_OFFLOAD_BYTES']
+        
+        # Procesar contenido
+        file_ext = original_filename.rsplit('.', 1)[1].lower()
+        
+        if file_ext in ['docx', 'doc']:
+            delta, html, error = process_docx_upload(file.stream, offload=offload)
+            
+            if error:
+                return jsonify({'error': f'Error procesando documento: {error}'}), 400
+            
+            if offload:
+                # Las imágenes se guardaron en otra sesión: cerrar la transacción
+                # (snapshot REPEATABLE READ) para que add_refs las vea
+                db.session.commit()
+        else:
+            return jsonify({'error': 'Formato no soportado'}), 400
+        
         # Crear respaldo de versión actual
         from settings.utils import create_version_backup
         create_version_backup(doc)
         
-        # Procesar archivo
-        original_filename = secure_filename(file.filename)
-        safe_filename = generate_safe_filename(original_filename)
+        # Actualizar documento
+        if not keep_title:
+            doc.title = original_filename.rsplit('.', 1)[0]
         
-        upload_folder = current_app.config['UPLOAD_FOLDER']
-        temp_file_path = os.path.join(upload_folder, safe_filename)
-        file.save(temp_file_path)
+        doc.original_filename = original_filename
+        doc.mime_type = f'application/vnd.openxmlformats-officedocument.wordprocessingml.document' if file_ext == 'docx' else 'application/msword'
+        doc.document_type = 'uploaded'
+        doc.updated_at = datetime.utcnow()
+        doc.version_number += 1
         
-        try:
-            # Procesar contenido
-            file_ext = original_filename.rsplit('.', 1)[1].lower()
-            
-            if file_ext in ['docx', 'doc']:
-                delta, html, error = process_docx_upload(temp_file_path)
-                
-                if error:
-                    return jsonify({'error': f'Error procesando documento: {error}'}), 400
-            else:
-                return jsonify({'error': 'Formato no soportado'}), 400
-            
-            # Actualizar documento
-            if not keep_title:
-                doc.title = original_filename.rsplit('.', 1)[0]
-            
-            doc.original_filename = original_filename
-            doc.mime_type = f'application/vnd.openxmlformats-officedocument.wordprocessingml.document' if file_ext == 'docx' else 'application/msword'
-            doc.document_type = 'uploaded'
-            doc.updated_at = datetime.utcnow()
-            doc.version_number += 1
-            
-            # Actualizar contenido
-            content_size = get_content_size(delta, html)
-            doc.size_bytes = content_size
-            
-            # Limpiar almacenamiento anterior si estaba en Minio
-            if doc.minio_path:
-                try:
-                    from settings.extensions import minio_client
-                    if doc.minio_path.startswith('local://'):
-                        import os
-                        real_filename = doc.minio_path.replace('local://', '')
-                        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-                        local_path = os.path.join(upload_folder, 'documents', real_filename)
-                        if os.path.exists(local_path):
-                            os.remove(local_path)
-                            logger.info(f"Archivo local eliminado (reemplazo): {real_filename}")
-                    else:
-                        minio_client.remove_object('documents', doc.minio_path)
-                except Exception as rem_err:
-                    logger.warning(f"Error eliminando objeto previo: {rem_err}")
-                doc.minio_path = None
-            
-            # Decidir nuevo almacenamiento
-            if content_size <= current_app.config['MAX_DB_SIZE']:
-                import json
-                doc.content_delta = json.dumps(delta)
-                doc.content_html = html
-                doc.storage_type = 'database'
-            else:
-                from settings.utils import save_to_minio_compressed
-                minio_path = save_to_minio_compressed(delta, html)
-                doc.minio_path = minio_path
-                doc.storage_type = 'minio'
-                doc.content_delta = None
-                doc.content_html = None
-            
-            db.session.commit()
-            
-            # Invalidar cache
-            from settings.utils import invalidate_document_cache
-            invalidate_document_cache(doc_id)
-            
-            # Registrar actividad
-            DocumentActivity.log_activity(
-                doc_id, current_user.email, 'content_replaced', 
-                f'Contenido reemplazado con archivo "{original_filename}"',
-                request
-            )
-            
-            logger.info(f"Contenido de documento {doc_id} reemplazado con {original_filename}")
-            
-            return jsonify({
-                'id': doc.id,
-                'title': doc.title,
-                'original_filename': original_filename,
-                'storage_type': doc.storage_type,
-                'size_bytes': content_size,
-                'version_number': doc.version_number,
-                'updated_at': doc.updated_at.isoformat(),
-                'message': f'Contenido reemplazado con "{original_filename}" exitosamente'
-            })
-            
-        finally:
-            # Limpiar archivo temporal
-            try:
-                if os.path.exists(temp_file_path):
-                    os.remove(temp_file_path)
-            except:
-                pass
+        # Actualizar contenido (nuevo content_hash: los parches contra el
+        # contenido reemplazado reciben base_mismatch)
+        delta_json, doc.content_hash = serialize_delta(delta)
+        content_size = get_content_size(delta, html, delta_json)
+        doc.size_bytes = content_size
+        doc.html_stale = False
+        
+        # Soltar la referencia al blob anterior (compartido con versiones; lo elimina el GC)
+        doc.minio_path = None
+        
+        # Decidir nuevo almacenamiento
+        if content_size <= current_app.config['MAX_DB_SIZE']:
+            doc.content_delta = delta_json
+            doc.content_html = html
+            doc.storage_type = 'database'
+        else:
+            from settings.utils import save_to_minio_compressed
+            minio_path = save_to_minio_compressed(delta, html)
+            doc.minio_path = minio_path
+            doc.storage_type = 'minio'
+            doc.content_delta = None
+            doc.content_html = None
+        
+        from services.image_store import ImageStore
+        ImageStore.add_refs(doc.id, delta)
+        db.session.commit()
+        
+        # Invalidar cache
+        from settings.utils import invalidate_document_cache
+        invalidate_document_cache(doc_id)
+        from services.search_index import SearchIndex
+        SearchIndex.mark_dirty(doc_id)
+        
+        # Registrar actividad
+        DocumentActivity.log_activity(
+            doc_id, current_user.email, 'content_replaced', 
+            f'Contenido reemplazado con archivo "{original_filename}"',
+            request
+        )
+        
+        logger.info(f"Contenido de documento {doc_id} reemplazado con {original_filename}")
+        
+        return jsonify({
+            'id': doc.id,
+            'title': doc.title,
+            'original_filename': original_filename,
+            'storage_type': doc.storage_type,
+            'size_bytes': content_size,
+            'version_number': doc.version_number,
+            'updated_at': doc.updated_at.isoformat(),
+            'message': f'Contenido reemplazado con "{original_filename}" exitosamente'
+        })
         
     except Exception as e:
         logger.error(f"Error reemplazando contenido: {e}")
@@ -641,6 +641,18 @@ def get_invite_document(token):
         })
 
     doc = invitation.document
+
+    # Revalidación barata (tab switch / reconexión): 304 antes de leer SeaweedFS
+    from settings.utils import document_etag, not_modified_response, with_etag
+    etag = document_etag(
+        doc, 'invite', invitation.id, is_closed,
+        getattr(workspace, 'has_word_limit', False) if workspace else False,
+        getattr(workspace, 'word_limit', None) if workspace else None,
+    )
+    not_modified = not_modified_response(etag)
+    if not_modified is not None:
+        return not_modified
+
     delta = {}
     html = doc.content_html or ''
 
@@ -661,7 +673,7 @@ def get_invite_document(token):
         except Exception:
             delta = {"ops": [{"insert": "\n"}]}
 
-    return jsonify({
+    return with_etag(jsonify({
         'success': True,
         'document': {
             'id': doc.id,
@@ -676,14 +688,13 @@ def get_invite_document(token):
         },
         'invitation_id': invitation.id,
         'is_closed': is_closed
-    })
+    }), etag)
 
 
 @workspace_bp.route('/invite/<token>/document', methods=['PUT'])
 def save_invite_document(token):
     """Save document content from invited participant"""
     from models.models import WorkspaceInvitation
-    import json
 
     invitation = WorkspaceInvitation.query.filter_by(token=token).first()
     if not invitation or invitation.status == 'blocked':
@@ -710,10 +721,34 @@ def save_invite_document(token):
 
     doc = invitation.document
     try:
-        if 'delta' in data:
-            doc.content_delta = json.dumps(data['delta'])
+        from settings.utils import extract_and_upload_images, serialize_delta
+        from services.image_store import ImageStore
+
+        if 'change' in data:
+            # Autosave por parches: solo el cambio respecto a base_hash
+            from settings.utils import apply_delta_change
+            from services.quill_delta import BaseMismatch, DeltaError
+            change = extract_and_upload_images(data['change'])
+            ImageStore.add_refs(doc.id, change)
+            try:
+                delta, _ = apply_delta_change(doc, change, data.get('base_hash'))
+            except BaseMismatch:
+                return jsonify({'success': False, 'error': 'Base version out of date',
+                                'code': 'base_mismatch', 'content_hash': doc.content_hash}), 409
+            except DeltaError as e:
+                return jsonify({'success': False, 'error': str(e)}), 400
+            delta_json, content_hash = serialize_delta(delta)
+            if content_hash != doc.content_hash:
+                doc.content_delta = delta_json
+                doc.content_hash = content_hash
+                doc.html_stale = 'html' not in data
+        elif 'delta' in data:
+            delta = extract_and_upload_images(data['delta'])
+            ImageStore.add_refs(doc.id, delta)
+            doc.content_delta, doc.content_hash = serialize_delta(delta)
         if 'html' in data:
             doc.content_html = data['html']
+            doc.html_stale = False
         doc.size_bytes = len(doc.content_delta.encode('utf-8')) if doc.content_delta else 0
         
         # Consolidate metrics saving (REFINED DESIGN: Update existing or create new)
@@ -776,6 +811,12 @@ def save_invite_document(token):
 
         db.session.commit()
 
+        from services.search_index import SearchIndex
+        SearchIndex.mark_dirty(doc.id)
+        if 'change' in data or 'delta' in data:
+            from services.paste_presence import PastePresence
+            PastePresence.on_save(doc.id, delta, doc.content_hash)
+
         # FIX: Invalidar cache Redis DESPUÉS del commit para que metrics.id exista siempre.
         # Antes estaba antes del commit → en registros nuevos metrics.id era None → delete sin efecto.
         if metrics_payload:
@@ -785,7 +826,7 @@ def save_invite_document(token):
                     cache.delete(f"metrics:detail:{metrics_record.id}")
             except Exception as cache_err:
                 logger.warning(f'[workspace] Cache invalidation failed (non-critical): {cache_err}')
-        return jsonify({'success': True, 'message': 'Saved'})
+        return jsonify({'success': True, 'message': 'Saved', 'content_hash': doc.content_hash})
     except Exception as e:
         db.session.rollback()
         logger.exception(f"Error saving document {doc.id} for invite {token}: {str(e)}")
@@ -994,47 +1035,65 @@ def review_document(token):
 # AI ANALYSIS PROXY (XplagiaX Engine)
 # ============================================================================
 
+def _analysis_reply(job):
+    """
+    Respuesta de un job de AnalysisGateway: el JSON del microservicio cuando
+    terminó, 202 + job_id si sigue en curso (el cliente consulta status_url o
+    espera 'analysis:done' por Socket.IO), o el error con su código HTTP.
+    """
+    from flask import current_app
+    from services.analysis_gateway import AnalysisGateway
+
+    if job['status'] == 'pending' and not request.args.get('async'):
+        job = AnalysisGateway.wait(job['job_id'], current_app.config.get('ANALYSIS_SYNC_WAIT_SECONDS', 25))
+    if job['status'] == 'pending':
+        return jsonify({
+            'status': 'pending',
+            'job_id': job['job_id'],
+            'status_url': f"/api/analysis/jobs/{job['job_id']}",
+        }), 202
+    if job['status'] == 'error':
+        return jsonify({'status': 'error', 'message': job['error']}), job.get('http_status', 500)
+    return jsonify(job['result'])
+
+
 @workspace_bp.route('/api/ai/analyze', methods=['POST'])
 @login_required
 def ai_analyze_proxy():
-    """Proxy request to the XplagiaX AI analysis microservice."""
-    import requests as req_lib
-    import os
+    """Proxy request to the XplagiaX AI analysis microservice (cached / coalesced by AnalysisGateway)."""
+    from services.analysis_gateway import AnalysisGateway
 
-    data = request.get_json()
+    data = request.get_json(silent=True)
     if not data or not data.get('text'):
         return jsonify({'status': 'error', 'message': 'No text provided'}), 400
 
-    ai_service_url = os.environ.get(
-        'XPLAGIAX_URL', 'http://localhost:5006/analyze_document'
-    )
-
     try:
-        resp = req_lib.post(
-            ai_service_url,
-            json={
-                "text": data['text'],
-                "plugins": data.get('plugins', [
-                    "ai_detection",
-                    "citation_check",
-                    "stylometric_analysis"
-                ]),
-            },
-            timeout=60,
-        )
-        resp.raise_for_status()
-        return jsonify(resp.json())
-    except req_lib.exceptions.Timeout:
-        logger.warning('[ai_analyze_proxy] XplagiaX timeout')
-        return jsonify({'status': 'error', 'message': 'Analysis service timeout'}), 504
-    except req_lib.exceptions.ConnectionError:
-        logger.warning('[ai_analyze_proxy] XplagiaX connection refused')
-        return jsonify({'status': 'error', 'message': 'Analysis service unavailable'}), 503
+        job = AnalysisGateway.submit('text', {
+            "text": data['text'],
+            "plugins": data.get('plugins', [
+                "ai_detection",
+                "citation_check",
+                "stylometric_analysis"
+            ]),
+        }, current_user.id)
+        return _analysis_reply(job)
     except Exception as e:
         logger.error(f'[ai_analyze_proxy] Error: {e}')
         return jsonify({'status': 'error', 'message': str(e)}), 500
 
 
+@workspace_bp.route('/api/analysis/jobs/<job_id>', methods=['GET'])
+@login_required
+def analysis_job_status(job_id):
+    """Estado de un job de análisis (pending → 202, done → resultado, error)."""
+    from services.analysis_gateway import AnalysisGateway
+
+    job = AnalysisGateway.get_job(job_id)
+    if not job or job['user_id'] != current_user.id:
+        return jsonify({'status': 'error', 'message': 'Analysis job not found'}), 404
+    return _analysis_reply(job)
+
+
 # ============================================================================
 # IMAGE ANALYSIS PROXY (Image Microservice :5010)
 # ============================================================================
@@ -1043,24 +1102,14 @@ def ai_analyze_proxy():
 @login_required
 def media_ai_detection_proxy():
     """Proxy: detect AI-generated images via image microservice."""
-    import requests as req_lib, os
-    data = request.get_json()
+    from services.analysis_gateway import AnalysisGateway
+    data = request.get_json(silent=True)
     if not data or not data.get('image_url'):
         return jsonify({'status': 'error', 'message': 'image_url required'}), 400
 
-    svc = os.environ.get('IMAGE_SVC_URL', 'http://localhost:5010')
     try:
-        resp = req_lib.post(
-            f'{svc}/api/v1/search/ai-detection',
-            json={'image_url': data['image_url']},
-            timeout=30,
-        )
-        resp.raise_for_status()
-        return jsonify(resp.json())
-    except req_lib.exceptions.Timeout:
-        return jsonify({'status': 'error', 'message': 'Image service timeout'}), 504
-    except req_lib.exceptions.ConnectionError:
-        return jsonify({'status': 'error', 'message': 'Image service unavailable'}), 503
+        job = AnalysisGateway.submit('image_ai', {'image_url': data['image_url']}, current_user.id)
+        return _analysis_reply(job)
     except Exception as e:
         logger.error(f'[media_ai_detection] {e}')
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -1070,27 +1119,17 @@ def media_ai_detection_proxy():
 @login_required
 def media_plagiarism_proxy():
     """Proxy: check image plagiarism via image microservice."""
-    import requests as req_lib, os
-    data = request.get_json()
+    from services.analysis_gateway import AnalysisGateway
+    data = request.get_json(silent=True)
     if not data or not data.get('image_url'):
         return jsonify({'status': 'error', 'message': 'image_url required'}), 400
 
-    svc = os.environ.get('IMAGE_SVC_URL', 'http://localhost:5010')
     try:
-        resp = req_lib.post(
-            f'{svc}/api/v1/search/plagiarism',
-            json={
-                'image_url': data['image_url'],
-                'similarity_threshold': data.get('similarity_threshold', 0.85),
-            },
-            timeout=30,
-        )
-        resp.raise_for_status()
-        return jsonify(resp.json())
-    except req_lib.exceptions.Timeout:
-        return jsonify({'status': 'error', 'message': 'Image service timeout'}), 504
-    except req_lib.exceptions.ConnectionError:
-        return jsonify({'status': 'error', 'message': 'Image service unavailable'}), 503
+        job = AnalysisGateway.submit('image_plagiarism', {
+            'image_url': data['image_url'],
+            'similarity_threshold': data.get('similarity_threshold', 0.85),
+        }, current_user.id)
+        return _analysis_reply(job)
     except Exception as e:
         logger.error(f'[media_plagiarism] {e}')
         return jsonify({'status': 'error', 'message': str(e)}), 500
@@ -0,0 +1,41 @@
+"""
+scratch/add_cloud_index_backoff_columns.py
+One-off script to add attempted_at and error_count to cloud_index_state.
+CloudIndex uses them to back off syncs while a provider keeps failing.
+"""
+import sys
+import os
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from settings.extensions import db
+from sqlalchemy import text, inspect
+
+COLUMNS = {
+    'attempted_at': "ALTER TABLE cloud_index_state ADD COLUMN attempted_at DATETIME NULL",
+    'error_count':  "ALTER TABLE cloud_index_state ADD COLUMN error_count INT NOT NULL DEFAULT 0",
+}
+
+def add_columns():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [c['name'] for c in inspector.get_columns('cloud_index_state')]
+
+        for name, ddl in COLUMNS.items():
+            if name in columns:
+                print(f"[DB] Column '{name}' already exists in 'cloud_index_state'.")
+                continue
+
+            print(f"[DB] Adding '{name}' column to 'cloud_index_state'...")
+            try:
+                db.session.execute(text(ddl))
+                db.session.commit()
+                print("[DB] Column added successfully.")
+            except Exception as e:
+                print(f"[DB] Error adding column: {e}")
+                db.session.rollback()
+
+if __name__ == "__main__":
+    add_columns()
@@ -0,0 +1,35 @@
+"""
+scratch/add_content_hash_column.py
+One-off script to add the content_hash column to the Documents table.
+Documents without a hash simply take a full save before their first patch.
+"""
+import sys
+import os
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from settings.extensions import db
+from sqlalchemy import text, inspect
+
+def add_column():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [c['name'] for c in inspector.get_columns('marktrack_documents')]
+        
+        if 'content_hash' in columns:
+            print("[DB] Column 'content_hash' already exists in 'marktrack_documents'.")
+            return
+
+        print("[DB] Adding 'content_hash' column to 'marktrack_documents'...")
+        try:
+            db.session.execute(text("ALTER TABLE marktrack_documents ADD COLUMN content_hash VARCHAR(64) NULL"))
+            db.session.commit()
+            print("[DB] Column added successfully.")
+        except Exception as e:
+            print(f"[DB] Error adding column: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_column()
@@ -0,0 +1,36 @@
+"""
+scratch/add_html_stale_column.py
+One-off script to add the html_stale column to marktrack_documents.
+Existing documents start as not stale; the flag is set by the next patch
+autosave that arrives without html.
+"""
+import sys
+import os
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from settings.extensions import db
+from sqlalchemy import text, inspect
+
+def add_column():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [c['name'] for c in inspector.get_columns('marktrack_documents')]
+
+        if 'html_stale' in columns:
+            print("[DB] Column 'html_stale' already exists in 'marktrack_documents'.")
+            return
+
+        print("[DB] Adding 'html_stale' column to 'marktrack_documents'...")
+        try:
+            db.session.execute(text("ALTER TABLE marktrack_documents ADD COLUMN html_stale TINYINT(1) NOT NULL DEFAULT 0"))
+            db.session.commit()
+            print("[DB] Column added successfully.")
+        except Exception as e:
+            print(f"[DB] Error adding column: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_column()
@@ -0,0 +1,64 @@
+"""
+scratch/add_keyset_indexes.py
+One-off script to add the composite indexes behind keyset pagination
+(services/pagination.py) to existing tables; db.create_all() only creates
+them for new tables. Also gives trashed documents without deleted_at one
+(their updated_at), since the trash listing pages on (deleted_at, id).
+"""
+import sys
+import os
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from settings.extensions import db
+from sqlalchemy import text, inspect
+
+from models.models import (
+    Document, DocumentVersion, DocumentActivity, Folder,
+    EssaySubmissionMetrics, Notification, DocumentComment,
+)
+
+INDEXES = {
+    Document:               ('idx_doc_owner_updated', 'idx_doc_owner_trash'),
+    DocumentVersion:        ('idx_docver_doc_created',),
+    DocumentActivity:       ('idx_docact_doc_created',),
+    Folder:                 ('idx_folder_user_created',),
+    EssaySubmissionMetrics: ('idx_esm_workspace_submitted',),
+    Notification:           ('idx_notif_user_created',),
+    DocumentComment:        ('idx_comment_doc_thread',),
+}
+
+def add_indexes():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        for model, names in INDEXES.items():
+            table = model.__table__
+            existing = {ix['name'] for ix in inspector.get_indexes(table.name)}
+            for index in table.indexes:
+                if index.name not in names:
+                    continue
+                if index.name in existing:
+                    print(f"[DB] Index '{index.name}' already exists in '{table.name}'.")
+                    continue
+                print(f"[DB] Creating index '{index.name}' on '{table.name}'...")
+                try:
+                    index.create(bind=db.engine)
+                    print("[DB] Index created successfully.")
+                except Exception as e:
+                    print(f"[DB] Error creating index: {e}")
+
+        try:
+            result = db.session.execute(text(
+                "UPDATE marktrack_documents SET deleted_at = updated_at "
+                "WHERE is_deleted = 1 AND deleted_at IS NULL"
+            ))
+            db.session.commit()
+            print(f"[DB] deleted_at backfilled for {result.rowcount} trashed documents.")
+        except Exception as e:
+            print(f"[DB] Error backfilling deleted_at: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_indexes()
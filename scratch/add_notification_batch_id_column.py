@@ -0,0 +1,37 @@
+"""
+scratch/add_notification_batch_id_column.py
+One-off script to add the batch_id column (and its index) to notifications.
+create_bulk() tags each fan-out with it to read the inserted ids back.
+Existing notifications keep batch_id NULL.
+"""
+import sys
+import os
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from settings.extensions import db
+from sqlalchemy import text, inspect
+
+def add_column():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [c['name'] for c in inspector.get_columns('notifications')]
+
+        if 'batch_id' in columns:
+            print("[DB] Column 'batch_id' already exists in 'notifications'.")
+            return
+
+        print("[DB] Adding 'batch_id' column to 'notifications'...")
+        try:
+            db.session.execute(text("ALTER TABLE notifications ADD COLUMN batch_id VARCHAR(32) NULL"))
+            db.session.execute(text("CREATE INDEX ix_notifications_batch_id ON notifications (batch_id)"))
+            db.session.commit()
+            print("[DB] Column added successfully.")
+        except Exception as e:
+            print(f"[DB] Error adding column: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_column()
@@ -0,0 +1,35 @@
+"""
+scratch/add_presence_coverage_column.py
+One-off script to add the presence_coverage column to pasted_internet_content.
+Existing evidence gets its coverage on the next save of its document.
+"""
+import sys
+import os
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from settings.extensions import db
+from sqlalchemy import text, inspect
+
+def add_column():
+    with app.app_context():
+        inspector = inspect(db.engine)
+        columns = [c['name'] for c in inspector.get_columns('pasted_internet_content')]
+
+        if 'presence_coverage' in columns:
+            print("[DB] Column 'presence_coverage' already exists in 'pasted_internet_content'.")
+            return
+
+        print("[DB] Adding 'presence_coverage' column to 'pasted_internet_content'...")
+        try:
+            db.session.execute(text("ALTER TABLE pasted_internet_content ADD COLUMN presence_coverage SMALLINT NULL"))
+            db.session.commit()
+            print("[DB] Column added successfully.")
+        except Exception as e:
+            print(f"[DB] Error adding column: {e}")
+            db.session.rollback()
+
+if __name__ == "__main__":
+    add_column()
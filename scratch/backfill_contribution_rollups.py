@@ -0,0 +1,32 @@
+"""
+scratch/backfill_contribution_rollups.py
+One-off script to fill contribution_rollups (created by db.create_all())
+from the snapshots stored before the rollups existed.
+
+Rollups are additive: run it once, on an empty table. If the new code is
+already writing, pass --until-id with the last snapshot id written by the
+old code, so batches flushed since are not counted twice.
+"""
+import sys
+import os
+import argparse
+
+# Add root to sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import app
+from models.models import ContributionRollup
+from services.contributions import ContributionStore
+
+def backfill(until_id=None):
+    with app.app_context():
+        if ContributionRollup.query.first() is not None and until_id is None:
+            print("[DB] contribution_rollups is not empty; pass --until-id to backfill anyway.")
+            return
+        written = ContributionStore.rebuild_rollups(until_id=until_id)
+        print(f"[DB] {written} contribution rollups written.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--until-id', type=int, default=None)
+    backfill(parser.parse_args().until_id)
@@ -0,0 +1,42 @@
+"""
+Move contribution snapshots older than --older-than-days out of
+contribution_snapshots into compressed contribution_archives rows.
+
+    python scripts/tools/archive_contributions.py --dry-run
+    python scripts/tools/archive_contributions.py --older-than-days 180 --document 42
+
+Totals shown in the Activity panel come from contribution_rollups and do
+not change. ContributionStore.read_archive() decodes an archive row.
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.contributions import ContributionStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--older-than-days', type=int, default=90)
+    parser.add_argument('--document', type=int, action='append', help='only these documents (repeatable)')
+    parser.add_argument('--chunk', type=int, default=50_000, help='snapshots per archive row')
+    parser.add_argument('--dry-run', action='store_true', help='report without archiving')
+    args = parser.parse_args()
+
+    with app.app_context():
+        report = ContributionStore.archive(
+            timedelta(days=args.older_than_days),
+            document_ids=args.document,
+            dry_run=args.dry_run,
+            chunk=args.chunk,
+        )
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,184 @@
+"""
+Analysis proxies: previous direct requests.post vs services/analysis_gateway,
+against the stand-in of scripts/tools/fake_analysis_service.py with
+--latency-ms per analysis.
+
+    REDIS_URL=redis://localhost:6379 python scripts/tools/bench_analysis_gateway.py [--requests 40 --distinct 10]
+
+  burst      --requests concurrent text analyses over --distinct texts (each
+             text requested several times, as when a class re-runs the same
+             submission): backend calls, TCP connections, wall time.
+  re-run     the same burst again: served from the result cache.
+  workers    with REDIS_URL, --workers processes submit the same new text at
+             once: coalesced into one backend call cluster-wide.
+  breaker    backend down: calls made before the breaker opens, time of the
+             fast-failing submits, recovery after the open window.
+
+Exits 1 (FAIL) when the gateway makes more backend calls than distinct
+inputs, re-runs reach the backend, or the breaker does not open / recover.
+Runs monkey-patched like app.py: the SocketIO push needs eventlet's hub.
+"""
+import eventlet
+eventlet.monkey_patch()
+
+import argparse  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import threading  # noqa: E402
+import time  # noqa: E402
+import uuid  # noqa: E402
+
+import requests  # noqa: E402
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.dirname(__file__))
+
+from services import analysis_gateway  # noqa: E402
+from services.analysis_gateway import AnalysisGateway  # noqa: E402
+
+PLUGINS = ['ai_detection', 'citation_check', 'stylometric_analysis']
+
+
+def _stats(base):
+    return requests.get(f'{base}/_admin/stats').json()
+
+
+def _burst(fn, texts):
+    """Run fn(text) for every text in its own thread, all at once. Returns (results, seconds)."""
+    results = [None] * len(texts)
+    barrier = threading.Barrier(len(texts))
+
+    def run(i):
+        barrier.wait()
+        results[i] = fn(texts[i])
+
+    threads = [threading.Thread(target=run, args=(i,)) for i in range(len(texts))]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results, time.perf_counter() - t0
+
+
+def legacy(url, text):
+    """Previous ai_analyze_proxy: a new connection and a blocking POST per request."""
+    resp = requests.post(url, json={'text': text, 'plugins': PLUGINS}, timeout=60)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def gateway(text, order=PLUGINS):
+    job = AnalysisGateway.submit('text', {'text': text, 'plugins': list(order)}, user_id=1)
+    if job['status'] == 'pending':
+        job = AnalysisGateway.wait(job['job_id'], 60)
+    return job
+
+
+def child(args):
+    time.sleep(max(0.0, args.start_at - time.time()))
+    job = gateway(args.child)
+    print(json.dumps({'status': job['status'], 'result': job.get('result')}), flush=True)
+    os._exit(0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=40)
+    parser.add_argument('--distinct', type=int, default=10)
+    parser.add_argument('--latency-ms', type=float, default=1000, help='analysis time of the stand-in')
+    parser.add_argument('--workers', type=int, default=4, help='processes for the cross-worker run (REDIS_URL)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    import fake_analysis_service
+
+    server, _, base = fake_analysis_service.serve(0, latency_ms=args.latency_ms)
+    os.environ['XPLAGIAX_URL'] = f'{base}/analyze_document'
+    run = uuid.uuid4().hex[:8]           # textos nuevos en cada ejecución: la caché de Redis empieza vacía
+    texts = [f'submission {i % args.distinct} of run {run} ' * 200 for i in range(args.requests)]
+    failed = False
+
+    print(f'{args.requests} concurrent analyses over {args.distinct} distinct texts, '
+          f'backend {args.latency_ms:.0f} ms per analysis')
+
+    before = _stats(base)
+    legacy_results, legacy_s = _burst(lambda t: legacy(f'{base}/analyze_document', t), texts)
+    after = _stats(base)
+    print(f"  previous  burst   calls {after['calls'] - before['calls']:4d}   connections "
+          f"{after['connections'] - before['connections']:4d}   {legacy_s:6.2f} s")
+
+    before = after
+    jobs, gw_s = _burst(gateway, texts)
+    after = _stats(base)
+    calls = after['calls'] - before['calls']
+    print(f"  gateway   burst   calls {calls:4d}   connections "
+          f"{after['connections'] - before['connections']:4d}   {gw_s:6.2f} s")
+    if calls > args.distinct or any(j['status'] != 'done' for j in jobs):
+        print(f'FAIL: {calls} backend calls for {args.distinct} distinct texts, '
+              f"statuses {sorted({j['status'] for j in jobs})}")
+        failed = True
+    if any(j['result'] != r for j, r in zip(jobs, legacy_results)):
+        print('FAIL: gateway results differ from the direct calls')
+        failed = True
+
+    before = after
+    reversed_plugins = list(reversed(PLUGINS))
+    jobs, rerun_s = _burst(lambda t: gateway(t, reversed_plugins), texts)
+    after = _stats(base)
+    calls = after['calls'] - before['calls']
+    print(f"  gateway   re-run  calls {calls:4d}   cached {sum(j['cached'] for j in jobs):4d}/{len(jobs)}"
+          f"   {rerun_s * 1000:8.1f} ms  (plugins in another order)")
+    if calls:
+        print(f'FAIL: {calls} backend calls on unchanged texts')
+        failed = True
+
+    if os.environ.get('REDIS_URL'):
+        before = _stats(base)
+        start_at = time.time() + 2.0
+        text = f'shared submission of run {run} ' * 200
+        procs = [subprocess.Popen([sys.executable, __file__, '--child', text, '--start-at', str(start_at)],
+                                  stdout=subprocess.PIPE, text=True, env=os.environ.copy())
+                 for _ in range(args.workers)]
+        outs = [json.loads(p.communicate()[0].strip().splitlines()[-1]) for p in procs]
+        calls = _stats(base)['calls'] - before['calls']
+        print(f"  gateway   {args.workers} workers, same text   calls {calls:4d}   "
+              f"done {sum(o['status'] == 'done' for o in outs)}/{len(outs)}")
+        if calls != 1 or any(o['status'] != 'done' for o in outs):
+            print(f'FAIL: cross-worker coalescing made {calls} calls')
+            failed = True
+    else:
+        print('  (REDIS_URL not set: cross-worker coalescing not measured)')
+
+    analysis_gateway._BREAKER_OPEN_S = 1
+    requests.post(f'{base}/_admin/mode', json={'mode': 'down'})
+    before = _stats(base)
+    t0 = time.perf_counter()
+    statuses = [gateway(f'down {i} {run}')['http_status'] for i in range(20)]
+    down_s = time.perf_counter() - t0
+    calls = _stats(base)['calls'] - before['calls']
+    print(f"  breaker   backend down: 20 submits, calls {calls:3d}, {down_s * 1000:7.1f} ms, "
+          f"state {AnalysisGateway.stats()['breakers']['xplagiax']}")
+    if calls != analysis_gateway._BREAKER_FAILURES or set(statuses) != {503}:
+        print(f'FAIL: breaker let {calls} calls through (statuses {sorted(set(statuses))})')
+        failed = True
+    requests.post(f'{base}/_admin/mode', json={'mode': 'ok'})
+    time.sleep(1.1)
+    job = gateway(f'recovered {run}')
+    print(f"  breaker   after the open window: {job['status']}, state {AnalysisGateway.stats()['breakers']['xplagiax']}")
+    if job['status'] != 'done':
+        print('FAIL: breaker did not recover')
+        failed = True
+
+    server.shutdown()
+    print('FAIL' if failed else 'OK', flush=True)
+    os._exit(1 if failed else 0)        # sin el teardown de eventlet (hilos verdes del pool y de SocketIO)
+
+
+if __name__ == '__main__':
+    main()
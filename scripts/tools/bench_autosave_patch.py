@@ -0,0 +1,99 @@
+"""
+Autosave load test for a ~100 KB document: full-body save (legacy) vs the
+patch protocol (Quill change + base_hash). Reports request bytes-in and CPU
+time per autosave for the server-side work of each path.
+
+    python scripts/tools/bench_autosave_patch.py [autosaves] [doc_kb]
+
+Legacy:  json body (delta + html) → validate_delta dump → get_content_size
+         dump → image scan → json.dumps for the LONGTEXT column.
+Patch:   json body (change) → stored delta json.loads → compose → one
+         json.dumps + sha256 reused for size, hash and persistence.
+Each autosave types a short burst (1-20 chars) at a random position.
+"""
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from services.quill_delta import apply_change, document_length  # noqa: E402
+
+_WORDS = ('students compare primary sources and argue about causes and '
+          'consequences of change over several decades').split()
+
+
+def _document(kb):
+    rnd = random.Random(7)
+    ops, size = [], 0
+    while size < kb * 1024 / 2:
+        text = ' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(20, 60))) + '\n'
+        ops.append({'insert': text, 'attributes': {'bold': True}} if rnd.random() < 0.1 else {'insert': text})
+        size += len(text)
+    return {'ops': ops}
+
+
+def _html(delta):
+    return ''.join(f'<p>{op["insert"].rstrip()}</p>' for op in delta['ops'])
+
+
+def _legacy(body_bytes):
+    data = json.loads(body_bytes)
+    delta, html = data['delta'], data['html']
+    len(json.dumps(delta))                                   # validate_delta
+    sys.getsizeof(json.dumps(delta)) + sys.getsizeof(html)   # get_content_size
+    for op in delta['ops']:                                  # extract_and_upload_images
+        if isinstance(op.get('insert'), dict):
+            pass
+    return json.dumps(delta)                                 # persistence
+
+
+def _patch(body_bytes, stored_json):
+    data = json.loads(body_bytes)
+    stored = json.loads(stored_json)
+    delta = {'ops': apply_change(stored['ops'], data['change']['ops'])}
+    delta_json = json.dumps(delta)
+    hashlib.sha256(delta_json.encode('utf-8')).hexdigest()
+    return delta_json
+
+
+def run(saves=200, doc_kb=100):
+    rnd = random.Random(11)
+    delta = _document(doc_kb)
+    stored_json = json.dumps(delta)
+    legacy_in = patch_in = 0
+    legacy_cpu = patch_cpu = 0.0
+
+    for _ in range(saves):
+        pos = rnd.randrange(document_length(delta['ops']))
+        typed = ''.join(rnd.choice('abcdefgh ') for _ in range(rnd.randint(1, 20)))
+        change = [{'retain': pos}, {'insert': typed}]
+        base_hash = hashlib.sha256(stored_json.encode('utf-8')).hexdigest()
+        patch_body = json.dumps({'change': {'ops': change}, 'base_hash': base_hash,
+                                 'title': 'Essay', 'is_autosave': True}).encode()
+
+        t0 = time.process_time()
+        new_json = _patch(patch_body, stored_json)
+        patch_cpu += time.process_time() - t0
+        patch_in += len(patch_body)
+
+        delta = json.loads(new_json)
+        legacy_body = json.dumps({'delta': delta, 'html': _html(delta), 'title': 'Essay',
+                                  'is_autosave': True}).encode()
+        t0 = time.process_time()
+        _legacy(legacy_body)
+        legacy_cpu += time.process_time() - t0
+        legacy_in += len(legacy_body)
+        stored_json = new_json
+
+    print(f'{saves} autosaves, document ≈ {len(stored_json) / 1024:.0f} KB delta')
+    print(f'  legacy: {legacy_in / saves / 1024:8.1f} KB in/save  {legacy_cpu / saves * 1000:7.3f} ms CPU/save')
+    print(f'  patch:  {patch_in / saves / 1024:8.3f} KB in/save  {patch_cpu / saves * 1000:7.3f} ms CPU/save')
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
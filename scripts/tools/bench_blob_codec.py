@@ -0,0 +1,136 @@
+"""
+Document blob codecs: compression ratio and compress/decompress MB/s of the
+legacy gzip blobs vs zstd with and without a dictionary trained on the
+corpus itself (90% train / 10% held-out, measured on the held-out part).
+
+    python scripts/tools/bench_blob_codec.py --corpus uploads/documents
+    python scripts/tools/bench_blob_codec.py --synthetic 400
+
+--corpus takes a directory of stored blobs (legacy *.json.gz, *.blob copied
+from the `documents` bucket) or exported *.json documents ({'delta', 'html'}
+or a bare Quill delta). --synthetic generates Quill documents above
+MAX_DB_SIZE with the attribute/class mix of the editor.
+"""
+import argparse
+import gzip
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import zstandard  # noqa: E402
+
+from services.document_blobs import BlobDictionaries, DocumentBlobStore  # noqa: E402
+
+_WORDS = ('the students compare primary sources and argue about causes and consequences '
+          'of economic change over several decades while citing evidence from archives').split()
+_ATTRS = [None, None, None, {'bold': True}, {'italic': True}, {'underline': True},
+          {'link': 'https://example.org/source'}, {'color': '#e60000'}]
+_LINE_ATTRS = [None, None, None, {'header': 2}, {'list': 'bullet'}, {'list': 'ordered'},
+               {'align': 'center'}, {'align': 'justify'}, {'blockquote': True}]
+
+
+def _synthetic_document(rnd, min_kb):
+    ops, html, size = [], [], 0
+    while size < min_kb * 1024:
+        parts = []
+        for _ in range(rnd.randint(1, 6)):
+            text = ' '.join(rnd.choice(_WORDS) for _ in range(rnd.randint(3, 25))) + ' '
+            attrs = rnd.choice(_ATTRS)
+            ops.append({'insert': text, 'attributes': attrs} if attrs else {'insert': text})
+            parts.append(f'<strong>{text}</strong>' if attrs and attrs.get('bold') else text)
+        line = rnd.choice(_LINE_ATTRS)
+        ops.append({'insert': '\n', 'attributes': line} if line else {'insert': '\n'})
+        cls = f' class="ql-align-{line["align"]}"' if line and 'align' in line else ''
+        html.append(f'<p{cls}>{"".join(parts)}</p>')
+        size += sum(len(p) for p in parts) * 2
+    if rnd.random() < 0.3:
+        ops.append({'insert': {'image': f'/api/image/{rnd.getrandbits(256):064x}.png'}})
+    return DocumentBlobStore.canonical({'ops': ops}, ''.join(html))
+
+
+def _load_corpus(directory):
+    samples = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        if not entry.is_file():
+            continue
+        with open(entry.path, 'rb') as f:
+            data = f.read()
+        try:
+            if entry.name.endswith('.json'):
+                content = json.loads(data)
+                if 'ops' in content:
+                    content = {'delta': content, 'html': ''}
+                samples.append(DocumentBlobStore.canonical(content.get('delta'), content.get('html', '')))
+            else:
+                content = json.loads(DocumentBlobStore.decode(data))
+                samples.append(DocumentBlobStore.canonical(content.get('delta'), content.get('html', '')))
+        except Exception as exc:
+            print(f'skip {entry.name}: {exc}')
+    return samples
+
+
+def _measure(name, samples, compress, decompress, repeat=3):
+    raw = sum(len(s) for s in samples)
+    blobs = [compress(s) for s in samples]
+    stored = sum(len(b) for b in blobs)
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for s in samples:
+            compress(s)
+    c_s = (time.perf_counter() - t0) / repeat
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        for b in blobs:
+            decompress(b)
+    d_s = (time.perf_counter() - t0) / repeat
+    print(f'{name:<22} ratio {raw / stored:6.2f}x   '
+          f'compress {raw / c_s / 1e6:8.1f} MB/s   decompress {raw / d_s / 1e6:8.1f} MB/s   '
+          f'avg blob {stored / len(samples) / 1024:6.1f} KB')
+
+
+def run(samples, dict_size):
+    random.Random(3).shuffle(samples)
+    held_out = samples[:max(1, len(samples) // 10)]
+    training = samples[len(held_out):]
+    raw_kb = sum(len(s) for s in held_out) / len(held_out) / 1024
+    print(f'corpus: {len(samples)} documents, held-out {len(held_out)} (avg {raw_kb:.1f} KB raw)')
+
+    t0 = time.perf_counter()
+    zdict = BlobDictionaries.train(training, dict_size=dict_size)
+    print(f'dictionary: {len(zdict.as_bytes())} bytes, trained in {time.perf_counter() - t0:.2f}s')
+
+    _measure('gzip-9 (legacy)', held_out, gzip.compress, gzip.decompress)
+    _measure('gzip-6', held_out, lambda s: gzip.compress(s, 6), gzip.decompress)
+    for level in (3, 9, 19):
+        plain_c = zstandard.ZstdCompressor(level=level)
+        _measure(f'zstd-{level}', held_out, plain_c.compress, zstandard.ZstdDecompressor().decompress)
+        zdict.precompute_compress(level=level)
+        dict_c = zstandard.ZstdCompressor(dict_data=zdict, level=level)
+        _measure(f'zstd-{level} + dict', held_out, dict_c.compress,
+                 zstandard.ZstdDecompressor(dict_data=zdict).decompress)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='directory of stored blobs or exported .json documents')
+    parser.add_argument('--synthetic', type=int, default=400, help='documents to generate without --corpus')
+    parser.add_argument('--min-kb', type=int, default=60, help='synthetic document size (raw JSON)')
+    parser.add_argument('--dict-size', type=int, default=112640)
+    args = parser.parse_args()
+
+    if args.corpus:
+        samples = _load_corpus(args.corpus)
+    else:
+        rnd = random.Random(11)
+        samples = [_synthetic_document(rnd, args.min_kb * rnd.uniform(1, 4)) for _ in range(args.synthetic)]
+    if len(samples) < 20:
+        sys.exit(f'Corpus too small ({len(samples)} documents)')
+    run(samples, args.dict_size)
+
+
+if __name__ == '__main__':
+    main()
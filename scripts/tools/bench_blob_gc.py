@@ -0,0 +1,169 @@
+"""
+Benchmark the document blob GC against a local stand-in filer holding 100k
+objects: paginated listing (SeaweedFSClient.iter_objects) + sweep with
+sequential vs parallel deletes.
+
+    python scripts/tools/bench_blob_gc.py [--objects 100000] [--orphan-ratio 0.4]
+                                          [--latency-ms 1.0] [--workers 1 16]
+
+The stand-in implements the three Filer calls the GC uses (JSON directory
+listing with lastFileName paging, HEAD with Last-Modified for the re-stat
+before each delete, DELETE) over a ThreadingHTTPServer, with an optional
+per-request latency to model volume-server round-trips.
+The filer runs in its own process so its request handling does not compete
+with the GC for the GIL. The referenced set is synthetic (no database):
+`orphan-ratio` of the blobs are unreferenced and old enough to be collected.
+"""
+import argparse
+import bisect
+import hashlib
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from services.document_blobs import BUCKET, DocumentBlobStore  # noqa: E402
+from settings.seaweedfs_client import SeaweedFSClient  # noqa: E402
+
+
+class StandInFiler:
+    def __init__(self, latency_s):
+        self.latency_s = latency_s
+        self.names = []          # sorted
+        self.objects = {}        # name → (size, mtime)
+        self.lock = threading.Lock()
+
+    def populate(self, count, old_mtime):
+        for i in range(count):
+            name = f'doc_{hashlib.sha256(str(i).encode()).hexdigest()}.json.gz'
+            self.objects[name] = (20_000 + i % 5000, old_mtime)
+        self.names = sorted(self.objects)
+
+    def handler(self):
+        filer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def _name(self):
+                path = unquote(urlparse(self.path).path)
+                return path[len(f'/{BUCKET}/'):]
+
+            def _reply(self, status, body=b'', content_type='application/json', headers=()):
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                for header in headers:
+                    self.send_header(*header)
+                self.end_headers()
+                if body and self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                limit = int(query.get('limit', ['1000'])[0])
+                last = query.get('lastFileName', [''])[0]
+                prefix = query.get('namePattern', ['*'])[0].rstrip('*')
+                with filer.lock:
+                    start = bisect.bisect_right(filer.names, last) if last else 0
+                    entries, index = [], start
+                    while index < len(filer.names) and len(entries) < limit:
+                        name = filer.names[index]
+                        index += 1
+                        if name in filer.objects and name.startswith(prefix):
+                            size, mtime = filer.objects[name]
+                            entries.append({'FullPath': f'/{BUCKET}/{name}', 'Mtime': mtime,
+                                            'FileSize': size, 'IsDirectory': False})
+                    more = index < len(filer.names)
+                body = json.dumps({
+                    'Path': f'/{BUCKET}', 'Entries': entries, 'Limit': limit,
+                    'LastFileName': entries[-1]['FullPath'].rsplit('/', 1)[-1] if entries else '',
+                    'ShouldDisplayLoadMore': more,
+                }).encode()
+                self._reply(200, body)
+
+            def do_HEAD(self):
+                with filer.lock:
+                    entry = filer.objects.get(self._name())
+                if entry is None:
+                    self._reply(404)
+                    return
+                mtime = datetime.strptime(entry[1], '%Y-%m-%dT%H:%M:%SZ').replace(tzinfo=timezone.utc)
+                self._reply(200, headers=[('Last-Modified', format_datetime(mtime, usegmt=True))])
+
+            def do_DELETE(self):
+                time.sleep(filer.latency_s)
+                with filer.lock:
+                    existed = filer.objects.pop(self._name(), None) is not None
+                self._reply(204 if existed else 404)
+
+        return Handler
+
+
+class _FilerServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256     # default backlog (5) drops parallel connects
+
+
+def _serve(port_queue, objects, latency_s, old_mtime):
+    filer = StandInFiler(latency_s)
+    filer.populate(objects, old_mtime)
+    server = _FilerServer(('127.0.0.1', 0), filer.handler())
+    port_queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def run(objects, orphan_ratio, latency_ms, worker_counts):
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=6)
+    old_mtime = (cutoff - timedelta(days=2)).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+    for workers in worker_counts:
+        port_queue = multiprocessing.Queue()
+        process = multiprocessing.Process(
+            target=_serve, args=(port_queue, objects, latency_ms / 1000, old_mtime), daemon=True)
+        process.start()
+        client = SeaweedFSClient(f'http://127.0.0.1:{port_queue.get(timeout=60)}')
+
+        t0 = time.perf_counter()
+        listed = list(client.iter_objects(BUCKET, prefix='doc_'))
+        list_s = time.perf_counter() - t0
+        keep = int(len(listed) * (1 - orphan_ratio))
+        referenced = {obj.object_name for obj in listed[:keep]}
+
+        dry = DocumentBlobStore.sweep(client, listed, referenced, cutoff, dry_run=True)
+        t0 = time.perf_counter()
+        report = DocumentBlobStore.sweep(client, listed, referenced, cutoff, workers=workers)
+        sweep_s = time.perf_counter() - t0
+        remaining = sum(1 for _ in client.iter_objects(BUCKET, prefix='doc_'))
+        process.terminate()
+
+        print(f'workers={workers:>3}  listed={len(listed)} in {list_s:.2f}s  '
+              f'dry-run orphans={dry["orphans"]} ({dry["orphan_bytes"] / 1e6:.0f} MB)  '
+              f'deleted={report["deleted"]} revived={report["revived"]} errors={report["errors"]}  '
+              f'sweep={sweep_s:.2f}s ({report["deleted"] / sweep_s:,.0f} deletes/s)  '
+              f'remaining={remaining}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--objects', type=int, default=100_000)
+    parser.add_argument('--orphan-ratio', type=float, default=0.4)
+    parser.add_argument('--latency-ms', type=float, default=1.0)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 16])
+    args = parser.parse_args()
+    run(args.objects, args.orphan_ratio, args.latency_ms, args.workers)
+
+
+if __name__ == '__main__':
+    main()
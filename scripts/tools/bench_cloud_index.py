@@ -0,0 +1,177 @@
+"""
+/storage/files/<provider> on a --files drive served by the local stand-in
+(scripts/tools/fake_cloud_provider.py, --latency-ms per request): the
+previous live listing (Drive 100 files per request, Dropbox recursive
+list_folder + continue, serially, then filtered in Python) vs the local
+index (services/cloud_index.py): cold build, warm call (index only), a sync
+with no changes and a sync after --changes changes.
+
+    python scripts/tools/bench_cloud_index.py [--files 50000 --latency-ms 40]
+    python scripts/tools/bench_cloud_index.py --providers google_drive --database-url mysql+mysqldb://…
+
+After every sync the indexed ids must equal the documents the stand-in
+holds; exits 1 otherwise. OneDrive has no "previous" row: the old code used
+Graph search capped at 200 results per extension, so it never listed a
+large drive completely. Uses a bare Flask app on the repo's models (SQLite
+temp file by default). Without REDIS_URL builds are not lock-coordinated,
+which does not matter for a single process.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.dirname(__file__))
+
+from flask import Flask  # noqa: E402
+
+import fake_cloud_provider  # noqa: E402
+from models.models import CloudFileIndex, User  # noqa: E402
+from services.cloud_index import CloudIndex, is_document  # noqa: E402
+from settings.extensions import db  # noqa: E402
+
+_API = {'google_drive': '/drive/v3', 'dropbox': '/dropbox/2', 'onedrive': '/graph/v1.0'}
+_TOKEN = 'bench-token'
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def legacy_google_drive(api_base):
+    """fetch_files_from_provider('google_drive') as it was, plus the filter."""
+    headers = {'Authorization': f'Bearer {_TOKEN}'}
+    mimes = ['application/pdf', 'application/msword',
+             'application/vnd.openxmlformats-officedocument.wordprocessingml.document', 'text/plain',
+             'application/vnd.ms-powerpoint',
+             'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+             'application/vnd.google-apps.document', 'application/vnd.google-apps.presentation',
+             'application/epub+zip', 'application/rtf']
+    query = '(' + ' or '.join(f"mimeType='{m}'" for m in mimes) + ') and trashed=false'
+    files, token = [], None
+    while True:
+        params = {'q': query, 'pageSize': 100, 'orderBy': 'modifiedTime desc',
+                  'fields': 'nextPageToken,files(id,name,size,modifiedTime,mimeType,webViewLink,parents)'}
+        if token:
+            params['pageToken'] = token
+        resp = requests.get(f'{api_base}/files', headers=headers, params=params)
+        resp.raise_for_status()
+        data = resp.json()
+        files.extend({'id': f['id'], 'name': f['name'], 'type': f.get('mimeType')} for f in data.get('files', []))
+        token = data.get('nextPageToken')
+        if not token:
+            return [f for f in files if is_document(f, 'google_drive')]
+
+
+def legacy_dropbox(api_base):
+    """fetch_files_from_provider('dropbox') as it was (minus the debug prints), plus the filter."""
+    headers = {'Authorization': f'Bearer {_TOKEN}', 'Content-Type': 'application/json'}
+    payload = {'path': '', 'recursive': True, 'include_media_info': False, 'include_deleted': False,
+               'include_has_explicit_shared_members': False, 'include_mounted_folders': True, 'limit': 2000}
+    resp = requests.post(f'{api_base}/files/list_folder', headers=headers, data=json.dumps(payload))
+    resp.raise_for_status()
+    data = resp.json()
+    files = [{'id': e['id'], 'name': e['name'], 'type': 'file'} for e in data['entries'] if e['.tag'] == 'file']
+    while data.get('has_more'):
+        resp = requests.post(f'{api_base}/files/list_folder/continue', headers=headers,
+                             data=json.dumps({'cursor': data['cursor']}))
+        resp.raise_for_status()
+        data = resp.json()
+        files.extend({'id': e['id'], 'name': e['name'], 'type': 'file'} for e in data['entries'] if e['.tag'] == 'file')
+    return [f for f in files if is_document(f, 'dropbox')]
+
+
+_LEGACY = {'google_drive': legacy_google_drive, 'dropbox': legacy_dropbox}
+
+
+def _expected(base, provider):
+    ids = requests.get(f'{base}/_admin/documents').json()['ids']
+    return {f'id:{i}' if provider == 'dropbox' else i for i in ids}
+
+
+def _indexed(user_id, provider):
+    return {fid for (fid,) in db.session.query(CloudFileIndex.file_id).filter_by(user_id=user_id, provider=provider)}
+
+
+def _timed(handler, fn):
+    before = handler.requests
+    t0 = time.perf_counter()
+    result = fn()
+    return result, (time.perf_counter() - t0) * 1000, handler.requests - before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--files', type=int, default=50_000)
+    parser.add_argument('--latency-ms', type=float, default=40, help='simulated provider round-trip')
+    parser.add_argument('--changes', type=int, default=300, help='adds, renames and deletes per sync round')
+    parser.add_argument('--providers', nargs='+', default=list(_API))
+    args = parser.parse_args()
+
+    server, handler, base = fake_cloud_provider.serve(args.files, latency_ms=args.latency_ms)
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "bench_cloud_index.db")}'
+    app = _make_app(url)
+    failed = False
+    print(f'{args.files:,} files ({len(_expected(base, "google_drive")):,} documents), '
+          f'{args.latency_ms:.0f} ms per provider request')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        user = User(email='cloud-bench@example.org')
+        db.session.add(user)
+        db.session.commit()
+
+        for provider in args.providers:
+            api_base = base + _API[provider]
+            print(f'\n{provider}')
+            if provider in _LEGACY:
+                files, ms, calls = _timed(handler, lambda: _LEGACY[provider](api_base))
+                print(f'  {"previous live listing":<35}{ms:9.0f} ms  {calls:5d} provider requests  {len(files):,} documents')
+
+            def call(force=False):
+                CloudIndex.ensure_fresh(user.id, provider, _TOKEN, api_base, force=force)
+                return CloudIndex.list_files(user.id, provider, per_page=100)
+
+            page, ms, calls = _timed(handler, call)
+            print(f'  index: {"cold build":<28}{ms:9.0f} ms  {calls:5d} provider requests  {page.total:,} documents')
+            _, ms, calls = _timed(handler, call)
+            print(f'  index: {"warm call":<28}{ms:9.1f} ms  {calls:5d} provider requests')
+            _, ms, calls = _timed(handler, lambda: call(force=True))
+            print(f'  index: {"sync, no change":<28}{ms:9.1f} ms  {calls:5d} provider requests')
+            _, ms, _ = _timed(handler, lambda: CloudIndex.list_files(
+                user.id, provider, q='essay_f00012', extensions=['docx', 'pdf'], per_page=50))
+            print(f'  index: {"name+ext filter":<28}{ms:9.1f} ms')
+
+            for round_ in range(2):
+                n = args.changes // 3
+                requests.post(f'{base}/_admin/mutate', json={'add': n, 'rename': n, 'delete': n,
+                                                             'trash_folder': round_ == 1})
+                _, ms, calls = _timed(handler, lambda: call(force=True))
+                label = f'sync, {args.changes} changes' + (' + folder' if round_ else '')
+                print(f'  index: {label:<28}{ms:9.1f} ms  {calls:5d} provider requests')
+                expected, indexed = _expected(base, provider), _indexed(user.id, provider)
+                if expected != indexed:
+                    print(f'  FAIL: index has {len(indexed - expected)} stale and misses '
+                          f'{len(expected - indexed)} documents')
+                    failed = True
+        db.drop_all()
+    server.shutdown()
+
+    if failed:
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
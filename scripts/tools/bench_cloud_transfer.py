@@ -0,0 +1,301 @@
+"""
+Cloud upload / download proxy on --size MB files through the local stand-in
+(scripts/tools/fake_cloud_provider.py): the previous code (file.read() and a
+body built in memory, Drive simple multipart; downloads relayed with
+iter_content(8192)) vs services/cloud_transfer.py (resumable sessions fed
+chunk by chunk; downloads relayed in 64 KB → 1 MB chunks). Every transfer
+runs in its own child process, so the reported peak RSS (VmHWM minus the RSS
+before the transfer) belongs to that transfer alone.
+
+    python scripts/tools/bench_cloud_transfer.py [--size 1024] [--skip-legacy]
+    python scripts/tools/bench_cloud_transfer.py --providers google_drive dropbox --size 256
+
+Checks, exiting 1 on failure: every upload arrives with the right SHA-256;
+every download yields the right bytes; Range requests come back as 206 with
+the requested slice (416 past the end); and uploads of --retry-size MB still
+arrive intact when the provider fails every 3rd chunk request after keeping
+only half of it. Box is measured too, but it stays a single streamed request
+(the real API caps that at 50 MB).
+"""
+import argparse
+import hashlib
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.dirname(__file__))
+
+from fake_cloud_provider import pattern_bytes  # noqa: E402
+
+_MiB = 1024 * 1024
+_TOKEN = 'bench-token'
+_BASES = {
+    'google_drive': ('/drive/v3', '/upload/drive/v3'),
+    'dropbox': ('/dropbox/2', '/dropbox-content/2'),
+    'onedrive': ('/graph/v1.0', '/graph/v1.0'),
+    'box': ('/box/2.0', '/box-upload/api/2.0'),
+}
+
+
+class PatternStream:
+    """File-like source of `size` bytes of the stand-in's pattern (like werkzeug's spooled upload)."""
+
+    def __init__(self, size):
+        self.size, self.pos = size, 0
+
+    def read(self, n=-1):
+        n = self.size - self.pos if n is None or n < 0 else min(n, self.size - self.pos)
+        data = pattern_bytes(self.pos, n)
+        self.pos += n
+        return data
+
+
+def pattern_sha256(size):
+    digest = hashlib.sha256()
+    for pos in range(0, size, 8 * _MiB):
+        digest.update(pattern_bytes(pos, min(8 * _MiB, size - pos)))
+    return digest.hexdigest()
+
+
+def _memory():
+    """(current RSS, peak RSS) of this process in bytes."""
+    values = {}
+    with open('/proc/self/status') as f:
+        for line in f:
+            key, _, rest = line.partition(':')
+            if key in ('VmRSS', 'VmHWM'):
+                values[key] = int(rest.split()[0]) * 1024
+    return values['VmRSS'], values['VmHWM']
+
+
+# ── Previous code (routes/routes_integrations.py before the change) ───────────
+
+def legacy_upload(provider, base, stream, filename):
+    headers = {'Authorization': f'Bearer {_TOKEN}'}
+    file_content = stream.read()
+    api, content = (base + p for p in _BASES[provider])
+    if provider == 'google_drive':
+        boundary = '-------314159265358979323846'
+        body = (
+            f'--{boundary}\r\n'
+            f'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+            f'{json.dumps({"name": filename})}\r\n'
+            f'--{boundary}\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8') + file_content + f'\r\n--{boundary}--'.encode('utf-8')
+        response = requests.post(f'{content}/files?uploadType=multipart', headers={
+            **headers, 'Content-Type': f'multipart/related; boundary={boundary}'}, data=body)
+        response.raise_for_status()
+        return response.json()['id']
+    if provider == 'dropbox':
+        response = requests.post(f'{content}/files/upload', headers={
+            **headers, 'Content-Type': 'application/octet-stream',
+            'Dropbox-API-Arg': json.dumps({'path': f'/{filename}', 'mode': 'add', 'autorename': True})},
+            data=file_content)
+        response.raise_for_status()
+        return response.json()['id'].removeprefix('id:')
+    if provider == 'box':
+        attributes = json.dumps({'name': filename, 'parent': {'id': '0'}})
+        response = requests.post(f'{content}/files/content', headers=headers, files={
+            'attributes': (None, attributes), 'file': (filename, file_content)})
+        response.raise_for_status()
+        return response.json()['entries'][0]['id']
+    response = requests.put(f'{api}/me/drive/root:/{filename}:/content', headers={
+        **headers, 'Content-Type': 'application/octet-stream'}, data=file_content)
+    response.raise_for_status()
+    return response.json()['id']
+
+
+def legacy_download(provider, base, file_id):
+    headers = {'Authorization': f'Bearer {_TOKEN}'}
+    api, content = (base + p for p in _BASES[provider])
+    if provider == 'google_drive':
+        response = requests.get(f'{api}/files/{file_id}?alt=media', headers=headers, stream=True)
+    elif provider == 'dropbox':
+        response = requests.post(f'{content}/files/download', stream=True, headers={
+            **headers, 'Dropbox-API-Arg': json.dumps({'path': f'id:{file_id}'})})
+    elif provider == 'box':
+        response = requests.get(f'{api}/files/{file_id}/content', headers=headers, stream=True)
+    else:
+        response = requests.get(f'{api}/me/drive/items/{file_id}/content', headers=headers, stream=True)
+    response.raise_for_status()
+    return 200, response.iter_content(chunk_size=8192)
+
+
+# ── New code ──────────────────────────────────────────────────────────────────
+
+def new_upload(provider, base, stream, filename):
+    from services.cloud_transfer import CloudTransfer
+
+    api, content = (base + p for p in _BASES[provider])
+    result = CloudTransfer.upload(provider, _TOKEN, stream, stream.size, filename, api_base=api, content_base=content)
+    return result['file']['id'].removeprefix('id:')
+
+
+def new_download(provider, base, file_id, range_header=None):
+    from flask import Flask
+
+    from services.cloud_transfer import CloudTransfer
+
+    api, content = (base + p for p in _BASES[provider])
+    with Flask(__name__).test_request_context():
+        response = CloudTransfer.download(provider, _TOKEN, f'id:{file_id}' if provider == 'dropbox' else file_id,
+                                          api_base=api, content_base=content, range_header=range_header)
+    return response.status_code, response.response, response.headers
+
+
+def child(args):
+    """One transfer in this process; prints a JSON line."""
+    base = args.base
+    if args.child.endswith('upload'):
+        stream = PatternStream(args.size)
+        baseline, _ = _memory()
+        t0 = time.perf_counter()
+        fn = legacy_upload if args.child == 'legacy-upload' else new_upload
+        file_id = fn(args.provider, base, stream, f'bench-{args.provider}.bin')
+        elapsed = time.perf_counter() - t0
+        _, peak = _memory()
+        blob = requests.get(f'{base}/_admin/blob', params={'id': file_id}).json()
+        ok = blob['size'] == args.size and blob['sha256'] == args.sha256
+        print(json.dumps({'ms': elapsed * 1000, 'peak': peak - baseline, 'ok': ok, 'chunks': None}))
+        return
+    baseline, _ = _memory()
+    t0 = time.perf_counter()
+    if args.child == 'legacy-download':
+        _, body = legacy_download(args.provider, base, args.file_id)
+    else:
+        _, body, _ = new_download(args.provider, base, args.file_id)
+    digest, chunks, size = hashlib.sha256(), 0, 0
+    for data in body:
+        digest.update(data)
+        chunks += 1
+        size += len(data)
+    elapsed = time.perf_counter() - t0
+    _, peak = _memory()
+    ok = size == args.size and digest.hexdigest() == args.sha256
+    print(json.dumps({'ms': elapsed * 1000, 'peak': peak - baseline, 'ok': ok, 'chunks': chunks}))
+
+
+def _run_child(mode, provider, base, size, sha256, file_id=None):
+    cmd = [sys.executable, __file__, '--child', mode, '--provider', provider, '--base', base,
+           '--size-bytes', str(size), '--sha256', sha256]
+    if file_id:
+        cmd += ['--file-id', file_id]
+    out = subprocess.run(cmd, capture_output=True, text=True)
+    if out.returncode != 0:
+        return {'ms': 0, 'peak': 0, 'ok': False, 'chunks': None, 'error': out.stderr.strip().splitlines()[-1:]}
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _start_fake(fail_every=0):
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    proc = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(__file__), 'fake_cloud_provider.py'),
+                             '--files', '0', '--port', str(port), '--fail-every', str(fail_every)],
+                            stdout=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{port}'
+    for _ in range(100):
+        try:
+            requests.get(f'{base}/_admin/documents', timeout=1)
+            return proc, base
+        except requests.ConnectionError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit('fake_cloud_provider did not start')
+
+
+def _row(label, size, result):
+    if result.get('error'):
+        return f"  {label:<20} FAILED: {' '.join(result['error'])}"
+    mbps = size / _MiB / (result['ms'] / 1000) if result['ms'] else 0
+    chunks = f"{result['chunks']:>9,} chunks" if result['chunks'] is not None else ''
+    flag = '' if result['ok'] else '   FAIL: wrong bytes'
+    return f"  {label:<20}{result['ms'] / 1000:8.1f} s {mbps:8.0f} MB/s   peak +{result['peak'] / _MiB:7.0f} MB {chunks}{flag}"
+
+
+def check_ranges(provider, base, file_id, size):
+    """Range passthrough through CloudTransfer.download; returns a list of failures."""
+    failures = []
+    for header, start, end in (('bytes=1000000-1999999', 1_000_000, 2_000_000),
+                               ('bytes=-500', size - 500, size),
+                               (f'bytes={size - 10}-', size - 10, size)):
+        status, body, headers = new_download(provider, base, file_id, header)
+        data = b''.join(body)
+        if status != 206 or data != pattern_bytes(start, end - start) \
+                or headers.get('Content-Range') != f'bytes {start}-{end - 1}/{size}':
+            failures.append(f'{header}: {status} {len(data)} bytes {headers.get("Content-Range")}')
+    status, body, _ = new_download(provider, base, file_id, f'bytes={size}-')
+    b''.join(body)
+    if status != 416:
+        failures.append(f'bytes={size}-: {status}, expected 416')
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--size', type=int, default=1024, help='file size in MB')
+    parser.add_argument('--retry-size', type=int, default=64, help='file size in MB for the failing-provider run')
+    parser.add_argument('--providers', nargs='+', default=list(_BASES))
+    parser.add_argument('--skip-legacy', action='store_true', help='do not run the previous code (needs ~2x --size RAM)')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--provider', help=argparse.SUPPRESS)
+    parser.add_argument('--base', help=argparse.SUPPRESS)
+    parser.add_argument('--size-bytes', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--sha256', help=argparse.SUPPRESS)
+    parser.add_argument('--file-id', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        args.size = args.size_bytes
+        return child(args)
+
+    size = args.size * _MiB
+    sha256 = pattern_sha256(size)
+    failed = False
+    proc, base = _start_fake()
+    try:
+        print(f'{args.size} MB files, stand-in provider at {base}')
+        for provider in args.providers:
+            print(f'\n{provider}')
+            results = []
+            if not args.skip_legacy:
+                results.append(('previous upload', _run_child('legacy-upload', provider, base, size, sha256)))
+            results.append(('streamed upload', _run_child('upload', provider, base, size, sha256)))
+            file_id = requests.post(f'{base}/_admin/blob', json={'size': size, 'name': 'bench.bin'}).json()['id']
+            if not args.skip_legacy:
+                results.append(('previous download', _run_child('legacy-download', provider, base, size, sha256, file_id)))
+            results.append(('streamed download', _run_child('download', provider, base, size, sha256, file_id)))
+            for label, result in results:
+                print(_row(label, size, result))
+                failed |= not result['ok']
+            for failure in check_ranges(provider, base, file_id, size):
+                print(f'  FAIL: Range {failure}')
+                failed = True
+    finally:
+        proc.terminate()
+
+    retry_size = args.retry_size * _MiB
+    retry_sha = pattern_sha256(retry_size)
+    proc, base = _start_fake(fail_every=3)
+    try:
+        print(f'\n{args.retry_size} MB uploads, provider failing every 3rd chunk request after keeping half of it')
+        for provider in [p for p in args.providers if p != 'box']:
+            result = _run_child('upload', provider, base, retry_size, retry_sha)
+            print(_row(provider, retry_size, result))
+            failed |= not result['ok']
+    finally:
+        proc.terminate()
+
+    if failed:
+        sys.exit(1)
+    print('\nOK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,151 @@
+"""
+Comment listing of a heavily annotated document: SQL statements and latency
+of the previous loader (root comments, then `c.replies` per comment, then a
+lazy `author` load per to_dict) vs CommentTree.load (one query, authors
+joined) and CommentTree.get served from Redis.
+
+    python scripts/tools/bench_comment_tree.py [--roots 150 --replies 3]
+    REDIS_URL=redis://localhost:6379 python scripts/tools/bench_comment_tree.py
+
+Also the query-count regression check for the loader: CommentTree.load must
+issue exactly one statement however many comments and authors there are,
+and return the same threads as the previous loader; exits 1 otherwise.
+Uses a bare Flask app on the repo's models (SQLite temp file by default,
+--database-url for MySQL). Without REDIS_URL the cached row is skipped.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from models.models import Document, DocumentComment, User  # noqa: E402
+from services.comment_tree import CommentTree  # noqa: E402
+from settings.extensions import db, redis_client  # noqa: E402
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def populate(roots, replies, authors):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(db.insert(User), [
+        {'email': f'reviewer{i}@example.org', 'name': f'Reviewer{i}', 'lastname': 'Bench'}
+        for i in range(authors)])
+    user_ids = [uid for (uid,) in db.session.query(User.id)]
+    doc = Document(title='Thesis draft', owner_id=user_ids[0])
+    db.session.add(doc)
+    db.session.flush()
+
+    rnd = random.Random(3)
+    start = datetime(2024, 3, 1)
+    root_rows = [{'document_id': doc.id, 'author_id': rnd.choice(user_ids),
+                  'text': f'Comment {i}: please cite a source for this claim.',
+                  'selection_from': i * 40, 'selection_to': i * 40 + 25, 'color': '#FDE68A',
+                  'resolved': i % 4 == 0, 'created_at': start + timedelta(minutes=i)}
+                 for i in range(roots)]
+    db.session.execute(db.insert(DocumentComment), root_rows)
+    root_ids = [cid for (cid,) in db.session.query(DocumentComment.id).order_by(DocumentComment.id)]
+    db.session.execute(db.insert(DocumentComment), [
+        {'document_id': doc.id, 'author_id': rnd.choice(user_ids), 'text': f'Reply {j} to {rid}',
+         'parent_id': rid, 'color': '#FDE68A',
+         'created_at': start + timedelta(days=1, minutes=k * replies + j)}
+        for k, rid in enumerate(root_ids) for j in range(replies)])
+    db.session.commit()
+    return doc.id
+
+
+def legacy_list(doc_id):
+    """list_comments as it was before the keyset/tree work."""
+    roots = (DocumentComment.query.filter_by(document_id=doc_id, parent_id=None)
+             .order_by(DocumentComment.created_at.asc()).all())
+    result = []
+    for c in roots:
+        c_dict = c.to_dict()
+        c_dict['replies'] = [r.to_dict() for r in c.replies.order_by(DocumentComment.created_at.asc()).all()]
+        result.append(c_dict)
+    return result
+
+
+def _measure(fn, doc_id, statements, repeat):
+    samples, sql = [], 0
+    for _ in range(repeat):
+        db.session.expunge_all()
+        statements[0] = 0
+        t0 = time.perf_counter()
+        result = fn(doc_id)
+        samples.append((time.perf_counter() - t0) * 1000)
+        sql = statements[0]
+    return result, statistics.median(samples), sql
+
+
+def _threads(tree):
+    return [(n['id'], n['author_name'], [r['id'] for r in n['replies']]) for n in tree]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--roots', type=int, default=150)
+    parser.add_argument('--replies', type=int, default=3, help='replies per root comment')
+    parser.add_argument('--authors', type=int, default=12)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "bench_comments.db")}'
+    app = _make_app(url)
+    failed = False
+    with app.app_context():
+        statements = [0]
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *a, **kw: statements.__setitem__(0, statements[0] + 1))
+        doc_id = populate(args.roots, args.replies, args.authors)
+        total = args.roots * (1 + args.replies)
+        print(f'{db.engine.dialect.name}: {args.roots} comments + {args.roots * args.replies} replies '
+              f'({total} rows, {args.authors} authors)')
+
+        legacy, legacy_ms, legacy_sql = _measure(legacy_list, doc_id, statements, args.repeat)
+        tree, tree_ms, tree_sql = _measure(CommentTree.load, doc_id, statements, args.repeat)
+        print(f'  previous loader     {legacy_ms:9.2f} ms   SQL statements {legacy_sql:>5}')
+        print(f'  CommentTree.load    {tree_ms:9.2f} ms   SQL statements {tree_sql:>5}')
+
+        if tree_sql != 1:
+            print(f'FAIL: CommentTree.load issued {tree_sql} statements, expected 1')
+            failed = True
+        if _threads(tree) != _threads(legacy):
+            print('FAIL: CommentTree.load and the previous loader return different threads')
+            failed = True
+
+        if os.environ.get('REDIS_URL') and redis_client.ping():
+            CommentTree.invalidate(doc_id)
+            CommentTree.get(doc_id)
+            _, cached_ms, cached_sql = _measure(CommentTree.get, doc_id, statements, args.repeat)
+            print(f'  CommentTree.get     {cached_ms:9.2f} ms   SQL statements {cached_sql:>5}   (Redis hit)')
+            CommentTree.invalidate(doc_id)
+            _, _, miss_sql = _measure(CommentTree.get, doc_id, statements, 1)
+            if miss_sql != 1:
+                print(f'FAIL: after invalidate() the tree was not reloaded ({miss_sql} statements)')
+                failed = True
+        db.drop_all()
+
+    if failed:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""
+Contribution summary and ingestion: the previous path (SUM(CASE…) over every
+snapshot of the document + User.query.get per contributor + a last-snapshot
+query; one INSERT + COMMIT per POST) vs services/contributions (rollup read
+joined with users; buffered batches written as one multi-row INSERT + rollup
+upsert per transaction), on a document with --snapshots snapshots.
+
+    python scripts/tools/bench_contributions.py [--snapshots 500000]
+    python scripts/tools/bench_contributions.py --database-url mysql+mysqldb://root:@localhost/xplagiax_bench
+
+Also checks that the rollup summary equals the full re-aggregation after
+ingestion and after archiving snapshots older than --archive-days (then
+prints the archive compression). Uses a bare Flask app on the repo's models
+(SQLite temp file by default, --database-url for a scratch MySQL).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event, func  # noqa: E402
+
+from models.models import ContributionArchive, ContributionSnapshot, Document, User  # noqa: E402
+from services.contributions import _FLUSH_BATCH, CONTRIBUTOR_COLORS, ContributionStore  # noqa: E402
+from settings.extensions import db  # noqa: E402
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def _snapshot(rnd, doc_id, user_ids, created_at):
+    delta = rnd.choice((0, 1, 2, 3, 5, 8, 13, -1, -2, -4))
+    return {'document_id': doc_id, 'user_id': rnd.choice(user_ids),
+            'action': 'insert' if delta > 0 else ('delete' if delta < 0 else 'format'),
+            'content': 'lorem ipsum dolor sit amet'[:max(delta, 0) * 3], 'position_from': rnd.randrange(20000),
+            'position_to': None, 'word_count_delta': delta, 'created_at': created_at}
+
+
+def populate(snapshots, users, days):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(db.insert(User), [
+        {'email': f'writer{i}@example.org', 'name': f'Writer{i}', 'lastname': 'Bench'} for i in range(users)])
+    user_ids = [uid for (uid,) in db.session.query(User.id)]
+    doc = Document(title='Group essay', owner_id=user_ids[0])
+    db.session.add(doc)
+    db.session.commit()
+
+    rnd = random.Random(11)
+    start = datetime.utcnow() - timedelta(days=days)
+    step = timedelta(days=days) / max(snapshots, 1)
+    chunk = 20_000
+    for first in range(0, snapshots, chunk):
+        db.session.execute(db.insert(ContributionSnapshot), [
+            _snapshot(rnd, doc.id, user_ids, start + step * i)
+            for i in range(first, min(snapshots, first + chunk))])
+        db.session.commit()
+    ContributionStore.rebuild_rollups()
+    return doc.id, user_ids
+
+
+def legacy_summary(doc_id):
+    """get_contributions_summary as it was (minus jsonify)."""
+    rows = (
+        db.session.query(
+            ContributionSnapshot.user_id,
+            func.sum(db.case((ContributionSnapshot.word_count_delta > 0, ContributionSnapshot.word_count_delta),
+                             else_=0)).label('words_added'),
+            func.sum(db.case((ContributionSnapshot.word_count_delta < 0, ContributionSnapshot.word_count_delta),
+                             else_=0)).label('words_removed'),
+            func.max(ContributionSnapshot.created_at).label('last_active'),
+        )
+        .filter(ContributionSnapshot.document_id == doc_id)
+        .group_by(ContributionSnapshot.user_id)
+        .all()
+    )
+    total_words_added = sum(max(int(r.words_added or 0), 0) for r in rows)
+    contributors = []
+    for i, row in enumerate(rows):
+        user = User.query.get(row.user_id)
+        if not user:
+            continue
+        words_added = int(row.words_added or 0)
+        words_removed = abs(int(row.words_removed or 0))
+        contributors.append({
+            'user_id': row.user_id,
+            'user_name': f"{user.name or ''} {user.lastname or ''}".strip() or user.email,
+            'words_added': words_added, 'words_removed': words_removed,
+            'net_words': words_added - words_removed,
+            'percentage': round((words_added / total_words_added * 100) if total_words_added > 0 else 0, 1),
+            'color': CONTRIBUTOR_COLORS[i % len(CONTRIBUTOR_COLORS)],
+            'last_active': row.last_active.isoformat() if row.last_active else None,
+        })
+    contributors.sort(key=lambda x: x['words_added'], reverse=True)
+    last = (ContributionSnapshot.query.filter_by(document_id=doc_id)
+            .order_by(ContributionSnapshot.created_at.desc()).first())
+    return {'contributors': contributors, 'total_words_added': total_words_added,
+            'last_updated': last.created_at.isoformat() if last else None}
+
+
+def _timed(fn, statements, repeat):
+    samples = []
+    for _ in range(repeat):
+        db.session.expunge_all()
+        statements[0] = 0
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples), statements[0]
+
+
+def _totals(summary):
+    """Summary without last_active (archiving keeps totals, not the raw rows)."""
+    return [(c['user_id'], c['words_added'], c['words_removed']) for c in summary['contributors']], \
+        summary['total_words_added']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--snapshots', type=int, default=500_000)
+    parser.add_argument('--users', type=int, default=6)
+    parser.add_argument('--days', type=int, default=365, help='span of the stored snapshots')
+    parser.add_argument('--ingest', type=int, default=5000, help='snapshots for the ingestion comparison')
+    parser.add_argument('--archive-days', type=int, default=90)
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "bench_contrib.db")}'
+    app = _make_app(url)
+    failed = False
+    with app.app_context():
+        statements = [0]
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *a, **kw: statements.__setitem__(0, statements[0] + 1))
+        t0 = time.perf_counter()
+        doc_id, user_ids = populate(args.snapshots, args.users, args.days)
+        print(f'{db.engine.dialect.name}: {args.snapshots:,} snapshots, {args.users} contributors '
+              f'(populated in {time.perf_counter() - t0:.1f}s)')
+
+        legacy_ms, legacy_sql = _timed(lambda: legacy_summary(doc_id), statements, args.repeat)
+        rollup_ms, rollup_sql = _timed(lambda: ContributionStore.summary(doc_id), statements, args.repeat)
+        print(f'summary   previous {legacy_ms:9.2f} ms ({legacy_sql} statements)   '
+              f'rollup {rollup_ms:7.2f} ms ({rollup_sql} statement)   {legacy_ms / rollup_ms:6.0f}x')
+        if ContributionStore.summary(doc_id) != legacy_summary(doc_id):
+            print('FAIL: rollup summary differs from the full aggregation')
+            failed = True
+
+        rnd = random.Random(5)
+        fresh = [_snapshot(rnd, doc_id, user_ids, datetime.utcnow()) for _ in range(args.ingest)]
+        last_id = db.session.query(func.max(ContributionSnapshot.id)).scalar()
+        statements[0] = 0
+        t0 = time.perf_counter()
+        for row in fresh:
+            db.session.add(ContributionSnapshot(**row))
+            db.session.commit()
+        per_request_ms = (time.perf_counter() - t0) * 1000
+        per_request_sql = statements[0]
+        # Las filas por-request no pasan por los rollups: fuera antes del camino nuevo
+        db.session.query(ContributionSnapshot).filter(ContributionSnapshot.id > last_id).delete()
+        db.session.commit()
+
+        statements[0] = 0
+        t0 = time.perf_counter()
+        for first in range(0, len(fresh), _FLUSH_BATCH):
+            ContributionStore.write([dict(row) for row in fresh[first:first + _FLUSH_BATCH]])
+        batched_ms = (time.perf_counter() - t0) * 1000
+        print(f'ingest    {args.ingest} snapshots: per-request {per_request_ms:8.1f} ms ({per_request_sql} statements)'
+              f'   batched {batched_ms:7.1f} ms ({statements[0]} statements, {_FLUSH_BATCH}/batch)')
+        if ContributionStore.summary(doc_id) != legacy_summary(doc_id):
+            print('FAIL: rollups diverged from the snapshots after batched ingestion')
+            failed = True
+
+        before = _totals(ContributionStore.summary(doc_id))
+        t0 = time.perf_counter()
+        report = ContributionStore.archive(timedelta(days=args.archive_days))
+        elapsed = time.perf_counter() - t0
+        ratio = report['raw_bytes'] / report['stored_bytes'] if report['stored_bytes'] else 0
+        print(f"archive   {report['snapshots']:,} snapshots older than {args.archive_days} days -> "
+              f"{report['archives']} archive rows in {elapsed:.1f}s, "
+              f"{report['raw_bytes'] / 1e6:.1f} MB -> {report['stored_bytes'] / 1e6:.1f} MB ({ratio:.1f}x)")
+        remaining = db.session.query(ContributionSnapshot).count()
+        archived = sum(len(ContributionStore.read_archive(a)) for a in ContributionArchive.query)
+        if _totals(ContributionStore.summary(doc_id)) != before:
+            print('FAIL: archiving changed the summary totals')
+            failed = True
+        if archived != report['snapshots'] or remaining + archived != args.snapshots + args.ingest:
+            print(f'FAIL: {archived} archived + {remaining} remaining != {args.snapshots + args.ingest}')
+            failed = True
+        rollup_ms, _ = _timed(lambda: ContributionStore.summary(doc_id), statements, args.repeat)
+        print(f'summary   after archiving: rollup {rollup_ms:.2f} ms')
+        db.drop_all()
+
+    if failed:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+"""
+Document cache: legacy JSON string (document:{id}) vs services/document_cache
+(binary hash, per-field codec). For payload sizes taken from the size_bytes
+percentiles of the real marktrack_documents table, reports Redis MEMORY USAGE
+and hit latency (full payload, delta-only, html-only).
+
+    python scripts/tools/bench_document_cache.py [iterations]
+
+Needs the app's database and Redis.
+"""
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from models.models import Document  # noqa: E402
+from services.document_cache import DocumentCache  # noqa: E402
+from settings.extensions import redis_bytes_client  # noqa: E402
+
+_BENCH_ID = 2_000_000_000
+_WORDS = ('the essay argues that evidence from primary sources supports a '
+          'nuanced reading of historical change across several decades').split()
+
+
+def _percentile_sizes():
+    sizes = sorted(s for (s,) in Document.query.with_entities(Document.size_bytes) if s)
+    if not sizes:
+        return {'p50': 20_000, 'p90': 200_000, 'p99': 1_500_000, 'max': 5_000_000}
+    pick = lambda q: sizes[min(len(sizes) - 1, int(q * len(sizes)))]  # noqa: E731
+    return {'p50': pick(0.5), 'p90': pick(0.9), 'p99': pick(0.99), 'max': sizes[-1]}
+
+
+def _payload(size):
+    ops, html, total, i = [], [], 0, 0
+    while total < size / 2:
+        text = ' '.join(_WORDS[(i + k) % len(_WORDS)] for k in range(40)) + '\n'
+        ops.append({'insert': text, 'attributes': {'bold': True}} if i % 7 == 0 else {'insert': text})
+        html.append(f'<p>{text}</p>')
+        total += len(text)
+        i += 1
+    return {'id': _BENCH_ID, 'title': 'bench', 'delta': {'ops': ops}, 'html': ''.join(html),
+            'storage_type': 'database', 'size_bytes': size, 'version_number': 1,
+            'created_at': '2026-01-01T00:00:00', 'updated_at': '2026-01-01T00:00:00'}
+
+
+def _timed(fn, n):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1000
+
+
+def run(n=50):
+    legacy_key = f'document:{_BENCH_ID}'
+    with app.app_context():
+        sizes = _percentile_sizes()
+        stats = DocumentCache.stats()
+        print(f'codec: {stats["serializer"]}+{stats["compressor"]}')
+        print(f'{"":5s} {"size":>9s} {"legacy mem":>11s} {"v2 mem":>9s} '
+              f'{"legacy hit":>11s} {"v2 full":>9s} {"v2 delta":>9s} {"v2 html":>9s}')
+        for label, size in sizes.items():
+            payload = _payload(size)
+            redis_bytes_client.setex(legacy_key, 300, json.dumps(payload))
+            DocumentCache.put(_BENCH_ID, payload)
+            legacy_mem = redis_bytes_client.memory_usage(legacy_key) or 0
+            v2_mem = redis_bytes_client.memory_usage(f'document:v2:{_BENCH_ID}') or 0
+
+            legacy = _timed(lambda: json.loads(redis_bytes_client.get(legacy_key)), n)
+            full = _timed(lambda: DocumentCache.get(_BENCH_ID), n)
+            delta = _timed(lambda: DocumentCache.get(_BENCH_ID, ('delta',)), n)
+            html = _timed(lambda: DocumentCache.get(_BENCH_ID, ('html',)), n)
+            print(f'{label:5s} {size / 1e3:8.0f}K {legacy_mem / 1e3:10.0f}K {v2_mem / 1e3:8.0f}K '
+                  f'{legacy:9.2f}ms {full:7.2f}ms {delta:7.2f}ms {html:7.2f}ms')
+        DocumentCache.invalidate(_BENCH_ID)
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,84 @@
+"""
+DOCX import: legacy pipeline (base64-inlined images + two BeautifulSoup
+passes + base64 decode on save) vs services/docx_import (single tree walk,
+images handed to the uploader as raw bytes). Reports wall time and the
+tracemalloc peak for a generated 200-page DOCX with 100 images.
+
+    python scripts/tools/bench_docx_import.py [pages] [images]
+
+Uploads are replaced by a no-op sink so only conversion cost is measured.
+"""
+import base64
+import os
+import sys
+import time
+import tracemalloc
+from io import BytesIO
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import mammoth  # noqa: E402
+from bs4 import BeautifulSoup  # noqa: E402
+from docx import Document as DocxDocument  # noqa: E402
+from docx.shared import Inches  # noqa: E402
+from PIL import Image  # noqa: E402
+
+from services.docx_import import _convert  # noqa: E402
+
+
+def _build_docx(pages, images):
+    img = BytesIO()
+    Image.new('RGB', (1200, 800), (120, 160, 200)).save(img, format='PNG')
+    doc = DocxDocument()
+    every = max(1, pages // max(images, 1))
+    for page in range(pages):
+        doc.add_heading(f'Chapter {page}', level=2)
+        for _ in range(6):
+            p = doc.add_paragraph('Lorem ipsum dolor sit amet, consectetur adipiscing elit. ' * 4)
+            p.add_run(' bold tail').bold = True
+        if page % every == 0 and images:
+            img.seek(0)
+            doc.add_picture(img, width=Inches(4))
+            images -= 1
+    out = BytesIO()
+    doc.save(out)
+    return out
+
+
+def _legacy(stream):
+    def to_b64(image):
+        with image.open() as f:
+            return {'src': f'data:{image.content_type};base64,{base64.b64encode(f.read()).decode()}'}
+    html = mammoth.convert_to_html(stream, convert_image=mammoth.images.inline(to_b64)).value
+    html = str(BeautifulSoup(html, 'html.parser'))          # process_html_for_quill
+    soup = BeautifulSoup(html, 'html.parser')               # html_to_basic_delta
+    for img in soup.find_all('img'):                        # extract_and_upload_images
+        base64.b64decode(img['src'].split(',', 1)[1])
+    return html
+
+
+def _new(stream):
+    return _convert(stream, lambda data, ext: '/document_bp/api/image/x.' + ext)
+
+
+def _measure(fn, data):
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    fn(BytesIO(data))
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def run(pages=200, images=100):
+    data = _build_docx(pages, images).getvalue()
+    print(f'DOCX: {pages} pages, {images} images, {len(data) / 1e6:.1f} MB')
+    for name, fn in (('legacy', _legacy), ('stream', _new)):
+        elapsed, peak = _measure(fn, data)
+        print(f'  {name:7s} wall={elapsed:6.2f}s  peak={peak / 1e6:7.1f} MB')
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:3]]
+    run(*args)
@@ -0,0 +1,175 @@
+"""
+Incremental grammar analysis (MultiLanguageQuillAnalyzer.analyze_incremental)
+vs whole-text analyze(), replaying editing sessions against the inference
+service of services/grammar_inference.py.
+
+    python scripts/tools/bench_grammar_incremental.py [--paragraphs 24 --steps 20 --models random|real]
+
+A session is a document of --paragraphs paragraphs (3 sentences each) that
+the student edits --steps times; every step rewrites sentences (and now and
+then adds a paragraph) until 1–5% of the characters changed, and the editor
+re-sends the whole document, as the Quill client does. One English and one
+French session. Per call:
+
+  no cache      whole text, sentence cache disabled: every sentence through
+                the model again (the analyzer before the inference service;
+                only the first --baseline-steps steps, it is slow).
+  analyze       whole text, sentence LRU warm.
+  incremental   analyze_incremental(text, doc_id): changed paragraphs only.
+
+Reports mean latency, sentences generated and language detections per call.
+--models random uses the random-init t5-small of bench_grammar_inference.py
+(timings only). Exits 1 (FAIL) when the incremental result differs from
+analyze(), an edit's offset does not point at its text in the document, or
+incremental is not faster than analyze.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.dirname(__file__))
+
+from routes.multilang_quill import MultiLanguageQuillAnalyzer  # noqa: E402
+from services import grammar_inference  # noqa: E402
+from services.grammar_inference import GrammarService, load_models, serve  # noqa: E402
+
+WORDS = {
+    'en': ('the student were write an essays about their summer holiday and they goes to beach with friends '
+           'who has many idea for the next years project but nobody know how start it because teacher say '
+           'it must be finish before monday').split(),
+    'fr': ('les élèves a écrit une rédaction sur leurs vacances et ils est allé à la plage avec des amis qui '
+           'avait beaucoup de idée pour le projet de année prochaine mais personne sais comment le commencer '
+           'parce que le professeur dit que il faut le finir avant lundi').split(),
+}
+
+
+def sentence(rng, lang) -> str:
+    return ' '.join(rng.choice(WORDS[lang]) for _ in range(rng.randint(10, 18))).capitalize() + '.'
+
+
+def session(rng, lang, paragraphs, steps):
+    """Successive full texts of one editing session (1–5% of characters changed per step)."""
+    doc = [[sentence(rng, lang) for _ in range(3)] for _ in range(paragraphs)]
+    texts = ['\n'.join(' '.join(p) for p in doc) + '\n']
+    for _ in range(steps):
+        size = len(texts[-1])
+        budget = size * rng.uniform(0.01, 0.05)
+        changed = 0
+        if rng.random() < 0.1:
+            doc.append([sentence(rng, lang)])
+            changed += len(doc[-1][0])
+        while changed < budget:
+            p = rng.randrange(len(doc))
+            s = rng.randrange(len(doc[p]))
+            doc[p][s] = sentence(rng, lang)
+            changed += len(doc[p][s])
+        texts.append('\n'.join(' '.join(p) for p in doc) + '\n')
+    return texts
+
+
+class _CountingDetect:
+    """Wraps detect_language to count calls (it runs in this process for analyze_incremental)."""
+
+    def __init__(self):
+        self.calls = 0
+        self._detect = grammar_inference.detect_language
+
+    def __call__(self, text):
+        self.calls += 1
+        return self._detect(text)
+
+
+def replay(analyze, service, texts, detect):
+    latencies, generated, detections = [], [], []
+    results = []
+    for text in texts:
+        before, calls = service.stats()['sentences'], detect.calls
+        t0 = time.perf_counter()
+        results.append(analyze(text))
+        latencies.append(time.perf_counter() - t0)
+        generated.append(service.stats()['sentences'] - before)
+        detections.append(detect.calls - calls)
+    return results, latencies, generated, detections
+
+
+def report(label, latencies, generated, detections):
+    print(f'  {label:<12} {statistics.mean(latencies) * 1000:9.1f} ms/call   p95 '
+          f'{sorted(latencies)[int(len(latencies) * 0.95) - 1] * 1000:9.1f} ms   '
+          f'{statistics.mean(generated):5.1f} sentences generated   {statistics.mean(detections):3.1f} detections')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--paragraphs', type=int, default=24)
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--baseline-steps', type=int, default=2)
+    parser.add_argument('--models', choices=('random', 'real'), default='random')
+    args = parser.parse_args()
+
+    import torch
+    torch.set_num_threads(1)
+    if args.models == 'random':
+        from bench_grammar_inference import random_models
+        models = random_models(False)
+    else:
+        models = load_models()
+
+    detect = _CountingDetect()
+    grammar_inference.detect_language = detect               # servicio y analizador comparten el proceso
+    import routes.multilang_quill as multilang_quill
+    multilang_quill.detect_language = detect
+
+    service = GrammarService(workers=1, threads=1, max_batch=32, models=models).start()
+    _, base = serve(service, port=0)
+    uncached = GrammarService(workers=1, threads=1, max_batch=32, cache_size=1, models=models).start()
+    _, uncached_base = serve(uncached, port=0)
+
+    rng = random.Random(11)
+    failed = False
+    overall = {'analyze': [], 'incremental': []}
+    for lang in ('en', 'fr'):
+        texts = session(rng, lang, args.paragraphs, args.steps)
+        print(f'{lang} session: {len(texts[0])} characters, {args.steps} edits of 1–5%')
+
+        # Estado inicial: el documento ya se analizó una vez en ambos modos
+        full = MultiLanguageQuillAnalyzer(url=base)
+        incremental = MultiLanguageQuillAnalyzer(url=base)
+        full.analyze(texts[0])
+        incremental.analyze_incremental(texts[0], doc_id=lang)
+
+        baseline = MultiLanguageQuillAnalyzer(url=uncached_base)
+        _, lat, gen, det = replay(baseline.analyze, uncached, texts[1:1 + args.baseline_steps], detect)
+        report('no cache', lat, gen, det)
+        full_results, lat, gen, det = replay(full.analyze, service, texts[1:], detect)
+        report('analyze', lat, gen, det)
+        overall['analyze'] += lat
+        inc_results, lat, gen, det = replay(lambda t: incremental.analyze_incremental(t, doc_id=lang),
+                                            service, texts[1:], detect)
+        report('incremental', lat, gen, det)
+        overall['incremental'] += lat
+
+        for text, a, b in zip(texts[1:], full_results, inc_results):
+            if a['corrected'] != b['corrected'] or a['language'] != b['language']:
+                print('FAIL: incremental result differs from analyze()')
+                failed = True
+                break
+            bad = [e for e in b['edits'] if text[e['offset']:e['offset'] + e['length']] != e['original']]
+            if bad:
+                print(f'FAIL: {len(bad)} edits point outside their text, e.g. {bad[0]}')
+                failed = True
+                break
+
+    speedup = statistics.mean(overall['analyze']) / statistics.mean(overall['incremental'])
+    print(f'incremental vs analyze: {speedup:.1f}x faster per call')
+    if speedup <= 1:
+        failed = True
+    print('FAIL' if failed else 'OK', flush=True)
+    os._exit(1 if failed else 0)        # sin esperar al teardown de los pools de procesos
+
+
+if __name__ == '__main__':
+    main()
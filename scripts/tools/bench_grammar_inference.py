@@ -0,0 +1,173 @@
+"""
+Grammar-correction inference on CPU (services/grammar_inference.py).
+
+    python scripts/tools/bench_grammar_inference.py [--models random|real] [--int8] [--clients 8]
+
+  batch     sentences/sec of one padded generate(num_beams=4) at batch sizes
+            1, 2, 4, 8, 16, 32 (fp32, and int8 with --int8).
+  service   --clients concurrent requests of --sentences sentences each
+            through the HTTP service: --max-batch 1 (one generate per
+            sentence, as MultiLanguageQuillAnalyzer did) vs dynamic
+            micro-batching; then the same requests again (sentence LRU).
+
+--models real loads the production checkpoints (Gramformer's T5 and the
+French T5; needs the Hugging Face cache or network). --models random builds
+a randomly initialised t5-small with a word-hash tokenizer, which has the
+same cost profile and needs no download: the sentences it "corrects" are
+noise, only the timings mean something. Exits 1 (FAIL) when micro-batching
+is not faster than one generate per sentence or cached requests reach the
+models.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+import warnings
+import zlib
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from services.grammar_inference import GrammarClient, GrammarService, _Seq2Seq, load_models, serve  # noqa: E402
+
+WORDS = ('the student were write an essays about their summer holiday and they goes to beach '
+         'with friends who has many idea for the next years project but nobody know how start it').split()
+
+
+class _WordTokenizer:
+    """Word → hashed id tokenizer for the random model (ids 0/1 are pad/eos, as in T5)."""
+
+    def __init__(self, vocab: int):
+        self.vocab = vocab
+
+    def __call__(self, texts, return_tensors='pt', padding=True, truncation=True, max_length=128):
+        import torch
+
+        rows = [[2 + zlib.crc32(w.encode()) % (self.vocab - 2) for w in t.split()][:max_length - 1] + [1]
+                for t in texts]
+        width = max(len(r) for r in rows)
+        ids = torch.zeros((len(rows), width), dtype=torch.long)
+        mask = torch.zeros_like(ids)
+        for i, row in enumerate(rows):
+            ids[i, :len(row)] = torch.tensor(row)
+            mask[i, :len(row)] = 1
+        return {'input_ids': ids, 'attention_mask': mask}
+
+    def batch_decode(self, out, skip_special_tokens=True):
+        return [' '.join(f'w{int(t)}' for t in row if int(t) > 1) for row in out]
+
+
+def random_models(int8: bool) -> dict:
+    import torch
+    from transformers import T5Config, T5ForConditionalGeneration
+
+    torch.manual_seed(0)
+    config = T5Config(vocab_size=32128, d_model=512, d_ff=2048, d_kv=64, num_layers=6, num_decoder_layers=6,
+                      num_heads=8, decoder_start_token_id=0, pad_token_id=0, eos_token_id=1)
+    model = T5ForConditionalGeneration(config).eval()
+    if int8:
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore')
+            model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    seq = _Seq2Seq(model, _WordTokenizer(config.vocab_size), 'gec: ', 128)
+    return {'en': seq, 'fr': seq, 'gramformer': None}
+
+
+def sentence(rng) -> str:
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(12, 20))).capitalize() + '.'
+
+
+def bench_batches(models, label, rng):
+    seq = models['en']
+    seq.correct([sentence(rng)], 4)                          # warm-up
+    rates = {}
+    for size in (1, 2, 4, 8, 16, 32):
+        batch = [sentence(rng) for _ in range(size)]
+        t0 = time.perf_counter()
+        seq.correct(batch, 4)
+        rates[size] = size / (time.perf_counter() - t0)
+    print(f'  {label:<5} ' + '  '.join(f'b{size}: {rate:5.1f}' for size, rate in rates.items()) + '  sentences/s')
+    return rates
+
+
+def bench_service(models, max_batch, texts, label, clients):
+    service = GrammarService(workers=1, threads=1, max_batch=max_batch, max_wait_ms=5, models=models).start()
+    server, base = serve(service, port=0)
+    client = GrammarClient(base)
+    client.analyze('Warm up the worker.')
+
+    def run(results, latencies):
+        barrier = threading.Barrier(len(texts))
+
+        def one(i):
+            barrier.wait()
+            t0 = time.perf_counter()
+            results[i] = client.analyze(texts[i])
+            latencies[i] = time.perf_counter() - t0
+
+        threads = [threading.Thread(target=one, args=(i,)) for i in range(len(texts))]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - t0
+
+    n_sentences = sum(len([p for p in t.split('. ') if p]) for t in texts)
+    results, latencies = [None] * len(texts), [0.0] * len(texts)
+    before = service.stats()
+    wall = run(results, latencies)
+    after = service.stats()
+    batches = after['batches'] - before['batches']
+    print(f'  {label:<22} {n_sentences / wall:6.1f} sentences/s   p50 {statistics.median(latencies):6.2f} s   '
+          f'{batches:3d} generate() calls, avg batch {(after["sentences"] - before["sentences"]) / max(batches, 1):4.1f}')
+
+    again, cached_lat = [None] * len(texts), [0.0] * len(texts)
+    cached_wall = run(again, cached_lat)
+    extra = service.stats()['batches'] - after['batches']
+    server.shutdown()
+    service._pool.shutdown(cancel_futures=True)
+    return n_sentences / wall, results, again, cached_wall, extra
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--models', choices=('random', 'real'), default='random')
+    parser.add_argument('--int8', action='store_true', help='also measure dynamic int8 quantization')
+    parser.add_argument('--clients', type=int, default=8, help='concurrent requests')
+    parser.add_argument('--sentences', type=int, default=4, help='sentences per request')
+    args = parser.parse_args()
+
+    import torch
+    torch.set_num_threads(1)
+    rng = random.Random(7)
+    load = (lambda int8: random_models(int8)) if args.models == 'random' else (lambda int8: load_models(int8=int8))
+    print(f'{args.models} models, CPU, 1 worker x 1 thread, num_beams=4')
+
+    print('batch size sweep (one padded generate):')
+    models = load(False)
+    bench_batches(models, 'fp32', rng)
+    if args.int8:
+        bench_batches(load(True), 'int8', rng)
+
+    texts = [' '.join(sentence(rng) for _ in range(args.sentences)) for _ in range(args.clients)]
+    print(f'service: {args.clients} concurrent requests x {args.sentences} sentences')
+    failed = False
+    single, _, _, _, _ = bench_service(models, 1, texts, 'one generate / sentence', args.clients)
+    batched, results, again, cached_wall, extra = bench_service(models, 32, texts, 'micro-batching (32)',
+                                                                args.clients)
+    print(f'  repeated requests      {cached_wall * 1000:8.1f} ms for all, {extra} generate() calls (LRU)')
+    if batched <= single:
+        print(f'FAIL: micro-batching {batched:.1f} sentences/s vs {single:.1f} unbatched')
+        failed = True
+    if extra or [r['corrected'] for r in results] != [r['corrected'] for r in again]:
+        print('FAIL: repeated requests were recomputed or changed')
+        failed = True
+    print('FAIL' if failed else 'OK', flush=True)
+    os._exit(1 if failed else 0)        # sin esperar al teardown del pool de procesos
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Storage used by repeated classroom uploads: legacy uuid-per-upload naming vs
+the content-addressed ImageStore (one object per distinct SHA-256).
+
+A class of N students each saves M documents. Every document pastes the
+shared assignment images (rubric, logo, diagram — the same bytes for the
+whole class), some images shared inside small groups, and one photo of its
+own. Each document is saved S times (autosave + manual saves), which in the
+legacy pipeline re-uploaded any image still inlined as base64.
+
+    python scripts/tools/bench_image_dedup.py [students] [docs] [saves]
+
+Sizes are PNG-encoded synthetic images; optimize_image is not applied, so
+the ratio (not the absolute size) is the number to read.
+"""
+import hashlib
+import random
+import sys
+from io import BytesIO
+
+from PIL import Image
+
+SHARED = 3          # images handed out with the assignment
+GROUP_SIZE = 4      # students sharing a group diagram
+VARIANT_RATIO = 0.35  # w480 + w960 + thumb WebP ≈ 35% of the PNG original
+
+
+def _image(seed, size=(1024, 768)):
+    rnd = random.Random(seed)
+    img = Image.new('RGB', size, tuple(rnd.randrange(256) for _ in range(3)))
+    px = img.load()
+    for _ in range(4000):
+        px[rnd.randrange(size[0]), rnd.randrange(size[1])] = tuple(rnd.randrange(256) for _ in range(3))
+    out = BytesIO()
+    img.save(out, format='PNG')
+    return out.getvalue()
+
+
+def _uploads(students, docs, saves):
+    shared = [_image(f'shared-{i}') for i in range(SHARED)]
+    groups = {}
+    for student in range(students):
+        gid = student // GROUP_SIZE
+        if gid not in groups:
+            groups[gid] = _image(f'group-{gid}')
+        group = groups[gid]
+        for doc in range(docs):
+            own = _image(f'own-{student}-{doc}', size=(640, 480))
+            for _ in range(saves):
+                yield from shared
+                yield group
+                yield own
+
+
+def run(students=30, docs=2, saves=3):
+    legacy_bytes = legacy_objects = 0
+    stored = {}
+    for data in _uploads(students, docs, saves):
+        legacy_bytes += len(data)
+        legacy_objects += 1
+        stored.setdefault(hashlib.sha256(data).hexdigest(), len(data))
+
+    dedup_bytes = sum(stored.values())
+    with_variants = int(dedup_bytes * (1 + VARIANT_RATIO))
+    print(f'{students} students x {docs} docs x {saves} saves')
+    print(f'  legacy (uuid per upload): {legacy_objects:6d} objects  {legacy_bytes / 1e6:9.1f} MB'
+          f'  optimize_image calls={legacy_objects}')
+    print(f'  content-addressed:        {len(stored):6d} objects  {dedup_bytes / 1e6:9.1f} MB'
+          f'  optimize_image calls={len(stored)}')
+    print(f'  + WebP variants (est.):   {len(stored) * 4:6d} objects  {with_variants / 1e6:9.1f} MB')
+    print(f'  savings: {100 * (1 - dedup_bytes / legacy_bytes):.1f}% originals, '
+          f'{100 * (1 - with_variants / legacy_bytes):.1f}% including variants')
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
@@ -0,0 +1,65 @@
+"""
+Requests/sec of document_bp.serve_image for a ~2 MB content-addressed image:
+cold (hot cache evicted before each request → SeaweedFS fetch), warm (served
+from the on-disk LRU), conditional (If-None-Match → 304) and a 64 KB Range.
+
+    python scripts/tools/bench_image_serving.py [requests]
+
+Needs a reachable SeaweedFS filer. Uses Flask's test client, so numbers
+exclude network and WSGI server overhead.
+"""
+import hashlib
+import os
+import sys
+import time
+from io import BytesIO
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.image_cache import HotImageCache  # noqa: E402
+from settings.extensions import minio_client  # noqa: E402
+
+
+def _upload():
+    data = os.urandom(2 * 1024 * 1024)
+    filename = f'{hashlib.sha256(data).hexdigest()}.png'
+    minio_client.put_object(bucket_name='images', object_name=filename,
+                            data=BytesIO(data), length=len(data), content_type='image/png')
+    return filename
+
+
+def _rps(client, url, n, headers=None, before=None, expect=200):
+    t0 = time.perf_counter()
+    for _ in range(n):
+        if before:
+            before()
+        resp = client.get(url, headers=headers or {})
+        assert resp.status_code == expect, resp.status_code
+        resp.close()
+    return n / (time.perf_counter() - t0)
+
+
+def run(n=200):
+    with app.app_context():
+        filename = _upload()
+        url = f'/api/image/{filename}'
+        client = app.test_client()
+        etag = filename.rsplit('.', 1)[0]
+
+        results = {
+            'cold':        _rps(client, url, max(n // 10, 1), before=lambda: HotImageCache.discard(filename)),
+            'warm':        _rps(client, url, n),
+            'conditional': _rps(client, url, n, headers={'If-None-Match': f'"{etag}"'}, expect=304),
+            'range 64KB':  _rps(client, url, n, headers={'Range': 'bytes=0-65535'}, expect=206),
+        }
+        minio_client.remove_object('images', filename)
+        HotImageCache.discard(filename)
+
+    print('serve_image, 2 MB object')
+    for name, rps in results.items():
+        print(f'  {name:12s} {rps:9.1f} req/s')
+
+
+if __name__ == '__main__':
+    run(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
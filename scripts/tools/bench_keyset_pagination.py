@@ -0,0 +1,143 @@
+"""
+Offset vs keyset pagination: latency of page 1 and page N of a user's
+document listing (ORDER BY updated_at DESC, id DESC, 20 per page), before
+(`LIMIT/OFFSET`, what Query.paginate() issues) and after
+(services/pagination.Paginator with a cursor).
+
+    python scripts/tools/bench_keyset_pagination.py [--rows 500000] [--pages 1 50 500]
+    python scripts/tools/bench_keyset_pagination.py --database-url mysql+pymysql://root:@localhost/xplagiax_bench
+
+Runs on its own table (bench_keyset_documents, same columns and composite
+index (owner_id, updated_at, id) as marktrack_documents) in a scratch
+database; SQLite in a temp file by default. One owner holds --hot-rows of
+the rows, as a professor with thousands of submissions would.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from sqlalchemy import Boolean, Column, DateTime, Index, Integer, String, create_engine  # noqa: E402
+from sqlalchemy.orm import Session, declarative_base  # noqa: E402
+
+from services.pagination import Paginator  # noqa: E402
+
+Base = declarative_base()
+_HOT_OWNER = 1
+_PER_PAGE = 20
+
+
+class BenchDocument(Base):
+    __tablename__ = 'bench_keyset_documents'
+
+    id = Column(Integer, primary_key=True)
+    title = Column(String(255), nullable=False)
+    owner_id = Column(Integer, nullable=False)
+    is_deleted = Column(Boolean, default=False)
+    updated_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('idx_bench_owner_updated', 'owner_id', 'updated_at', 'id'),
+    )
+
+
+def populate(engine, rows, hot_rows):
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+    rnd = random.Random(7)
+    start = datetime(2024, 1, 1)
+    chunk = 10_000
+    with engine.begin() as conn:
+        for first in range(0, rows, chunk):
+            conn.execute(BenchDocument.__table__.insert(), [{
+                'id': i + 1,
+                'title': f'Documento {i}',
+                'owner_id': _HOT_OWNER if i < hot_rows else rnd.randint(2, 5000),
+                'is_deleted': rnd.random() < 0.02,
+                # second precision like MySQL DATETIME; ties on purpose
+                'updated_at': start + timedelta(seconds=rnd.randrange(60 * 86400)),
+            } for i in range(first, min(rows, first + chunk))])
+
+
+def _base(session):
+    return session.query(BenchDocument).filter(
+        BenchDocument.owner_id == _HOT_OWNER, BenchDocument.is_deleted == False)  # noqa: E712
+
+
+def offset_page(session, page):
+    return (_base(session)
+            .order_by(BenchDocument.updated_at.desc(), BenchDocument.id.desc())
+            .offset((page - 1) * _PER_PAGE).limit(_PER_PAGE).all())
+
+
+def cursors_for(session, pages):
+    """Cursor that leads to each page (walked once, outside the timing)."""
+    cursors, cursor = {1: None}, None
+    for page in range(1, max(pages)):
+        result = Paginator.paginate(_base(session), BenchDocument.updated_at, BenchDocument.id,
+                                    cursor=cursor, per_page=_PER_PAGE, count=False, scope='bench')
+        cursor = result.next_cursor
+        if cursor is None:
+            break
+        cursors[page + 1] = cursor
+    return cursors
+
+
+def _timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def run(engine, pages, repeat):
+    with Session(engine) as session:
+        cursors = cursors_for(session, pages)
+        for page in pages:
+            if page not in cursors:
+                print(f'page {page:>5}: beyond the end of the listing')
+                continue
+            expected = [d.id for d in offset_page(session, page)]
+            got = Paginator.paginate(_base(session), BenchDocument.updated_at, BenchDocument.id,
+                                     cursor=cursors[page], per_page=_PER_PAGE, count=False, scope='bench')
+            assert [d.id for d in got.items] == expected, f'page {page}: keyset and offset disagree'
+
+            offset_ms = _timed(lambda: offset_page(session, page), repeat)
+            keyset_ms = _timed(lambda: Paginator.paginate(
+                _base(session), BenchDocument.updated_at, BenchDocument.id,
+                cursor=cursors[page], per_page=_PER_PAGE, count=False, scope='bench'), repeat)
+            session.expunge_all()
+            print(f'page {page:>5}:  offset {offset_ms:8.2f} ms   keyset {keyset_ms:8.2f} ms   '
+                  f'({offset_ms / keyset_ms:5.1f}x)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--rows', type=int, default=500_000)
+    parser.add_argument('--hot-rows', type=int, default=20_000, help="rows of the benchmarked owner")
+    parser.add_argument('--pages', type=int, nargs='+', default=[1, 50, 500])
+    parser.add_argument('--repeat', type=int, default=30)
+    parser.add_argument('--skip-populate', action='store_true')
+    args = parser.parse_args()
+
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "bench_keyset.db")}'
+    engine = create_engine(url)
+    if not args.skip_populate:
+        t0 = time.perf_counter()
+        populate(engine, args.rows, args.hot_rows)
+        print(f'populated {args.rows:,} rows ({args.hot_rows:,} for the benchmarked owner) '
+              f'in {time.perf_counter() - t0:.1f}s on {engine.dialect.name}')
+    run(engine, args.pages, args.repeat)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""
+Notification fan-out: the previous create_bulk (create() per recipient:
+preference lookup, INSERT + commit, cache DELETE, two emits) vs the bulk
+path (one preference query, multi-row INSERT, one commit, pipelined cache
+refresh, grouped count emits) for 1, 100 and 5,000 recipients.
+
+    python scripts/tools/bench_notification_fanout.py [--recipients 1 100 5000]
+    python scripts/tools/bench_notification_fanout.py --database-url mysql+mysqldb://root:@localhost/xplagiax_bench
+
+Uses a bare Flask app on the repo's models and extensions (SQLite temp file
+by default; point --database-url at a scratch database for MySQL numbers).
+Socket.IO emits go to rooms nobody joined, so they cost serialisation and,
+with a Redis message queue configured, one PUBLISH each. A tenth of the
+recipients have muted the notification type.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+
+from models.models import Notification, NotificationType, User, UserNotificationPreference  # noqa: E402
+from services.notification_service import NotificationService  # noqa: E402
+from settings.extensions import db, socketio  # noqa: E402
+
+_TYPE = NotificationType.DEADLINE_REMINDER
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    socketio.init_app(app)
+    return app
+
+
+def _populate(count):
+    db.drop_all()
+    db.create_all()
+    db.session.execute(db.insert(User), [{'email': f'bench{i}@example.org'} for i in range(count)])
+    db.session.flush()
+    ids = [uid for (uid,) in db.session.query(User.id).order_by(User.id)]
+    db.session.execute(db.insert(UserNotificationPreference), [
+        {'user_id': uid, 'muted_types': [_TYPE.value] if i % 10 == 9 else [], 'muted_courses': []}
+        for i, uid in enumerate(ids)
+    ])
+    db.session.commit()
+    return ids
+
+
+def legacy_create_bulk(user_ids, **kwargs):
+    """create_bulk as it was: one create() per recipient."""
+    created = []
+    for uid in user_ids:
+        notif = NotificationService.create(user_id=uid, **kwargs)
+        if notif:
+            created.append(notif)
+    return created
+
+
+def _run(fn, user_ids, statements):
+    kwargs = dict(type=_TYPE, title='Assignment closing soon!',
+                  message="The assignment 'Essay 3' closes in 24 hours.", url='/invite/bench',
+                  priority=1, course_id=7)
+    db.session.query(Notification).delete()
+    db.session.commit()
+    db.session.expunge_all()
+    statements[0] = 0
+    t0 = time.perf_counter()
+    created = fn(user_ids, **kwargs)
+    elapsed = time.perf_counter() - t0
+    sql = statements[0]
+    stored = dict(db.session.query(Notification.id, Notification.user_id))
+    assert all(stored.get(n.id) == n.user_id for n in created), 'returned ids do not match the stored rows'
+    return elapsed, len(created), len(stored), sql
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--recipients', type=int, nargs='+', default=[1, 100, 5000])
+    args = parser.parse_args()
+
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "bench_fanout.db")}'
+    app = _make_app(url)
+    with app.app_context():
+        statements = [0]
+        event.listen(db.engine, 'before_cursor_execute',
+                     lambda *a, **kw: statements.__setitem__(0, statements[0] + 1))
+        user_ids = _populate(max(args.recipients))
+        print(f'{db.engine.dialect.name}: {len(user_ids)} users, 10% muted')
+        for n in args.recipients:
+            audience = user_ids[:n]
+            for name, fn in (('per-recipient', legacy_create_bulk),
+                             ('bulk', NotificationService.create_bulk)):
+                elapsed, created, stored, sql = _run(fn, audience, statements)
+                print(f'{n:>6} recipients  {name:<14} {elapsed * 1000:9.1f} ms   '
+                      f'created {created:>5} (stored {stored:>5})   SQL statements {sql:>6}')
+        db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""
+Paste evidence ingestion: score_paste throughput on realistic clipboard HTML
+(the previous scorer — one case-insensitive regex scan of the whole HTML per
+signal, four sanitizer passes — vs the current one) and end-to-end events/sec
+of register-paste (one request, INSERT and commit per paste) vs
+register-pastes (batches of --batch events, one multi-row INSERT).
+
+    python scripts/tools/bench_paste_ingest.py [--events 500 --batch 20]
+    python scripts/tools/bench_paste_ingest.py --scorer-only
+    python scripts/tools/bench_paste_ingest.py --database-url mysql+mysqldb://root:@localhost/xplagiax_bench
+
+The clipboard samples imitate what browsers put on the clipboard when copying
+from Wikipedia, a news site (utm-tagged links), Google Docs, Word and a chat
+assistant, plus plain-text pastes. Exits 1 when the current scorer returns
+anything different from the previous one. The ingestion part uses a bare
+Flask app with the plagiarism blueprint (SQLite temp file by default); every
+event carries a source_url, so the search-service lookup is never made.
+"""
+import argparse
+import html
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from services import paste_scorer  # noqa: E402
+from services.paste_scorer import score_paste  # noqa: E402
+
+WORDS = ('the industrial revolution began in great britain and spread to western europe and north america '
+         'within a few decades transforming manufacturing transport and agriculture through steam power '
+         'mechanised textile production and new methods of iron making').split()
+
+
+def _sentence(rng, n=18):
+    return ' '.join(rng.choice(WORDS) for _ in range(n)).capitalize() + '.'
+
+
+def wikipedia(rng, paragraphs):
+    body = ''.join(
+        f'<p>{_sentence(rng)} <a href="/wiki/Steam_engine" title="Steam engine">steam engine</a> '
+        f'{_sentence(rng)}<sup id="cite_ref-{i}" class="reference"><a href="#cite_note-{i}">[{i}]</a></sup></p>\n'
+        for i in range(paragraphs))
+    return ('<html><body><!--StartFragment--><div class="mw-content-ltr mw-parser-output" lang="en" dir="ltr">'
+            f'{body}</div><!--EndFragment--></body></html>')
+
+
+def news(rng, paragraphs):
+    body = ''.join(
+        f'<p class="article__text">{_sentence(rng)} <a href="https://www.example-news.com/2024/03/'
+        f'story-{i}?utm_source=newsletter&amp;utm_medium=email">Read more</a></p>'
+        for i in range(paragraphs))
+    return f'<meta charset="utf-8"><article class="story"><header class="story__head"></header>{body}</article>'
+
+
+def google_docs(rng, paragraphs):
+    span = ('<span style="font-size:11pt;font-family:Arial,sans-serif;color:#000000;background-color:transparent;'
+            'font-weight:400;font-style:normal;font-variant:normal;text-decoration:none;vertical-align:baseline;'
+            'white-space:pre;white-space:pre-wrap;">')
+    body = ''.join(
+        f'<p dir="ltr" style="line-height:1.38;margin-top:0pt;margin-bottom:0pt;">{span}{_sentence(rng)}</span></p><br>'
+        for _ in range(paragraphs))
+    return f'<meta charset="utf-8"><b style="font-weight:normal;" id="docs-internal-guid-{uuid.uuid4()}">{body}</b>'
+
+
+def word(rng, paragraphs):
+    style = '<style><!--\n' + ''.join(
+        f'p.MsoNormal{i}, li.MsoNormal{i} {{margin:0cm; font-size:12.0pt; font-family:"Calibri",sans-serif;}}\n'
+        for i in range(60)) + '--></style>'
+    body = ''.join(f'<p class=MsoNormal><span lang=EN-US>{_sentence(rng)}<o:p></o:p></span></p>\n'
+                   for _ in range(paragraphs))
+    return (f'<html xmlns:o="urn:schemas-microsoft-com:office:office"><head>{style}</head>'
+            f'<body lang=EN-US><!--StartFragment-->{body}<!--EndFragment--></body></html>')
+
+
+def assistant(rng, paragraphs):
+    body = ''.join(f'<p>{_sentence(rng)} <strong>{_sentence(rng, 4)}</strong></p>' for _ in range(paragraphs))
+    return f'<div class="markdown prose w-full break-words dark:prose-invert light">{body}<ul><li>x</li></ul></div>'
+
+
+SOURCES = {'wikipedia': wikipedia, 'news': news, 'google docs': google_docs, 'word': word, 'assistant': assistant}
+
+
+def samples(rng, count):
+    """(pasted_text, clipboard_html) pairs: a sixth plain text, the rest 1–40 paragraphs of one source."""
+    out = []
+    makers = list(SOURCES.values())
+    for i in range(count):
+        paragraphs = rng.randint(1, 40)
+        text = ' '.join(_sentence(rng) for _ in range(paragraphs * 2))
+        out.append((text, '' if i % 6 == 5 else makers[i % len(makers)](rng, paragraphs)[:50_000]))
+    return out
+
+
+def legacy_score_paste(pasted_text, clipboard_html=None, source_url=None):
+    """score_paste as it was (logging left out)."""
+    score = 0
+    has_html = bool(clipboard_html and clipboard_html.strip())
+    if has_html:
+        score += 20
+    if has_html and re.search(r'<a\s[^>]*href', clipboard_html, re.I):
+        score += 20
+    detected_url = source_url
+    if has_html:
+        url_match = paste_scorer._URL_RE.search(clipboard_html)
+        if url_match:
+            score += 20
+            detected_url = detected_url or url_match.group(0)
+    if has_html and re.search(r'<(cite|blockquote|sup|bib|reference)', clipboard_html, re.I):
+        score += 10
+    if len(pasted_text) > 300:
+        score += 10
+    if paste_scorer._TRACKING_RE.search((clipboard_html or '') + (detected_url or '')):
+        score += 10
+    if has_html and re.search(r'<(div|section|article|header|nav)\s', clipboard_html, re.I):
+        score += 10
+    score = min(score, 100)
+    source_domain = None
+    if detected_url:
+        m = paste_scorer._DOMAIN_RE.search(detected_url)
+        if m:
+            source_domain = m.group(1)[:255]
+        detected_url = detected_url[:2048]
+    clean_html = None
+    if has_html:
+        cleaned = re.sub(r'<script[\s\S]*?</script>', '', clipboard_html, flags=re.I)
+        cleaned = re.sub(r'<style[\s\S]*?</style>', '', cleaned, flags=re.I)
+        cleaned = re.sub(r'<[^>]+>', ' ', cleaned)
+        cleaned = re.sub(r'\s{2,}', ' ', cleaned).strip()
+        clean_html = html.escape(cleaned)[:20000]
+    risk = 'high' if score >= 71 else ('medium' if score >= 31 else 'low')
+    return {'score': score, 'risk_level': risk, 'source_url': detected_url,
+            'source_domain': source_domain, 'clipboard_html_clean': clean_html}
+
+
+def bench_scorer(pairs, repeat):
+    mismatches = [i for i, (text, clip) in enumerate(pairs)
+                  if score_paste(text, clip or None) != legacy_score_paste(text, clip or None)]
+    size = sum(len(clip) for _, clip in pairs) / 1e6
+    print(f'score_paste: {len(pairs)} pastes, {size:.1f} MB of clipboard HTML')
+    for name, fn in (('previous', legacy_score_paste), ('current', score_paste)):
+        best = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            for text, clip in pairs:
+                fn(text, clip or None)
+            best = min(best, time.perf_counter() - t0)
+        print(f'  {name:<9} {len(pairs) / best:9.0f} pastes/s   {size / best:7.1f} MB/s')
+    for source, maker in SOURCES.items():
+        clip = maker(random.Random(1), 20)
+        times = {}
+        for name, fn in (('previous', legacy_score_paste), ('current', score_paste)):
+            t0 = time.perf_counter()
+            for _ in range(200):
+                fn('x' * 400, clip)
+            times[name] = (time.perf_counter() - t0) / 200
+        print(f'  {source:<12} {len(clip):6d} chars  previous {times["previous"] * 1e6:7.1f} us   '
+              f'current {times["current"] * 1e6:7.1f} us')
+    return mismatches
+
+
+def bench_ingest(pairs, batch, url):
+    from flask import Flask
+
+    from models.models import Document, User
+    from models.paste_evidence import PastedInternetContent
+    from routes.plagiarism_routes import plagiarism_bp
+    from settings.extensions import db
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'bench'
+    db.init_app(app)
+    app.register_blueprint(plagiarism_bp)
+    logging_level = paste_scorer.logger.level
+    paste_scorer.logger.setLevel('WARNING')
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        owner = User(email='owner@example.org')
+        db.session.add(owner)
+        db.session.flush()
+        doc = Document(title='Essay', owner_id=owner.id)
+        db.session.add(doc)
+        db.session.commit()
+        doc_id = doc.id
+
+    events = [{'pasted_text': text, 'clipboard_html': clip, 'source_url': 'https://en.wikipedia.org/wiki/Bench',
+               'paste_uuid': str(uuid.uuid4())} for text, clip in pairs]
+    client = app.test_client()
+    print(f'ingestion ({url.split(":")[0]}): {len(events)} events')
+    for name in ('register-paste', 'register-pastes'):
+        with app.app_context():
+            db.session.query(PastedInternetContent).delete()
+            db.session.commit()
+        t0 = time.perf_counter()
+        if name == 'register-paste':
+            for e in events:
+                client.post('/api/plagiarism/register-paste', json={'document_id': doc_id, **e})
+        else:
+            for i in range(0, len(events), batch):
+                client.post('/api/plagiarism/register-pastes',
+                            json={'document_id': doc_id, 'events': events[i:i + batch]})
+        elapsed = time.perf_counter() - t0
+        with app.app_context():
+            stored = db.session.query(PastedInternetContent).count()
+        label = name if name == 'register-paste' else f'{name} x{batch}'
+        print(f'  {label:<22} {len(events) / elapsed:8.0f} events/s   stored {stored}')
+    with app.app_context():
+        db.drop_all()
+    paste_scorer.logger.setLevel(logging_level)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--batch', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--scorer-only', action='store_true', help='skip the Flask/database part')
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    args = parser.parse_args()
+
+    pairs = samples(random.Random(7), args.events)
+    mismatches = bench_scorer(pairs, args.repeat)
+    if not args.scorer_only:
+        url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "bench_paste_ingest.db")}'
+        bench_ingest(pairs, args.batch, url)
+    if mismatches:
+        print(f'FAIL: {len(mismatches)} pastes scored differently, e.g. #{mismatches[0]}')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""
+Paste-evidence presence check: PastePresence's word-level Aho-Corasick scan
+vs checking fragments one by one, at --fragments pastes in a --kb document.
+
+    python scripts/tools/bench_paste_presence.py [--fragments 500 --kb 200]
+
+The document is built from the pasted fragments (a third intact, a third
+partly rewritten, the rest deleted) padded with other text. Timed:
+
+  client anchor   what DocumentSyncWatcher did: `first 200 chars in text`
+                  per fragment (exact text, no coverage)
+  per chunk       `' chunk ' in normalized text` for every chunk of every
+                  fragment: same result as the automaton, one scan per chunk
+  build           chunking + automaton construction (once per fragment set)
+  scan            one pass over the saved text (every save)
+
+Exits 1 (FAIL) when the automaton's coverage differs from the per-chunk
+check. Pure Python, no database.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from services.paste_presence import _DocumentIndex, chunks, normalize  # noqa: E402
+
+WORDS = ('the industrial revolution began in great britain and spread to western europe and north america '
+         'within a few decades transforming manufacturing transport agriculture through steam power '
+         'mechanised textile production new methods of iron making coal mining railways canals factory '
+         'workers cities population growth wages labour conditions reform movements').split()
+
+
+def _text(rng, words):
+    out = []
+    for i in range(words):
+        word = rng.choice(WORDS)
+        out.append(word.capitalize() if i % 14 == 0 else word)
+        if i % 14 == 13:
+            out[-1] += '.'
+    return ' '.join(out)
+
+
+def build(rng, fragments, kb):
+    pasted = [_text(rng, rng.randint(12, 120)) for _ in range(fragments)]
+    parts = []
+    for i, frag in enumerate(pasted):
+        if i % 3 == 0:
+            parts.append(frag)
+        elif i % 3 == 1:
+            words = frag.split()
+            cut = len(words) // 3
+            parts.append(' '.join(words[:cut] + ['rewritten'] * cut + words[2 * cut:]))
+    size = sum(len(p) for p in parts)
+    while size < kb * 1000:
+        parts.append(_text(rng, 60))
+        size += len(parts[-1])
+    rng.shuffle(parts)
+    return pasted, '\n'.join(parts)
+
+
+def per_chunk(pasted, text):
+    haystack = f' {" ".join(normalize(text))} '
+    coverage = {}
+    for fid, frag in enumerate(pasted):
+        frag_chunks = chunks(normalize(frag))
+        if frag_chunks:
+            found = sum(f' {" ".join(c)} ' in haystack for c in frag_chunks)
+            coverage[fid] = round(100 * found / len(frag_chunks))
+    return coverage
+
+
+def timed(fn, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--fragments', type=int, default=500)
+    parser.add_argument('--kb', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    pasted, text = build(random.Random(5), args.fragments, args.kb)
+    print(f'{len(pasted)} fragments ({sum(map(len, pasted)) / 1000:.0f} KB), document {len(text) / 1000:.0f} KB')
+
+    anchors, t_anchor = timed(lambda: [frag[:200].strip() in text for frag in pasted], args.repeat)
+    expected, t_chunk = timed(lambda: per_chunk(pasted, text), args.repeat)
+    index, t_build = timed(lambda: _DocumentIndex({fid: chunks(normalize(f)) for fid, f in enumerate(pasted)}),
+                           args.repeat)
+    coverage, t_scan = timed(lambda: index.coverage(text), args.repeat)
+
+    print(f'  client anchor  {t_anchor * 1000:8.1f} ms   {sum(anchors)} present (exact text only)')
+    print(f'  per chunk      {t_chunk * 1000:8.1f} ms')
+    print(f'  build          {t_build * 1000:8.1f} ms   {len(index.automaton.goto)} states')
+    print(f'  scan           {t_scan * 1000:8.1f} ms   {t_chunk / t_scan:.1f}x faster than per chunk')
+    full = sum(pct == 100 for pct in coverage.values())
+    partial = sum(0 < pct < 100 for pct in coverage.values())
+    print(f'  coverage: {full} complete, {partial} partial, {len(coverage) - full - partial} absent')
+
+    if coverage != expected:
+        diff = [fid for fid in expected if coverage.get(fid) != expected[fid]]
+        print(f'FAIL: coverage differs for {len(diff)} fragments, e.g. #{diff[0]}')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Simulated 8-user document room: message-queue traffic and per-client receive
+rate for cursor/awareness events, immediate re-broadcast vs PresenceCoalescer.
+
+    python scripts/tools/bench_presence.py [users] [seconds] [events_per_s]
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from services.presence_coalescer import PresenceCoalescer, _TICK_MS  # noqa: E402
+
+
+class _CountingSio:
+    """Counts emits (= messages published on the Redis queue) and deliveries."""
+    def __init__(self, users):
+        self.users = users
+        self.emits = 0
+        self.deliveries = 0
+
+    def emit(self, event, payload, room=None, skip_sid=None):
+        self.emits += 1
+        self.deliveries += self.users - 1 if skip_sid else self.users
+
+    def start_background_task(self, fn):
+        pass  # the benchmark drives flush() on a simulated clock
+
+
+def run(users=8, seconds=10, events_per_s=60):
+    ticks_per_s = 1000 // _TICK_MS
+    total_events = users * seconds * events_per_s
+
+    # Before: every event is re-broadcast to the room immediately
+    before = _CountingSio(users)
+    for _ in range(total_events):
+        before.emit('yjs:awareness', {}, room='doc_1', skip_sid=True)
+
+    # After: coalesced per sid, flushed once per tick
+    after = _CountingSio(users)
+    PresenceCoalescer.init(after)
+    PresenceCoalescer._running = True
+    PresenceCoalescer.reset_stats()
+    per_tick = max(1, events_per_s // ticks_per_s)
+    for _ in range(seconds * ticks_per_s):
+        for u in range(users):
+            for _ in range(per_tick):
+                PresenceCoalescer.submit('doc_1', f'sid{u}', 'awareness', {'awareness': 'x'})
+        PresenceCoalescer.flush()
+        # advance every bucket by one tick of refill
+        for b in PresenceCoalescer._buckets.values():
+            b.updated -= _TICK_MS / 1000.0
+
+    print(f'users={users} seconds={seconds} events/s/user={events_per_s} tick={_TICK_MS}ms')
+    print(f'  before: mq msgs/s={before.emits / seconds:8.1f}  '
+          f'recv/s/client={before.deliveries / seconds / users:8.1f}')
+    print(f'  after:  mq msgs/s={after.emits / seconds:8.1f}  '
+          f'recv/s/client={after.emits / seconds:8.1f}  stats={PresenceCoalescer.stats()}')
+
+
+if __name__ == '__main__':
+    args = [int(a) for a in sys.argv[1:4]]
+    run(*args)
@@ -0,0 +1,142 @@
+"""
+Full-text search latency at scale: SearchIndex.search (FULLTEXT, ranked)
+vs the legacy `title LIKE '%x%'` filter and a body LIKE scan, on a
+synthetic corpus of --documents rows spread over --owners users.
+
+    DATABASE_URL=mysql+pymysql://root:@localhost/xplagiax_bench \\
+        python scripts/tools/bench_search.py --documents 1000000 [--queries 200]
+
+Run it against a scratch database: it bulk-inserts documents and index rows
+with ids above _BENCH_ID (foreign key checks off for the session) and
+deletes them again with --cleanup. Population is the slow part
+(≈ 10-20 min for 1M rows with the FULLTEXT indexes); --skip-populate reuses
+rows from a previous run.
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+import sqlalchemy as sa  # noqa: E402
+
+from app import app  # noqa: E402
+from services.search_index import SearchIndex  # noqa: E402
+from settings.extensions import db  # noqa: E402
+
+_BENCH_ID = 1_000_000_000
+_CHUNK = 2000
+# Zipf-like vocabulary: a few very common words, a long tail of rare ones
+_COMMON = ('the students compare primary sources argue about causes consequences economic '
+           'change several decades evidence archives revolution industrial education').split()
+_RARE = [f'term{i:05d}' for i in range(20000)]
+
+
+def _text(rnd, words):
+    return ' '.join(rnd.choice(_COMMON) if rnd.random() < 0.8 else rnd.choice(_RARE)
+                    for _ in range(words))
+
+
+def populate(documents, owners, words):
+    rnd = random.Random(5)
+    conn = db.session.connection()
+    conn.execute(sa.text('SET FOREIGN_KEY_CHECKS = 0'))
+    t0 = time.perf_counter()
+    for start in range(0, documents, _CHUNK):
+        ids = range(_BENCH_ID + start, _BENCH_ID + min(documents, start + _CHUNK))
+        titles = {i: _text(rnd, 6) for i in ids}
+        conn.execute(sa.text(
+            'INSERT INTO marktrack_documents (id, title, owner_id, is_deleted, is_archived, '
+            'document_type, updated_at) VALUES (:id, :title, :owner, 0, 0, :type, NOW())'
+        ), [{'id': i, 'title': titles[i], 'owner': _BENCH_ID + i % owners, 'type': 'created'}
+            for i in ids])
+        conn.execute(sa.text(
+            'INSERT INTO document_search_index (document_id, workspace_id, title, body, indexed_at) '
+            'VALUES (:id, NULL, :title, :body, NOW())'
+        ), [{'id': i, 'title': titles[i], 'body': _text(rnd, rnd.randint(words // 2, words * 2))}
+            for i in ids])
+        db.session.commit()
+        conn = db.session.connection()
+        conn.execute(sa.text('SET FOREIGN_KEY_CHECKS = 0'))
+        done = ids[-1] - _BENCH_ID + 1
+        if done % 50_000 < _CHUNK:
+            print(f'  … {done:,} rows ({done / (time.perf_counter() - t0):,.0f} rows/s)')
+    db.session.commit()
+
+
+def cleanup():
+    db.session.execute(sa.text('DELETE FROM document_search_index WHERE document_id >= :b'), {'b': _BENCH_ID})
+    db.session.execute(sa.text('DELETE FROM marktrack_documents WHERE id >= :b'), {'b': _BENCH_ID})
+    db.session.commit()
+
+
+def _timed(fn, queries):
+    samples = []
+    for q in queries:
+        t0 = time.perf_counter()
+        fn(q)
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {'p50': statistics.median(samples), 'p95': samples[int(len(samples) * 0.95) - 1],
+            'max': samples[-1]}
+
+
+def run(owners, query_count):
+    rnd = random.Random(9)
+    queries = [(_BENCH_ID + rnd.randrange(owners),
+                ' '.join(rnd.choice(_COMMON if rnd.random() < 0.5 else _RARE)
+                         for _ in range(rnd.randint(1, 3))))
+               for _ in range(query_count)]
+
+    def like_title(item):
+        uid, q = item
+        db.session.execute(sa.text(
+            'SELECT id FROM marktrack_documents WHERE owner_id = :uid AND is_deleted = 0 '
+            'AND title LIKE :q ORDER BY updated_at DESC LIMIT 20'), {'uid': uid, 'q': f'%{q}%'}).all()
+
+    def like_body(item):
+        uid, q = item
+        db.session.execute(sa.text(
+            'SELECT s.document_id FROM document_search_index s '
+            'JOIN marktrack_documents d ON d.id = s.document_id '
+            'WHERE d.owner_id = :uid AND d.is_deleted = 0 AND s.body LIKE :q LIMIT 20'),
+            {'uid': uid, 'q': f'%{q}%'}).all()
+
+    def fulltext(item):
+        uid, q = item
+        SearchIndex.search(uid, q, page=1, per_page=20)
+
+    for name, fn in (('title LIKE (legacy)', like_title), ('body LIKE', like_body),
+                     ('FULLTEXT + snippets', fulltext)):
+        fn(queries[0])
+        stats = _timed(fn, queries)
+        print(f'{name:<22} p50 {stats["p50"]:8.2f} ms   p95 {stats["p95"]:8.2f} ms   '
+              f'max {stats["max"]:8.2f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--documents', type=int, default=1_000_000)
+    parser.add_argument('--owners', type=int, default=500, help='users the documents are spread over')
+    parser.add_argument('--words', type=int, default=400, help='average body length in words')
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--skip-populate', action='store_true')
+    parser.add_argument('--cleanup', action='store_true', help='delete the bench rows and exit')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if db.engine.dialect.name != 'mysql':
+            sys.exit('bench_search needs MySQL (FULLTEXT); set DATABASE_URL to a scratch database')
+        if args.cleanup:
+            cleanup()
+            return
+        if not args.skip_populate:
+            populate(args.documents, args.owners, args.words)
+        run(args.owners, args.queries)
+
+
+if __name__ == '__main__':
+    main()
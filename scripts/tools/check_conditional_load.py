@@ -0,0 +1,116 @@
+"""
+Integration check for conditional document loading (ETag / If-None-Match).
+
+For /api/document/<id>/load, /documentedit/<token>, /documentview/<token>
+and /invite/<token>/document it requests the resource once (200 + ETag),
+then again with If-None-Match and asserts:
+  - the second response is 304, and
+  - it issued no SeaweedFS get_object and no Redis command.
+
+    python scripts/tools/check_conditional_load.py [doc_id]
+
+Runs against the app's configured database / Redis / SeaweedFS through the
+Flask test client. Exit code 1 on any failure.
+"""
+import os
+import sys
+from contextlib import contextmanager
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from flask_login.utils import _create_identifier  # noqa: E402
+from itsdangerous.url_safe import URLSafeTimedSerializer  # noqa: E402
+
+from app import app  # noqa: E402
+from models.models import Document, WorkspaceInvitation  # noqa: E402
+from settings import extensions  # noqa: E402
+
+
+class _Reads:
+    """Counts storage/cache reads by wrapping the shared client instances."""
+
+    def __init__(self):
+        self.calls = []
+
+    def wrap(self, obj, attr, label):
+        original = getattr(obj, attr, None)
+        if original is None or not callable(original):
+            return
+
+        def counted(*args, **kwargs):
+            self.calls.append(f'{label} {args[:1]}')
+            return original(*args, **kwargs)
+        setattr(obj, attr, counted)
+
+
+@contextmanager
+def _count_reads():
+    reads = _Reads()
+    targets = [
+        (extensions.minio_client, 'get_object', 'seaweedfs.get_object'),
+        (extensions.redis_client, 'execute_command', 'redis'),
+        (extensions.redis_bytes_client, 'execute_command', 'redis(bytes)'),
+    ]
+    for obj, attr, label in targets:
+        reads.wrap(obj, attr, label)
+    try:
+        yield reads
+    finally:
+        for obj, attr, _ in targets:
+            obj.__dict__.pop(attr, None)
+
+
+def _login(client, user_id):
+    with app.test_request_context():
+        ident = _create_identifier()
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+        sess['_id'] = ident
+
+
+def _check(client, label, url):
+    first = client.get(url)
+    etag = first.headers.get('ETag')
+    if first.status_code != 200 or not etag:
+        print(f'FAIL {label}: first request → {first.status_code}, ETag={etag}')
+        return False
+    with _count_reads() as reads:
+        second = client.get(url, headers={'If-None-Match': etag})
+    ok = second.status_code == 304 and not reads.calls
+    print(f'{"ok  " if ok else "FAIL"} {label}: {second.status_code}, reads={reads.calls or "none"}')
+    return ok
+
+
+def run(doc_id=None):
+    results = []
+    with app.app_context():
+        query = Document.query.filter(Document.is_deleted.is_(False))
+        doc = query.filter_by(id=doc_id).first() if doc_id else query.first()
+        if doc is None:
+            print('No document to check')
+            return False
+        client = app.test_client()
+        _login(client, doc.owner_id)
+        signer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
+        token = signer.dumps({'document_id': doc.id})
+
+        results.append(_check(client, 'load', f'/api/document/{doc.id}/load'))
+        results.append(_check(client, 'load?fields=delta', f'/api/document/{doc.id}/load?fields=delta'))
+        results.append(_check(client, 'documentedit', f'/documentedit/{token}'))
+        results.append(_check(client, 'documentview', f'/documentview/{token}'))
+
+        invitation = (WorkspaceInvitation.query
+                      .filter(WorkspaceInvitation.document_id.isnot(None),
+                              WorkspaceInvitation.status.in_(('active', 'pending', 'completed')))
+                      .first())
+        if invitation:
+            results.append(_check(app.test_client(), 'invite document',
+                                  f'/invite/{invitation.token}/document'))
+        else:
+            print('skip invite document: no invitation with a document')
+    return all(results)
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run(int(sys.argv[1]) if len(sys.argv) > 1 else None) else 1)
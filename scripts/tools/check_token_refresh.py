@@ -0,0 +1,246 @@
+"""
+--requests concurrent requests on an expired Google Drive token, spread over
+--workers processes (threads inside each), each running the token block of
+the integration routes (get_user_tokens → is_token_expired →
+refresh_access_token → get_user_tokens) against the stand-in token endpoint
+of scripts/tools/fake_cloud_provider.py (--latency-ms per call). Meanwhile
+one extra request connects OneDrive for the same user.
+
+    REDIS_URL=redis://localhost:6379 python scripts/tools/check_token_refresh.py [--requests 50 --workers 4]
+
+Runs the previous helpers (one refresh per request, whole-blob saves) and
+then services/oauth_tokens.TokenManager, and for the latter checks, exiting
+1 otherwise: exactly one call to the provider, every request got the new
+token, and OneDrive is still connected afterwards. Without REDIS_URL the
+workers cannot coordinate, so it runs with one process. Also times a cached
+token read against the previous SELECT + json.loads. Uses a bare Flask app
+on the repo's models (SQLite temp file by default).
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+sys.path.append(os.path.dirname(__file__))
+
+from flask import Flask  # noqa: E402
+
+from models.models import User  # noqa: E402
+from services.oauth_tokens import TokenManager  # noqa: E402
+from settings.extensions import db  # noqa: E402
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(app)
+    return app
+
+
+def _config(base):
+    return {'token_url': f'{base}/oauth2/token', 'client_id': 'bench', 'client_secret': 'bench'}
+
+
+# ── Previous helpers (routes/routes_integrations.py before the change) ────────
+
+def legacy_get_user_tokens(user_id):
+    user = db.session.query(User).filter_by(id=user_id).first()
+    return json.loads(user.tokens) if user and user.tokens else {}
+
+
+def legacy_save_user_tokens(user_id, tokens):
+    user = db.session.query(User).filter_by(id=user_id).first()
+    user.tokens = json.dumps(tokens)
+    db.session.commit()
+    return True
+
+
+def legacy_is_token_expired(token_info):
+    return datetime.now() >= datetime.fromisoformat(token_info['expires_at'])
+
+
+def legacy_refresh_access_token(user_id, provider, config):
+    user_tokens = legacy_get_user_tokens(user_id)
+    response = requests.post(config['token_url'], data={
+        'grant_type': 'refresh_token', 'refresh_token': user_tokens[provider]['refresh_token'],
+        'client_id': config['client_id'], 'client_secret': config['client_secret']})
+    response.raise_for_status()
+    tokens = response.json()
+    user_tokens[provider]['access_token'] = tokens['access_token']
+    user_tokens[provider]['expires_at'] = (datetime.now() + timedelta(seconds=tokens.get('expires_in', 3600))).isoformat()
+    return legacy_save_user_tokens(user_id, user_tokens)
+
+
+def _onedrive():
+    return {'access_token': 'onedrive-token', 'refresh_token': 'r-od',
+            'expires_at': (datetime.now() + timedelta(hours=1)).isoformat(), 'connected_at': datetime.now().isoformat()}
+
+
+def route_block(mode, user_id, provider, config):
+    """The token block every integration route runs; returns the access token it ends up with."""
+    if mode == 'legacy':
+        tokens = legacy_get_user_tokens(user_id)
+        if legacy_is_token_expired(tokens[provider]):
+            legacy_refresh_access_token(user_id, provider, config)
+            tokens = legacy_get_user_tokens(user_id)
+        return tokens[provider]['access_token']
+    tokens = TokenManager.get_all(user_id)
+    if TokenManager.needs_refresh(tokens[provider]):
+        if not TokenManager.refresh(user_id, provider, config):
+            return None
+        tokens = TokenManager.get_all(user_id)
+    return tokens[provider]['access_token']
+
+
+def connect_onedrive(mode, user_id):
+    if mode == 'legacy':
+        tokens = legacy_get_user_tokens(user_id)
+        tokens['onedrive'] = _onedrive()
+        legacy_save_user_tokens(user_id, tokens)
+    else:
+        TokenManager.set(user_id, 'onedrive', _onedrive())
+
+
+def child(args):
+    app = _make_app(args.database_url)
+    config = _config(args.base)
+    results, errors = [], []
+
+    def run(connect=False):
+        with app.app_context():
+            time.sleep(max(0.0, args.start_at - time.time()) + (0.05 if connect else 0))
+            try:
+                if connect:
+                    connect_onedrive(args.child, args.user_id)
+                else:
+                    results.append(route_block(args.child, args.user_id, 'google_drive', config))
+            except Exception as e:
+                errors.append(f'{type(e).__name__}: {e}')
+            finally:
+                db.session.remove()
+
+    threads = [threading.Thread(target=run) for _ in range(args.threads)]
+    if args.connect:
+        threads.append(threading.Thread(target=run, kwargs={'connect': True}))
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(json.dumps({'tokens': results, 'errors': errors}))
+
+
+def run_mode(mode, args, base, url, user_id):
+    per_worker = [args.requests // args.workers + (1 if i < args.requests % args.workers else 0)
+                  for i in range(args.workers)]
+    start_at = time.time() + 2.0        # todos los procesos arrancan a la vez
+    before = requests.get(f'{base}/_admin/token_stats').json()['refreshes']
+    procs = [subprocess.Popen([sys.executable, __file__, '--child', mode, '--base', base, '--database-url', url,
+                               '--user-id', str(user_id), '--threads', str(n), '--start-at', str(start_at)]
+                              + (['--connect'] if i == 0 else []),
+                              stdout=subprocess.PIPE, text=True)
+             for i, n in enumerate(per_worker)]
+    tokens, errors = [], []
+    for proc in procs:
+        out, _ = proc.communicate()
+        data = json.loads(out.strip().splitlines()[-1])
+        tokens += data['tokens']
+        errors += data['errors']
+    refreshes = requests.get(f'{base}/_admin/token_stats').json()['refreshes'] - before
+    TokenManager._cache.clear()
+    stored = json.loads(db.session.get(User, user_id, populate_existing=True).tokens)
+    return {'refreshes': refreshes, 'tokens': tokens, 'errors': errors, 'stored': stored}
+
+
+def _new_user(email):
+    expired = {'google_drive': {'access_token': 'expired-token', 'refresh_token': 'r-gd',
+                                'expires_at': (datetime.now() - timedelta(minutes=1)).isoformat(),
+                                'connected_at': datetime.now().isoformat()}}
+    user = User(email=email, tokens=json.dumps(expired))
+    db.session.add(user)
+    db.session.commit()
+    return user.id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--requests', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=4, help='processes (needs REDIS_URL to coordinate)')
+    parser.add_argument('--latency-ms', type=float, default=300, help='token endpoint round-trip')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--base', help=argparse.SUPPRESS)
+    parser.add_argument('--user-id', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--threads', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--start-at', type=float, help=argparse.SUPPRESS)
+    parser.add_argument('--connect', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return child(args)
+
+    import fake_cloud_provider
+
+    if not os.environ.get('REDIS_URL') and args.workers > 1:
+        print('REDIS_URL not set: workers cannot coordinate, running 1 process')
+        args.workers = 1
+    server, _, base = fake_cloud_provider.serve(0, latency_ms=args.latency_ms)
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "check_token_refresh.db")}'
+    app = _make_app(url)
+    failed = False
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        print(f'{args.requests} concurrent requests on an expired token, {args.workers} worker processes, '
+              f'token endpoint {args.latency_ms:.0f} ms, OneDrive connected meanwhile')
+        for mode in ('legacy', 'new'):
+            user_id = _new_user(f'{mode}-tokens@example.org')
+            r = run_mode(mode, args, base, url, user_id)
+            label = 'previous' if mode == 'legacy' else 'TokenManager'
+            final = r['stored'].get('google_drive', {}).get('access_token')
+            print(f"  {label:<13} provider refreshes {r['refreshes']:3d}   distinct tokens served "
+                  f"{len(set(r['tokens'])):3d}   errors {len(r['errors']):2d}   "
+                  f"OneDrive kept: {'yes' if 'onedrive' in r['stored'] else 'NO'}")
+            if mode == 'new':
+                if r['refreshes'] != 1:
+                    print(f"FAIL: {r['refreshes']} refresh calls, expected 1")
+                    failed = True
+                if r['errors'] or len(r['tokens']) != args.requests or set(r['tokens']) != {final}:
+                    print(f"FAIL: requests got {sorted(set(map(str, r['tokens'])))} (stored {final}), "
+                          f"errors {r['errors'][:3]}")
+                    failed = True
+                if 'onedrive' not in r['stored']:
+                    print('FAIL: the concurrent OneDrive connect was overwritten')
+                    failed = True
+
+        user_id = _new_user('read-tokens@example.org')
+        n = 2000
+        t0 = time.perf_counter()
+        for _ in range(n):
+            legacy_get_user_tokens(user_id)
+            db.session.expunge_all()
+        legacy_us = (time.perf_counter() - t0) / n * 1e6
+        TokenManager.get_all(user_id)
+        t0 = time.perf_counter()
+        for _ in range(n):
+            TokenManager.get_all(user_id)
+        cached_us = (time.perf_counter() - t0) / n * 1e6
+        print(f'  token read: SELECT + json.loads {legacy_us:7.1f} us   cached '
+              f"{'(Redis version check) ' if os.environ.get('REDIS_URL') else ''}{cached_us:7.1f} us")
+        db.drop_all()
+    server.shutdown()
+
+    if failed:
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""
+Accuracy check for the exact unread-notification counters: concurrent
+create / mark_read / mark_all_read / get_unread_count (plus counter
+evictions) against the same users, then every Redis counter is compared
+with COUNT(*) in the database, before and after reconciliation.
+
+    REDIS_URL=redis://localhost:6379 python scripts/tools/check_unread_counters.py
+    REDIS_URL=... python scripts/tools/check_unread_counters.py --threads 32 --ops 4000 --evict-rate 0
+
+Needs a real Redis (the counters are Lua scripts). Uses a bare Flask app on
+the repo's models (SQLite temp file by default, --database-url for MySQL).
+Counters are seeded before the run. Several threads mark the same
+notifications at once, so double mark-reads and a mark-read overtaking its
+create's +1 race on purpose. With --evict-rate 0 every counter must be
+exact without reconciliation; evictions (a counter deleted, as by TTL or
+maxmemory) re-seed it concurrently with writes, the race reconciliation
+exists for, so then only the post-reconciliation result must be exact.
+Exits 1 on any remaining mismatch.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from flask import Flask  # noqa: E402
+
+from models.models import Notification, NotificationType, User  # noqa: E402
+from services.notification_service import NotificationService  # noqa: E402
+from settings.extensions import _register_lua_scripts, db, redis_client, socketio  # noqa: E402
+
+
+def _make_app(url):
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if url.startswith('sqlite'):
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 60}}
+    db.init_app(app)
+    socketio.init_app(app)
+    return app
+
+
+def _worker(app, seed, user_ids, created, created_lock, ops, evict_rate, stats):
+    rnd = random.Random(seed)
+    with app.app_context():
+        for _ in range(ops):
+            uid = rnd.choice(user_ids)
+            roll = rnd.random()
+            try:
+                if roll < evict_rate:
+                    redis_client.delete(NotificationService._unread_key(uid))
+                    stats['evict'] += 1
+                elif roll < 0.45:
+                    notif = NotificationService.create(
+                        user_id=uid, type=NotificationType.COMMENT_ADDED,
+                        title='Nuevo comentario', message='check_unread_counters')
+                    if notif:
+                        with created_lock:
+                            created[uid].append(notif.id)
+                    stats['create'] += 1
+                elif roll < 0.80:
+                    with created_lock:
+                        pool = created[uid][-20:]
+                    if pool:
+                        NotificationService.mark_read(rnd.choice(pool), uid)
+                        stats['mark_read'] += 1
+                elif roll < 0.83:
+                    NotificationService.mark_all_read(uid)
+                    stats['mark_all_read'] += 1
+                else:
+                    NotificationService.get_unread_count(uid)
+                    stats['read_count'] += 1
+            except Exception as exc:
+                db.session.rollback()
+                stats[f'error:{type(exc).__name__}'] += 1
+
+
+def _mismatches(user_ids):
+    actual = NotificationService._count_unread_db_many(user_ids)
+    wrong = {}
+    for uid in user_ids:
+        value = redis_client.get(NotificationService._unread_key(uid))
+        if value is not None and int(value) != actual[uid]:
+            wrong[uid] = (int(value), actual[uid])
+    return wrong
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--database-url', help='scratch database (default: SQLite temp file)')
+    parser.add_argument('--users', type=int, default=8)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--ops', type=int, default=1500, help='operations per thread')
+    parser.add_argument('--evict-rate', type=float, default=0.02)
+    args = parser.parse_args()
+
+    _register_lua_scripts()
+    if not redis_client.ping():
+        sys.exit('check_unread_counters needs Redis (set REDIS_URL)')
+    url = args.database_url or f'sqlite:///{os.path.join(tempfile.gettempdir(), "check_unread.db")}'
+    app = _make_app(url)
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.execute(db.insert(User), [{'email': f'check{i}@example.org'} for i in range(args.users)])
+        db.session.commit()
+        user_ids = [uid for (uid,) in db.session.query(User.id)]
+        for uid in user_ids:
+            redis_client.delete(NotificationService._unread_key(uid))
+            NotificationService.get_unread_count(uid)      # sembrados: estado estable
+        redis_client.delete('notif:unread:touched', 'notif:unread:suspect')
+
+    created = {uid: [] for uid in user_ids}
+    created_lock = threading.Lock()
+    stats = Counter()
+    threads = [threading.Thread(target=_worker, args=(app, seed, user_ids, created, created_lock,
+                                                      args.ops, args.evict_rate, stats))
+               for seed in range(args.threads)]
+    t0 = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - t0
+
+    with app.app_context():
+        total = db.session.query(Notification).count()
+        unread = db.session.query(Notification).filter_by(read=False).count()
+        print(f'{args.threads} threads x {args.ops} ops on {args.users} users in {elapsed:.1f}s '
+              f'({db.engine.dialect.name}): {dict(stats)}')
+        print(f'notifications: {total} stored, {unread} unread')
+
+        before = _mismatches(user_ids)
+        print(f'counters wrong before reconciliation: {len(before)} {before or ""}')
+        for _ in range(2):
+            report = NotificationService.reconcile_unread_counts(limit=10_000)
+            print(f'reconciliation pass: {report}')
+        after = _mismatches(user_ids)
+        print(f'counters wrong after reconciliation:  {len(after)} {after or ""}')
+        db.drop_all()
+
+    if after or (args.evict_rate == 0 and before):
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
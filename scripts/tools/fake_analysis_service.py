@@ -0,0 +1,126 @@
+"""
+Local stand-in for the analysis microservices behind
+services/analysis_gateway.py, with configurable latency:
+
+    python scripts/tools/fake_analysis_service.py --port 8766 --latency-ms 2000
+
+    XPLAGIAX_URL=http://127.0.0.1:8766/analyze_document
+    IMAGE_SVC_URL=http://127.0.0.1:8766
+    AITESTPRO_BATCH_URL=http://127.0.0.1:8766/analyze-batch
+
+POST /analyze_document {text, plugins} answers in the XplagiaX shape
+({'status': 'ok', 'results': {plugin: {'data': ...}}}) with scores derived
+from the text hash, so equal inputs give equal results.
+/api/v1/search/ai-detection, /api/v1/search/plagiarism and /analyze-batch do
+the same for their payloads.
+
+GET /_admin/stats → {'calls': n, 'connections': n}: backend calls and TCP
+connections accepted (keep-alive reuse). POST /_admin/mode {"mode": "ok" |
+"down" | "slow", "latency_ms": n} switches behaviour: 'down' answers 503 at
+once, 'slow' sleeps latency_ms (to drive timeouts and the circuit breaker).
+"""
+import argparse
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+def _score(*parts) -> int:
+    digest = hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).digest()
+    return digest[0] * 100 // 256
+
+
+class Handler(BaseHTTPRequestHandler):
+    latency = 0.0
+    mode = 'ok'
+    calls = 0
+    connections = 0
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def setup(self):
+        type(self).connections += 1
+        super().setup()
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        if urlparse(self.path).path == '/_admin/stats':
+            return self._send(200, {'calls': type(self).calls, 'connections': type(self).connections})
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        cls = type(self)
+        if path == '/_admin/mode':
+            cls.mode = body.get('mode', 'ok')
+            if 'latency_ms' in body:
+                cls.latency = body['latency_ms'] / 1000
+            return self._send(200, {'mode': cls.mode})
+
+        cls.calls += 1
+        if cls.mode == 'down':
+            return self._send(503, {'status': 'error', 'message': 'service down'})
+        if cls.latency:
+            time.sleep(cls.latency)
+
+        if path == '/analyze_document':
+            text = body.get('text', '')
+            results = {p: {'data': {'ai_percentage': _score(text, p), 'plugin': p}}
+                       for p in body.get('plugins', [])}
+            return self._send(200, {'status': 'ok', 'results': results})
+        if path == '/api/v1/search/ai-detection':
+            return self._send(200, {'status': 'ok', 'ai_probability': _score(body.get('image_url'))})
+        if path == '/api/v1/search/plagiarism':
+            return self._send(200, {'status': 'ok', 'matches': [],
+                                    'similarity': _score(body.get('image_url'), body.get('similarity_threshold'))})
+        if path == '/analyze-batch':
+            return self._send(200, {'results': [{'ai_percentage': _score(t)} for t in body.get('texts', [])]})
+        self._send(404, {'error': 'not found'})
+
+
+class _Server(ThreadingHTTPServer):
+    request_queue_size = 256           # ráfagas de conexiones nuevas (el cliente sin pool)
+
+
+def serve(port: int = 0, latency_ms: float = 0):
+    """Start the server in a daemon thread. Returns (server, handler class, base URL)."""
+    handler = type('BoundHandler', (Handler,), {'latency': latency_ms / 1000})
+    server = _Server(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    args = parser.parse_args()
+    server, _, base = serve(args.port, args.latency_ms)
+    print(f'analysis stand-in at {base}/analyze_document  {base}/api/v1/search/*  {base}/analyze-batch  (Ctrl+C to stop)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,695 @@
+"""
+Local stand-in for the Google Drive v3, Dropbox v2 and Microsoft Graph
+endpoints that services/cloud_index.py uses (listing + change feeds), over
+one synthetic drive, with optional per-request latency, and for the upload /
+download endpoints of services/cloud_transfer.py (plus Box's).
+
+    python scripts/tools/fake_cloud_provider.py --files 50000 --port 8765 --latency-ms 40
+
+API bases (pass as api_base / content_base, or point OAUTH_CONFIG at them in
+development):
+    google_drive  http://127.0.0.1:8765/drive/v3   http://127.0.0.1:8765/upload/drive/v3
+    dropbox       http://127.0.0.1:8765/dropbox/2  http://127.0.0.1:8765/dropbox-content/2
+    onedrive      http://127.0.0.1:8765/graph/v1.0 (both)
+    box           http://127.0.0.1:8765/box/2.0    http://127.0.0.1:8765/box-upload/api/2.0
+
+Transfers never keep file contents: an upload is recorded as its size and
+SHA-256, and a downloadable file (POST /_admin/blob {"size": n, "name": ...}
+→ {"id"}) is a fixed 1 MB pseudo-random pattern repeated, served with Range
+support. GET /_admin/blob?id= returns what an upload stored. With
+--fail-every N, every N-th upload chunk request keeps only the first half of
+the chunk and answers 503, so clients have to resume from the offset the
+provider reports.
+
+POST /oauth2/token (grant_type=refresh_token) hands out access-<n> tokens and
+GET /_admin/token_stats counts them (services/oauth_tokens.py).
+
+POST /_admin/mutate {"add": n, "rename": n, "delete": n, "trash_folder": bool}
+applies random changes that then show up in the three change feeds. GET
+/_admin/documents returns the ids of the document files, which is what an
+index should hold (Dropbox ids carry an 'id:' prefix). Any Bearer token is
+accepted. Only the parameters cloud_index and the legacy
+listing send are implemented.
+"""
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+_MIME = {
+    'pdf': 'application/pdf',
+    'doc': 'application/msword',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'txt': 'text/plain',
+    'pptx': 'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'jpg': 'image/jpeg',
+    'png': 'image/png',
+    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'zip': 'application/zip',
+}
+# 60 % documentos, 40 % otros archivos
+_EXTENSIONS = ['pdf'] * 20 + ['docx'] * 20 + ['doc'] * 6 + ['txt'] * 8 + ['pptx'] * 6 + \
+              ['jpg'] * 15 + ['png'] * 10 + ['xlsx'] * 10 + ['zip'] * 5
+_DOCUMENT_EXT = {'pdf', 'doc', 'docx', 'txt', 'pptx'}
+
+
+def _token(obj) -> str:
+    return base64.urlsafe_b64encode(json.dumps(obj).encode()).decode()
+
+
+def _untoken(value: str):
+    return json.loads(base64.urlsafe_b64decode(value.encode()))
+
+
+class FakeDrive:
+    """One synthetic drive with a sequential change log."""
+
+    def __init__(self, files: int, folders: int = 50, seed: int = 1):
+        self.lock = threading.Lock()
+        self.rnd = random.Random(seed)
+        self.files = {}          # id -> file
+        self.log = []            # (seq, id, removed, path_lower)
+        self.seq = 0
+        self.next_id = 1
+        self.folders = [f'/Course {k:02d}/Week {j}' for k in range(folders) for j in range(1, 5)]
+        self.now = datetime(2025, 1, 1)
+        for _ in range(files):
+            self._add()
+
+    def _add(self):
+        ext = self.rnd.choice(_EXTENSIONS)
+        fid = f'f{self.next_id:07d}'
+        self.next_id += 1
+        self.now += timedelta(seconds=self.rnd.randint(1, 600))
+        folder = self.rnd.choice(self.folders)
+        name = f'essay_{fid}.{ext}'
+        self.files[fid] = {'id': fid, 'name': name, 'ext': ext, 'size': self.rnd.randint(1_000, 5_000_000),
+                           'modified': self.now.strftime('%Y-%m-%dT%H:%M:%S.000Z'), 'folder': folder}
+        return fid
+
+    def path(self, f) -> str:
+        return f"{f['folder']}/{f['name']}"
+
+    def _log(self, fid, removed, path_lower=None):
+        self.seq += 1
+        self.log.append((self.seq, fid, removed, path_lower))
+
+    def mutate(self, add=0, rename=0, delete=0, trash_folder=False) -> dict:
+        with self.lock:
+            for _ in range(add):
+                self._log(self._add(), False)
+            for fid in self.rnd.sample(sorted(self.files), min(rename, len(self.files))):
+                f = self.files[fid]
+                old = self.path(f).lower()
+                ext = self.rnd.choice(_EXTENSIONS)
+                f['name'], f['ext'] = f'renamed_{fid}.{ext}', ext
+                self.now += timedelta(seconds=5)
+                f['modified'] = self.now.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+                self._log(fid, True, old)       # Dropbox: rename = delete old path + new file
+                self._log(fid, False)
+            for fid in self.rnd.sample(sorted(self.files), min(delete, len(self.files))):
+                f = self.files.pop(fid)
+                self._log(fid, True, self.path(f).lower())
+            removed_folder = None
+            if trash_folder:
+                removed_folder = self.rnd.choice(self.folders)
+                for fid in [fid for fid, f in self.files.items() if f['folder'] == removed_folder]:
+                    self.files.pop(fid)
+                    self._log(fid, True, None)
+                self._log(None, True, removed_folder.lower())   # Dropbox: sólo la carpeta
+            return {'files': len(self.files), 'seq': self.seq, 'removed_folder': removed_folder}
+
+    def changes_since(self, seq: int) -> dict:
+        """Net per-file changes after seq: {id: current file, or None if removed}."""
+        net = {}
+        for s, fid, removed, _ in self.log:
+            if s > seq and fid is not None:
+                net[fid] = None if removed else self.files.get(fid)
+        return net
+
+    def documents(self) -> list[str]:
+        with self.lock:
+            return sorted(fid for fid, f in self.files.items() if f['ext'] in _DOCUMENT_EXT)
+
+
+_PATTERN = random.Random(7).randbytes(1 << 20)
+_IO_CHUNK = 1 << 20
+
+
+def pattern_bytes(offset: int, length: int) -> bytes:
+    """Bytes [offset, offset + length) of a downloadable file (the pattern, repeated)."""
+    out = []
+    while length > 0:
+        i = offset % len(_PATTERN)
+        take = min(length, len(_PATTERN) - i)
+        out.append(_PATTERN[i:i + take])
+        offset += take
+        length -= take
+    return b''.join(out)
+
+
+class Blobs:
+    """Uploaded files (size + SHA-256 only), downloadable files and open upload sessions."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.items = {}          # id -> {'name', 'size', 'sha256', 'pattern'}
+        self.sessions = {}       # id -> {'name', 'size', 'received', 'hash'}
+        self.counter = 0
+
+    def _next(self, prefix):
+        with self.lock:
+            self.counter += 1
+            return f'{prefix}{self.counter:06d}'
+
+    def register(self, size: int, name: str) -> str:
+        bid = self._next('b')
+        self.items[bid] = {'name': name, 'size': size, 'sha256': None, 'pattern': True}
+        return bid
+
+    def store(self, name: str, size: int, digest) -> dict:
+        bid = self._next('u')
+        self.items[bid] = {'name': name, 'size': size, 'sha256': digest.hexdigest(), 'pattern': False}
+        return {'id': bid, 'name': name}
+
+    def open(self, name: str, size=None) -> str:
+        sid = self._next('s')
+        self.sessions[sid] = {'name': name, 'size': size, 'received': 0, 'hash': hashlib.sha256()}
+        return sid
+
+    def close(self, sid: str) -> dict:
+        sess = self.sessions.pop(sid)
+        return self.store(sess['name'], sess['received'], sess['hash'])
+
+
+class Handler(BaseHTTPRequestHandler):
+    drive: FakeDrive = None
+    blobs: Blobs = None
+    latency = 0.0
+    requests = 0
+    fail_every = 0
+    chunk_requests = 0
+    token_refreshes = 0
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True     # cabeceras y cuerpo van en escrituras separadas
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _base(self):
+        return f'http://{self.headers["Host"]}'
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        type(self).requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        url = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        transfer = self._transfer_route(method, url.path)
+        if transfer is not None:
+            return transfer(url.path, params)
+        body = self._body() if method == 'POST' else {}
+        routes = {
+            '/drive/v3/files': self.drive_files,
+            '/drive/v3/changes/startPageToken': self.drive_start,
+            '/drive/v3/changes': self.drive_changes,
+            '/dropbox/2/files/list_folder': self.dropbox_list,
+            '/dropbox/2/files/list_folder/continue': self.dropbox_continue,
+            '/dropbox/2/files/list_folder/get_latest_cursor': self.dropbox_latest,
+            '/graph/v1.0/me/drive/root/delta': self.graph_delta,
+            '/_admin/mutate': lambda p, b: (200, self.drive.mutate(**b)),
+            '/_admin/documents': lambda p, b: (200, {'ids': self.drive.documents()}),
+            '/_admin/blob': self.admin_blob,
+            '/_admin/token_stats': lambda p, b: (200, {'refreshes': type(self).token_refreshes}),
+        }
+        handler = routes.get(url.path)
+        if handler is None:
+            return self._send(404, {'error': f'not implemented: {url.path}'})
+        status, payload = handler(params, body)
+        self._send(status, payload)
+
+    # ── Google Drive ──────────────────────────────────────────────────────────
+    @staticmethod
+    def _drive_file(f):
+        return {'id': f['id'], 'name': f['name'], 'size': str(f['size']), 'modifiedTime': f['modified'],
+                'mimeType': _MIME[f['ext']], 'webViewLink': f"https://drive.example/{f['id']}", 'trashed': False}
+
+    def drive_files(self, params, body):
+        q = params.get('q', '')
+        mimes = {part.split("'")[1] for part in q.split('mimeType=')[1:]} if 'mimeType=' in q else None
+        size = min(int(params.get('pageSize', 100)), 1000)
+        offset = int(params.get('pageToken', 0))
+        with self.drive.lock:
+            match = [f for f in self.drive.files.values() if mimes is None or _MIME[f['ext']] in mimes]
+        page = match[offset:offset + size]
+        out = {'files': [self._drive_file(f) for f in page]}
+        if offset + size < len(match):
+            out['nextPageToken'] = str(offset + size)
+        return 200, out
+
+    def drive_start(self, params, body):
+        return 200, {'startPageToken': str(self.drive.seq)}
+
+    def drive_changes(self, params, body):
+        with self.drive.lock:
+            seq = int(params['pageToken'])
+            if seq > self.drive.seq:
+                return 404, {'error': {'message': 'Invalid page token'}}
+            changes = [{'fileId': fid, 'removed': f is None, **({'file': self._drive_file(f)} if f else {})}
+                       for fid, f in self.drive.changes_since(seq).items()]
+            return 200, {'changes': changes, 'newStartPageToken': str(self.drive.seq)}
+
+    # ── Dropbox ───────────────────────────────────────────────────────────────
+    def _dropbox_file(self, f):
+        path = self.drive.path(f)
+        return {'.tag': 'file', 'id': f'id:{f["id"]}', 'name': f['name'], 'size': f['size'],
+                'server_modified': f['modified'][:19] + 'Z', 'path_lower': path.lower(), 'path_display': path}
+
+    def _dropbox_entries(self, path, recursive):
+        path = path.lower()
+        entries, folders = [], set()
+        with self.drive.lock:
+            for folder in self.drive.folders:
+                if not folder.lower().startswith(path + '/') and path:
+                    continue
+                rest = folder[len(path):].strip('/').split('/')
+                top = f'{path}/{rest[0]}'.lower() if rest[0] else None
+                if recursive:
+                    folders.add(folder)
+                elif top:
+                    folders.add(top)
+            for f in self.drive.files.values():
+                p = self.drive.path(f).lower()
+                if recursive and p.startswith(path + '/'):
+                    entries.append(self._dropbox_file(f))
+                elif not recursive and p.rsplit('/', 1)[0] == path:
+                    entries.append(self._dropbox_file(f))
+        folder_entries = [{'.tag': 'folder', 'name': p.rsplit('/', 1)[-1], 'path_lower': p.lower(),
+                           'path_display': p} for p in sorted(folders)]
+        return folder_entries + entries
+
+    def _dropbox_page(self, path, recursive, offset, limit):
+        entries = self._dropbox_entries(path, recursive)
+        page = entries[offset:offset + limit]
+        more = offset + limit < len(entries)
+        cursor = _token({'kind': 'list', 'path': path, 'recursive': recursive, 'offset': offset + limit,
+                         'limit': limit}) if more else _token({'kind': 'changes', 'seq': self.drive.seq})
+        return 200, {'entries': page, 'cursor': cursor, 'has_more': more}
+
+    def dropbox_list(self, params, body):
+        return self._dropbox_page(body.get('path', ''), body.get('recursive', False), 0,
+                                  min(int(body.get('limit', 2000)), 2000))
+
+    def dropbox_latest(self, params, body):
+        return 200, {'cursor': _token({'kind': 'changes', 'seq': self.drive.seq})}
+
+    def dropbox_continue(self, params, body):
+        cursor = _untoken(body['cursor'])
+        if cursor['kind'] == 'list':
+            return self._dropbox_page(cursor['path'], cursor['recursive'], cursor['offset'], cursor['limit'])
+        with self.drive.lock:
+            if cursor['seq'] > self.drive.seq:
+                return 409, {'error_summary': 'reset/', 'error': {'.tag': 'reset'}}
+            entries = []
+            for s, fid, removed, path_lower in self.drive.log:
+                if s <= cursor['seq']:
+                    continue
+                if removed:
+                    if path_lower:
+                        entries.append({'.tag': 'deleted', 'path_lower': path_lower,
+                                        'name': path_lower.rsplit('/', 1)[-1]})
+                elif fid in self.drive.files:
+                    entries.append(self._dropbox_file(self.drive.files[fid]))
+            return 200, {'entries': entries, 'cursor': _token({'kind': 'changes', 'seq': self.drive.seq}),
+                         'has_more': False}
+
+    # ── Microsoft Graph ───────────────────────────────────────────────────────
+    @staticmethod
+    def _graph_item(f):
+        return {'id': f['id'], 'name': f['name'], 'size': f['size'], 'lastModifiedDateTime': f['modified'][:19] + 'Z',
+                'file': {'mimeType': _MIME[f['ext']]}, 'webUrl': f"https://onedrive.example/{f['id']}"}
+
+    def graph_delta(self, params, body):
+        base = f'{self._base()}/graph/v1.0/me/drive/root/delta'
+        token = params.get('token')
+        if token == 'latest':
+            return 200, {'value': [], '@odata.deltaLink': f'{base}?token={self.drive.seq}'}
+        if token is not None:
+            with self.drive.lock:
+                if int(token) > self.drive.seq:
+                    return 410, {'error': {'code': 'resyncRequired'}}
+                value = [self._graph_item(f) if f else {'id': fid, 'deleted': {'state': 'deleted'}}
+                         for fid, f in self.drive.changes_since(int(token)).items()]
+                return 200, {'value': value, '@odata.deltaLink': f'{base}?token={self.drive.seq}'}
+        offset = int(params.get('$skiptoken', 0))
+        size = 200
+        with self.drive.lock:
+            items = list(self.drive.files.values())
+            seq = self.drive.seq
+        page = [self._graph_item(f) for f in items[offset:offset + size]]
+        if offset + size < len(items):
+            return 200, {'value': page, '@odata.nextLink': f'{base}?$skiptoken={offset + size}'}
+        return 200, {'value': page, '@odata.deltaLink': f'{base}?token={seq}'}
+
+
+    # ── Transfers (services/cloud_transfer.py) ────────────────────────────────
+    def _transfer_route(self, method, path):
+        if path == '/oauth2/token' and method == 'POST':
+            return self.oauth_token
+        if path == '/upload/drive/v3/files':
+            return {'POST': self.drive_upload_start, 'PUT': self.drive_upload_chunk,
+                    'DELETE': self.drive_upload_cancel}.get(method)
+        if path.startswith('/drive/v3/files/') and method == 'GET':
+            return self.drive_get
+        if path.startswith('/dropbox-content/2/files/') and method == 'POST':
+            return self.dropbox_content
+        if path.startswith('/graph/v1.0/me/drive/') and ':/' in path:
+            return {'PUT': self.graph_simple_upload, 'POST': self.graph_create_session}.get(method)
+        if path.startswith('/graph/v1.0/me/drive/items/') and path.endswith('/content') and method == 'GET':
+            return self.graph_download
+        if path.startswith('/graph-upload/'):
+            return {'PUT': self.graph_upload_chunk, 'GET': self.graph_upload_status,
+                    'DELETE': self.graph_upload_cancel}.get(method)
+        if path.startswith('/graph-dl/') and method == 'GET':
+            return lambda p, params: self._serve_blob(p.rsplit('/', 1)[1])
+        if path == '/box-upload/api/2.0/files/content' and method == 'POST':
+            return self.box_upload
+        if path.startswith('/box/2.0/files/') and path.endswith('/content') and method == 'GET':
+            return lambda p, params: self._serve_blob(p.split('/')[4])
+        return None
+
+    def _send_raw(self, status, headers=None, body=b''):
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _length(self):
+        return int(self.headers.get('Content-Length') or 0)
+
+    def _consume(self, length, sink=None):
+        """Read the request body in 1 MB pieces, passing each to sink."""
+        while length > 0:
+            data = self.rfile.read(min(length, _IO_CHUNK))
+            if not data:
+                break
+            length -= len(data)
+            if sink:
+                sink(data)
+
+    def _fail_now(self):
+        type(self).chunk_requests += 1
+        return bool(self.fail_every) and type(self).chunk_requests % self.fail_every == 0
+
+    def _write_chunk(self, sess, length, fail):
+        """Append the body to the session; when failing, keep only the first half (256 KB aligned)."""
+        keep = (length // 2) // (256 * 1024) * (256 * 1024) if fail else length
+        state = {'left': keep}
+
+        def sink(data):
+            take = data[:state['left']]
+            state['left'] -= len(take)
+            sess['hash'].update(take)
+
+        self._consume(length, sink)
+        sess['received'] += keep
+
+    def _consume_multipart(self, length, boundary):
+        """Stream a two-part body (JSON metadata, then the file): (metadata, size, sha256)."""
+        marker = b'--' + boundary.encode()
+        head = self.rfile.read(min(length, 65536))
+        length -= len(head)
+        start1 = head.index(b'\r\n\r\n', head.index(marker)) + 4
+        end1 = head.index(b'\r\n' + marker, start1)
+        metadata = json.loads(head[start1:end1])
+        pending = head[head.index(b'\r\n\r\n', end1) + 4:]
+        digest, size, hold = hashlib.sha256(), 0, len(marker) + 8
+
+        def sink(data):
+            nonlocal pending, size
+            pending += data
+            if len(pending) > hold:
+                digest.update(pending[:-hold])
+                size += len(pending) - hold
+                pending = pending[-hold:]
+
+        self._consume(length, sink)
+        tail = pending[:pending.rindex(b'\r\n' + marker + b'--')]
+        digest.update(tail)
+        return metadata, size + len(tail), digest
+
+    def _range(self, size):
+        """(start, end, partial) for the request's Range header, or None if unsatisfiable."""
+        header = self.headers.get('Range', '')
+        if not header.startswith('bytes='):
+            return 0, size, False
+        first, _, last = header[6:].split(',')[0].strip().partition('-')
+        if not first:
+            start, end = max(0, size - int(last)), size
+        else:
+            start, end = int(first), min(int(last) + 1, size) if last else size
+        if start >= size or start >= end:
+            return None
+        return start, end, True
+
+    def _serve_blob(self, bid, extra=None):
+        blob = self.blobs.items.get(bid)
+        if blob is None or not blob['pattern']:
+            return self._send(404, {'error': 'not_found'})
+        size = blob['size']
+        span = self._range(size)
+        if_range = self.headers.get('If-Range')
+        if span and span[2] and if_range and if_range != f'"{bid}"':
+            span = (0, size, False)      # la versión cambió: archivo completo
+        if span is None:
+            return self._send_raw(416, {'Content-Range': f'bytes */{size}'})
+        start, end, partial = span
+        self.send_response(206 if partial else 200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', f'"{bid}"')
+        if partial:
+            self.send_header('Content-Range', f'bytes {start}-{end - 1}/{size}')
+        for name, value in (extra or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        try:
+            for pos in range(start, end, _IO_CHUNK):
+                self.wfile.write(pattern_bytes(pos, min(_IO_CHUNK, end - pos)))
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def admin_blob(self, params, body):
+        if body:
+            return 200, {'id': self.blobs.register(int(body['size']), body.get('name', 'file.bin'))}
+        blob = self.blobs.items.get(params.get('id'))
+        return (200, blob) if blob else (404, {'error': 'not_found'})
+
+    # OAuth (form-encoded, like the real token endpoints)
+    def oauth_token(self, path, params):
+        form = {k: v[0] for k, v in parse_qs(self.rfile.read(self._length()).decode()).items()}
+        if form.get('grant_type') != 'refresh_token' or not form.get('refresh_token'):
+            return self._send(400, {'error': 'invalid_request'})
+        with self.blobs.lock:
+            type(self).token_refreshes += 1
+            n = type(self).token_refreshes
+        self._send(200, {'access_token': f'access-{n}', 'expires_in': 3600, 'token_type': 'Bearer'})
+
+    # Google Drive
+    def drive_upload_start(self, path, params):
+        if params.get('uploadType') == 'multipart':
+            boundary = self.headers['Content-Type'].split('boundary=')[1]
+            metadata, size, digest = self._consume_multipart(self._length(), boundary)
+            return self._send(200, self.blobs.store(metadata['name'], size, digest))
+        metadata = self._body()
+        sid = self.blobs.open(metadata['name'], int(self.headers['X-Upload-Content-Length']))
+        self._send_raw(200, {'Location': f'{self._base()}/upload/drive/v3/files?uploadType=resumable&upload_id={sid}'})
+
+    def drive_upload_chunk(self, path, params):
+        sess = self.blobs.sessions.get(params.get('upload_id'))
+        length = self._length()
+        if sess is None:
+            self._consume(length)
+            return self._send(404, {'error': {'message': 'upload session not found'}})
+        span = self.headers.get('Content-Range', '').split(' ', 1)[1]
+        if not span.startswith('*'):
+            if int(span.split('-')[0]) != sess['received']:
+                self._consume(length)
+            else:
+                fail = self._fail_now()
+                self._write_chunk(sess, length, fail)
+                if fail:
+                    return self._send(503, {'error': {'message': 'backend error'}})
+        if sess['received'] >= sess['size']:
+            return self._send(200, self.blobs.close(params['upload_id']))
+        received = {'Range': f"bytes=0-{sess['received'] - 1}"} if sess['received'] else {}
+        self._send_raw(308, received)
+
+    def drive_upload_cancel(self, path, params):
+        self.blobs.sessions.pop(params.get('upload_id'), None)
+        self._send_raw(499)
+
+    def drive_get(self, path, params):
+        bid = path.rsplit('/', 1)[1]
+        if params.get('alt') == 'media':
+            return self._serve_blob(bid)
+        blob = self.blobs.items.get(bid)
+        if blob is None:
+            return self._send(404, {'error': {'message': 'File not found'}})
+        return self._send(200, {'name': blob['name'], 'mimeType': 'application/octet-stream'})
+
+    # Dropbox
+    def dropbox_content(self, path, params):
+        endpoint = path[len('/dropbox-content/2/files/'):]
+        arg = json.loads(self.headers.get('Dropbox-API-Arg') or '{}')
+        length = self._length()
+        if endpoint == 'download':
+            bid = arg['path'].removeprefix('id:')
+            blob = self.blobs.items.get(bid)
+            name = blob['name'] if blob else ''
+            return self._serve_blob(bid, {'Dropbox-API-Result': json.dumps({'name': name, 'id': f'id:{bid}'})})
+        if endpoint == 'upload':
+            digest = hashlib.sha256()
+            self._consume(length, digest.update)
+            stored = self.blobs.store(arg['path'].rsplit('/', 1)[-1], length, digest)
+            return self._send(200, {'id': f"id:{stored['id']}", 'name': stored['name']})
+        if endpoint == 'upload_session/start':
+            sid = self.blobs.open(None)
+            self._write_chunk(self.blobs.sessions[sid], length, False)
+            return self._send(200, {'session_id': sid})
+        cursor = arg['cursor']
+        sess = self.blobs.sessions.get(cursor['session_id'])
+        if sess is None:
+            self._consume(length)
+            return self._send(409, {'error_summary': 'not_found/', 'error': {'.tag': 'not_found'}})
+        if cursor['offset'] != sess['received']:
+            self._consume(length)
+            error = {'.tag': 'incorrect_offset', 'correct_offset': sess['received']}
+            if endpoint == 'upload_session/finish':
+                error = {'.tag': 'lookup_failed', 'lookup_failed': error}
+            return self._send(409, {'error_summary': 'incorrect_offset/', 'error': error})
+        fail = length > 0 and self._fail_now()
+        self._write_chunk(sess, length, fail)
+        if fail:
+            return self._send(503, {'error_summary': 'internal_error/'})
+        if endpoint == 'upload_session/finish':
+            sess['name'] = arg['commit']['path'].rsplit('/', 1)[-1]
+            stored = self.blobs.close(cursor['session_id'])
+            return self._send(200, {'id': f"id:{stored['id']}", 'name': stored['name']})
+        self._send(200, None)
+
+    # Microsoft Graph
+    def graph_simple_upload(self, path, params):
+        digest = hashlib.sha256()
+        length = self._length()
+        self._consume(length, digest.update)
+        name = unquote(path.split(':/')[1].split(':')[0])
+        self._send(201, self.blobs.store(name, length, digest))
+
+    def graph_create_session(self, path, params):
+        self._body()
+        sid = self.blobs.open(unquote(path.split(':/')[1].split(':')[0]))
+        self._send(200, {'uploadUrl': f'{self._base()}/graph-upload/{sid}',
+                         'expirationDateTime': '2099-01-01T00:00:00Z'})
+
+    def graph_upload_chunk(self, path, params):
+        sid = path.rsplit('/', 1)[1]
+        sess = self.blobs.sessions.get(sid)
+        length = self._length()
+        if sess is None:
+            self._consume(length)
+            return self._send(404, {'error': {'code': 'itemNotFound'}})
+        span, total = self.headers['Content-Range'].split(' ', 1)[1].split('/')
+        sess['size'] = int(total)
+        if int(span.split('-')[0]) != sess['received']:
+            self._consume(length)
+            return self._send(416, {'error': {'code': 'invalidRange'}})
+        fail = self._fail_now()
+        self._write_chunk(sess, length, fail)
+        if fail:
+            return self._send(503, {'error': {'code': 'serviceNotAvailable'}})
+        if sess['received'] >= sess['size']:
+            return self._send(201, self.blobs.close(sid))
+        self._send(202, {'nextExpectedRanges': [f"{sess['received']}-"]})
+
+    def graph_upload_status(self, path, params):
+        sess = self.blobs.sessions.get(path.rsplit('/', 1)[1])
+        if sess is None:
+            return self._send(404, {'error': {'code': 'itemNotFound'}})
+        self._send(200, {'nextExpectedRanges': [f"{sess['received']}-"]})
+
+    def graph_upload_cancel(self, path, params):
+        self.blobs.sessions.pop(path.rsplit('/', 1)[1], None)
+        self._send_raw(204)
+
+    def graph_download(self, path, params):
+        bid = path.split('/')[6]
+        self._send_raw(302, {'Location': f'{self._base()}/graph-dl/{bid}'})
+
+    # Box
+    def box_upload(self, path, params):
+        boundary = self.headers['Content-Type'].split('boundary=')[1]
+        attributes, size, digest = self._consume_multipart(self._length(), boundary)
+        self._send(201, {'entries': [self.blobs.store(attributes['name'], size, digest)]})
+
+
+def serve(files: int, port: int = 0, latency_ms: float = 0, seed: int = 1, fail_every: int = 0):
+    """Start the server in a daemon thread. Returns (server, handler class, base URL)."""
+    handler = type('BoundHandler', (Handler,), {'drive': FakeDrive(files, seed=seed), 'blobs': Blobs(),
+                                                'latency': latency_ms / 1000, 'fail_every': fail_every})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, handler, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--files', type=int, default=50_000)
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency-ms', type=float, default=0)
+    parser.add_argument('--fail-every', type=int, default=0, help='fail every N-th upload chunk request')
+    args = parser.parse_args()
+    server, _, base = serve(args.files, args.port, args.latency_ms, fail_every=args.fail_every)
+    print(f'{args.files} files at {base}/drive/v3  {base}/dropbox/2  {base}/graph/v1.0  (Ctrl+C to stop)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
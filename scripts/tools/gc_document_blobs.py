@@ -0,0 +1,45 @@
+"""
+Mark-and-sweep garbage collection of document blobs (`documents` bucket and
+the local:// fallback directory) no Document or DocumentVersion references.
+
+    python scripts/tools/gc_document_blobs.py --dry-run
+    python scripts/tools/gc_document_blobs.py --grace-hours 12 --workers 16
+
+Blobs younger than the grace period are kept: a save uploads its blob before
+the row that references it is committed. The grace cannot be shorter than
+twice the interval at which reused blobs get their mtime refreshed (6 h).
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.document_blobs import _MIN_GC_GRACE, DocumentBlobStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='report orphans without deleting')
+    parser.add_argument('--grace-hours', type=int, default=6)
+    parser.add_argument('--workers', type=int, default=8, help='parallel deletes')
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+    if timedelta(hours=args.grace_hours) < _MIN_GC_GRACE:
+        parser.error(f'--grace-hours must be at least {_MIN_GC_GRACE.total_seconds() / 3600:g}')
+
+    with app.app_context():
+        report = DocumentBlobStore.collect_garbage(
+            dry_run=args.dry_run,
+            grace=timedelta(hours=args.grace_hours),
+            workers=args.workers,
+            batch_size=args.batch_size,
+        )
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
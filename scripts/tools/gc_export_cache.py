@@ -0,0 +1,43 @@
+"""
+Delete cached PDF/DOCX renders (`exports` bucket, cache/) older than the
+export cache TTL.
+
+    python scripts/tools/gc_export_cache.py --dry-run
+    python scripts/tools/gc_export_cache.py --ttl-days 3 --workers 16
+
+A render's mtime is when it was produced; ExportService.submit() re-renders
+instead of reusing a file close to expiry, so a sweep never removes a file
+behind a download URL it handed out.
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.export_service import _CACHE_TTL, ExportService  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='report expired renders without deleting')
+    parser.add_argument('--ttl-days', type=int, default=_CACHE_TTL.days)
+    parser.add_argument('--workers', type=int, default=8, help='parallel deletes')
+    args = parser.parse_args()
+    if args.ttl_days < 1:
+        parser.error('--ttl-days must be at least 1')
+
+    with app.app_context():
+        report = ExportService.collect_expired(
+            dry_run=args.dry_run,
+            ttl=timedelta(days=args.ttl_days),
+            workers=args.workers,
+        )
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
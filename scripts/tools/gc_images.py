@@ -0,0 +1,39 @@
+"""
+Garbage-collect content-addressed images no document references any more.
+
+    python scripts/tools/gc_images.py --dry-run
+    python scripts/tools/gc_images.py --grace-hours 48 --batch-size 1000
+
+Images younger than the grace period are kept: a fresh upload is only
+referenced after the document that uses it is saved.
+"""
+import argparse
+import os
+import sys
+from datetime import timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.image_store import ImageStore  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help='report orphans without deleting')
+    parser.add_argument('--grace-hours', type=int, default=24)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+
+    with app.app_context():
+        report = ImageStore.collect_garbage(
+            dry_run=args.dry_run,
+            grace=timedelta(hours=args.grace_hours),
+            batch_size=args.batch_size,
+        )
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+"""
+Build or refresh the full-text search index (document_search_index).
+
+    python scripts/tools/reindex_search.py                 # every document
+    python scripts/tools/reindex_search.py --since-id 120000 --batch-size 500
+    python scripts/tools/reindex_search.py --dirty         # queued documents past the debounce
+
+Documents whose content_hash and title match their index row are skipped,
+so re-running after an interrupted backfill only pays for what is missing.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.search_index import SearchIndex  # noqa: E402
+
+
+def backfill(since_id, batch_size):
+    from models.models import Document
+    from settings.extensions import db
+
+    last_id, seen, written, t0 = since_id, 0, 0, time.perf_counter()
+    while True:
+        ids = [i for (i,) in db.session.query(Document.id)
+               .filter(Document.id > last_id).order_by(Document.id).limit(batch_size)]
+        if not ids:
+            break
+        written += SearchIndex.reindex(ids)
+        db.session.expunge_all()
+        seen += len(ids)
+        last_id = ids[-1]
+        print(f'  … id {last_id}: {seen} documents, {written} written '
+              f'({seen / (time.perf_counter() - t0):,.0f} docs/s)')
+    return {'documents': seen, 'written': written, 'last_id': last_id}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--since-id', type=int, default=0, help='resume after this document id')
+    parser.add_argument('--batch-size', type=int, default=200)
+    parser.add_argument('--dirty', action='store_true', help='only process the search:dirty queue')
+    args = parser.parse_args()
+
+    with app.app_context():
+        if args.dirty:
+            total = 0
+            while (claimed := SearchIndex.process_dirty(args.batch_size)):
+                total += claimed
+            report = {'reindexed': total}
+        else:
+            report = backfill(args.since_id, args.batch_size)
+    for key, value in report.items():
+        print(f'{key}: {value}')
+
+
+if __name__ == '__main__':
+    main()
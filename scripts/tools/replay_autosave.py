@@ -0,0 +1,109 @@
+"""
+Replay captured save_document traffic through the fast-path decision and
+report how many saves are skipped and how many MySQL writes that removes.
+
+Capture real traffic on one worker first (hashes only, no document text):
+
+    AUTOSAVE_CAPTURE_PATH=/var/log/xplagiax/autosave.jsonl gunicorn ...
+    python scripts/tools/replay_autosave.py /var/log/xplagiax/autosave.jsonl
+
+Without a capture file, --synthetic N generates N editing sessions (load →
+idle/typing autosave ticks → occasional manual save) to exercise the report.
+
+MySQL statements per save (see routes/document_routes.save_document):
+    before: UPDATE documents + INSERT document_versions (manual saves)
+            + metrics upsert (when the client sends metrics)
+    after:  unchanged saves keep only the metrics upsert
+Redis per autosave: lock GET+SETEX → one EVALSHA; cache DEL only on writes.
+"""
+import argparse
+import hashlib
+import json
+import random
+from collections import Counter
+
+
+def _h(value):
+    return hashlib.sha1(str(value).encode()).hexdigest()[:16]
+
+
+def synthetic(sessions, seed=5):
+    rnd = random.Random(seed)
+    for s in range(sessions):
+        doc_id = rnd.randrange(max(1, sessions // 3))
+        version = rnd.randrange(1000)
+        title = _h(f'title-{doc_id}')
+        # The first save after opening the editor is a full save of the loaded content
+        yield {'doc_id': doc_id, 'is_autosave': True, 'mode': 'full',
+               'content_hash': _h((doc_id, version)), 'title_hash': title,
+               'html_hash': _h(('html', doc_id, version)), 'metrics': True}
+        for tick in range(rnd.randint(5, 60)):
+            typing = rnd.random() < 0.55
+            if typing:
+                version += 1
+            manual = rnd.random() < 0.03
+            if not typing and not manual and rnd.random() < 0.6:
+                continue   # idle tick filtered by the client (empty diff)
+            yield {'doc_id': doc_id, 'is_autosave': not manual,
+                   'mode': 'full' if manual else 'patch',
+                   'content_hash': _h((doc_id, version)), 'title_hash': title,
+                   'html_hash': _h(('html', doc_id, version)) if manual or tick % 10 == 0 else None,
+                   'metrics': True}
+
+
+def replay(events):
+    state = {}
+    c = Counter()
+    for ev in events:
+        doc_id = ev['doc_id']
+        prev = state.get(doc_id)
+        html_hash = ev.get('html_hash')
+        unchanged = prev is not None and prev[0] == ev['content_hash'] and prev[1] == ev.get('title_hash') and (
+            (ev.get('mode') == 'patch' and html_hash is None) or html_hash == prev[2]
+        )
+
+        c['saves'] += 1
+        c['autosaves'] += bool(ev.get('is_autosave'))
+        manual = not ev.get('is_autosave')
+        metrics = 1 if ev.get('metrics') else 0
+        c['sql_before'] += 1 + manual + metrics
+        if unchanged:
+            c['skipped'] += 1
+            c['autosaves_skipped'] += bool(ev.get('is_autosave'))
+            c['sql_after'] += metrics
+        else:
+            c['sql_after'] += 1 + manual + metrics
+            c['doc_updates_after'] += 1
+            state[doc_id] = (ev['content_hash'], ev.get('title_hash'),
+                             html_hash if html_hash is not None else (prev[2] if prev else None))
+    return c
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('capture', nargs='?', help='JSONL written with AUTOSAVE_CAPTURE_PATH')
+    parser.add_argument('--synthetic', type=int, default=0, help='generate N synthetic sessions instead')
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, encoding='utf-8') as f:
+            events = [json.loads(line) for line in f if line.strip()]
+        source = args.capture
+    else:
+        events = list(synthetic(args.synthetic or 2000))
+        source = f'synthetic ({args.synthetic or 2000} sessions)'
+
+    c = replay(events)
+    saves, autosaves = c['saves'] or 1, c['autosaves'] or 1
+    print(f'Source:                 {source}')
+    print(f'Saves:                  {c["saves"]} ({c["autosaves"]} autosaves)')
+    print(f'Skipped (no-op):        {c["skipped"]} ({c["skipped"] / saves:.1%})')
+    print(f'Autosaves skipped:      {c["autosaves_skipped"]} ({c["autosaves_skipped"] / autosaves:.1%})')
+    print(f'UPDATE documents:       {c["saves"]} → {c["doc_updates_after"]}')
+    reduction = 1 - c['sql_after'] / c['sql_before'] if c['sql_before'] else 0.0
+    print(f'MySQL write statements: {c["sql_before"]} → {c["sql_after"]} (-{reduction:.1%})')
+    print(f'Redis lock round-trips: {c["autosaves"] * 2} → {c["autosaves"]}')
+
+
+if __name__ == '__main__':
+    main()
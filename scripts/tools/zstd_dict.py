@@ -0,0 +1,98 @@
+"""
+Train, publish and rotate the zstd dictionary used for document blobs.
+
+    python scripts/tools/zstd_dict.py train [--samples 2000] [--size 112640] [--activate]
+    python scripts/tools/zstd_dict.py activate <dict_id>
+    python scripts/tools/zstd_dict.py list
+
+`train` samples the most recent documents (both storage tiers), trains on
+90% of them and reports the compression ratio on the held-out 10% with and
+without the new dictionary. Blobs written with a previous dictionary keep
+naming it in their header, so rotating never breaks reads.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+
+from app import app  # noqa: E402
+from services.document_blobs import BlobDictionaries, DocumentBlobStore  # noqa: E402
+
+
+def _corpus(limit):
+    from models.models import Document
+    from settings.utils import load_from_minio_compressed
+
+    samples = []
+    for doc in Document.query.order_by(Document.id.desc()).limit(limit).yield_per(200):
+        if doc.storage_type == 'minio' and doc.minio_path:
+            delta, html = load_from_minio_compressed(doc.minio_path)
+            if delta is None:
+                continue
+        elif doc.content_delta:
+            delta, html = json.loads(doc.content_delta), doc.content_html or ''
+        else:
+            continue
+        samples.append(DocumentBlobStore.canonical(delta, html))
+    return samples
+
+
+def _ratio(samples, zdict):
+    raw = sum(len(s) for s in samples)
+    stored = sum(len(DocumentBlobStore.compress(s, zdict)) for s in samples)
+    return raw / stored if stored else 0.0
+
+
+def train(args):
+    samples = _corpus(args.samples)
+    if len(samples) < 20:
+        sys.exit(f'Not enough documents to train ({len(samples)})')
+    random.Random(3).shuffle(samples)
+    held_out = samples[:max(1, len(samples) // 10)]
+    training = samples[len(held_out):]
+
+    zdict = BlobDictionaries.train(training, dict_size=args.size)
+    dict_id = BlobDictionaries.publish(zdict)
+    print(f'dict_id: {dict_id} ({len(zdict.as_bytes())} bytes, {len(training)} samples)')
+    print(f'held-out ratio without dictionary: {_ratio(held_out, None):.2f}x')
+    print(f'held-out ratio with dictionary:    {_ratio(held_out, zdict):.2f}x')
+    if args.activate:
+        BlobDictionaries.activate(dict_id)
+        print(f'activated: {dict_id}')
+
+
+def activate(args):
+    BlobDictionaries.activate(args.dict_id)
+    print(f'activated: {args.dict_id}')
+
+
+def list_dicts(args):
+    current = BlobDictionaries.current()
+    current_id = current.dict_id() if current is not None else None
+    for dict_id in BlobDictionaries.available():
+        print(f'{dict_id}{"  (active)" if dict_id == current_id else ""}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_train = sub.add_parser('train', help='train and publish a new dictionary')
+    p_train.add_argument('--samples', type=int, default=2000)
+    p_train.add_argument('--size', type=int, default=112640, help='dictionary size in bytes')
+    p_train.add_argument('--activate', action='store_true', help='rotate to it right away')
+    p_train.set_defaults(func=train)
+    p_activate = sub.add_parser('activate', help='rotate new blobs to an existing dictionary')
+    p_activate.add_argument('dict_id', type=int)
+    p_activate.set_defaults(func=activate)
+    sub.add_parser('list', help='published dictionaries').set_defaults(func=list_dicts)
+    args = parser.parse_args()
+
+    with app.app_context():
+        args.func(args)
+
+
+if __name__ == '__main__':
+    main()
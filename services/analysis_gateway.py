@@ -0,0 +1,524 @@
+"""
+services/analysis_gateway.py
+Gateway to the analysis microservices (XplagiaX text engine, image service,
+batch analyzer): job API, result cache, request coalescing, pooled HTTP and a
+circuit breaker per backend.
+
+Before, every proxy route blocked its worker on requests.post (30–300 s) over
+a fresh connection, and re-running an analysis on unchanged text paid the
+full cost again. Now:
+
+  key      sha256 of (kind, canonical JSON payload); for text analysis that
+           is the text plus the sorted plugin set.
+  cache    successful results in Redis (analysis:result:{key}, RESULT_TTL),
+           mirrored in a bounded per-process dict.
+  flights  one backend call per key across the cluster: the submit that wins
+           SET NX analysis:flight:{key} runs it in the gateway's thread pool,
+           later submits of the same key get a job on that flight. Jobs are
+           resolved when read: outcome of their flight recorded → that,
+           result cached → done, flight still held → pending.
+  push     the jobs waiting on a flight are kept in analysis:waiters:{flight};
+           when it ends the owner emits 'analysis:done' to each user_{id}
+           room (through the SocketIO Redis queue, so any worker's clients).
+  breaker  per backend and per worker: _BREAKER_FAILURES consecutive
+           timeouts / connection errors / 5xx open it for _BREAKER_OPEN_S,
+           submits fail fast with 503 meanwhile; then a single trial call is
+           let through (half-open).
+
+Usage:
+    job = AnalysisGateway.submit('text', {'text': t, 'plugins': [...]}, user_id)
+    job = AnalysisGateway.wait(job['job_id'], timeout=25)
+    job = AnalysisGateway.get_job(job_id)   # status: pending | done | error
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+RESULT_TTL = int(os.environ.get('ANALYSIS_RESULT_TTL', str(24 * 3600)))
+
+_WORKERS = int(os.environ.get('ANALYSIS_WORKERS', '32'))
+_JOB_TTL_SECONDS = 3600
+_OUTCOME_TTL_SECONDS = 600
+_LOCAL_MAX = 1000
+_BREAKER_FAILURES = 5
+_BREAKER_OPEN_S = 30
+_KEY_JOB = 'analysis:job:{job_id}'
+_KEY_RESULT = 'analysis:result:{key}'
+_KEY_FLIGHT = 'analysis:flight:{key}'
+_KEY_OUTCOME = 'analysis:outcome:{flight}'
+_KEY_WAITERS = 'analysis:waiters:{flight}'
+_KEY_DELIVERED = 'analysis:delivered:{job_id}'
+
+# backend: (env var, default URL, label used in error messages)
+_BACKENDS = {
+    'xplagiax': ('XPLAGIAX_URL', 'http://localhost:5006/analyze_document', 'Analysis service'),
+    'image':    ('IMAGE_SVC_URL', 'http://localhost:5010', 'Image service'),
+    'batch':    ('AITESTPRO_BATCH_URL', 'https://xplagiax.ca/x_aitestpro/api/analyze-batch', 'Analysis service'),
+}
+
+# kind: (backend, path appended to the backend URL, timeout s)
+KINDS = {
+    'text':             ('xplagiax', '', 60),
+    'image_ai':         ('image', '/api/v1/search/ai-detection', 30),
+    'image_plagiarism': ('image', '/api/v1/search/plagiarism', 30),
+    'batch':            ('batch', '', 300),
+}
+
+
+def _create_session() -> requests.Session:
+    """Keep-alive pool shared by all backends; only connection errors are retried (POST)."""
+    sess = requests.Session()
+    retry = Retry(total=2, connect=2, read=0, status=0, backoff_factor=0.2)
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=_WORKERS)
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    return sess
+
+
+analysis_http = _create_session()
+
+
+class _Breaker:
+    """Circuit breaker of one backend (closed → open → half-open)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if time.monotonic() - self.opened_at < _BREAKER_OPEN_S or self.trial:
+                return False
+            self.trial = True            # half-open: una sola llamada de prueba
+            return True
+
+    def record(self, ok: bool) -> None:
+        with self._lock:
+            self.trial = False
+            if ok:
+                if self.opened_at is not None:
+                    logger.info(f'[AnalysisGateway] Breaker {self.name} cerrado')
+                self.failures, self.opened_at = 0, None
+                return
+            self.failures += 1
+            if self.opened_at is not None or self.failures >= _BREAKER_FAILURES:
+                if self.opened_at is None:
+                    logger.warning(f'[AnalysisGateway] Breaker {self.name} abierto tras {self.failures} fallos')
+                self.opened_at = time.monotonic()
+
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return 'closed'
+            return 'open' if time.monotonic() - self.opened_at < _BREAKER_OPEN_S else 'half-open'
+
+
+class AnalysisGateway:
+    """Cached, coalesced analysis jobs over the analysis microservices."""
+
+    _pool: ThreadPoolExecutor | None = None
+    _pool_guard = threading.Lock()
+    _breakers = {name: _Breaker(name) for name in _BACKENDS}
+    _jobs: dict[str, dict] = {}
+    _flights: dict[str, str] = {}          # key -> flight id (owned by this process)
+    _flights_guard = threading.Lock()
+    _outcomes: dict[str, dict] = {}        # flight id -> outcome (mirror)
+    _results: dict[str, tuple] = {}        # key -> (deadline, result) (mirror)
+    _waiters: dict[str, list] = {}         # flight id -> [(user_id, job_id)]
+    _delivered: set[str] = set()
+
+    # ── Keys ──────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def cache_key(kind: str, payload: dict) -> str:
+        payload = dict(payload)
+        if isinstance(payload.get('plugins'), list):
+            payload['plugins'] = sorted(set(payload['plugins']))
+        digest = hashlib.sha256(kind.encode('utf-8') + b'\0')
+        digest.update(json.dumps(payload, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8'))
+        return digest.hexdigest()
+
+    # ── Jobs ──────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def submit(cls, kind: str, payload: dict, user_id: int | None = None) -> dict:
+        """
+        Return a job for analysing `payload` with the `kind` backend. Born
+        'done' on a cache hit; otherwise attached to the key's running flight
+        or to a new one.
+        """
+        backend = KINDS[kind][0]
+        key = cls.cache_key(kind, payload)
+        job = {
+            'job_id':     uuid.uuid4().hex,
+            'user_id':    user_id,
+            'kind':       kind,
+            'key':        key,
+            'flight':     None,
+            'status':     'pending',
+            'cached':     False,
+            'created_at': time.time(),
+        }
+
+        for _ in range(3):
+            result = cls._cached_result(key)
+            if result is not None:
+                job.update(status='done', cached=True)
+                cls._save_job(job)
+                return dict(job, result=result)
+
+            flight, mine = cls._claim(key, KINDS[kind][2])
+            if flight is None:
+                continue                         # el vuelo acaba de terminar: releer la caché
+            job['flight'] = flight
+            if mine:
+                if not cls._breakers[backend].allow():
+                    cls._release(key, flight)
+                    label = _BACKENDS[backend][2]
+                    job.update(status='error', http_status=503, error=f'{label} unavailable')
+                    cls._save_job(job)
+                    return job
+                result = cls._cached_result(key)
+                if result is not None:           # terminó entre la lectura y el claim
+                    cls._release(key, flight)
+                    job.update(status='done', cached=True, flight=None)
+                    cls._save_job(job)
+                    return dict(job, result=result)
+            cls._add_waiter(flight, user_id, job['job_id'])
+            cls._save_job(job)
+            if mine:
+                cls._get_pool().submit(cls._run, kind, payload, key, flight)
+            else:
+                logger.debug(f'[AnalysisGateway] Job {job["job_id"]} se une al vuelo {flight}')
+            return job
+
+        job.update(status='error', http_status=503, error='Analysis could not be scheduled')
+        cls._save_job(job)
+        return job
+
+    @classmethod
+    def wait(cls, job_id: str, timeout: float) -> dict | None:
+        """
+        Poll a job until it finishes or `timeout` elapses. Uses time.sleep,
+        which eventlet patches, so other greenlets keep running.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = cls.get_job(job_id)
+            if not job or job['status'] in ('done', 'error'):
+                return job
+            time.sleep(0.05)
+        return cls.get_job(job_id)
+
+    @classmethod
+    def get_job(cls, job_id: str) -> dict | None:
+        """The job with its current status; 'result' when done, 'error' / 'http_status' when failed."""
+        from settings.extensions import redis_client
+
+        job = cls._jobs.get(job_id)
+        if job is None:
+            try:
+                raw = redis_client.get(_KEY_JOB.format(job_id=job_id))
+                job = json.loads(raw) if raw else None
+            except Exception as exc:
+                logger.debug(f'[AnalysisGateway] Redis job read failed {job_id}: {exc}')
+        if job is None:
+            return None
+        job = dict(job)
+        if job['status'] == 'error':
+            return job
+
+        # Dos pasadas: el dueño guarda el outcome antes de soltar el vuelo
+        for _ in range(2):
+            outcome = cls._outcome(job['flight']) if job['flight'] else None
+            if outcome is not None and outcome['status'] == 'error':
+                job.update(status='error', error=outcome['error'], http_status=outcome['http_status'])
+                if 'details' in outcome:
+                    job['details'] = outcome['details']
+                return job
+            if outcome is not None and 'result' in outcome:
+                job.update(status='done', result=outcome['result'])
+                return job
+            result = cls._cached_result(job['key'])
+            if result is not None:
+                job.update(status='done', result=result)
+                return job
+            if not job['flight'] or not cls._flight_alive(job['key'], job['flight']):
+                continue
+            job['status'] = 'pending'
+            return job
+        job.update(status='error', http_status=500, error='Analysis result expired')
+        return job
+
+    @classmethod
+    def first_delivery(cls, job_id: str) -> bool:
+        """True only the first time it is called for `job_id` (usage counting)."""
+        from settings.extensions import redis_client
+
+        if job_id in cls._delivered:
+            return False
+        cls._delivered.add(job_id)
+        if len(cls._delivered) > _LOCAL_MAX:
+            cls._delivered.clear()
+            cls._delivered.add(job_id)
+        try:
+            claimed = redis_client.set(_KEY_DELIVERED.format(job_id=job_id), '1', nx=True, ex=_JOB_TTL_SECONDS)
+            if claimed is None and not redis_client.ping():
+                return True                      # sin Redis sólo cuenta el mirror local
+            return bool(claimed)
+        except Exception:
+            return True
+
+    @classmethod
+    def stats(cls) -> dict:
+        return {
+            'breakers': {name: b.state() for name, b in cls._breakers.items()},
+            'flights':  len(cls._flights),
+        }
+
+    # ── Flights ───────────────────────────────────────────────────────────────
+
+    @classmethod
+    def _claim(cls, key: str, timeout: int) -> tuple[str | None, bool]:
+        """(flight id, owned by us) for `key`; (None, False) if it ended in between."""
+        from settings.extensions import redis_client
+
+        with cls._flights_guard:
+            flight = cls._flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = secrets.token_hex(8)
+            try:
+                if redis_client.set(_KEY_FLIGHT.format(key=key), flight, nx=True, ex=timeout + 30):
+                    cls._flights[key] = flight
+                    return flight, True
+                if not redis_client.ping():
+                    cls._flights[key] = flight   # sin Redis: sólo se coalesce dentro del proceso
+                    return flight, True
+                other = redis_client.get(_KEY_FLIGHT.format(key=key))
+                return other, False
+            except Exception as exc:
+                logger.debug(f'[AnalysisGateway] Redis flight claim failed: {exc}')
+                cls._flights[key] = flight
+                return flight, True
+
+    @classmethod
+    def _release(cls, key: str, flight: str) -> None:
+        from settings.extensions import redis_client
+
+        with cls._flights_guard:
+            if cls._flights.get(key) == flight:
+                cls._flights.pop(key, None)
+        try:
+            name = _KEY_FLIGHT.format(key=key)
+            if redis_client.get(name) == flight:
+                redis_client.delete(name)
+        except Exception:
+            pass
+
+    @classmethod
+    def _flight_alive(cls, key: str, flight: str) -> bool:
+        from settings.extensions import redis_client
+
+        if cls._flights.get(key) == flight:
+            return True
+        try:
+            return redis_client.get(_KEY_FLIGHT.format(key=key)) == flight
+        except Exception:
+            return False
+
+    @classmethod
+    def _run(cls, kind: str, payload: dict, key: str, flight: str) -> None:
+        """Thread-pool entry point: one backend call, then cache / outcome / push."""
+        backend, path, timeout = KINDS[kind]
+        env, default, label = _BACKENDS[backend]
+        url = os.environ.get(env, default) + path
+        breaker = cls._breakers[backend]
+        outcome: dict
+        started = time.monotonic()
+        try:
+            resp = analysis_http.post(url, json=payload, timeout=timeout)
+            breaker.record(resp.status_code < 500)
+            if resp.ok:
+                result = resp.json()
+                outcome = {'status': 'done', 'result': result}
+            else:
+                outcome = {'status': 'error', 'http_status': resp.status_code,
+                           'error': f'{label} failed', 'details': resp.text[:2000]}
+        except requests.exceptions.Timeout:
+            breaker.record(False)
+            outcome = {'status': 'error', 'http_status': 504, 'error': f'{label} timeout'}
+        except requests.exceptions.ConnectionError:
+            breaker.record(False)
+            outcome = {'status': 'error', 'http_status': 503, 'error': f'{label} unavailable'}
+        except ValueError:
+            outcome = {'status': 'error', 'http_status': 502, 'error': f'Invalid response from {label.lower()}'}
+        except Exception as exc:
+            logger.error(f'[AnalysisGateway] {kind} error: {exc}')
+            outcome = {'status': 'error', 'http_status': 500, 'error': str(exc)}
+
+        try:
+            if outcome['status'] == 'done' and cls._cacheable(outcome['result']):
+                cls._store_result(key, outcome['result'])
+                outcome = {'status': 'done', 'cached_as': key}
+            cls._store_outcome(flight, outcome)
+        finally:
+            cls._release(key, flight)
+        logger.info(f'[AnalysisGateway] {kind} {outcome["status"]} en {time.monotonic() - started:.2f}s '
+                    f'(breaker {breaker.state()})')
+        cls._notify(flight, outcome['status'])
+
+    @staticmethod
+    def _cacheable(result) -> bool:
+        return (isinstance(result, dict) and result.get('status') != 'error'
+                and result.get('success') is not False)
+
+    @classmethod
+    def _get_pool(cls) -> ThreadPoolExecutor:
+        with cls._pool_guard:
+            if cls._pool is None:
+                cls._pool = ThreadPoolExecutor(max_workers=_WORKERS, thread_name_prefix='analysis')
+                logger.info(f'[AnalysisGateway] Pool started with {_WORKERS} workers')
+            return cls._pool
+
+    # ── Push ──────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def _add_waiter(cls, flight: str, user_id: int | None, job_id: str) -> None:
+        from settings.extensions import redis_client
+
+        cls._waiters.setdefault(flight, []).append((user_id, job_id))
+        try:
+            name = _KEY_WAITERS.format(flight=flight)
+            pipe = redis_client.pipeline()
+            if pipe is not None:
+                pipe.sadd(name, f'{user_id or 0}:{job_id}')
+                pipe.expire(name, _JOB_TTL_SECONDS)
+                pipe.execute()
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis waiter write failed: {exc}')
+
+    @classmethod
+    def _notify(cls, flight: str, status: str) -> None:
+        """'analysis:done' to the personal room of every user waiting on the flight."""
+        from settings.extensions import redis_client, socketio as sio
+
+        waiters = set(cls._waiters.pop(flight, []))
+        try:
+            name = _KEY_WAITERS.format(flight=flight)
+            for member in redis_client.smembers(name) or ():
+                user_id, job_id = member.split(':', 1)
+                waiters.add((int(user_id) or None, job_id))
+            redis_client.delete(name)
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis waiter read failed: {exc}')
+        for user_id, job_id in waiters:
+            if not user_id:
+                continue
+            try:
+                sio.emit('analysis:done', {'job_id': job_id, 'status': status}, room=f'user_{user_id}')
+            except Exception as exc:
+                logger.debug(f'[AnalysisGateway] SocketIO emit failed: {exc}')
+
+    # ── Storage ───────────────────────────────────────────────────────────────
+
+    @classmethod
+    def _cached_result(cls, key: str):
+        from settings.extensions import redis_client
+
+        entry = cls._results.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        try:
+            raw = redis_client.get(_KEY_RESULT.format(key=key))
+            if raw:
+                result = json.loads(raw)
+                cls._remember(cls._results, key, (time.monotonic() + RESULT_TTL, result))
+                return result
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis result read failed: {exc}')
+        return None
+
+    @classmethod
+    def _store_result(cls, key: str, result) -> None:
+        from settings.extensions import redis_client
+
+        cls._remember(cls._results, key, (time.monotonic() + RESULT_TTL, result))
+        try:
+            redis_client.setex(_KEY_RESULT.format(key=key), RESULT_TTL, json.dumps(result))
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis result write failed: {exc}')
+
+    @classmethod
+    def _outcome(cls, flight: str) -> dict | None:
+        from settings.extensions import redis_client
+
+        outcome = cls._outcomes.get(flight)
+        if outcome is not None:
+            return cls._with_result(outcome)
+        try:
+            raw = redis_client.get(_KEY_OUTCOME.format(flight=flight))
+            if raw:
+                return cls._with_result(json.loads(raw))
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis outcome read failed: {exc}')
+        return None
+
+    @classmethod
+    def _with_result(cls, outcome: dict) -> dict | None:
+        if 'cached_as' not in outcome:
+            return outcome
+        result = cls._cached_result(outcome['cached_as'])
+        return None if result is None else {'status': 'done', 'result': result}
+
+    @classmethod
+    def _store_outcome(cls, flight: str, outcome: dict) -> None:
+        from settings.extensions import redis_client
+
+        cls._remember(cls._outcomes, flight, outcome)
+        try:
+            redis_client.setex(_KEY_OUTCOME.format(flight=flight), _OUTCOME_TTL_SECONDS, json.dumps(outcome))
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis outcome write failed: {exc}')
+
+    @classmethod
+    def _save_job(cls, job: dict) -> None:
+        from settings.extensions import redis_client
+
+        cls._jobs[job['job_id']] = job
+        try:
+            redis_client.setex(_KEY_JOB.format(job_id=job['job_id']), _JOB_TTL_SECONDS, json.dumps(job))
+        except Exception as exc:
+            logger.debug(f'[AnalysisGateway] Redis job write failed {job["job_id"]}: {exc}')
+
+        # Bound the local mirror; Redis is the source of truth for old jobs.
+        if len(cls._jobs) > _LOCAL_MAX:
+            cutoff = time.time() - _JOB_TTL_SECONDS
+            for jid in [j for j, v in cls._jobs.items() if v['created_at'] < cutoff]:
+                cls._jobs.pop(jid, None)
+
+    @staticmethod
+    def _remember(mirror: dict, key: str, value) -> None:
+        mirror.pop(key, None)
+        mirror[key] = value
+        while len(mirror) > _LOCAL_MAX:
+            mirror.pop(next(iter(mirror)), None)
@@ -0,0 +1,99 @@
+"""
+services/autosave_stats.py
+Counters (and optional traffic capture) for the save_document fast path.
+
+Metrics (HASH metrics:autosave, Redis DB 1):
+    saves / autosaves            every save request that reached the decision
+    written / skipped            document row written vs. no-op (same content_hash)
+    autosaves_skipped            skipped saves that were autosaves
+    bytes_written                size_bytes of written saves
+
+Capture: with AUTOSAVE_CAPTURE_PATH set, every save appends one JSON line
+with hashes only (no document text), for scripts/tools/replay_autosave.py:
+    {"ts", "doc_id", "is_autosave", "mode", "content_hash", "title_hash",
+     "html_hash", "size", "metrics", "outcome"}
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_KEY_METRICS = 'metrics:autosave'
+
+_CAPTURE_PATH = os.environ.get('AUTOSAVE_CAPTURE_PATH', '')
+_capture_lock = threading.Lock()
+
+
+def _short_hash(text: str | None) -> str | None:
+    if text is None:
+        return None
+    return hashlib.sha1(text.encode('utf-8', errors='surrogatepass')).hexdigest()[:16]
+
+
+class AutosaveStats:
+    """Fast-path outcome counters for save_document."""
+
+    @staticmethod
+    def record(doc_id: int, *, written: bool, is_autosave: bool, mode: str,
+               content_hash: str, title: str, html: str | None, size: int,
+               has_metrics: bool) -> None:
+        from settings.extensions import redis_client
+
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.hincrby(_KEY_METRICS, 'saves', 1)
+            pipe.hincrby(_KEY_METRICS, 'written' if written else 'skipped', 1)
+            if is_autosave:
+                pipe.hincrby(_KEY_METRICS, 'autosaves', 1)
+                if not written:
+                    pipe.hincrby(_KEY_METRICS, 'autosaves_skipped', 1)
+            if written:
+                pipe.hincrby(_KEY_METRICS, 'bytes_written', size)
+            pipe.execute()
+        except Exception as exc:
+            logger.debug(f'[AutosaveStats] Counters unavailable: {exc}')
+
+        if _CAPTURE_PATH:
+            line = json.dumps({
+                'ts':           round(time.time(), 3),
+                'doc_id':       doc_id,
+                'is_autosave':  bool(is_autosave),
+                'mode':         mode,
+                'content_hash': content_hash,
+                'title_hash':   _short_hash(title),
+                'html_hash':    _short_hash(html),
+                'size':         size,
+                'metrics':      bool(has_metrics),
+                'outcome':      'written' if written else 'skipped',
+            })
+            try:
+                with _capture_lock, open(_CAPTURE_PATH, 'a', encoding='utf-8') as f:
+                    f.write(line + '\n')
+            except OSError as exc:
+                logger.warning(f'[AutosaveStats] Capture failed: {exc}')
+
+    @staticmethod
+    def stats() -> dict:
+        from settings.extensions import redis_client
+
+        raw = redis_client.hgetall(_KEY_METRICS) or {}
+        counters = {k: int(v) for k, v in raw.items()}
+        saves = counters.get('saves', 0)
+        autosaves = counters.get('autosaves', 0)
+        return {
+            'saves':             saves,
+            'written':           counters.get('written', 0),
+            'skipped':           counters.get('skipped', 0),
+            'skip_rate':         round(counters.get('skipped', 0) / saves, 4) if saves else 0.0,
+            'autosaves':         autosaves,
+            'autosaves_skipped': counters.get('autosaves_skipped', 0),
+            'autosave_skip_rate': round(counters.get('autosaves_skipped', 0) / autosaves, 4) if autosaves else 0.0,
+            'bytes_written':     counters.get('bytes_written', 0),
+            'capture':           bool(_CAPTURE_PATH),
+        }
@@ -0,0 +1,581 @@
+"""
+services/cloud_index.py
+Local index of a user's cloud-drive documents, per (user, provider).
+
+Before, every /storage/files/<provider> call listed the whole drive again
+(Google Drive 100 files per request, serially; Dropbox recursively) and
+filtered the result in Python. Now:
+
+  build   one full listing, written to cloud_file_index in one transaction.
+          The provider's change cursor is taken BEFORE listing, so nothing
+          that changes during the listing is lost (at worst it is applied
+          twice, which is idempotent). Listing is concurrent where the
+          provider allows it: Drive, one query per document MIME type;
+          Dropbox, one recursive listing per top-level folder. Graph delta
+          is a single sequential enumeration.
+  sync    apply the change feed from the stored cursor: Drive changes.list
+          page tokens, Dropbox list_folder/continue cursors, Graph delta
+          links. Throttled to one every _SYNC_MIN_S per (user, provider)
+          unless forced; after a failed sync the next attempt waits
+          _SYNC_MIN_S · 2^(failures − 1), capped at _BACKOFF_MAX_S, so a
+          provider outage does not turn every request into a sync. A cursor the provider no longer accepts (Drive
+          404, Dropbox reset, Graph 410) triggers a rebuild.
+  list    SQL over the index: name search, extension filter and keyset
+          pagination (services/pagination.Paginator) on (modified_at, id).
+
+Builds and syncs of the same (user, provider) are serialized with a Redis
+lock; a request that finds the lock taken waits for the holder instead of
+listing the drive again. Box is not indexed (no change feed implemented
+here); its route keeps the live listing.
+
+The provider's API base URL is a parameter, so scripts/tools/
+fake_cloud_provider.py can stand in for the three APIs (benchmarks, local
+development).
+"""
+from __future__ import annotations
+
+import logging
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+_SYNC_MIN_S = 30
+_BACKOFF_MAX_S = 900
+_LOCK_TTL_S = 600
+_WAIT_S = 120
+_WORKERS = 8
+_WRITE_CHUNK = 1000
+_HTTP_TIMEOUT = 30
+_KEY_LOCK = 'cloudindex:lock:{user_id}:{provider}'
+_EPOCH = datetime(1970, 1, 1)
+
+DOCUMENT_EXTENSIONS = {'.pdf', '.doc', '.docx', '.txt', '.epub', '.ppt', '.pptx', '.rtf', '.mobi'}
+
+# MIME types específicos por proveedor
+PROVIDER_MIME_TYPES = {
+    'google_drive': {
+        'application/pdf',
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'text/plain',
+        'application/vnd.ms-powerpoint',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'application/vnd.google-apps.document',  # Google Docs
+        'application/vnd.google-apps.presentation',  # Google Slides
+        'application/rtf',
+        'text/rtf'
+    },
+    'dropbox': {
+        'application/pdf',
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'text/plain',
+        'application/vnd.ms-powerpoint',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'application/rtf',
+        'text/rtf'
+    },
+    'box': {
+        'file',  # Box usa 'file' como tipo genérico
+        'application/pdf',
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'text/plain',
+        'application/vnd.ms-powerpoint',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+        'application/rtf'
+    },
+    'onedrive': {
+        'file',
+        'application/pdf',
+        'application/msword',
+        'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+        'text/plain',
+        'application/vnd.ms-powerpoint',
+        'application/vnd.openxmlformats-officedocument.presentationml.presentation'
+    }
+}
+
+# MIME types que la búsqueda de Drive pide (una partición concurrente cada uno)
+DRIVE_QUERY_MIME_TYPES = (
+    'application/pdf',
+    'application/msword',
+    'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+    'text/plain',
+    'application/vnd.ms-powerpoint',
+    'application/vnd.openxmlformats-officedocument.presentationml.presentation',
+    'application/vnd.google-apps.document',
+    'application/vnd.google-apps.presentation',
+    'application/epub+zip',
+    'application/rtf',
+)
+
+
+def is_document(file: dict, provider: str) -> bool:
+    """A file entry ({'name', 'type'}) is a document for the given provider."""
+    name = (file.get('name') or '').lower()
+    if name and any(name.endswith(ext) for ext in DOCUMENT_EXTENSIONS):
+        return True
+    return bool(file.get('type')) and file['type'] in PROVIDER_MIME_TYPES.get(provider, set())
+
+
+def _http_session() -> requests.Session:
+    sess = requests.Session()
+    retry = Retry(total=3, backoff_factor=0.5, status_forcelist=[429, 500, 502, 503, 504],
+                  allowed_methods=frozenset({'GET', 'POST'}))
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=4, pool_maxsize=_WORKERS * 2)
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    return sess
+
+
+_http = _http_session()
+
+
+def _parse_time(value) -> datetime:
+    """Provider timestamp ('2024-03-01T10:00:00.000Z') → naive UTC."""
+    if not value:
+        return _EPOCH
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        return _EPOCH
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def _path_and_parents(path: str):
+    """'/a/b/c.pdf' -> '/a/b/c.pdf', '/a/b', '/a'."""
+    while path:
+        yield path
+        path = path.rpartition('/')[0]
+
+
+class CursorExpired(Exception):
+    """The provider no longer accepts the stored change cursor."""
+
+
+# ── Provider adapters ─────────────────────────────────────────────────────────
+# Entries are normalized to dicts with file_id, name, mime_type, size,
+# modified, path_lower, path_display, web_url. changes() returns
+# (entries to upsert, removed file ids, removed Dropbox paths, next cursor).
+
+class _Adapter:
+    def __init__(self, access_token: str, api_base: str):
+        self.api_base = api_base.rstrip('/')
+        self.headers = {'Authorization': f'Bearer {access_token}'}
+
+    def _get(self, url, **params):
+        return _http.get(url, headers=self.headers, params=params or None, timeout=_HTTP_TIMEOUT)
+
+    def _post(self, url, payload):
+        return _http.post(url, headers=self.headers, json=payload, timeout=_HTTP_TIMEOUT)
+
+
+class GoogleDriveAdapter(_Adapter):
+    _FILE_FIELDS = 'id,name,size,modifiedTime,mimeType,webViewLink,trashed'
+
+    @classmethod
+    def _entry(cls, f: dict) -> dict:
+        return {
+            'file_id': f['id'], 'name': f.get('name', ''), 'mime_type': f.get('mimeType'),
+            'size': int(f.get('size', 0) or 0), 'modified': f.get('modifiedTime'),
+            'path_lower': None, 'path_display': None, 'web_url': f.get('webViewLink'),
+        }
+
+    def _list_mime(self, mime: str) -> list[dict]:
+        entries, token = [], None
+        while True:
+            params = {'q': f"mimeType='{mime}' and trashed=false", 'pageSize': 1000,
+                      'fields': f'nextPageToken,files({self._FILE_FIELDS})'}
+            if token:
+                params['pageToken'] = token
+            resp = self._get(f'{self.api_base}/files', **params)
+            resp.raise_for_status()
+            data = resp.json()
+            entries.extend(self._entry(f) for f in data.get('files', []))
+            token = data.get('nextPageToken')
+            if not token:
+                return entries
+
+    def snapshot(self, pool) -> tuple[list[dict], str]:
+        resp = self._get(f'{self.api_base}/changes/startPageToken')
+        resp.raise_for_status()
+        cursor = resp.json()['startPageToken']
+        entries = [e for part in pool.map(self._list_mime, DRIVE_QUERY_MIME_TYPES) for e in part]
+        return entries, cursor
+
+    def changes(self, cursor: str):
+        upserts, removed = [], []
+        while True:
+            resp = self._get(f'{self.api_base}/changes', pageToken=cursor, pageSize=1000, includeRemoved='true',
+                             fields=f'nextPageToken,newStartPageToken,changes(fileId,removed,file({self._FILE_FIELDS}))')
+            if resp.status_code in (400, 404):
+                raise CursorExpired(resp.text[:200])
+            resp.raise_for_status()
+            data = resp.json()
+            for change in data.get('changes', []):
+                f = change.get('file')
+                if change.get('removed') or not f or f.get('trashed'):
+                    removed.append(change['fileId'])
+                else:
+                    upserts.append(self._entry(f))
+            if data.get('newStartPageToken'):
+                return upserts, removed, [], data['newStartPageToken']
+            cursor = data['nextPageToken']
+
+
+class DropboxAdapter(_Adapter):
+
+    @staticmethod
+    def _entry(e: dict) -> dict:
+        return {
+            'file_id': e.get('id', ''), 'name': e.get('name', ''),
+            'mime_type': 'file',  # Dropbox no da MIME type en list_folder
+            'size': int(e.get('size', 0) or 0), 'modified': e.get('server_modified', ''),
+            'path_lower': e.get('path_lower'), 'path_display': e.get('path_display', ''), 'web_url': None,
+        }
+
+    def _list(self, path: str, recursive: bool) -> list[dict]:
+        resp = self._post(f'{self.api_base}/files/list_folder', {
+            'path': path, 'recursive': recursive, 'include_deleted': False,
+            'include_mounted_folders': True, 'limit': 2000,
+        })
+        resp.raise_for_status()
+        data = resp.json()
+        entries = list(data.get('entries', []))
+        while data.get('has_more'):
+            resp = self._post(f'{self.api_base}/files/list_folder/continue', {'cursor': data['cursor']})
+            resp.raise_for_status()
+            data = resp.json()
+            entries.extend(data.get('entries', []))
+        return entries
+
+    def snapshot(self, pool) -> tuple[list[dict], str]:
+        resp = self._post(f'{self.api_base}/files/list_folder/get_latest_cursor', {
+            'path': '', 'recursive': True, 'include_deleted': False, 'include_mounted_folders': True,
+        })
+        resp.raise_for_status()
+        cursor = resp.json()['cursor']
+        top = self._list('', recursive=False)
+        folders = [e['path_lower'] for e in top if e.get('.tag') == 'folder']
+        raw = top + [e for part in pool.map(lambda p: self._list(p, recursive=True), folders) for e in part]
+        return [self._entry(e) for e in raw if e.get('.tag') == 'file'], cursor
+
+    def changes(self, cursor: str):
+        upserts, removed_paths = [], []
+        while True:
+            resp = self._post(f'{self.api_base}/files/list_folder/continue', {'cursor': cursor})
+            if resp.status_code == 409 and 'reset' in resp.text:
+                raise CursorExpired(resp.text[:200])
+            resp.raise_for_status()
+            data = resp.json()
+            for e in data.get('entries', []):
+                if e.get('.tag') == 'file':
+                    upserts.append(self._entry(e))
+                elif e.get('.tag') == 'deleted':
+                    removed_paths.append(e['path_lower'])
+            cursor = data['cursor']
+            if not data.get('has_more'):
+                return upserts, [], removed_paths, cursor
+
+
+class OneDriveAdapter(_Adapter):
+
+    @staticmethod
+    def _entry(item: dict) -> dict:
+        return {
+            'file_id': item['id'], 'name': item.get('name', ''),
+            'mime_type': item.get('file', {}).get('mimeType', 'file'),
+            'size': int(item.get('size', 0) or 0), 'modified': item.get('lastModifiedDateTime'),
+            'path_lower': None, 'path_display': None, 'web_url': item.get('webUrl'),
+        }
+
+    def _delta(self, url: str):
+        """Follow a delta enumeration to its deltaLink."""
+        upserts, removed = [], []
+        while True:
+            resp = _http.get(url, headers=self.headers, timeout=_HTTP_TIMEOUT)
+            if resp.status_code == 410:
+                raise CursorExpired(resp.text[:200])
+            resp.raise_for_status()
+            data = resp.json()
+            for item in data.get('value', []):
+                if 'deleted' in item:
+                    removed.append(item['id'])
+                elif 'file' in item:
+                    upserts.append(self._entry(item))
+            if '@odata.deltaLink' in data:
+                return upserts, removed, data['@odata.deltaLink']
+            url = data['@odata.nextLink']
+
+    def snapshot(self, pool) -> tuple[list[dict], str]:
+        upserts, _, cursor = self._delta(
+            f'{self.api_base}/me/drive/root/delta?$select=id,name,size,lastModifiedDateTime,file,folder,deleted,webUrl')
+        return upserts, cursor
+
+    def changes(self, cursor: str):
+        upserts, removed, cursor = self._delta(cursor)
+        return upserts, removed, [], cursor
+
+
+_ADAPTERS = {
+    'google_drive': GoogleDriveAdapter,
+    'dropbox': DropboxAdapter,
+    'onedrive': OneDriveAdapter,
+}
+
+
+# ── Index ─────────────────────────────────────────────────────────────────────
+
+class CloudIndex:
+    """Build, sync and query the per-(user, provider) cloud file index."""
+
+    @staticmethod
+    def supports(provider: str) -> bool:
+        return provider in _ADAPTERS
+
+    @staticmethod
+    def _state(user_id: int, provider: str):
+        from models.models import CloudIndexState
+        from settings.extensions import db
+
+        return db.session.get(CloudIndexState, (user_id, provider), populate_existing=True)
+
+    @classmethod
+    def ensure_fresh(cls, user_id: int, provider: str, access_token: str, api_base: str,
+                     force: bool = False):
+        """
+        Build the index if missing, else apply the change feed (at most once
+        per _SYNC_MIN_S unless `force`). Returns the CloudIndexState, or None
+        when another request is still building the index.
+        """
+        from settings.extensions import redis_client
+
+        state = cls._state(user_id, provider)
+        if cls._is_fresh(state, force):
+            return state
+
+        key = _KEY_LOCK.format(user_id=user_id, provider=provider)
+        token = secrets.token_hex(8)
+        if not cls._acquire(key, token):
+            return cls._wait_for(user_id, provider, key, state)
+        try:
+            state = cls._state(user_id, provider)
+            if cls._is_fresh(state, force):
+                return state
+            if state is None or not state.cursor:
+                cls.build(user_id, provider, access_token, api_base)
+            else:
+                try:
+                    cls.sync(user_id, provider, access_token, api_base)
+                except CursorExpired as e:
+                    logger.info(f'[CloudIndex] Cursor caducado user={user_id} {provider}, reconstruyendo: {e}')
+                    cls.build(user_id, provider, access_token, api_base)
+                except requests.RequestException as e:
+                    # Proveedor caído o lento: se sirve el índice tal como está
+                    logger.warning(f'[CloudIndex] Sync fallido user={user_id} {provider}: {e}')
+                    cls._record_error(user_id, provider, str(e))
+            return cls._state(user_id, provider)
+        finally:
+            try:
+                if redis_client.get(key) == token:
+                    redis_client.delete(key)
+            except Exception:
+                pass
+
+    @classmethod
+    def _record_error(cls, user_id: int, provider: str, message: str) -> None:
+        """Store the failed attempt: its time and the failure count drive the backoff."""
+        from settings.extensions import db
+
+        try:
+            state = cls._state(user_id, provider)
+            state.last_error = message[:500]
+            state.attempted_at = datetime.utcnow()
+            state.error_count = (state.error_count or 0) + 1
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+
+    @staticmethod
+    def _is_fresh(state, force: bool) -> bool:
+        if state is None or not state.cursor or force or state.synced_at is None:
+            return False
+        now = datetime.utcnow()
+        if now - state.synced_at < timedelta(seconds=_SYNC_MIN_S):
+            return True
+        if state.error_count and state.attempted_at is not None:
+            backoff = min(_SYNC_MIN_S * 2 ** (state.error_count - 1), _BACKOFF_MAX_S)
+            return now - state.attempted_at < timedelta(seconds=backoff)
+        return False
+
+    @staticmethod
+    def _acquire(key: str, token: str) -> bool:
+        from settings.extensions import redis_client
+
+        try:
+            if redis_client.set(key, token, nx=True, ex=_LOCK_TTL_S):
+                return True
+            # Sin Redis (stub → None, ping → None) no hay coordinación entre procesos
+            return not redis_client.ping()
+        except Exception:
+            return True
+
+    @classmethod
+    def _wait_for(cls, user_id, provider, key, state):
+        """Another request holds the lock: wait for its build/sync to land."""
+        from settings.extensions import redis_client
+
+        before = (state.synced_at, state.attempted_at) if state is not None else None
+        deadline = time.monotonic() + _WAIT_S
+        while time.monotonic() < deadline:
+            time.sleep(0.25)
+            current = cls._state(user_id, provider)
+            if current is not None and (current.synced_at, current.attempted_at) != before:
+                return current
+            try:
+                if not redis_client.exists(key):
+                    return current
+            except Exception:
+                return current
+        return cls._state(user_id, provider)
+
+    @classmethod
+    def build(cls, user_id: int, provider: str, access_token: str, api_base: str) -> int:
+        """Full listing → index rows + change cursor, in one transaction."""
+        from models.models import CloudFileIndex, CloudIndexState
+        from settings.extensions import db
+
+        adapter = _ADAPTERS[provider](access_token, api_base)
+        t0 = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=_WORKERS) as pool:
+            entries, cursor = adapter.snapshot(pool)
+        unique = {}
+        for e in entries:
+            if is_document({'name': e['name'], 'type': e['mime_type']}, provider):
+                unique[e['file_id']] = e
+        try:
+            db.session.query(CloudFileIndex).filter_by(user_id=user_id, provider=provider) \
+                .delete(synchronize_session=False)
+            cls._insert(user_id, provider, list(unique.values()))
+            state = db.session.get(CloudIndexState, (user_id, provider)) \
+                or CloudIndexState(user_id=user_id, provider=provider)
+            now = datetime.utcnow()
+            state.cursor = cursor
+            state.file_count = len(unique)
+            state.built_at = state.synced_at = now
+            state.last_error = None
+            state.error_count = 0
+            db.session.add(state)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        logger.info(f'[CloudIndex] Índice construido user={user_id} {provider}: {len(unique)} documentos '
+                    f'de {len(entries)} archivos en {time.perf_counter() - t0:.1f}s')
+        return len(unique)
+
+    @classmethod
+    def sync(cls, user_id: int, provider: str, access_token: str, api_base: str) -> dict:
+        """Apply the change feed since the stored cursor. Raises CursorExpired."""
+        from models.models import CloudFileIndex
+        from settings.extensions import db
+
+        state = cls._state(user_id, provider)
+        adapter = _ADAPTERS[provider](access_token, api_base)
+        upserts, removed_ids, removed_paths, cursor = adapter.changes(state.cursor)
+
+        docs = {}
+        for e in upserts:
+            if is_document({'name': e['name'], 'type': e['mime_type']}, provider):
+                docs[e['file_id']] = e
+            else:
+                removed_ids.append(e['file_id'])   # renombrado a algo que ya no es documento
+        try:
+            base = db.session.query(CloudFileIndex).filter_by(user_id=user_id, provider=provider)
+            stale = set(removed_ids) | set(docs)
+            if removed_paths:
+                # Dropbox da los borrados sólo por ruta (y el de una carpeta, sólo con la
+                # ruta de la carpeta): se resuelven contra path_lower en una lectura, en vez
+                # de un LIKE por ruta, comprobando la ruta y cada carpeta que la contiene
+                gone = set(removed_paths)
+                for fid, path in base.with_entities(CloudFileIndex.file_id, CloudFileIndex.path_lower):
+                    if path and any(p in gone for p in _path_and_parents(path)):
+                        stale.add(fid)
+            stale = list(stale)
+            for start in range(0, len(stale), _WRITE_CHUNK):
+                base.filter(CloudFileIndex.file_id.in_(stale[start:start + _WRITE_CHUNK])) \
+                    .delete(synchronize_session=False)
+            cls._insert(user_id, provider, list(docs.values()))
+            state.cursor = cursor
+            state.synced_at = datetime.utcnow()
+            state.file_count = base.count()
+            state.last_error = None
+            state.error_count = 0
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        report = {'upserted': len(docs), 'removed': len(set(removed_ids)) + len(removed_paths)}
+        if docs or removed_ids or removed_paths:
+            logger.info(f'[CloudIndex] Cambios aplicados user={user_id} {provider}: {report}')
+        return report
+
+    @staticmethod
+    def _insert(user_id: int, provider: str, entries: list[dict]) -> None:
+        from models.models import CloudFileIndex
+        from settings.extensions import db
+
+        rows = []
+        for e in entries:
+            name = e['name'] or ''
+            ext = name.rsplit('.', 1)[1].lower()[:16] if '.' in name else None
+            rows.append({
+                'user_id': user_id, 'provider': provider, 'file_id': e['file_id'], 'name': name[:255],
+                'extension': ext, 'mime_type': e['mime_type'], 'size': e['size'], 'modified': e['modified'],
+                'modified_at': _parse_time(e['modified']), 'path_lower': e['path_lower'],
+                'path_display': e['path_display'], 'web_url': e['web_url'],
+            })
+        for start in range(0, len(rows), _WRITE_CHUNK):
+            db.session.execute(db.insert(CloudFileIndex), rows[start:start + _WRITE_CHUNK])
+
+    @staticmethod
+    def list_files(user_id: int, provider: str, *, q: str | None = None, extensions=None,
+                   cursor: str | None = None, page: int = 1, per_page: int = 100, max_per_page: int = 100):
+        """Indexed documents, newest first, as a KeysetPage of CloudFileIndex rows."""
+        from models.models import CloudFileIndex
+        from services.pagination import Paginator
+
+        query = CloudFileIndex.query.filter_by(user_id=user_id, provider=provider)
+        if q:
+            query = query.filter(CloudFileIndex.name.contains(q, autoescape=True))
+        if extensions:
+            query = query.filter(CloudFileIndex.extension.in_([e.lower().lstrip('.') for e in extensions]))
+        return Paginator.paginate(
+            query, CloudFileIndex.modified_at, CloudFileIndex.id,
+            cursor=cursor, page=page, per_page=per_page,
+            scope=f'cloud:{provider}', max_per_page=max_per_page,
+        )
+
+    @staticmethod
+    def drop(user_id: int, provider: str) -> None:
+        """Forget the index of a provider (on disconnect)."""
+        from models.models import CloudFileIndex, CloudIndexState
+        from settings.extensions import db
+
+        try:
+            CloudFileIndex.query.filter_by(user_id=user_id, provider=provider).delete(synchronize_session=False)
+            CloudIndexState.query.filter_by(user_id=user_id, provider=provider).delete(synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f'[CloudIndex] Error borrando índice user={user_id} {provider}: {e}')
@@ -0,0 +1,459 @@
+"""
+services/cloud_transfer.py
+Streaming upload / download proxy between the browser and the cloud drives.
+
+cloud_upload_file used to read the whole upload (file.read()) and build the
+request body by concatenating bytes, and Google Drive went through the
+simple multipart endpoint, which the API limits to small files. Downloads
+were relayed in 8 KB chunks. Now:
+
+  upload    the request body is read once, CHUNK_BYTES at a time, straight
+            into the provider's resumable upload: a Drive resumable session,
+            a Dropbox upload session or a Graph upload session. Only the
+            chunk in flight is held in memory. A chunk that fails
+            (connection error, 429, 5xx) is retried with backoff from the
+            offset the provider says it has (Drive / Graph status query,
+            Dropbox incorrect_offset), so a half-received chunk is not sent
+            twice. Files up to SIMPLE_UPLOAD_MAX keep the single-request
+            upload. Box keeps it too (its chunked API starts at 20 MB and
+            needs per-part SHA-1 digests), but its multipart body is now
+            streamed instead of built in memory.
+  download  the provider response is relayed as it arrives, with Range and
+            If-Range passed through (206 + Content-Range come back to the
+            browser, so players and download managers can seek and resume).
+            Chunks start at 64 KB, for a quick first byte, and double up to
+            1 MB, so a large file is not relayed in thousands of tiny writes.
+
+Base URLs are parameters (OAUTH_CONFIG api_base / content_base), so
+scripts/tools/fake_cloud_provider.py can stand in for the providers.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import secrets
+import time
+from urllib.parse import quote
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+_KiB = 1024
+_MiB = 1024 * _KiB
+
+SIMPLE_UPLOAD_MAX = 4 * _MiB
+# Drive exige múltiplos de 256 KiB, Graph de 320 KiB (< 60 MiB); Dropbox, múltiplos de 4 MiB
+CHUNK_BYTES = {'google_drive': 8 * _MiB, 'dropbox': 8 * _MiB, 'onedrive': 10 * _MiB}
+_CHUNK_RETRIES = 5
+_BACKOFF_S = 0.5
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+_HTTP_TIMEOUT = (10, 120)
+_DOWNLOAD_FIRST = 64 * _KiB
+_DOWNLOAD_MAX = 1 * _MiB
+_RELAY_HEADERS = ('Content-Length', 'Content-Range', 'Content-Encoding', 'Accept-Ranges', 'ETag', 'Last-Modified')
+
+
+class TransferError(Exception):
+    """The provider rejected the upload, or the request body ended early."""
+
+
+class _Retry(Exception):
+    """Transient failure: the chunk can be sent again."""
+
+
+def _http_session() -> requests.Session:
+    # Sin Retry de urllib3: los reintentos de fragmentos se hacen aquí, desde el offset confirmado
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    return sess
+
+
+_http = _http_session()
+
+
+def _request(method: str, url: str, **kwargs) -> requests.Response:
+    try:
+        resp = _http.request(method, url, timeout=_HTTP_TIMEOUT, **kwargs)
+    except (requests.ConnectionError, requests.Timeout) as e:
+        raise _Retry(str(e)) from e
+    if resp.status_code in _RETRY_STATUS:
+        resp.close()
+        raise _Retry(f'HTTP {resp.status_code}')
+    return resp
+
+
+def _read(stream, n: int) -> bytes:
+    """Up to n bytes; fewer only at the end of the stream (WSGI input returns short reads)."""
+    parts, got = [], 0
+    while got < n:
+        data = stream.read(n - got)
+        if not data:
+            break
+        parts.append(data)
+        got += len(data)
+    return b''.join(parts)
+
+
+def _upload_chunks(stream, size: int, chunk: int, send, status, label: str):
+    """
+    Feed `size` bytes of `stream` to a resumable session, `chunk` at a time.
+
+    send(offset, data) and status(offset) return (bytes the provider has,
+    final response or None) and raise _Retry on transient failures. After a
+    failure the provider is asked how much it kept and only the rest of the
+    buffered chunk is sent again.
+    """
+    offset, buf, failures, ask = 0, b'', 0, False
+    while True:
+        want = min(chunk, size - offset)
+        if len(buf) < want:
+            buf += _read(stream, want - len(buf))
+            if len(buf) < want:
+                raise TransferError(f'El cuerpo terminó en {offset + len(buf)} de {size} bytes')
+        try:
+            confirmed, result = status(offset) if ask else send(offset, buf)
+        except _Retry as e:
+            failures += 1
+            if failures > _CHUNK_RETRIES:
+                raise TransferError(f'{label}: fragmento en {offset} falló {failures} veces ({e})') from e
+            logger.warning(f'[CloudTransfer] {label}: fragmento en {offset} falló ({e}), reintento {failures}')
+            time.sleep(_BACKOFF_S * 2 ** (failures - 1))
+            ask = True
+            continue
+        ask = False
+        if result is not None:
+            return result
+        if not offset <= confirmed <= offset + len(buf):
+            raise TransferError(f'{label}: el proveedor confirmó {confirmed}, se esperaba {offset}..{offset + len(buf)}')
+        if confirmed > offset:
+            failures = 0
+        buf = buf[confirmed - offset:]
+        offset = confirmed
+
+
+# ── Google Drive ──────────────────────────────────────────────────────────────
+
+def _drive_upload(access_token, stream, size, filename, parent_id, api_base, content_base):
+    auth = {'Authorization': f'Bearer {access_token}'}
+    metadata = {'name': filename}
+    if parent_id:
+        metadata['parents'] = [parent_id]
+
+    if size <= SIMPLE_UPLOAD_MAX:
+        boundary = '-------314159265358979323846'
+        body = (
+            f'--{boundary}\r\n'
+            f'Content-Type: application/json; charset=UTF-8\r\n\r\n'
+            f'{json.dumps(metadata)}\r\n'
+            f'--{boundary}\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'
+        ).encode('utf-8') + _read(stream, size) + f'\r\n--{boundary}--'.encode('utf-8')
+        resp = _http.post(f'{content_base}/files', params={'uploadType': 'multipart'}, data=body, headers={
+            **auth, 'Content-Type': f'multipart/related; boundary={boundary}'}, timeout=_HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+
+    resp = _http.post(f'{content_base}/files', params={'uploadType': 'resumable'}, data=json.dumps(metadata),
+                      headers={**auth, 'Content-Type': 'application/json; charset=UTF-8',
+                               'X-Upload-Content-Length': str(size)}, timeout=_HTTP_TIMEOUT)
+    resp.raise_for_status()
+    session_url = resp.headers['Location']
+
+    def parse(resp):
+        if resp.status_code in (200, 201):
+            return size, resp.json()
+        if resp.status_code == 308:
+            # Range: bytes=0-N → tiene N+1 bytes; sin Range todavía no tiene nada
+            received = resp.headers.get('Range')
+            return (int(received.rsplit('-', 1)[1]) + 1 if received else 0), None
+        if resp.status_code == 404:
+            raise TransferError('Drive: la sesión de subida expiró')
+        resp.raise_for_status()
+        raise TransferError(f'Drive: respuesta inesperada {resp.status_code}')
+
+    def send(offset, data):
+        return parse(_request('PUT', session_url, data=data, headers={
+            'Content-Range': f'bytes {offset}-{offset + len(data) - 1}/{size}'}))
+
+    def status(offset):
+        return parse(_request('PUT', session_url, data=b'', headers={'Content-Range': f'bytes */{size}'}))
+
+    try:
+        return _upload_chunks(stream, size, CHUNK_BYTES['google_drive'], send, status, 'Drive')
+    except TransferError:
+        try:
+            _http.delete(session_url, timeout=_HTTP_TIMEOUT)
+        except requests.RequestException:
+            pass
+        raise
+
+
+def _drive_download(auth, headers, file_id, api_base, content_base):
+    meta = _http.get(f'{api_base}/files/{file_id}', headers=auth, params={'fields': 'name,mimeType'},
+                     timeout=_HTTP_TIMEOUT)
+    meta.raise_for_status()
+    meta = meta.json()
+    upstream = _http.get(f'{api_base}/files/{file_id}', params={'alt': 'media'}, headers=headers,
+                         stream=True, timeout=_HTTP_TIMEOUT)
+    return upstream, meta.get('name', 'download'), meta.get('mimeType', 'application/octet-stream')
+
+
+# ── Dropbox ───────────────────────────────────────────────────────────────────
+
+def _dropbox_upload(access_token, stream, size, filename, parent_id, api_base, content_base):
+    auth = {'Authorization': f'Bearer {access_token}', 'Content-Type': 'application/octet-stream'}
+    path = f"{parent_id or ''}/{filename}"
+    if not path.startswith('/'):
+        path = '/' + path
+    commit = {'path': path, 'mode': 'add', 'autorename': True}
+
+    if size <= SIMPLE_UPLOAD_MAX:
+        resp = _http.post(f'{content_base}/files/upload', data=_read(stream, size),
+                          headers={**auth, 'Dropbox-API-Arg': json.dumps(commit)}, timeout=_HTTP_TIMEOUT)
+        resp.raise_for_status()
+        return resp.json()
+
+    session = {'id': None}
+
+    def call(endpoint, arg, data):
+        resp = _request('POST', f'{content_base}/files/upload_session/{endpoint}', data=data,
+                        headers={**auth, 'Dropbox-API-Arg': json.dumps(arg)})
+        if resp.status_code == 409:
+            error = resp.json().get('error', {})
+            error = error.get('lookup_failed', error)     # finish anida el error en lookup_failed
+            if error.get('.tag') == 'incorrect_offset':
+                return error['correct_offset'], None
+            raise TransferError(f"Dropbox: {resp.json().get('error_summary', resp.text)}")
+        resp.raise_for_status()
+        return None, resp.json()
+
+    def send(offset, data):
+        if session['id'] is None:
+            session['id'] = call('start', {'close': False}, b'')[1]['session_id']
+        cursor = {'session_id': session['id'], 'offset': offset}
+        if offset + len(data) == size:
+            correct, result = call('finish', {'cursor': cursor, 'commit': commit}, data)
+            return (correct, None) if result is None else (size, result)
+        correct, _ = call('append_v2', {'cursor': cursor, 'close': False}, data)
+        return (correct, None) if correct is not None else (offset + len(data), None)
+
+    def status(offset):
+        # Dropbox no tiene consulta de estado: un append vacío en el offset supuesto
+        # responde incorrect_offset con el offset real si no coincide
+        if session['id'] is None:
+            return 0, None
+        correct, _ = call('append_v2', {'cursor': {'session_id': session['id'], 'offset': offset},
+                                        'close': False}, b'')
+        return (offset if correct is None else correct), None
+
+    return _upload_chunks(stream, size, CHUNK_BYTES['dropbox'], send, status, 'Dropbox')
+
+
+def _dropbox_download(auth, headers, file_id, api_base, content_base):
+    upstream = _http.post(f'{content_base}/files/download', stream=True, timeout=_HTTP_TIMEOUT,
+                          headers={**headers, 'Dropbox-API-Arg': json.dumps({'path': file_id})})
+    api_result = json.loads(upstream.headers.get('Dropbox-API-Result', '{}'))
+    return upstream, api_result.get('name', 'download'), 'application/octet-stream'
+
+
+# ── OneDrive (Microsoft Graph) ────────────────────────────────────────────────
+
+def _onedrive_upload(access_token, stream, size, filename, parent_id, api_base, content_base):
+    auth = {'Authorization': f'Bearer {access_token}'}
+    item = f'items/{parent_id}' if parent_id else 'root'
+    target = f'{api_base}/me/drive/{item}:/{quote(filename)}:'
+
+    if size <= SIMPLE_UPLOAD_MAX:
+        resp = _http.put(f'{target}/content', data=_read(stream, size), timeout=_HTTP_TIMEOUT,
+                         headers={**auth, 'Content-Type': 'application/octet-stream'})
+        resp.raise_for_status()
+        return resp.json()
+
+    # Mismo comportamiento que el PUT simple ante un nombre existente: reemplazar
+    resp = _http.post(f'{target}/createUploadSession', timeout=_HTTP_TIMEOUT,
+                      json={'item': {'@microsoft.graph.conflictBehavior': 'replace'}}, headers=auth)
+    resp.raise_for_status()
+    upload_url = resp.json()['uploadUrl']     # pre-autenticada: sin cabecera Authorization
+
+    def next_expected(resp):
+        ranges = resp.json().get('nextExpectedRanges') or ['0-']
+        return int(ranges[0].split('-')[0])
+
+    def status(offset):
+        resp = _request('GET', upload_url)
+        if resp.status_code == 404:
+            raise TransferError('OneDrive: la sesión de subida expiró')
+        resp.raise_for_status()
+        return next_expected(resp), None
+
+    def send(offset, data):
+        resp = _request('PUT', upload_url, data=data, headers={
+            'Content-Range': f'bytes {offset}-{offset + len(data) - 1}/{size}'})
+        if resp.status_code in (200, 201):
+            return size, resp.json()
+        if resp.status_code == 202:
+            return next_expected(resp), None
+        if resp.status_code == 416:      # el rango no encaja con lo recibido: preguntar
+            return status(offset)
+        if resp.status_code == 404:
+            raise TransferError('OneDrive: la sesión de subida expiró')
+        resp.raise_for_status()
+        raise TransferError(f'OneDrive: respuesta inesperada {resp.status_code}')
+
+    try:
+        return _upload_chunks(stream, size, CHUNK_BYTES['onedrive'], send, status, 'OneDrive')
+    except TransferError:
+        try:
+            _http.delete(upload_url, timeout=_HTTP_TIMEOUT)
+        except requests.RequestException:
+            pass
+        raise
+
+
+def _onedrive_download(auth, headers, file_id, api_base, content_base):
+    # /content redirige a una URL de descarga; requests conserva Range en la redirección
+    upstream = _http.get(f'{api_base}/me/drive/items/{file_id}/content', headers=headers,
+                         stream=True, allow_redirects=True, timeout=_HTTP_TIMEOUT)
+    return upstream, 'download', 'application/octet-stream'
+
+
+# ── Box ───────────────────────────────────────────────────────────────────────
+
+class _MultipartBody:
+    """multipart/form-data body read from a stream on demand, with a known length."""
+
+    def __init__(self, preamble: bytes, stream, size: int, epilogue: bytes):
+        self._parts = [preamble, (stream, size), epilogue]
+        self._len = len(preamble) + size + len(epilogue)
+
+    def __len__(self):
+        return self._len
+
+    def read(self, n: int = -1) -> bytes:
+        while self._parts:
+            part = self._parts[0]
+            if isinstance(part, bytes):
+                if not part:
+                    self._parts.pop(0)
+                    continue
+                n = len(part) if n is None or n < 0 else n
+                self._parts[0] = part[n:]
+                return part[:n]
+            stream, left = part
+            if left == 0:
+                self._parts.pop(0)
+                continue
+            data = stream.read(left if n is None or n < 0 else min(n, left))
+            if not data:
+                raise TransferError('El cuerpo terminó antes de tiempo')
+            self._parts[0] = (stream, left - len(data))
+            return data
+        return b''
+
+
+def _box_upload(access_token, stream, size, filename, parent_id, api_base, content_base):
+    boundary = secrets.token_hex(16)
+    attributes = json.dumps({'name': filename, 'parent': {'id': parent_id or '0'}})
+    safe_name = filename.replace('"', '')
+    preamble = (
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="attributes"\r\n\r\n'
+        f'{attributes}\r\n'
+        f'--{boundary}\r\n'
+        f'Content-Disposition: form-data; name="file"; filename="{safe_name}"\r\n'
+        f'Content-Type: application/octet-stream\r\n\r\n'
+    ).encode('utf-8')
+    body = _MultipartBody(preamble, stream, size, f'\r\n--{boundary}--\r\n'.encode('utf-8'))
+    resp = _http.post(f'{content_base}/files/content', data=body, timeout=_HTTP_TIMEOUT, headers={
+        'Authorization': f'Bearer {access_token}', 'Content-Type': f'multipart/form-data; boundary={boundary}'})
+    resp.raise_for_status()
+    data = resp.json()
+    return data['entries'][0] if data.get('entries') else {}
+
+
+def _box_download(auth, headers, file_id, api_base, content_base):
+    upstream = _http.get(f'{api_base}/files/{file_id}/content', headers=headers,
+                         stream=True, allow_redirects=True, timeout=_HTTP_TIMEOUT)
+    return upstream, 'download', 'application/octet-stream'
+
+
+_UPLOADERS = {'google_drive': _drive_upload, 'dropbox': _dropbox_upload,
+              'onedrive': _onedrive_upload, 'box': _box_upload}
+_DOWNLOADERS = {'google_drive': _drive_download, 'dropbox': _dropbox_download,
+                'onedrive': _onedrive_download, 'box': _box_download}
+
+
+def _relay(upstream):
+    """Yield the upstream body in chunks of 64 KB doubling up to 1 MB; always closes it."""
+    size = _DOWNLOAD_FIRST
+    try:
+        while True:
+            data = upstream.raw.read(size)
+            if not data:
+                break
+            yield data
+            if size < _DOWNLOAD_MAX:
+                size *= 2
+    finally:
+        upstream.close()
+
+
+def _disposition(filename: str) -> str:
+    fallback = filename.encode('ascii', 'replace').decode('ascii').replace('"', '')
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+class CloudTransfer:
+    """Upload and download files through the providers' APIs without buffering them."""
+
+    @staticmethod
+    def supports(provider: str) -> bool:
+        return provider in _UPLOADERS
+
+    @staticmethod
+    def upload(provider: str, access_token: str, stream, size: int, filename: str, parent_id=None, *,
+               api_base: str, content_base: str) -> dict:
+        """
+        Upload `size` bytes read from `stream` (a file-like object; the WSGI
+        input works) as `filename`. Returns the legacy route payload:
+        {'success': True, 'file': {'id', 'name'}}.
+        """
+        t0 = time.perf_counter()
+        data = _UPLOADERS[provider](access_token, stream, size, filename, parent_id, api_base, content_base)
+        if size > SIMPLE_UPLOAD_MAX:
+            elapsed = time.perf_counter() - t0
+            logger.info(f'[CloudTransfer] {provider}: {filename} ({size / _MiB:.1f} MB) subido en '
+                        f'{elapsed:.1f}s ({size / _MiB / max(elapsed, 1e-6):.1f} MB/s)')
+        return {'success': True, 'file': {'id': data.get('id'), 'name': data.get('name', filename)}}
+
+    @staticmethod
+    def download(provider: str, access_token: str, file_id: str, *, api_base: str, content_base: str,
+                 range_header: str | None = None, if_range: str | None = None):
+        """Flask Response relaying the file; a Range request gets the provider's 206 (or 416)."""
+        from flask import Response
+
+        auth = {'Authorization': f'Bearer {access_token}'}
+        # identity: los bytes se reenvían tal cual, así Content-Length / Content-Range siguen valiendo
+        headers = {**auth, 'Accept-Encoding': 'identity'}
+        if range_header:
+            headers['Range'] = range_header
+            if if_range:
+                headers['If-Range'] = if_range
+
+        upstream, filename, content_type = _DOWNLOADERS[provider](auth, headers, file_id, api_base, content_base)
+        if upstream.status_code == 416:
+            upstream.close()
+            return Response(status=416, headers={'Content-Range': upstream.headers.get('Content-Range', '')})
+        try:
+            upstream.raise_for_status()
+        except requests.HTTPError:
+            upstream.close()
+            raise
+
+        out = {'Content-Disposition': _disposition(filename), 'Content-Type': content_type, 'Accept-Ranges': 'bytes'}
+        out.update({h: upstream.headers[h] for h in _RELAY_HEADERS if h in upstream.headers})
+        return Response(_relay(upstream), status=upstream.status_code, headers=out, direct_passthrough=True)
@@ -0,0 +1,104 @@
+"""
+services/comment_tree.py
+Hilo completo de comentarios de un documento: una query + árbol en memoria.
+
+Antes, list_comments cargaba los comentarios raíz, luego las respuestas, y
+cada to_dict() disparaba un lazy load de `author` (una query por comentario):
+una revisión con 150 comentarios emitía cientos de SELECTs. Ahora:
+
+    SELECT document_comments … LEFT JOIN users (author)
+     WHERE document_id = :doc ORDER BY created_at, id
+
+y el árbol se arma en Python (respuestas anidadas a cualquier profundidad,
+cada nodo con su lista `replies`).
+
+Caché (Redis, JSON):
+    comments:gen:{doc_id}         generación del hilo (INCR al invalidar)
+    comments:tree:{doc_id}:{gen}  árbol serializado, TTL _TREE_TTL
+La generación se lee ANTES de la query, así un lector lento que guarda un
+árbol viejo lo guarda bajo la generación anterior, que ya nadie lee; un
+DELETE simple dejaría ese árbol viejo vivo hasta el TTL. Las rutas de
+create/reply/resolve/update/delete llaman a invalidate() tras el commit.
+El TTL acota lo único que no invalida: cambios de nombre del autor.
+"""
+from __future__ import annotations
+
+import json
+import logging
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+_KEY_GEN = 'comments:gen:{doc_id}'
+_KEY_TREE = 'comments:tree:{doc_id}:{gen}'
+_TREE_TTL = 600
+_GEN_TTL = 30 * 86400
+
+
+class CommentTree:
+    """Carga, cachea e invalida el árbol de comentarios de un documento."""
+
+    @staticmethod
+    def get(doc_id: int) -> list[dict]:
+        """Comentarios raíz (created_at, id ascendente) con sus `replies` anidadas."""
+        from settings.extensions import redis_client
+
+        gen = '0'
+        try:
+            gen = redis_client.get(_KEY_GEN.format(doc_id=doc_id)) or '0'
+            cached = redis_client.get(_KEY_TREE.format(doc_id=doc_id, gen=gen))
+            if cached:
+                return json.loads(cached)
+        except Exception as e:
+            logger.warning(f"[CommentTree] Redis no disponible doc={doc_id}: {e}")
+
+        tree = CommentTree.load(doc_id)
+        try:
+            redis_client.setex(_KEY_TREE.format(doc_id=doc_id, gen=gen), _TREE_TTL, json.dumps(tree))
+        except Exception:
+            pass
+        return tree
+
+    @staticmethod
+    def load(doc_id: int) -> list[dict]:
+        """Árbol desde la BD, en una sola query (autores por JOIN)."""
+        from sqlalchemy.orm import joinedload
+
+        from models.models import DocumentComment
+
+        rows = (
+            DocumentComment.query
+            .options(joinedload(DocumentComment.author))
+            .filter(DocumentComment.document_id == doc_id)
+            .order_by(DocumentComment.created_at.asc(), DocumentComment.id.asc())
+            .all()
+        )
+        nodes = {}
+        for c in rows:
+            node = c.to_dict()
+            node['replies'] = []
+            nodes[c.id] = node
+
+        roots = []
+        for c in rows:
+            parent = nodes.get(c.parent_id) if c.parent_id is not None else None
+            # Respuesta cuyo padre ya no existe: se muestra como raíz, no se pierde
+            (parent['replies'] if parent is not None else roots).append(nodes[c.id])
+        return roots
+
+    @staticmethod
+    def invalidate(doc_id: int) -> None:
+        """Nueva generación: los árboles cacheados del documento dejan de leerse."""
+        from settings.extensions import redis_client
+
+        key = _KEY_GEN.format(doc_id=doc_id)
+        try:
+            redis_client.incr(key)
+            redis_client.expire(key, _GEN_TTL)
+        except Exception as e:
+            logger.warning(f"[CommentTree] No se pudo invalidar doc={doc_id}: {e}")
+
+    @staticmethod
+    def sort_key(node: dict) -> tuple:
+        """(created_at, id) de un nodo serializado, para Paginator.paginate_list."""
+        return datetime.fromisoformat(node['created_at']), node['id']
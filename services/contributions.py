@@ -0,0 +1,477 @@
+"""
+services/contributions.py
+Contribution tracking: buffered snapshot ingestion, per-(document, user)
+rollups and archiving of old snapshots.
+
+Write path:
+  record() RPUSHes the snapshot (with its request time) to contrib:buffer
+  and returns. ContributionFlushWorker drains the buffer every _FLUSH_S in
+  batches (LRANGE + LTRIM inside MULTI, so concurrent flushers in several
+  gunicorn workers get disjoint batches) and write()s each batch in ONE
+  transaction: a multi-row INSERT into contribution_snapshots plus an upsert
+  of contribution_rollups (ON DUPLICATE KEY UPDATE col = col + VALUES(col)).
+  Snapshots and totals therefore never disagree. Snapshots of deleted
+  documents/users are dropped; a batch that still violates a constraint is
+  retried row by row and the failing rows are parked in contrib:dead. A
+  batch that fails for any other reason (database down) goes back to the
+  head of the buffer. Without Redis record() writes
+  inline; with a buffer above _BUFFER_MAX (no worker draining it) the
+  request flushes one batch itself.
+
+Read path:
+  summary() reads contribution_rollups joined with users: one indexed query
+  however many snapshots the document has. It trails the buffer by up to
+  _FLUSH_S.
+
+Retention:
+  archive() moves snapshots older than a cutoff into contribution_archives
+  rows (JSON lines, zstd or zlib) per document and id range, deleting them
+  in the same transaction. Rollups are untouched: they already count them.
+  Run it from cron: scripts/tools/archive_contributions.py.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import threading
+import zlib
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+
+_KEY_BUFFER = 'contrib:buffer'
+_KEY_DEAD = 'contrib:dead'
+_DEAD_MAX = 10_000
+_BUFFER_MAX = 200_000
+_FLUSH_S = 2
+_FLUSH_BATCH = 2000
+_ARCHIVE_CHUNK = 50_000
+_ZSTD_LEVEL = 10
+
+# Colores asignados por orden de aparición (hasta 8 colaboradores)
+CONTRIBUTOR_COLORS = [
+    '#6366f1', '#22c55e', '#f59e0b', '#ef4444',
+    '#3b82f6', '#ec4899', '#14b8a6', '#f97316',
+]
+
+_SNAPSHOT_FIELDS = ('document_id', 'user_id', 'action', 'content',
+                    'position_from', 'position_to', 'word_count_delta', 'created_at')
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+class ContributionStore:
+    """Ingestion, rollups and archives of contribution snapshots."""
+
+    # ── Write path ────────────────────────────────────────────────────────────
+    @classmethod
+    def record(cls, document_id: int, user_id: int, action: str, content: str = '',
+               position_from=None, position_to=None, word_count_delta: int = 0) -> None:
+        """Buffer one snapshot; written to the database by the next flush."""
+        from settings.extensions import redis_client
+
+        row = {
+            'document_id': document_id, 'user_id': user_id, 'action': action, 'content': content,
+            'position_from': position_from, 'position_to': position_to,
+            'word_count_delta': word_count_delta, 'created_at': datetime.utcnow().isoformat(),
+        }
+        try:
+            length = redis_client.rpush(_KEY_BUFFER, json.dumps(row))
+        except Exception as e:
+            logger.warning(f'[Contributions] Buffer no disponible, escritura directa: {e}')
+            length = None
+        if length is None:
+            cls.write([row])
+        elif length > _BUFFER_MAX:
+            try:
+                cls.flush()
+            except Exception as e:
+                # El snapshot ya está en el buffer; la request no falla por el volcado
+                logger.error(f'[Contributions] Volcado en línea fallido: {e}')
+
+    @classmethod
+    def flush(cls, limit: int = _FLUSH_BATCH) -> int:
+        """
+        Write one batch from the buffer. Returns the snapshots taken from it.
+
+        Snapshots of documents or users that no longer exist are dropped
+        before the INSERT. If the batch still hits an IntegrityError it is
+        written row by row and the rows that fail go to contrib:dead, so one
+        bad row never blocks the buffer. Any other error (database down)
+        puts the batch, or the rows the fallback had not written yet, back
+        at the head of the buffer.
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        from settings.extensions import redis_client
+
+        pipe = redis_client.pipeline()
+        if pipe is None:
+            return 0
+        pipe.lrange(_KEY_BUFFER, 0, limit - 1)
+        pipe.ltrim(_KEY_BUFFER, limit, -1)
+        items, _ = pipe.execute()
+        if not items:
+            return 0
+        try:
+            rows = cls._existing_targets([json.loads(item) for item in items])
+            cls.write(rows)
+        except IntegrityError:
+            cls._write_each(rows, [json.dumps(row) for row in rows])
+        except ValueError:
+            # JSON inválido: no se puede reintentar
+            cls._write_each(items, items, parse=True)
+        except Exception:
+            # De vuelta a la cabeza del buffer, en el mismo orden
+            redis_client.lpush(_KEY_BUFFER, *reversed(items))
+            raise
+        return len(items)
+
+    @classmethod
+    def _write_each(cls, entries: list, raw: list, parse: bool = False) -> None:
+        """
+        Row-by-row fallback of flush(): rows that cannot be written go to
+        contrib:dead; on any other error the rows not written yet (`raw`,
+        as stored in the buffer) go back to its head and the error is raised.
+        """
+        from sqlalchemy.exc import IntegrityError
+
+        from settings.extensions import redis_client
+
+        for i, entry in enumerate(entries):
+            try:
+                cls.write(cls._existing_targets([json.loads(entry)]) if parse else [entry])
+            except (ValueError, IntegrityError) as exc:
+                cls._dead_letter(entry, exc)
+            except Exception:
+                redis_client.lpush(_KEY_BUFFER, *reversed(raw[i:]))
+                raise
+
+    @staticmethod
+    def _existing_targets(rows: list[dict]) -> list[dict]:
+        """Rows whose document and user still exist (hard-deleted ones would violate the FKs)."""
+        from models.models import Document, User
+        from settings.extensions import db
+
+        doc_ids = {row.get('document_id') for row in rows}
+        user_ids = {row.get('user_id') for row in rows}
+        docs = {i for (i,) in db.session.query(Document.id).filter(Document.id.in_(doc_ids))}
+        users = {i for (i,) in db.session.query(User.id).filter(User.id.in_(user_ids))}
+        kept = [row for row in rows if row.get('document_id') in docs and row.get('user_id') in users]
+        if len(kept) < len(rows):
+            logger.info(f'[Contributions] {len(rows) - len(kept)} snapshots descartados: documento o usuario eliminado')
+        return kept
+
+    @staticmethod
+    def _dead_letter(row, exc: Exception) -> None:
+        """Park a snapshot that cannot be written in contrib:dead (capped) for inspection."""
+        from settings.extensions import redis_client
+
+        logger.warning(f'[Contributions] Snapshot descartado ({type(exc).__name__}): {str(row)[:200]}')
+        try:
+            pipe = redis_client.pipeline()
+            if pipe is not None:
+                pipe.rpush(_KEY_DEAD, row if isinstance(row, (str, bytes)) else json.dumps(row))
+                pipe.ltrim(_KEY_DEAD, -_DEAD_MAX, -1)
+                pipe.execute()
+        except Exception:
+            pass
+
+    @classmethod
+    def write(cls, rows: list[dict]) -> None:
+        """Insert snapshots and add them to the rollups, in one transaction."""
+        from models.models import ContributionSnapshot
+        from settings.extensions import db
+
+        if not rows:
+            return
+        snapshots, totals = [], {}
+        for row in rows:
+            snap = {field: row.get(field) for field in _SNAPSHOT_FIELDS}
+            if isinstance(snap['created_at'], str):
+                snap['created_at'] = datetime.fromisoformat(snap['created_at'])
+            snap['created_at'] = snap['created_at'] or datetime.utcnow()
+            snap['word_count_delta'] = int(snap['word_count_delta'] or 0)
+            snapshots.append(snap)
+
+            total = totals.setdefault((snap['document_id'], snap['user_id']), [0, 0, 0, None])
+            delta = snap['word_count_delta']
+            if delta > 0:
+                total[0] += delta
+            elif delta < 0:
+                total[1] -= delta
+            total[2] += 1
+            if total[3] is None or snap['created_at'] > total[3]:
+                total[3] = snap['created_at']
+        try:
+            db.session.execute(db.insert(ContributionSnapshot), snapshots)
+            cls._add_to_rollups(totals)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+    @staticmethod
+    def _add_to_rollups(totals: dict) -> None:
+        """rollup += totals[(doc, user)] = [added, removed, snapshots, last_active]."""
+        from sqlalchemy import func
+
+        from models.models import ContributionRollup
+        from settings.extensions import db
+
+        values = [
+            {'document_id': doc_id, 'user_id': user_id, 'words_added': added,
+             'words_removed': removed, 'snapshots': count, 'last_active': last}
+            for (doc_id, user_id), (added, removed, count, last) in totals.items()
+        ]
+        table = ContributionRollup.__table__
+        dialect = db.session.get_bind().dialect.name
+        if dialect == 'mysql':
+            from sqlalchemy.dialects.mysql import insert
+            stmt = insert(table).values(values)
+            new = stmt.inserted
+            stmt = stmt.on_duplicate_key_update(
+                words_added=table.c.words_added + new.words_added,
+                words_removed=table.c.words_removed + new.words_removed,
+                snapshots=table.c.snapshots + new.snapshots,
+                last_active=func.greatest(func.coalesce(table.c.last_active, new.last_active), new.last_active),
+            )
+            db.session.execute(stmt)
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).values(values)
+            new = stmt.excluded
+            stmt = stmt.on_conflict_do_update(
+                index_elements=['document_id', 'user_id'],
+                set_={
+                    'words_added': table.c.words_added + new.words_added,
+                    'words_removed': table.c.words_removed + new.words_removed,
+                    'snapshots': table.c.snapshots + new.snapshots,
+                    'last_active': func.max(func.coalesce(table.c.last_active, new.last_active), new.last_active),
+                },
+            )
+            db.session.execute(stmt)
+        else:
+            # Otros dialectos: lectura con bloqueo y actualización por fila
+            for value in values:
+                rollup = (ContributionRollup.query
+                          .filter_by(document_id=value['document_id'], user_id=value['user_id'])
+                          .with_for_update().first())
+                if rollup is None:
+                    db.session.add(ContributionRollup(**value))
+                    continue
+                rollup.words_added += value['words_added']
+                rollup.words_removed += value['words_removed']
+                rollup.snapshots += value['snapshots']
+                if rollup.last_active is None or value['last_active'] > rollup.last_active:
+                    rollup.last_active = value['last_active']
+
+    @classmethod
+    def rebuild_rollups(cls, until_id: int | None = None, document_ids=None) -> int:
+        """
+        Add the totals of the stored snapshots (id <= until_id) to the rollups.
+        Adds, does not replace: run it on an empty rollup table (deploy
+        backfill, scratch/backfill_contribution_rollups.py). Returns the
+        rollup rows written.
+        """
+        from sqlalchemy import case, func
+
+        from models.models import ContributionSnapshot
+        from settings.extensions import db
+
+        delta = ContributionSnapshot.word_count_delta
+        query = db.session.query(
+            ContributionSnapshot.document_id,
+            ContributionSnapshot.user_id,
+            func.sum(case((delta > 0, delta), else_=0)),
+            func.sum(case((delta < 0, -delta), else_=0)),
+            func.count(ContributionSnapshot.id),
+            func.max(ContributionSnapshot.created_at),
+        ).group_by(ContributionSnapshot.document_id, ContributionSnapshot.user_id)
+        if until_id is not None:
+            query = query.filter(ContributionSnapshot.id <= until_id)
+        if document_ids is not None:
+            query = query.filter(ContributionSnapshot.document_id.in_(list(document_ids)))
+
+        totals = {(doc_id, user_id): [int(added or 0), int(removed or 0), count, last]
+                  for doc_id, user_id, added, removed, count, last in query}
+        keys = list(totals)
+        for start in range(0, len(keys), _FLUSH_BATCH):
+            cls._add_to_rollups({k: totals[k] for k in keys[start:start + _FLUSH_BATCH]})
+        db.session.commit()
+        return len(keys)
+
+    # ── Read path ─────────────────────────────────────────────────────────────
+    @staticmethod
+    def summary(document_id: int) -> dict:
+        """Activity-panel summary of a document, from the rollups."""
+        from models.models import ContributionRollup, User
+        from settings.extensions import db
+
+        rows = (
+            db.session.query(ContributionRollup, User.name, User.lastname, User.email)
+            .join(User, User.id == ContributionRollup.user_id)
+            .filter(ContributionRollup.document_id == document_id)
+            .order_by(ContributionRollup.user_id)
+            .all()
+        )
+
+        total_words_added = sum(max(r.words_added, 0) for r, *_ in rows)
+        contributors = []
+        last_updated = None
+        for i, (rollup, name, lastname, email) in enumerate(rows):
+            percentage = round(
+                (rollup.words_added / total_words_added * 100) if total_words_added > 0 else 0, 1
+            )
+            contributors.append({
+                'user_id':       rollup.user_id,
+                'user_name':     f"{name or ''} {lastname or ''}".strip() or email,
+                'words_added':   rollup.words_added,
+                'words_removed': rollup.words_removed,
+                'net_words':     rollup.words_added - rollup.words_removed,
+                'percentage':    percentage,
+                'color':         CONTRIBUTOR_COLORS[i % len(CONTRIBUTOR_COLORS)],
+                'last_active':   rollup.last_active.isoformat() if rollup.last_active else None,
+            })
+            if rollup.last_active and (last_updated is None or rollup.last_active > last_updated):
+                last_updated = rollup.last_active
+
+        contributors.sort(key=lambda x: x['words_added'], reverse=True)
+        return {
+            'contributors':      contributors,
+            'total_words_added': total_words_added,
+            'last_updated':      last_updated.isoformat() if last_updated else None,
+        }
+
+    # ── Retention ─────────────────────────────────────────────────────────────
+    @staticmethod
+    def _compress(raw: bytes) -> tuple[str, bytes]:
+        if zstandard is not None:
+            return 'zstd', zstandard.ZstdCompressor(level=_ZSTD_LEVEL).compress(raw)
+        return 'zlib', zlib.compress(raw, 9)
+
+    @staticmethod
+    def read_archive(archive) -> list[dict]:
+        """Snapshots stored in a ContributionArchive row, as dicts."""
+        if archive.codec == 'zstd':
+            if zstandard is None:
+                raise RuntimeError('zstandard is required to read this archive')
+            raw = zstandard.ZstdDecompressor().decompress(archive.payload)
+        else:
+            raw = zlib.decompress(archive.payload)
+        return [json.loads(line) for line in raw.decode('utf-8').splitlines() if line]
+
+    @classmethod
+    def archive(cls, older_than: timedelta, document_ids=None, dry_run: bool = False,
+                chunk: int = _ARCHIVE_CHUNK) -> dict:
+        """
+        Move snapshots created before now - older_than into compressed
+        archive rows, `chunk` snapshots per row; one transaction per row.
+        """
+        from sqlalchemy import select
+
+        from models.models import ContributionArchive, ContributionSnapshot
+        from settings.extensions import db
+
+        cutoff = datetime.utcnow() - older_than
+        snapshots = ContributionSnapshot.__table__
+        old = snapshots.c.created_at < cutoff
+        if document_ids is None:
+            document_ids = [d for (d,) in db.session.query(ContributionSnapshot.document_id)
+                            .filter(ContributionSnapshot.created_at < cutoff).distinct()]
+
+        report = {'documents': 0, 'archives': 0, 'snapshots': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+        for doc_id in document_ids:
+            archived_any = False
+            after_id = 0
+            while True:
+                rows = db.session.execute(
+                    select(snapshots)
+                    .where(snapshots.c.document_id == doc_id, old, snapshots.c.id > after_id)
+                    .order_by(snapshots.c.id)
+                    .limit(chunk)
+                ).mappings().all()
+                if not rows:
+                    break
+                first_id, last_id = rows[0]['id'], rows[-1]['id']
+                after_id = last_id
+                raw = '\n'.join(json.dumps(dict(row), default=_json_default) for row in rows).encode('utf-8')
+                codec, payload = cls._compress(raw)
+                report['archives'] += 1
+                report['snapshots'] += len(rows)
+                report['raw_bytes'] += len(raw)
+                report['stored_bytes'] += len(payload)
+                archived_any = True
+                if dry_run:
+                    continue
+                try:
+                    db.session.add(ContributionArchive(
+                        document_id=doc_id, first_id=first_id, last_id=last_id,
+                        period_start=min(r['created_at'] for r in rows),
+                        period_end=max(r['created_at'] for r in rows),
+                        row_count=len(rows), codec=codec, payload=payload,
+                    ))
+                    # Mismo predicado que el SELECT: borra exactamente las filas archivadas
+                    db.session.execute(
+                        snapshots.delete().where(snapshots.c.document_id == doc_id, old,
+                                                 snapshots.c.id.between(first_id, last_id))
+                    )
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    raise
+            if archived_any:
+                report['documents'] += 1
+        if report['snapshots']:
+            logger.info(f'[Contributions] Archivado{" (dry run)" if dry_run else ""}: {report}')
+        return report
+
+
+class ContributionFlushWorker:
+    """Vacía contrib:buffer a la base de datos cada _FLUSH_S (un hilo por proceso)."""
+
+    _thread = None
+    _stop_event = threading.Event()
+    _app = None
+
+    @classmethod
+    def start(cls, app):
+        if cls._thread is not None:
+            return
+        cls._app = app
+        cls._stop_event.clear()
+        cls._thread = threading.Thread(target=cls._run_loop, name='ContributionFlushWorker', daemon=True)
+        cls._thread.start()
+        logger.info('[Contributions] ContributionFlushWorker iniciado en segundo plano')
+
+    @classmethod
+    def stop(cls):
+        cls._stop_event.set()
+        if cls._thread:
+            cls._thread.join(timeout=5)
+            cls._thread = None
+
+    @classmethod
+    def _run_loop(cls):
+        while not cls._stop_event.is_set():
+            cls._drain()
+            cls._stop_event.wait(_FLUSH_S)
+        cls._drain()
+
+    @classmethod
+    def _drain(cls):
+        try:
+            with cls._app.app_context():
+                while ContributionStore.flush() >= _FLUSH_BATCH:
+                    pass
+        except Exception as exc:
+            logger.error(f'[Contributions] Error volcando snapshots: {exc}')
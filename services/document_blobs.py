@@ -0,0 +1,449 @@
+"""
+services/document_blobs.py
+Content-addressed blob storage for large documents (`documents` bucket).
+
+Architecture:
+  - A blob is the compressed canonical JSON {'delta', 'html', 'version'};
+    its object name is 'doc_{sha256 of that JSON}.blob'. Identical content
+    (an autosave that did not change anything, a version backup, a copied
+    document) is stored once and shared.
+  - References are the rows themselves: Document.minio_path and
+    DocumentVersion.minio_path. Nothing deletes blobs inline any more —
+    saves, version pruning and storage-tier switches only drop references.
+  - collect_garbage() is a mark-and-sweep job: list the bucket (and the
+    local:// fallback directory), mark every path referenced by a row,
+    delete the rest in parallel batches. Objects younger than the grace
+    period are kept, and put() refreshes a reused object whose mtime is
+    older than half the grace. The listing's mtime predates the mark, so
+    each orphan is stat'ed again right before its delete: one a save
+    re-put in the meantime is back inside the grace window and is kept.
+
+Blob format (versioned, 9-byte header + body):
+    b'XPB' | version (1) | codec b'z' zstd, b'g' gzip, b'-' none | dict_id (u32 BE)
+zstd blobs are compressed with the active dictionary trained on our own
+Quill/HTML corpus (BlobDictionaries, scripts/tools/zstd_dict.py); dict_id 0
+means no dictionary. decode() also accepts headerless gzip (legacy
+'doc_{uuid}.json.gz' objects) and raw zstd frames, so old blobs stay
+readable. Dictionaries are never deleted: every blob names the one it needs.
+
+Usage:
+    path = DocumentBlobStore.put(delta, html)     # 'doc_….blob' | 'local://…'
+    raw_json = DocumentBlobStore.decode(data)
+    report = DocumentBlobStore.collect_garbage(dry_run=True)
+"""
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import re
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+
+BUCKET = 'documents'
+LOCAL_PREFIX = 'local://'
+
+_MAGIC = b'XPB'
+_FORMAT_VERSION = 1
+_HEADER = struct.Struct('>3sBcI')
+_GZIP_MAGIC = b'\x1f\x8b'
+_ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+_ZSTD_LEVEL = int(os.environ.get('DOC_BLOB_ZSTD_LEVEL', '9'))
+
+_KEY_CURRENT_DICT = 'zdict:documents:current'
+_DICT_PREFIX = 'zdict/'
+_DICT_REFRESH_S = 60
+
+_GC_GRACE = timedelta(hours=6)
+_TOUCH_AFTER = _GC_GRACE / 2
+# put() only refreshes a reused blob every _TOUCH_AFTER: a shorter grace
+# would let the sweep delete blobs live saves are deduplicating against
+_MIN_GC_GRACE = 2 * _TOUCH_AFTER
+
+# Legacy 'doc_{uuid4}.json.gz', content-addressed 'doc_{sha256}.json.gz' and
+# 'doc_{sha256}.blob'. Anything else in the bucket (.keep, zdict/, manual
+# uploads) is never swept.
+_BLOB_NAME = re.compile(r'^doc_[0-9a-f-]{32,64}\.(?:json\.gz|blob)$')
+
+
+def _parse_mtime(value) -> datetime | None:
+    """Filer Mtime (RFC 3339), HTTP Last-Modified or epoch → aware UTC datetime."""
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value, tz=timezone.utc)
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(str(value))
+        except (TypeError, ValueError):
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def _local_dir() -> str:
+    from flask import current_app
+    return os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'documents')
+
+
+# ── Dictionaries ──────────────────────────────────────────────────────────────
+
+class BlobDictionaries:
+    """
+    zstd dictionaries for document blobs. Stored in SeaweedFS
+    (documents/zdict/{dict_id}.zdict) with a local copy under
+    UPLOAD_FOLDER/zdicts; the active id lives in Redis
+    (zdict:documents:current, falling back to DOC_BLOB_ZSTD_DICT_ID).
+    """
+
+    _dicts: dict[int, object] = {}
+    _current_id: int | None = None
+    _checked_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _local_path(dict_id: int) -> str:
+        from flask import current_app
+        directory = os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'zdicts')
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f'{dict_id}.zdict')
+
+    @staticmethod
+    def train(samples: list[bytes], dict_size: int = 112640, level: int = _ZSTD_LEVEL):
+        """Train a dictionary on raw blob JSON samples (ZstdCompressionDict)."""
+        return zstandard.train_dictionary(dict_size, samples, level=level)
+
+    @classmethod
+    def get(cls, dict_id: int):
+        """Dictionary by id: memory → local copy → SeaweedFS. Raises if missing."""
+        cached = cls._dicts.get(dict_id)
+        if cached is not None:
+            return cached
+        path = cls._local_path(dict_id)
+        if os.path.exists(path):
+            with open(path, 'rb') as f:
+                data = f.read()
+        else:
+            from settings.extensions import minio_client
+            data = minio_client.get_object(BUCKET, f'{_DICT_PREFIX}{dict_id}.zdict').read()
+            with open(path, 'wb') as f:
+                f.write(data)
+        zdict = zstandard.ZstdCompressionDict(data)
+        # Digest once per process; compressors built from it are then cheap
+        zdict.precompute_compress(level=_ZSTD_LEVEL)
+        with cls._lock:
+            cls._dicts[dict_id] = zdict
+        return zdict
+
+    @classmethod
+    def current(cls):
+        """Active dictionary (re-read at most every minute) or None."""
+        if zstandard is None:
+            return None
+        now = time.monotonic()
+        if now - cls._checked_at > _DICT_REFRESH_S:
+            cls._checked_at = now
+            dict_id = None
+            try:
+                from settings.extensions import redis_client
+                dict_id = redis_client.get(_KEY_CURRENT_DICT)
+            except Exception:
+                pass
+            dict_id = dict_id or os.environ.get('DOC_BLOB_ZSTD_DICT_ID')
+            cls._current_id = int(dict_id) if dict_id else None
+        if cls._current_id is None:
+            return None
+        try:
+            return cls.get(cls._current_id)
+        except Exception as exc:
+            logger.warning(f'[DocBlobs] Diccionario {cls._current_id} no disponible, zstd sin diccionario: {exc}')
+            cls._current_id = None
+            return None
+
+    @classmethod
+    def publish(cls, zdict) -> int:
+        """Upload a trained dictionary (SeaweedFS + local copy). Returns its id."""
+        from settings.extensions import minio_client
+
+        dict_id = zdict.dict_id()
+        data = zdict.as_bytes()
+        with open(cls._local_path(dict_id), 'wb') as f:
+            f.write(data)
+        minio_client.put_object(
+            bucket_name=BUCKET,
+            object_name=f'{_DICT_PREFIX}{dict_id}.zdict',
+            data=BytesIO(data),
+            length=len(data),
+            content_type='application/octet-stream'
+        )
+        logger.info(f'[DocBlobs] Diccionario {dict_id} publicado ({len(data)} bytes)')
+        return dict_id
+
+    @classmethod
+    def activate(cls, dict_id: int) -> None:
+        """Make `dict_id` the dictionary new blobs are written with."""
+        from settings.extensions import redis_client
+
+        cls.get(dict_id)   # must be loadable before anyone writes with it
+        redis_client.set(_KEY_CURRENT_DICT, str(dict_id))
+        cls._current_id, cls._checked_at = dict_id, time.monotonic()
+
+    @classmethod
+    def available(cls) -> list[int]:
+        from settings.extensions import minio_client
+
+        ids = []
+        for obj in minio_client.iter_objects(f'{BUCKET}/{_DICT_PREFIX.rstrip("/")}'):
+            stem = obj.object_name.rsplit('.', 1)[0]
+            if stem.isdigit():
+                ids.append(int(stem))
+        return sorted(ids)
+
+
+class DocumentBlobStore:
+    """Deduplicating document blob storage with mark-and-sweep GC."""
+
+    # ── Write ─────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def canonical(delta, html) -> bytes:
+        content = {'delta': delta, 'html': html, 'version': '1.0'}
+        return json.dumps(content, ensure_ascii=False, sort_keys=True).encode('utf-8')
+
+    @staticmethod
+    def compress(raw: bytes, zdict=None, level: int = _ZSTD_LEVEL) -> bytes:
+        """Versioned blob: zstd (+ dictionary) when available, gzip otherwise."""
+        if zstandard is None:
+            # mtime=0: same content → same bytes
+            return _HEADER.pack(_MAGIC, _FORMAT_VERSION, b'g', 0) + gzip.compress(raw, mtime=0)
+        if zdict is not None:
+            compressor = zstandard.ZstdCompressor(dict_data=zdict, level=level)
+            dict_id = zdict.dict_id()
+        else:
+            compressor = zstandard.ZstdCompressor(level=level)
+            dict_id = 0
+        return _HEADER.pack(_MAGIC, _FORMAT_VERSION, b'z', dict_id) + compressor.compress(raw)
+
+    @staticmethod
+    def decode(data: bytes) -> bytes:
+        """Raw blob JSON from any stored format (header, legacy gzip, bare zstd)."""
+        if data[:2] == _GZIP_MAGIC:
+            return gzip.decompress(data)
+        if data[:4] == _ZSTD_MAGIC:
+            dict_id = zstandard.get_frame_parameters(data).dict_id
+            zdict = BlobDictionaries.get(dict_id) if dict_id else None
+            return zstandard.ZstdDecompressor(dict_data=zdict).decompress(data)
+        if data[:3] != _MAGIC or len(data) < _HEADER.size:
+            raise ValueError('Formato de blob desconocido')
+        _, version, codec, dict_id = _HEADER.unpack_from(data)
+        if version != _FORMAT_VERSION:
+            raise ValueError(f'Versión de blob no soportada: {version}')
+        body = data[_HEADER.size:]
+        if codec == b'z':
+            zdict = BlobDictionaries.get(dict_id) if dict_id else None
+            return zstandard.ZstdDecompressor(dict_data=zdict).decompress(body)
+        if codec == b'g':
+            return gzip.decompress(body)
+        if codec == b'-':
+            return body
+        raise ValueError(f'Codec de blob desconocido: {codec!r}')
+
+    @classmethod
+    def encode(cls, delta, html) -> tuple[str, bytes]:
+        """(object_name, blob_bytes) for a document's content."""
+        raw = cls.canonical(delta, html)
+        name = f'doc_{hashlib.sha256(raw).hexdigest()}.blob'
+        return name, cls.compress(raw, BlobDictionaries.current())
+
+    @classmethod
+    def put(cls, delta, html) -> str:
+        """Store content once; returns the path to keep in minio_path."""
+        from settings.extensions import minio_client
+
+        name, compressed = cls.encode(delta, html)
+        try:
+            if cls._is_fresh(minio_client, name):
+                logger.info(f'[DocBlobs] Blob reutilizado: {name}')
+                return name
+            minio_client.put_object(
+                bucket_name=BUCKET,
+                object_name=name,
+                data=BytesIO(compressed),
+                length=len(compressed),
+                content_type='application/octet-stream'
+            )
+            logger.info(f'[DocBlobs] Blob guardado en SeaweedFS: {name}')
+            return name
+        except Exception as exc:
+            logger.warning(f'[DocBlobs] SeaweedFS no disponible, usando almacenamiento local: {exc}')
+
+        directory = _local_dir()
+        os.makedirs(directory, exist_ok=True)
+        local_path = os.path.join(directory, name)
+        if os.path.exists(local_path):
+            os.utime(local_path)   # keeps it out of the GC grace window
+        else:
+            tmp_path = f'{local_path}.tmp-{os.getpid()}'
+            with open(tmp_path, 'wb') as f:
+                f.write(compressed)
+            os.replace(tmp_path, local_path)
+        logger.info(f'[DocBlobs] Blob guardado localmente: {local_path}')
+        return LOCAL_PREFIX + name
+
+    @staticmethod
+    def _is_fresh(client, name: str) -> bool:
+        """True if `name` exists and is recent enough to survive the next sweep."""
+        stat = client.find_object(BUCKET, name)
+        if stat is None:
+            return False
+        modified = _parse_mtime(stat.last_modified)
+        return modified is not None and datetime.now(timezone.utc) - modified < _TOUCH_AFTER
+
+    # ── Garbage collection ────────────────────────────────────────────────────
+
+    @staticmethod
+    def mark() -> set[str]:
+        """Every minio_path referenced by a document or a version."""
+        from models.models import Document, DocumentVersion
+        from settings.extensions import db
+
+        referenced = set()
+        for model in (Document, DocumentVersion):
+            rows = (db.session.query(model.minio_path)
+                    .filter(model.minio_path.isnot(None))
+                    .distinct()
+                    .yield_per(5000))
+            referenced.update(path for (path,) in rows)
+        return referenced
+
+    @staticmethod
+    def sweep(client, candidates, referenced: set[str], cutoff: datetime,
+              dry_run: bool = False, workers: int = 8, batch_size: int = 1000,
+              remove=None, restat=None) -> dict:
+        """
+        Delete `candidates` (SeaweedFSObject-like: object_name, size,
+        last_modified) that are not referenced and older than `cutoff`.
+        `remove(name)` defaults to client.remove_object on the bucket and
+        `restat(name)` (current mtime, None if gone) to client.find_object.
+        """
+        def _stat_remote(name):
+            stat = client.find_object(BUCKET, name)
+            return stat.last_modified if stat is not None else None
+
+        remove = remove or (lambda name: client.remove_object(BUCKET, name))
+        restat = restat or _stat_remote
+        report = {'listed': 0, 'referenced': 0, 'young': 0, 'orphans': 0,
+                  'orphan_bytes': 0, 'deleted': 0, 'revived': 0, 'errors': 0}
+        orphans = []
+        for obj in candidates:
+            if not _BLOB_NAME.match(obj.object_name):
+                continue
+            report['listed'] += 1
+            if obj.object_name in referenced:
+                report['referenced'] += 1
+                continue
+            modified = _parse_mtime(obj.last_modified)
+            if modified is None or modified >= cutoff:
+                report['young'] += 1
+                continue
+            orphans.append(obj.object_name)
+            report['orphan_bytes'] += obj.size or 0
+        report['orphans'] = len(orphans)
+
+        if dry_run:
+            report['sample'] = orphans[:20]
+            return report
+
+        def _remove(name):
+            try:
+                # Re-guardado (put) después del listado: vuelve a estar en gracia
+                modified = _parse_mtime(restat(name))
+                if modified is None or modified >= cutoff:
+                    return 'revived'
+                remove(name)
+                return 'deleted'
+            except Exception as exc:
+                logger.error(f'[DocBlobs] GC no pudo eliminar {name}: {exc}')
+                return 'errors'
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            for start in range(0, len(orphans), batch_size):
+                for outcome in pool.map(_remove, orphans[start:start + batch_size]):
+                    report[outcome] += 1
+        return report
+
+    @classmethod
+    def collect_garbage(cls, dry_run: bool = False, grace: timedelta = _GC_GRACE,
+                        workers: int = 8, batch_size: int = 1000) -> dict:
+        """
+        Mark-and-sweep over the bucket and the local fallback directory.
+        Listing happens before marking: a blob uploaded after the listing is
+        not a candidate, and a reference committed before the mark is seen.
+        """
+        from settings.extensions import minio_client
+
+        if grace < _MIN_GC_GRACE:
+            raise ValueError(f'grace must be at least {_MIN_GC_GRACE} (2 × _TOUCH_AFTER), got {grace}')
+        cutoff = datetime.now(timezone.utc) - grace
+        try:
+            remote = list(minio_client.iter_objects(BUCKET, prefix='doc_'))
+        except Exception as exc:
+            logger.warning(f'[DocBlobs] No se pudo listar SeaweedFS: {exc}')
+            remote = []
+        local = cls._list_local()
+
+        referenced = cls.mark()
+        report = cls.sweep(minio_client, remote, referenced, cutoff,
+                           dry_run=dry_run, workers=workers, batch_size=batch_size)
+
+        local_refs = {p[len(LOCAL_PREFIX):] for p in referenced if p.startswith(LOCAL_PREFIX)}
+        directory = _local_dir()
+        local_report = cls.sweep(None, local, local_refs, cutoff, dry_run=dry_run,
+                                 workers=1, batch_size=batch_size,
+                                 remove=lambda name: os.remove(os.path.join(directory, name)),
+                                 restat=lambda name: cls._local_mtime(os.path.join(directory, name)))
+        report['local'] = local_report
+        report['dry_run'] = dry_run
+        report['grace_hours'] = grace.total_seconds() / 3600
+        logger.info(f'[DocBlobs] GC report: {report}')
+        return report
+
+    @staticmethod
+    def _local_mtime(path: str) -> float | None:
+        try:
+            return os.stat(path).st_mtime
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def _list_local() -> list:
+        from settings.seaweedfs_client import SeaweedFSObject
+
+        objects = []
+        try:
+            with os.scandir(_local_dir()) as it:
+                for entry in it:
+                    if entry.is_file():
+                        st = entry.stat()
+                        objects.append(SeaweedFSObject(entry.name, st.st_size, False, st.st_mtime))
+        except OSError:
+            pass
+        return objects
@@ -0,0 +1,202 @@
+"""
+services/document_cache.py
+Binary, field-selective Redis cache for /api/document/<id>/load payloads.
+
+Layout (Redis DB 1, binary client):
+    document:v2:{id}  HASH
+        meta   → every scalar field of the payload (title, version, dates…)
+        delta  → Quill delta
+        html   → rendered HTML
+Each field is encoded independently, so an editor fetches meta+delta and a
+viewer fetches meta+html without transferring or decoding the other half.
+
+Codec: 2-byte header + body.
+    byte 0  serializer  m=msgpack  o=orjson  j=json
+    byte 1  compressor  -=none  z=zstd  b=brotli  g=zlib
+Values below _COMPRESS_MIN_BYTES are stored uncompressed; values above
+_FAST_LEVEL_BYTES use a faster compression level. The header makes every
+stored value self-describing, so changing DOC_CACHE_SERIALIZER /
+DOC_CACHE_COMPRESSOR never breaks reads of entries written before.
+
+Metrics (HASH metrics:doccache): raw_bytes / stored_bytes (compression
+ratio), writes, hits, misses.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import zlib
+
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - optional
+    msgpack = None
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional
+    orjson = None
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional
+    zstandard = None
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional
+    brotli = None
+
+_KEY_DOC = 'document:v2:{doc_id}'
+_KEY_LEGACY = 'document:{doc_id}'
+_KEY_METRICS = 'metrics:doccache'
+
+FIELDS = ('delta', 'html')
+
+_COMPRESS_MIN_BYTES = int(os.environ.get('DOC_CACHE_COMPRESS_MIN_BYTES', '1024'))
+_FAST_LEVEL_BYTES = 1024 * 1024
+
+
+# ── Codec ─────────────────────────────────────────────────────────────────────
+
+def _default_serializer() -> str:
+    return 'm' if msgpack else ('o' if orjson else 'j')
+
+
+def _default_compressor() -> str:
+    return 'z' if zstandard else ('b' if brotli else 'g')
+
+
+_SERIALIZER = {'msgpack': 'm', 'orjson': 'o', 'json': 'j'}.get(
+    os.environ.get('DOC_CACHE_SERIALIZER', ''), _default_serializer())
+_COMPRESSOR = {'zstd': 'z', 'brotli': 'b', 'zlib': 'g', 'none': '-'}.get(
+    os.environ.get('DOC_CACHE_COMPRESSOR', ''), _default_compressor())
+
+# A configured codec whose library is missing falls back to the default
+_MODULES = {'m': msgpack, 'o': orjson, 'j': json, 'z': zstandard, 'b': brotli, 'g': zlib, '-': zlib}
+if _MODULES[_SERIALIZER] is None:
+    _SERIALIZER = _default_serializer()
+if _MODULES[_COMPRESSOR] is None:
+    _COMPRESSOR = _default_compressor()
+
+
+def _serialize(obj, kind: str) -> bytes:
+    if kind == 'm':
+        return msgpack.packb(obj, use_bin_type=True)
+    if kind == 'o':
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+
+def _deserialize(data: bytes, kind: str):
+    if kind == 'm':
+        return msgpack.unpackb(data, raw=False)
+    if kind == 'o':
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _compress(data: bytes, kind: str) -> bytes:
+    fast = len(data) >= _FAST_LEVEL_BYTES
+    if kind == 'z':
+        return zstandard.ZstdCompressor(level=1 if fast else 3).compress(data)
+    if kind == 'b':
+        return brotli.compress(data, quality=3 if fast else 5)
+    return zlib.compress(data, 1 if fast else 6)
+
+
+def _decompress(data: bytes, kind: str) -> bytes:
+    if kind == 'z':
+        return zstandard.ZstdDecompressor().decompress(data)
+    if kind == 'b':
+        return brotli.decompress(data)
+    if kind == 'g':
+        return zlib.decompress(data)
+    return data
+
+
+def encode(obj) -> tuple[bytes, int]:
+    """Encode a value; returns (stored_bytes, raw_serialized_size)."""
+    raw = _serialize(obj, _SERIALIZER)
+    comp = _COMPRESSOR if len(raw) >= _COMPRESS_MIN_BYTES else '-'
+    body = _compress(raw, comp) if comp != '-' else raw
+    return (_SERIALIZER + comp).encode('ascii') + body, len(raw)
+
+
+def decode(value: bytes):
+    serializer, compressor = chr(value[0]), chr(value[1])
+    return _deserialize(_decompress(value[2:], compressor), serializer)
+
+
+# ── Cache ─────────────────────────────────────────────────────────────────────
+
+class DocumentCache:
+    """Field-selective document payload cache (see module docstring)."""
+
+    @staticmethod
+    def _client():
+        from settings.extensions import redis_bytes_client
+        return redis_bytes_client
+
+    @classmethod
+    def put(cls, doc_id: int, payload: dict, ttl: int = 300) -> bool:
+        meta = {k: v for k, v in payload.items() if k not in FIELDS}
+        mapping = {}
+        raw_total = stored_total = 0
+        for name, value in (('meta', meta), *((f, payload.get(f)) for f in FIELDS)):
+            stored, raw_size = encode(value)
+            mapping[name] = stored
+            raw_total += raw_size
+            stored_total += len(stored)
+
+        key = _KEY_DOC.format(doc_id=doc_id)
+        pipe = cls._client().pipeline(transaction=True)
+        if pipe is None:
+            # No Redis (_RedisStub): nothing is cached
+            return False
+        pipe.delete(key)
+        pipe.hset(key, mapping=mapping)
+        pipe.expire(key, ttl)
+        pipe.hincrby(_KEY_METRICS, 'raw_bytes', raw_total)
+        pipe.hincrby(_KEY_METRICS, 'stored_bytes', stored_total)
+        pipe.hincrby(_KEY_METRICS, 'writes', 1)
+        pipe.execute()
+        return True
+
+    @classmethod
+    def get(cls, doc_id: int, fields=FIELDS) -> dict | None:
+        """meta + the requested fields, or None on a (partial) miss."""
+        fields = tuple(f for f in fields if f in FIELDS)
+        client = cls._client()
+        values = client.hmget(_KEY_DOC.format(doc_id=doc_id), ['meta', *fields])
+        if not values or any(v is None for v in values):
+            client.hincrby(_KEY_METRICS, 'misses', 1)
+            return None
+        client.hincrby(_KEY_METRICS, 'hits', 1)
+        payload = decode(values[0])
+        for name, value in zip(fields, values[1:]):
+            payload[name] = decode(value)
+        return payload
+
+    @classmethod
+    def invalidate(cls, doc_id: int) -> None:
+        cls._client().delete(_KEY_DOC.format(doc_id=doc_id), _KEY_LEGACY.format(doc_id=doc_id))
+
+    @classmethod
+    def stats(cls) -> dict:
+        raw = cls._client().hgetall(_KEY_METRICS) or {}
+        counters = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+        raw_bytes = counters.get('raw_bytes', 0)
+        stored_bytes = counters.get('stored_bytes', 0)
+        lookups = counters.get('hits', 0) + counters.get('misses', 0)
+        return {
+            'serializer':        _SERIALIZER,
+            'compressor':        _COMPRESSOR,
+            'writes':            counters.get('writes', 0),
+            'hits':              counters.get('hits', 0),
+            'misses':            counters.get('misses', 0),
+            'hit_rate':          round(counters.get('hits', 0) / lookups, 4) if lookups else 0.0,
+            'raw_bytes':         raw_bytes,
+            'stored_bytes':      stored_bytes,
+            'compression_ratio': round(raw_bytes / stored_bytes, 3) if stored_bytes else 0.0,
+        }
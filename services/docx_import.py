@@ -0,0 +1,205 @@
+"""
+services/docx_import.py
+Streaming DOCX → Quill import.
+
+Previous pipeline (settings/utils.process_docx_upload):
+  temp file → mammoth with every image inlined as a base64 data URI →
+  BeautifulSoup pass #1 (process_html_for_quill) → BeautifulSoup pass #2
+  (html_to_basic_delta) → base64 decoded again by extract_and_upload_images
+  on the next save.
+
+This pipeline:
+  - Reads the upload stream directly (mammoth only needs a seekable file).
+  - Walks mammoth's document tree ONCE through the public
+    `transform_document` hook, building the Quill delta and uploading each
+    embedded image to the `images` bucket as soon as it is met. The HTML
+    converter later reuses the uploaded URL, so no image is ever base64'd.
+  - With offload=True the whole conversion runs in eventlet's OS thread pool
+    (tpool), keeping the hub responsive while large files convert.
+
+Usage:
+    delta, html = import_docx(file.stream, offload=file_size > threshold)
+"""
+from __future__ import annotations
+
+import logging
+
+import mammoth
+from mammoth import documents
+
+logger = logging.getLogger(__name__)
+
+# Word paragraph alignment (w:jc) → Quill align attribute
+_ALIGN = {'center': 'center', 'right': 'right', 'end': 'right', 'both': 'justify', 'distribute': 'justify'}
+
+
+class _DeltaBuilder:
+    """Single-pass walker over a mammoth document that emits Quill ops."""
+
+    def __init__(self, upload_image):
+        self._upload_image = upload_image
+        self.ops: list[dict] = []
+        self.image_urls: dict[int, str] = {}
+
+    # ── Output ────────────────────────────────────────────────────────────────
+
+    def _insert(self, value, attrs: dict | None = None) -> None:
+        op = {'insert': value}
+        if attrs:
+            op['attributes'] = dict(attrs)
+        # Merge consecutive text inserts with identical attributes
+        if self.ops and isinstance(value, str) and value != '\n':
+            last = self.ops[-1]
+            if (isinstance(last['insert'], str) and last['insert'] != '\n'
+                    and last.get('attributes') == op.get('attributes')):
+                last['insert'] += value
+                return
+        self.ops.append(op)
+
+    # ── Walk ──────────────────────────────────────────────────────────────────
+
+    def walk(self, element, attrs: dict | None = None) -> None:
+        attrs = attrs or {}
+
+        if isinstance(element, documents.Paragraph):
+            for child in element.children:
+                self.walk(child)
+            self._insert('\n', self._block_attributes(element))
+
+        elif isinstance(element, documents.Run):
+            run_attrs = dict(attrs)
+            if element.is_bold:
+                run_attrs['bold'] = True
+            if element.is_italic:
+                run_attrs['italic'] = True
+            if element.is_underline:
+                run_attrs['underline'] = True
+            if element.is_strikethrough:
+                run_attrs['strike'] = True
+            valign = getattr(element, 'vertical_alignment', None)
+            if valign in ('superscript', 'subscript'):
+                run_attrs['script'] = 'super' if valign == 'superscript' else 'sub'
+            for child in element.children:
+                self.walk(child, run_attrs)
+
+        elif isinstance(element, documents.Text):
+            if element.value:
+                self._insert(element.value, attrs)
+
+        elif isinstance(element, documents.Hyperlink):
+            link_attrs = dict(attrs)
+            if element.href:
+                link_attrs['link'] = element.href
+            for child in element.children:
+                self.walk(child, link_attrs)
+
+        elif isinstance(element, documents.Tab):
+            self._insert('\t', attrs)
+
+        elif isinstance(element, documents.Break):
+            if element.break_type == 'line':
+                self._insert('\n')
+
+        elif isinstance(element, documents.Image):
+            url = self._store_image(element)
+            if url:
+                self._insert({'image': url})
+
+        elif hasattr(element, 'children'):
+            # Document, Table, TableRow, TableCell, ...
+            for child in element.children:
+                self.walk(child, attrs)
+
+    @staticmethod
+    def _block_attributes(paragraph) -> dict:
+        block = {}
+        style = (paragraph.style_name or paragraph.style_id or '').replace(' ', '').lower()
+        if style.startswith('heading') and style[7:].isdigit():
+            block['header'] = min(int(style[7:]), 6)
+        elif style == 'title':
+            block['header'] = 1
+
+        align = _ALIGN.get(getattr(paragraph, 'alignment', None) or '')
+        if align:
+            block['align'] = align
+
+        numbering = paragraph.numbering
+        if numbering is not None:
+            block['list'] = 'ordered' if numbering.is_ordered else 'bullet'
+            # level_index llega como cadena: "0" es el primer nivel, sin sangría
+            if int(numbering.level_index or 0) > 0:
+                block['indent'] = int(numbering.level_index)
+        return block
+
+    def _store_image(self, image) -> str | None:
+        key = id(image)
+        if key not in self.image_urls:
+            try:
+                from settings.utils import image_ext_from_mime
+                with image.open() as stream:
+                    self.image_urls[key] = self._upload_image(
+                        stream.read(), image_ext_from_mime(image.content_type)
+                    )
+            except Exception as exc:
+                logger.warning(f'[DocxImport] Image skipped: {exc}')
+                self.image_urls[key] = None
+        return self.image_urls[key]
+
+
+def _convert(fileobj, upload_image) -> tuple[dict, str]:
+    builder = _DeltaBuilder(upload_image)
+
+    def transform(document):
+        builder.walk(document)
+        return document
+
+    def img_src(image):
+        # Already uploaded during the tree walk
+        url = builder.image_urls.get(id(image))
+        return {'src': url} if url else {}
+
+    result = mammoth.convert_to_html(
+        fileobj,
+        transform_document=transform,
+        convert_image=mammoth.images.img_element(img_src),
+    )
+    for message in result.messages:
+        logger.warning(f"Mammoth warning: {message}")
+
+    ops = builder.ops
+    if not ops or ops[-1].get('insert') != '\n':
+        ops.append({'insert': '\n'})
+    return {'ops': ops}, result.value
+
+
+def import_docx(fileobj, offload: bool = False) -> tuple[dict, str]:
+    """
+    Convert a DOCX stream to (quill_delta, html), uploading embedded images
+    to the `images` bucket during conversion.
+    """
+    from flask import current_app
+    from settings.utils import upload_image_bytes
+
+    if not offload:
+        return _convert(fileobj, upload_image_bytes)
+
+    # tpool threads have no Flask context; upload_image_bytes needs one for
+    # the local-storage fallback path. That context has its own session, so
+    # the stored_images rows are committed there: the request's session
+    # never sees them and they would be lost with their blobs kept.
+    app = current_app._get_current_object()
+
+    def _run():
+        from settings.extensions import db
+
+        with app.app_context():
+            try:
+                result = _convert(fileobj, upload_image_bytes)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                raise
+            return result
+
+    from eventlet import tpool
+    return tpool.execute(_run)
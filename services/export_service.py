@@ -0,0 +1,285 @@
+"""
+services/export_service.py
+Off-request PDF/DOCX export with a content-addressed render cache.
+
+Architecture:
+  - Rendering (clean_html_for_export + WeasyPrint / python-docx) runs in a
+    ProcessPoolExecutor, never on the eventlet request worker.
+  - Rendered files are stored in the `exports` bucket under a content-addressed
+    name: cache/{sha256(title + html)}_{template_version}.{fmt}. A repeated
+    export of unchanged content is a single stat_object() away.
+  - Cached renders expire: collect_expired() (scripts/tools/
+    gc_export_cache.py) deletes those rendered more than _CACHE_TTL ago, and
+    submit() re-renders instead of reusing one within _CACHE_REUSE_MARGIN
+    of expiry, so a download URL handed out never points at a swept file.
+  - Identical renders in flight are coalesced: a job whose object_name is
+    already being rendered by this process waits on that future instead of
+    scheduling a second render.
+  - Jobs are tracked in Redis (`export:job:{job_id}`, TTL 1h) so any worker can
+    answer a status poll; an in-process dict mirrors them when Redis is down.
+
+Usage:
+    job = ExportService.submit(doc, html, 'pdf', user_id)   # → dict
+    job = ExportService.wait(job['job_id'], timeout=5)       # green-friendly wait
+    job = ExportService.get_job(job_id)
+    report = ExportService.collect_expired(dry_run=True)
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# Bump whenever the CSS / DOCX layout in settings/utils changes so that
+# previously rendered exports are not reused.
+EXPORT_TEMPLATE_VERSION = os.environ.get('EXPORT_TEMPLATE_VERSION', '1')
+
+_EXPORT_WORKERS = int(os.environ.get('EXPORT_WORKERS', '2'))
+_JOB_TTL_SECONDS = 3600
+_KEY_JOB = 'export:job:{job_id}'
+_CACHE_PREFIX = 'cache/'
+_CACHE_TTL = timedelta(days=int(os.environ.get('EXPORT_CACHE_TTL_DAYS', '7')))
+# Job TTL + presigned URL lifetime: a reused render must outlive both
+_CACHE_REUSE_MARGIN = timedelta(hours=2)
+
+MIMETYPES = {
+    'pdf':  'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+
+
+def _render_and_store(html: str, title: str, format_type: str, object_name: str) -> int:
+    """
+    Process-pool entry point: render the export and upload it to the
+    `exports` bucket. Returns the size in bytes. Runs outside any Flask
+    request; only touches settings.utils and the SeaweedFS client.
+    """
+    from settings.utils import export_to_pdf, export_to_docx
+    from settings.extensions import minio_client
+
+    renderer = export_to_pdf if format_type == 'pdf' else export_to_docx
+    buffer = renderer(html, title)
+    if buffer is None:
+        raise RuntimeError(f'Render failed for {object_name}')
+
+    data = buffer.getvalue()
+    minio_client.put_object(
+        bucket_name='exports',
+        object_name=object_name,
+        data=BytesIO(data),
+        length=len(data),
+        content_type=MIMETYPES[format_type],
+    )
+    return len(data)
+
+
+def _parse_mtime(value) -> datetime | None:
+    """Filer listing Mtime (RFC 3339) or HEAD Last-Modified → aware UTC datetime."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(str(value).replace('Z', '+00:00'))
+    except ValueError:
+        try:
+            parsed = parsedate_to_datetime(str(value))
+        except (TypeError, ValueError):
+            return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+class ExportService:
+    """Process-pool backed export jobs with a content-addressed result cache."""
+
+    _pool: ProcessPoolExecutor | None = None
+    _jobs: dict[str, dict] = {}
+    _futures: dict[str, object] = {}
+    _inflight: dict[str, object] = {}      # object_name -> render future
+    _inflight_guard = threading.Lock()
+
+    # ── Keys ──────────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def cache_object_name(html: str, title: str, format_type: str) -> str:
+        digest = hashlib.sha256()
+        digest.update((title or '').encode('utf-8'))
+        digest.update(b'\0')
+        digest.update((html or '').encode('utf-8'))
+        return f'{_CACHE_PREFIX}{digest.hexdigest()}_v{EXPORT_TEMPLATE_VERSION}.{format_type}'
+
+    # ── Jobs ──────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def submit(cls, doc, html: str, format_type: str, user_id: int) -> dict:
+        """
+        Return a job dict for exporting `html`. If the same content was already
+        rendered the job is born 'done' and no work is scheduled; if it is
+        being rendered, the job follows that render.
+        """
+        from settings.extensions import minio_client
+
+        object_name = cls.cache_object_name(html, doc.title, format_type)
+        job = {
+            'job_id':      uuid.uuid4().hex,
+            'document_id': doc.id,
+            'user_id':     user_id,
+            'format':      format_type,
+            'filename':    f'{doc.title}.{format_type}',
+            'object_name': object_name,
+            'status':      'pending',
+            'cached':      False,
+            'created_at':  time.time(),
+        }
+
+        stat = None
+        try:
+            stat = minio_client.find_object('exports', object_name)
+        except Exception:
+            pass  # storage unavailable: render
+        rendered_at = _parse_mtime(stat.last_modified) if stat is not None else None
+        if rendered_at is not None and \
+                datetime.now(timezone.utc) - rendered_at < _CACHE_TTL - _CACHE_REUSE_MARGIN:
+            job.update(status='done', cached=True)
+            cls._save_job(job)
+            return job
+        # Not rendered yet, or about to expire: (re)render
+
+        with cls._inflight_guard:
+            future = cls._inflight.get(object_name)
+            started = future is None
+            if started:
+                future = cls._get_pool().submit(_render_and_store, html, doc.title, format_type, object_name)
+                cls._inflight[object_name] = future
+        # Outside the lock: a future that is already done runs callbacks inline
+        if started:
+            future.add_done_callback(lambda f, name=object_name: cls._on_render_done(name, f))
+        else:
+            logger.debug(f'[Export] Joining in-flight render {object_name}')
+        cls._futures[job['job_id']] = future
+        cls._save_job(job)
+        future.add_done_callback(lambda f, job_id=job['job_id']: cls._on_done(job_id, f))
+        return job
+
+    @classmethod
+    def wait(cls, job_id: str, timeout: float) -> dict | None:
+        """
+        Poll a local job until it finishes or `timeout` elapses. Uses
+        time.sleep, which eventlet patches, so other greenlets keep running.
+        """
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            job = cls.get_job(job_id)
+            if not job or job['status'] in ('done', 'error'):
+                return job
+            time.sleep(0.05)
+        return cls.get_job(job_id)
+
+    @classmethod
+    def get_job(cls, job_id: str) -> dict | None:
+        try:
+            from settings.extensions import redis_client
+            raw = redis_client.get(_KEY_JOB.format(job_id=job_id))
+            if raw:
+                return json.loads(raw)
+        except Exception as exc:
+            logger.debug(f'[Export] Redis job read failed {job_id}: {exc}')
+        return cls._jobs.get(job_id)
+
+    @staticmethod
+    def download_url(job: dict) -> str:
+        from settings.extensions import minio_client
+        return minio_client.presigned_get_object(
+            'exports', job['object_name'], expires=timedelta(hours=1)
+        )
+
+    # ── Cache expiry ──────────────────────────────────────────────────────────
+
+    @staticmethod
+    def collect_expired(dry_run: bool = False, ttl: timedelta = _CACHE_TTL, workers: int = 8) -> dict:
+        """Delete cached renders older than `ttl` (mtime = when rendered)."""
+        from settings.extensions import minio_client
+
+        if ttl <= _CACHE_REUSE_MARGIN:
+            raise ValueError(f'ttl must be longer than {_CACHE_REUSE_MARGIN}, got {ttl}')
+        cutoff = datetime.now(timezone.utc) - ttl
+        report = {'listed': 0, 'expired': 0, 'expired_bytes': 0, 'deleted': 0, 'errors': 0}
+        expired = []
+        # The Filer lists one directory at a time: cache/ is listed as its own path
+        for obj in minio_client.iter_objects(f'exports/{_CACHE_PREFIX.rstrip("/")}'):
+            report['listed'] += 1
+            modified = _parse_mtime(obj.last_modified)
+            if modified is not None and modified < cutoff:
+                expired.append(_CACHE_PREFIX + obj.object_name)
+                report['expired_bytes'] += obj.size or 0
+        report['expired'] = len(expired)
+        if dry_run:
+            report['sample'] = expired[:20]
+            return report
+
+        def _remove(name):
+            try:
+                minio_client.remove_object('exports', name)
+                return True
+            except Exception as exc:
+                logger.error(f'[Export] Cache sweep failed for {name}: {exc}')
+                return False
+
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            results = list(pool.map(_remove, expired))
+        report['deleted'] = sum(results)
+        report['errors'] = len(results) - report['deleted']
+        logger.info(f'[Export] Cache sweep report: {report}')
+        return report
+
+    # ── Internals ─────────────────────────────────────────────────────────────
+
+    @classmethod
+    def _get_pool(cls) -> ProcessPoolExecutor:
+        if cls._pool is None:
+            cls._pool = ProcessPoolExecutor(max_workers=_EXPORT_WORKERS)
+            logger.info(f'[Export] Process pool started with {_EXPORT_WORKERS} workers')
+        return cls._pool
+
+    @classmethod
+    def _on_render_done(cls, object_name: str, future) -> None:
+        with cls._inflight_guard:
+            if cls._inflight.get(object_name) is future:
+                del cls._inflight[object_name]
+
+    @classmethod
+    def _on_done(cls, job_id: str, future) -> None:
+        cls._futures.pop(job_id, None)
+        job = cls._jobs.get(job_id)
+        if job is None:
+            return
+        exc = future.exception()
+        if exc is None:
+            job.update(status='done', size_bytes=future.result())
+        else:
+            logger.error(f'[Export] Job {job_id} failed: {exc}')
+            job.update(status='error', error=str(exc))
+        cls._save_job(job)
+
+    @classmethod
+    def _save_job(cls, job: dict) -> None:
+        cls._jobs[job['job_id']] = job
+        try:
+            from settings.extensions import redis_client
+            redis_client.setex(_KEY_JOB.format(job_id=job['job_id']), _JOB_TTL_SECONDS, json.dumps(job))
+        except Exception as exc:
+            logger.debug(f'[Export] Redis job write failed {job["job_id"]}: {exc}')
+
+        # Bound the local mirror; Redis is the source of truth for old jobs.
+        if len(cls._jobs) > 1000:
+            cutoff = time.time() - _JOB_TTL_SECONDS
+            for jid in [j for j, v in cls._jobs.items() if v['created_at'] < cutoff]:
+                cls._jobs.pop(jid, None)
@@ -0,0 +1,558 @@
+"""
+services/grammar_inference.py
+Grammar-correction inference service (English: Gramformer's T5, French:
+olix3000/french-grammar-correction) running outside the web tier.
+
+routes/multilang_quill.MultiLanguageQuillAnalyzer used to load both models in
+the importing process and run generate(num_beams=4) per text on the calling
+thread: inside an eventlet worker that freezes every socket for seconds, and
+each gunicorn worker would hold its own copy of the weights. Now:
+
+  process   python -m services.grammar_inference --port 5012 --workers 2
+            loads the models once and then forks the worker pool, so the
+            weights (never written after loading) are shared copy-on-write;
+            each worker runs --threads intra-op threads.
+  batching  texts are split into sentences; a dispatcher thread collects the
+            sentences of all concurrent requests, up to --max-batch or
+            --max-wait-ms, and sends them to a free worker as one padded
+            generate() per language. While every worker is busy sentences
+            keep accumulating, so batches grow with load.
+  cache     bounded LRU keyed by sha1(language, sentence) in the front
+            process; identical sentences in flight are computed once.
+  runtime   --int8: torch dynamic int8 quantization of the Linear layers.
+            --onnx: optimum's ONNX Runtime seq2seq models (loaded per worker,
+            ORT sessions are not fork-safe). Both optional, CPU only.
+  API       POST /analyze {"text": ...} → MultiLanguageQuillAnalyzer.analyze
+            result; {"texts": [...]} → {"results": [...]}; an optional
+            "language" ('en'/'fr') skips detection. Every edit carries
+            `offset`/`length`, its character range in the analyzed text.
+            GET /health, GET /stats. GrammarClient is the web tier's pooled
+            client.
+
+Needs torch, transformers, sentencepiece, gramformer and langdetect (plus
+optimum[onnxruntime] for --onnx); the web tier only needs requests.
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import hashlib
+import json
+import logging
+import os
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+EN_MODEL = 'prithivida/grammar_error_correcter_v1'     # Gramformer(models=1)
+FR_MODEL = 'olix3000/french-grammar-correction'
+MODEL_NAMES = {'en': 'Gramformer (EN)', 'fr': 'T5-French (FR)'}
+
+_DEFAULT_URL = 'http://127.0.0.1:5012'
+_MAX_TEXT_CHARS = 50_000
+_REQUEST_TIMEOUT_S = 120
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?…])(\s+)')
+
+# Estado de los procesos worker: se rellena en el padre antes del fork
+_STATE: dict = {}
+
+
+# ── Model side (worker processes) ─────────────────────────────────────────────
+
+class _Seq2Seq:
+    """One correction model: HF seq2seq model + tokenizer + task prefix."""
+
+    def __init__(self, model, tokenizer, prefix: str, max_length: int):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.prefix = prefix
+        self.max_length = max_length
+
+    def correct(self, sentences: List[str], num_beams: int) -> List[str]:
+        import torch
+
+        enc = self.tokenizer([self.prefix + s for s in sentences], return_tensors='pt', padding=True,
+                             truncation=True, max_length=self.max_length)
+        # Una corrección mide lo que la frase: tope de tokens nuevos proporcional a la entrada
+        max_new = min(self.max_length, int(enc['input_ids'].shape[1] * 1.5) + 8)
+        with torch.inference_mode():
+            out = self.model.generate(**enc, max_new_tokens=max_new, num_beams=num_beams, early_stopping=True)
+        return self.tokenizer.batch_decode(out, skip_special_tokens=True)
+
+
+def load_models(int8: bool = False, onnx: bool = False) -> dict:
+    """
+    {'en': _Seq2Seq, 'fr': _Seq2Seq, 'gramformer': Gramformer | None}.
+    Deterministic beam search (Gramformer samples), so results are cacheable.
+    """
+    import torch
+    from transformers import AutoModelForSeq2SeqLM, AutoTokenizer
+
+    gramformer = None
+    try:
+        from gramformer import Gramformer
+        gramformer = Gramformer(models=1, use_gpu=False)    # errant: highlight / get_edits
+        en_model, en_tok = gramformer.correction_model, gramformer.correction_tokenizer
+    except ImportError:
+        logger.warning('[GrammarInference] gramformer no instalado: EN sin highlight/edits de errant')
+        en_model, en_tok = AutoModelForSeq2SeqLM.from_pretrained(EN_MODEL), AutoTokenizer.from_pretrained(EN_MODEL)
+    fr_model, fr_tok = AutoModelForSeq2SeqLM.from_pretrained(FR_MODEL), AutoTokenizer.from_pretrained(FR_MODEL)
+
+    if onnx:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+        en_model = ORTModelForSeq2SeqLM.from_pretrained(EN_MODEL, export=True)
+        fr_model = ORTModelForSeq2SeqLM.from_pretrained(FR_MODEL, export=True)
+        if gramformer is not None:
+            gramformer.correction_model = None
+    else:
+        en_model.eval()
+        fr_model.eval()
+        if int8:
+            import warnings
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')             # torch.ao.quantization deprecation
+                en_model = torch.ao.quantization.quantize_dynamic(en_model, {torch.nn.Linear}, dtype=torch.qint8)
+                fr_model = torch.ao.quantization.quantize_dynamic(fr_model, {torch.nn.Linear}, dtype=torch.qint8)
+
+    return {
+        'en': _Seq2Seq(en_model, en_tok, 'gec: ', 128),
+        'fr': _Seq2Seq(fr_model, fr_tok, 'corriger: ', 512),
+        'gramformer': gramformer,
+    }
+
+
+def _init_worker(threads: int, loader) -> None:
+    import torch
+
+    torch.set_num_threads(max(1, threads))
+    if loader is not None and not _STATE:
+        _STATE.update(loader())                             # --onnx: carga propia por worker
+
+
+def _generate(groups: Dict[str, List[str]], num_beams: int) -> Dict[str, List[str]]:
+    """Worker entry point: one padded generate() per language."""
+    return {lang: _STATE[lang].correct(sentences, num_beams) for lang, sentences in groups.items()}
+
+
+def _annotate_en(original: str, corrected: str) -> tuple:
+    """Worker entry point: errant highlight + edits for an English text."""
+    gramformer = _STATE.get('gramformer')
+    if gramformer is None or original == corrected:
+        return original, []
+    try:
+        html = gramformer.highlight(original, corrected)
+    except Exception:
+        html = original
+    try:
+        # Lo mismo que gramformer.get_edits, conservando el Doc de spaCy para los offsets en caracteres
+        annotator = gramformer.annotator
+        orig, cor = annotator.parse(original), annotator.parse(corrected)
+        edits = []
+        for e in annotator.merge(annotator.align(orig, cor)):
+            e = annotator.classify(e)
+            offset = orig[e.o_start].idx if e.o_start < len(orig) else len(original)
+            end = orig[e.o_end - 1].idx + len(orig[e.o_end - 1]) if e.o_end > e.o_start else offset
+            edits.append({
+                'type': e.type[2:], 'original': e.o_str, 'corrected': e.c_str, 'start': e.o_start, 'end': e.o_end,
+                'offset': offset, 'length': end - offset, 'explanation': explain_en(e.type[2:]),
+            })
+    except Exception:
+        edits = []
+    return html, edits
+
+
+# ── Analysis helpers (same output as the in-process analyzer) ─────────────────
+
+def detect_language(text: str) -> str:
+    """'en' o 'fr'"""
+    try:
+        from langdetect import DetectorFactory, detect
+        DetectorFactory.seed = 0
+        return 'en' if detect(text).startswith('en') else 'fr'
+    except Exception:
+        return 'en'
+
+
+def split_sentences(text: str) -> List[str]:
+    """Sentences and the whitespace between them, alternating: ''.join() gives back `text`."""
+    return _SENTENCE_SPLIT.split(text)
+
+
+def explain_en(error_type: str) -> str:
+    explanations = {
+        "VERB:SVA": "Subject-verb agreement error",
+        "VERB:TENSE": "Wrong verb tense",
+        "PREP": "Wrong preposition",
+        "NOUN:NUM": "Singular/plural mismatch",
+        "ORTH": "Spelling error",
+        "PUNCT": "Punctuation error"
+    }
+    return explanations.get(error_type, "Grammar issue")
+
+
+def highlight_french(original: str, corrected: str) -> str:
+    # Resaltado básico (palabras cambiadas)
+    import difflib
+    diff = difflib.ndiff(original.split(), corrected.split())
+    highlighted = []
+    for word in diff:
+        if word.startswith('- '):
+            highlighted.append(f'<c class="error">{word[2:]}</c>')
+        elif word.startswith('+ '):
+            highlighted.append(f'<span class="correction">{word[2:]}</span>')
+        elif not word.startswith('? '):
+            highlighted.append(word[2:] if word.startswith('  ') else word)
+    return ' '.join(highlighted)
+
+
+def edits_french(original: str, corrected: str) -> List[Dict]:
+    # Ediciones básicas
+    import difflib
+    edits = []
+    spans = [m.span() for m in re.finditer(r'\S+', original)]      # posición de cada palabra de split()
+    matcher = difflib.SequenceMatcher(None, original.split(), corrected.split())
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'replace':
+            for k, (a, b) in enumerate(zip(original.split()[i1:i2], corrected.split()[j1:j2])):
+                edits.append({
+                    "type": "MOD",
+                    "original": a,
+                    "corrected": b,
+                    "start": original.find(a),
+                    "offset": spans[i1 + k][0],
+                    "length": len(a),
+                    "explanation": "Modification suggérée"
+                })
+    return edits
+
+
+def compute_stats(edits: List[Dict], lang: str) -> Dict:
+    total = len(edits)
+    severity = "excellent" if total == 0 else "bon" if total <= 2 else "moyen" if total <= 5 else "à améliorer"
+    if lang == 'en':
+        severity = {"excellent": "excellent", "bon": "good", "moyen": "fair", "à améliorer": "needs work"}.get(severity, severity)
+    return {
+        "total_errors": total,
+        "severity": severity,
+        "language_detected": lang
+    }
+
+
+def empty_result() -> Dict[str, Any]:
+    return {
+        "original": "", "corrected": "", "html": "", "edits": [], "stats": {}, "language": "", "model": ""
+    }
+
+
+# ── Front process: cache, micro-batching, HTTP ────────────────────────────────
+
+class _LRU:
+    """Bounded LRU (thread-safe)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class GrammarService:
+    """Sentence-level dynamic micro-batching over a forked model worker pool."""
+
+    def __init__(self, workers: int = 1, threads: int = 1, max_batch: int = 16, max_wait_ms: float = 5,
+                 cache_size: int = 20_000, num_beams: int = 4, int8: bool = False, onnx: bool = False,
+                 models: dict | None = None):
+        self.workers = max(1, workers)
+        self.threads = threads
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max_wait_ms / 1000
+        self.num_beams = num_beams
+        self.int8 = int8
+        self.onnx = onnx
+        self._models = models
+        self._cache = _LRU(cache_size)
+        self._queue: queue.Queue = queue.Queue()
+        self._inflight: dict[str, Future] = {}
+        self._inflight_guard = threading.Lock()
+        self._slots = threading.Semaphore(self.workers)
+        self._pool: ProcessPoolExecutor | None = None
+        self.batches = self.batched_sentences = 0
+
+    def start(self) -> 'GrammarService':
+        import multiprocessing
+
+        loader = None
+        if self.onnx:
+            loader = functools.partial(load_models, onnx=True)
+        elif self._models is not None:
+            _STATE.update(self._models)
+        else:
+            import torch
+            torch.set_num_threads(1)                        # sin hilos OpenMP vivos antes del fork
+            started = time.monotonic()
+            _STATE.update(load_models(int8=self.int8))
+            logger.info(f'[GrammarInference] Modelos cargados en {time.monotonic() - started:.1f}s '
+                        f'(int8={self.int8})')
+        self._pool = ProcessPoolExecutor(
+            max_workers=self.workers, mp_context=multiprocessing.get_context('fork'),
+            initializer=_init_worker, initargs=(self.threads, loader),
+        )
+        threading.Thread(target=self._dispatch_loop, name='GrammarDispatcher', daemon=True).start()
+        return self
+
+    # ── Analysis ──────────────────────────────────────────────────────────────
+
+    def analyze_many(self, texts: List[str], language: str | None = None) -> List[Dict[str, Any]]:
+        """`language` ('en'/'fr') skips detection: the caller already knows the document's language."""
+        jobs = []
+        for text in texts:
+            if not text or not text.strip():
+                jobs.append(None)
+                continue
+            lang = language if language in MODEL_NAMES else detect_language(text)
+            pieces = split_sentences(text)
+            futures = [self._correct(lang, piece) if i % 2 == 0 and piece.strip() else None
+                       for i, piece in enumerate(pieces)]
+            jobs.append((text, lang, pieces, futures))
+
+        results = []
+        for job in jobs:
+            if job is None:
+                results.append(empty_result())
+                continue
+            text, lang, pieces, futures = job
+            corrected = ''.join(f.result(timeout=_REQUEST_TIMEOUT_S) if f is not None else piece
+                                for piece, f in zip(pieces, futures))
+            if lang == 'en':
+                html, edits = self._pool.submit(_annotate_en, text, corrected).result(timeout=_REQUEST_TIMEOUT_S)
+            else:
+                html, edits = highlight_french(text, corrected), edits_french(text, corrected)
+            results.append({
+                "original": text,
+                "corrected": corrected,
+                "html": html,
+                "edits": edits,
+                "stats": compute_stats(edits, lang),
+                "language": lang,
+                "model": MODEL_NAMES[lang],
+            })
+        return results
+
+    def _correct(self, lang: str, sentence: str) -> Future:
+        key = hashlib.sha1(f'{lang}\0{sentence}'.encode('utf-8')).hexdigest()
+        cached = self._cache.get(key)
+        if cached is not None:
+            future = Future()
+            future.set_result(cached)
+            return future
+        with self._inflight_guard:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                self._queue.put((lang, sentence, key, future))
+        return future
+
+    def _dispatch_loop(self) -> None:
+        while True:
+            self._slots.acquire()                           # un batch en curso por worker
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait_s
+            while len(batch) < self.max_batch:
+                try:
+                    remaining = deadline - time.monotonic()
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            groups: Dict[str, List[str]] = {}
+            for lang, sentence, _, _ in batch:
+                groups.setdefault(lang, []).append(sentence)
+            self.batches += 1
+            self.batched_sentences += len(batch)
+            try:
+                task = self._pool.submit(_generate, groups, self.num_beams)
+            except Exception as e:
+                self._settle(batch, None, e)
+                continue
+            task.add_done_callback(lambda t, batch=batch: self._settle(batch, t, None))
+
+    def _settle(self, batch: list, task, error) -> None:
+        self._slots.release()
+        out = None
+        if error is None:
+            try:
+                out = {lang: iter(sentences) for lang, sentences in task.result().items()}
+            except Exception as e:
+                error = e
+                logger.error(f'[GrammarInference] Batch de {len(batch)} frases falló: {e}')
+        for lang, _, key, future in batch:
+            with self._inflight_guard:
+                self._inflight.pop(key, None)
+            if error is not None:
+                future.set_exception(error)
+                continue
+            corrected = next(out[lang])
+            self._cache.put(key, corrected)
+            future.set_result(corrected)
+
+    def stats(self) -> dict:
+        return {
+            'workers':        self.workers,
+            'max_batch':      self.max_batch,
+            'batches':        self.batches,
+            'sentences':      self.batched_sentences,
+            'avg_batch':      round(self.batched_sentences / self.batches, 2) if self.batches else 0,
+            'queued':         self._queue.qsize(),
+            'cache_entries':  len(self._cache),
+            'cache_hits':     self._cache.hits,
+            'cache_misses':   self._cache.misses,
+        }
+
+
+class _Handler(BaseHTTPRequestHandler):
+    service: GrammarService = None
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            return self._send(200, {'status': 'ok'})
+        if self.path == '/stats':
+            return self._send(200, self.service.stats())
+        self._send(404, {'error': 'not found'})
+
+    def do_POST(self):
+        if self.path != '/analyze':
+            return self._send(404, {'error': 'not found'})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get('Content-Length') or 0)) or b'{}')
+        except ValueError:
+            return self._send(400, {'error': 'invalid JSON'})
+        single = 'texts' not in body
+        texts = [body.get('text', '')] if single else body['texts']
+        language = body.get('language')
+        if not isinstance(texts, list) or not all(isinstance(t, str) for t in texts):
+            return self._send(400, {'error': "'text' must be a string, 'texts' a list of strings"})
+        if sum(len(t) for t in texts) > _MAX_TEXT_CHARS:
+            return self._send(413, {'error': f'more than {_MAX_TEXT_CHARS} characters'})
+        try:
+            results = self.service.analyze_many(texts, language)
+        except Exception as e:
+            logger.error(f'[GrammarInference] /analyze: {e}')
+            return self._send(500, {'error': 'inference failed'})
+        self._send(200, results[0] if single else {'results': results})
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+
+def serve(service: GrammarService, host: str = '127.0.0.1', port: int = 5012):
+    """Start the RPC server in a daemon thread. Returns (server, base URL)."""
+    handler = type('BoundHandler', (_Handler,), {'service': service})
+    server = _Server((host, port), handler)
+    threading.Thread(target=server.serve_forever, name='GrammarHTTP', daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+# ── Web tier ──────────────────────────────────────────────────────────────────
+
+def _create_session() -> requests.Session:
+    sess = requests.Session()
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=32)
+    sess.mount('http://', adapter)
+    return sess
+
+
+class GrammarClient:
+    """Pooled client of the inference service (GRAMMAR_SVC_URL)."""
+
+    _session = None
+
+    def __init__(self, url: str | None = None, timeout: float = _REQUEST_TIMEOUT_S):
+        self.url = (url or os.environ.get('GRAMMAR_SVC_URL', _DEFAULT_URL)).rstrip('/')
+        self.timeout = timeout
+        if GrammarClient._session is None:
+            GrammarClient._session = _create_session()
+
+    def analyze(self, text: str) -> Dict[str, Any]:
+        resp = self._session.post(f'{self.url}/analyze', json={'text': text}, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()
+
+    def analyze_many(self, texts: List[str], language: str | None = None) -> List[Dict[str, Any]]:
+        body = {'texts': texts, 'language': language} if language else {'texts': texts}
+        resp = self._session.post(f'{self.url}/analyze', json=body, timeout=self.timeout)
+        resp.raise_for_status()
+        return resp.json()['results']
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Grammar-correction inference service (CPU)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5012)
+    parser.add_argument('--workers', type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument('--threads', type=int, default=2, help='intra-op threads per worker')
+    parser.add_argument('--max-batch', type=int, default=16)
+    parser.add_argument('--max-wait-ms', type=float, default=5)
+    parser.add_argument('--cache-size', type=int, default=20_000, help='sentences kept in the LRU')
+    parser.add_argument('--num-beams', type=int, default=4)
+    parser.add_argument('--int8', action='store_true', help='dynamic int8 quantization (torch)')
+    parser.add_argument('--onnx', action='store_true', help='ONNX Runtime via optimum')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = GrammarService(args.workers, args.threads, args.max_batch, args.max_wait_ms,
+                             args.cache_size, args.num_beams, args.int8, args.onnx).start()
+    server, base = serve(service, args.host, args.port)
+    logger.info(f'[GrammarInference] {base}/analyze  workers={args.workers}x{args.threads} '
+                f'max_batch={args.max_batch} max_wait={args.max_wait_ms}ms')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,214 @@
+"""
+services/image_cache.py
+Local hot-object cache and fallback index for document_bp.serve_image.
+
+  - HotImageCache: bounded on-disk LRU of objects pulled from the `images`
+    bucket. Cached files are served by path, so send_file can use the WSGI
+    file wrapper (sendfile), answer Range requests, or hand the transfer to
+    nginx via X-Accel-Redirect (IMAGE_ACCEL_REDIRECT_PREFIX).
+  - LocalImageIndex: filename → path map of the local fallback directories
+    (images written while SeaweedFS was down), built with one scandir per
+    directory instead of four os.path.exists() probes per request.
+  - immutable_etag(): content-addressed names ('{sha256}.{ext}' and their
+    variants) never change, so the hash itself is a strong ETag and a
+    matching If-None-Match can be answered before touching storage.
+
+Several gunicorn workers may share the cache directory; each keeps its own
+LRU bookkeeping, so the byte budget is approximate across workers and a file
+evicted by a sibling is treated as a miss.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+LEGACY_CACHE_CONTROL = 'public, max-age=86400'
+
+_INDEX_REFRESH_S = 60
+
+# '{sha256}.{ext}', '{sha256}_w480.webp', '{sha256}_thumb.webp'
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{64})(?:_w\d+|_thumb)?\.[a-z0-9]+$')
+
+_MIMETYPES = {
+    'png':  'image/png',
+    'jpg':  'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'gif':  'image/gif',
+    'webp': 'image/webp',
+}
+
+
+def immutable_etag(filename: str) -> str | None:
+    """Strong ETag for content-addressed names; None for legacy uuid names."""
+    if not _CONTENT_NAME.match(filename):
+        return None
+    # '{sha256}' for originals, '{sha256}_w480' etc. for variants
+    return filename.rsplit('.', 1)[0]
+
+
+def image_mimetype(filename: str) -> str:
+    return _MIMETYPES.get(filename.rsplit('.', 1)[-1].lower(), 'image/png')
+
+
+class HotImageCache:
+    """Bounded on-disk LRU of image objects (process-wide singleton)."""
+
+    _dir: str | None = None
+    _max_bytes = 0
+    _entries: OrderedDict[str, int] = OrderedDict()
+    _size = 0
+    _disabled = False
+    _lock = threading.Lock()
+
+    @classmethod
+    def init(cls, directory: str, max_bytes: int) -> None:
+        os.makedirs(directory, exist_ok=True)
+        existing = []
+        with os.scandir(directory) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.startswith('.'):
+                    st = entry.stat()
+                    existing.append((st.st_atime, entry.name, st.st_size))
+        existing.sort()
+        with cls._lock:
+            cls._dir = directory
+            cls._max_bytes = max_bytes
+            cls._entries = OrderedDict((name, size) for _, name, size in existing)
+            cls._size = sum(size for _, _, size in existing)
+        cls._evict()
+        logger.info(f'[ImageCache] {len(cls._entries)} objects, {cls._size / 1e6:.1f} MB in {directory}')
+
+    @classmethod
+    def _ensure_init(cls) -> bool:
+        if cls._dir is None and not cls._disabled:
+            try:
+                from flask import current_app
+                cls.init(current_app.config['IMAGE_CACHE_DIR'], current_app.config['IMAGE_CACHE_MAX_BYTES'])
+            except Exception as exc:
+                logger.warning(f'[ImageCache] Disabled: {exc}')
+                cls._disabled = True
+        return cls._dir is not None
+
+    @classmethod
+    def directory(cls) -> str | None:
+        return cls._dir
+
+    @classmethod
+    def get(cls, filename: str) -> str | None:
+        """Path of a cached object (marked most recently used) or None."""
+        if not cls._ensure_init():
+            return None
+        with cls._lock:
+            if filename not in cls._entries:
+                return None
+            cls._entries.move_to_end(filename)
+        path = os.path.join(cls._dir, filename)
+        if not os.path.isfile(path):
+            # Evicted by another worker sharing the directory
+            with cls._lock:
+                cls._size -= cls._entries.pop(filename, 0)
+            return None
+        return path
+
+    @classmethod
+    def put(cls, filename: str, data: bytes) -> str | None:
+        """Write an object atomically and return its path (None if uncacheable)."""
+        if not cls._ensure_init() or len(data) > cls._max_bytes:
+            return None
+        path = os.path.join(cls._dir, filename)
+        try:
+            fd, tmp = tempfile.mkstemp(dir=cls._dir, prefix='.tmp-')
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.warning(f'[ImageCache] Could not cache {filename}: {exc}')
+            return None
+        with cls._lock:
+            cls._size += len(data) - cls._entries.pop(filename, 0)
+            cls._entries[filename] = len(data)
+        cls._evict()
+        return path
+
+    @classmethod
+    def discard(cls, filename: str) -> None:
+        if cls._dir is None:
+            return
+        with cls._lock:
+            cls._size -= cls._entries.pop(filename, 0)
+        try:
+            os.remove(os.path.join(cls._dir, filename))
+        except OSError:
+            pass
+
+    @classmethod
+    def _evict(cls) -> None:
+        victims = []
+        with cls._lock:
+            while cls._size > cls._max_bytes and cls._entries:
+                name, size = cls._entries.popitem(last=False)
+                cls._size -= size
+                victims.append(name)
+        for name in victims:
+            try:
+                os.remove(os.path.join(cls._dir, name))
+            except OSError:
+                pass
+
+
+class LocalImageIndex:
+    """filename → path for the local image fallback directories."""
+
+    _paths: dict[str, str] = {}
+    _built_at = 0.0
+    _lock = threading.Lock()
+
+    @staticmethod
+    def _directories() -> list[str]:
+        from flask import current_app
+        root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        # Same order as the historical os.path.exists() probes: first wins
+        return [
+            os.path.join(current_app.config.get('UPLOAD_FOLDER', 'uploads'), 'images'),
+            os.path.join(root, 'uploads', 'images'),
+            os.path.join(os.getcwd(), 'uploads', 'images'),
+            os.path.join(os.getcwd(), 'static', 'uploads', 'images'),
+        ]
+
+    @classmethod
+    def _build(cls) -> None:
+        paths = {}
+        for directory in reversed(cls._directories()):
+            try:
+                with os.scandir(directory) as it:
+                    for entry in it:
+                        if entry.is_file():
+                            paths[entry.name] = entry.path
+            except OSError:
+                continue
+        with cls._lock:
+            cls._paths = paths
+            cls._built_at = time.monotonic()
+        logger.info(f'[ImageIndex] Indexed {len(paths)} local images')
+
+    @classmethod
+    def lookup(cls, filename: str) -> str | None:
+        path = cls._paths.get(filename)
+        if path is None and time.monotonic() - cls._built_at > _INDEX_REFRESH_S:
+            # Rebuilt at most once per interval, so unknown names stay cheap
+            cls._build()
+            path = cls._paths.get(filename)
+        return path
+
+    @classmethod
+    def register(cls, filename: str, path: str) -> None:
+        with cls._lock:
+            cls._paths[filename] = path
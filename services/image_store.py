@@ -0,0 +1,241 @@
+"""
+services/image_store.py
+Content-addressed, deduplicated image store for the `images` bucket.
+
+Architecture:
+  - Images are keyed by SHA-256 of the uploaded bytes; the object name is
+    '{sha256}.{ext}'. A known hash short-circuits optimize_image() and the
+    upload entirely (one primary-key lookup on stored_images).
+  - Responsive WebP variants and a thumbnail are generated ONCE per image in
+    a ProcessPoolExecutor and stored next to the original:
+        {sha256}_w480.webp, {sha256}_w960.webp, {sha256}_thumb.webp
+  - document_image_refs rows link documents to the images they ever used.
+    Refs are only added while a document lives (so restoring an older
+    version never points at a collected image) and dropped when the document
+    is permanently deleted. collect_garbage() removes unreferenced images
+    older than a grace period (fresh uploads are not referenced until the
+    next save).
+
+Usage:
+    url = ImageStore.store(image_bytes, 'png')
+    ImageStore.add_refs(doc.id, delta)
+    ImageStore.release_document(doc.id)
+    report = ImageStore.collect_garbage(dry_run=True)
+"""
+from __future__ import annotations
+
+import hashlib
+import logging
+import os
+import re
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+IMAGE_URL_PREFIX = '/document_bp/api/image/'
+# /api/image/upload returns the unprefixed route; both point at serve_image
+_SERVED_PREFIXES = (IMAGE_URL_PREFIX, '/api/image/')
+
+VARIANT_WIDTHS = (480, 960)
+THUMBNAIL_SIZE = (240, 240)
+
+_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', '2'))
+_GC_GRACE = timedelta(days=1)
+
+# '{sha256}.{ext}' as produced by store(); legacy uuid names never match.
+_CONTENT_NAME = re.compile(r'^([0-9a-f]{64})\.[a-z0-9]+$')
+
+
+def variant_names(sha256: str) -> list[str]:
+    names = [f'{sha256}_w{w}.webp' for w in VARIANT_WIDTHS]
+    names.append(f'{sha256}_thumb.webp')
+    return names
+
+
+def _render_variants(sha256: str, image_bytes: bytes) -> int:
+    """Process-pool entry point: build and upload WebP variants. Returns count."""
+    from PIL import Image
+    from settings.extensions import minio_client
+
+    source = Image.open(BytesIO(image_bytes))
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA')
+
+    outputs = []
+    for width in VARIANT_WIDTHS:
+        if source.width > width:
+            height = round(source.height * width / source.width)
+            outputs.append((f'{sha256}_w{width}.webp', source.resize((width, height), Image.Resampling.LANCZOS)))
+        else:
+            outputs.append((f'{sha256}_w{width}.webp', source))
+    thumb = source.copy()
+    thumb.thumbnail(THUMBNAIL_SIZE, Image.Resampling.LANCZOS)
+    outputs.append((f'{sha256}_thumb.webp', thumb))
+
+    for name, image in outputs:
+        buffer = BytesIO()
+        image.save(buffer, format='WEBP', quality=80, method=4)
+        data = buffer.getvalue()
+        minio_client.put_object(
+            bucket_name='images',
+            object_name=name,
+            data=BytesIO(data),
+            length=len(data),
+            content_type='image/webp',
+        )
+    return len(outputs)
+
+
+class ImageStore:
+    """Deduplicating image storage keyed by SHA-256."""
+
+    _pool: ProcessPoolExecutor | None = None
+
+    # ── Write ─────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def store(cls, image_bytes: bytes, file_ext: str) -> str:
+        """
+        Store an image once and return its public URL. Duplicate content is
+        detected before optimisation/upload. The new stored_images row joins
+        the caller's transaction (flushed in a savepoint, committed by caller).
+        """
+        from sqlalchemy.exc import IntegrityError
+        from models.models import StoredImage
+        from settings.extensions import db
+        from settings.utils import optimize_image, put_image_object
+
+        sha256 = hashlib.sha256(image_bytes).hexdigest()
+        existing = db.session.get(StoredImage, sha256)
+        if existing is not None:
+            logger.info(f'[ImageStore] Duplicate image reused: {existing.filename}')
+            return IMAGE_URL_PREFIX + existing.filename
+
+        optimized = optimize_image(image_bytes, file_ext)
+        record = StoredImage(sha256=sha256, file_ext=file_ext, size_bytes=len(optimized))
+        put_image_object(record.filename, optimized, file_ext)
+
+        try:
+            with db.session.begin_nested():
+                db.session.add(record)
+        except IntegrityError:
+            # Same content stored concurrently by another request — same object name.
+            pass
+        else:
+            cls._schedule_variants(sha256, optimized)
+
+        return IMAGE_URL_PREFIX + record.filename
+
+    # ── References ────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def hashes_in_delta(delta: dict) -> set[str]:
+        """SHA-256s of the content-addressed images referenced by a delta."""
+        found = set()
+        for op in (delta or {}).get('ops', []):
+            insert = op.get('insert')
+            if isinstance(insert, dict):
+                src = insert.get('image')
+                if isinstance(src, str) and src.startswith(_SERVED_PREFIXES):
+                    match = _CONTENT_NAME.match(src.rsplit('/', 1)[-1])
+                    if match:
+                        found.add(match.group(1))
+        return found
+
+    @classmethod
+    def add_refs(cls, document_id: int, delta: dict) -> int:
+        """Add missing document → image refs (caller commits). Returns new refs."""
+        from models.models import DocumentImageRef, StoredImage
+        from settings.extensions import db
+
+        hashes = cls.hashes_in_delta(delta)
+        if not hashes:
+            return 0
+
+        known = {
+            sha for (sha,) in db.session.query(DocumentImageRef.image_sha256)
+            .filter(DocumentImageRef.document_id == document_id,
+                    DocumentImageRef.image_sha256.in_(hashes))
+        }
+        missing = hashes - known
+        if missing:
+            # Only images that exist in stored_images can be referenced (FK)
+            stored = {
+                sha for (sha,) in db.session.query(StoredImage.sha256)
+                .filter(StoredImage.sha256.in_(missing))
+            }
+            db.session.add_all(
+                DocumentImageRef(document_id=document_id, image_sha256=sha) for sha in stored
+            )
+            return len(stored)
+        return 0
+
+    @staticmethod
+    def release_document(document_id: int) -> None:
+        """Drop all refs of a permanently deleted document (caller commits)."""
+        from models.models import DocumentImageRef
+        DocumentImageRef.query.filter_by(document_id=document_id).delete(synchronize_session=False)
+
+    # ── Garbage collection ────────────────────────────────────────────────────
+
+    @staticmethod
+    def collect_garbage(dry_run: bool = False, grace: timedelta = _GC_GRACE, batch_size: int = 500) -> dict:
+        """
+        Delete images (and their variants) that no document references and
+        that are older than `grace`. Returns a report; with dry_run nothing
+        is deleted.
+        """
+        from models.models import DocumentImageRef, StoredImage
+        from settings.extensions import db, minio_client
+        from services.image_cache import HotImageCache
+
+        cutoff = datetime.utcnow() - grace
+        orphans = (
+            StoredImage.query
+            .outerjoin(DocumentImageRef, DocumentImageRef.image_sha256 == StoredImage.sha256)
+            .filter(DocumentImageRef.image_sha256.is_(None), StoredImage.created_at < cutoff)
+            .limit(batch_size)
+            .all()
+        )
+        report = {
+            'dry_run':     dry_run,
+            'orphans':     len(orphans),
+            'bytes':       sum(img.size_bytes or 0 for img in orphans),
+            'deleted':     0,
+            'errors':      0,
+        }
+        if dry_run:
+            report['sample'] = [img.filename for img in orphans[:20]]
+            return report
+
+        for img in orphans:
+            try:
+                for name in [img.filename] + variant_names(img.sha256):
+                    minio_client.remove_object('images', name)
+                    HotImageCache.discard(name)
+                db.session.delete(img)
+                report['deleted'] += 1
+            except Exception as exc:
+                logger.error(f'[ImageStore] GC failed for {img.filename}: {exc}')
+                report['errors'] += 1
+        db.session.commit()
+        logger.info(f'[ImageStore] GC report: {report}')
+        return report
+
+    # ── Internals ─────────────────────────────────────────────────────────────
+
+    @classmethod
+    def _schedule_variants(cls, sha256: str, image_bytes: bytes) -> None:
+        try:
+            if cls._pool is None:
+                cls._pool = ProcessPoolExecutor(max_workers=_VARIANT_WORKERS)
+            future = cls._pool.submit(_render_variants, sha256, image_bytes)
+            future.add_done_callback(
+                lambda f: f.exception() and logger.warning(
+                    f'[ImageStore] Variants failed for {sha256}: {f.exception()}'
+                )
+            )
+        except Exception as exc:
+            logger.warning(f'[ImageStore] Could not schedule variants for {sha256}: {exc}')
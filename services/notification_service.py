@@ -7,6 +7,28 @@ Flujo por cada notificación:
   3. _emit_to_user() → emite via SocketIO al room 'user_{id}'.
   4. Invalida caché Redis del contador de no leídas.
 
+Fan-out (create_bulk), misma notificación para N destinatarios:
+  1. Preferencias de silencio en una query por bloque de _BULK_CHUNK.
+  2. Un INSERT multi-fila y un único commit; las filas llevan un batch_id
+     propio del fan-out y los ids se releen por él.
+  3. Contadores de no leídas con un COUNT … GROUP BY y SETEX en pipeline.
+  4. 'notification:new' por room; 'notification:count_update' agrupado por
+     valor del contador (un emit a varios rooms = un PUBLISH en la cola).
+  Audiencias muy grandes: enqueue_bulk() → NotificationFanoutWorker.
+
+Contador de no leídas (badge): contador exacto en Redis, no caché con TTL.
+  - Se siembra con COUNT(*) la primera vez que se lee (SET NX, TTL 7 días).
+  - create → +1; mark_read → -1 sólo si el UPDATE … AND read = 0 cambió la
+    fila; mark_all_read → -filas actualizadas. Ajustes atómicos en Lua
+    (adjust_counter) y sólo sobre contadores sembrados. Sembrado el contador,
+    es exacto aunque los ajustes lleguen desordenados; la siembra (COUNT y
+    SET no atómicos con los commits concurrentes) puede desviarlo en ±n.
+  - El Socket.IO 'notification:count_update' se emite sólo si cambió.
+  - Reconciliación periódica (reconcile_unread_counts): un contador que
+    difiere de MySQL dos pasadas seguidas con los mismos valores se corrige
+    con compare-and-set; una diferencia transitoria (commit aún sin su +1)
+    no se toca.
+
 Uso:
     from services.notification_service import NotificationService, NotificationType
     NotificationService.create(
@@ -21,20 +43,33 @@ Uso:
 
 from __future__ import annotations
 
+import json
 import logging
+import threading
+import time
+import uuid
 from datetime import datetime
 from typing import Optional
 
 from flask import current_app
 
 from models.models import Notification, NotificationType, UserNotificationPreference
-from settings.extensions import db, redis_client
+from settings.extensions import adjust_counter, compare_and_set_counter, db, redis_client
 
 logger = logging.getLogger(__name__)
 
-# TTL del caché del badge de no leídas (segundos)
-_UNREAD_CACHE_TTL = 30
-_UNREAD_CACHE_KEY = "notif:unread:{user_id}"
+# Contador exacto de no leídas del badge
+_UNREAD_TTL = 7 * 86400                          # sin actividad expira y se re-siembra
+_KEY_UNREAD = "notif:unread:{prefix}:{id}"
+_KEY_UNREAD_TOUCHED = "notif:unread:touched"     # SET de contadores a reconciliar
+_KEY_UNREAD_SUSPECT = "notif:unread:suspect"     # HASH contador → "redis:mysql" observado
+_RECONCILE_S = 300
+_RECONCILE_BATCH = 500
+
+# Fan-out
+_BULK_CHUNK = 1000                       # ids por IN (...) / INSERT
+_KEY_BULK_QUEUE = "notif:bulk:queue"     # LIST de trabajos de enqueue_bulk
+_BULK_POLL_S = 5
 
 
 class NotificationService:
@@ -98,13 +133,13 @@ class NotificationService:
             current_app.logger.error(f"[NotificationService] Error al guardar notificación: {exc}")
             return None
 
-        # Invalida caché del badge
+        # +1 en el contador del badge
         if user_id:
-            NotificationService._invalidate_unread_cache(user_id, is_student=False)
-            NotificationService._emit_to_user(user_id, notif, is_student=False)
+            count = NotificationService._adjust_unread(user_id, 1, is_student=False)
+            NotificationService._emit_to_user(user_id, notif, is_student=False, count=count)
         elif student_id:
-            NotificationService._invalidate_unread_cache(student_id, is_student=True)
-            NotificationService._emit_to_user(student_id, notif, is_student=True)
+            count = NotificationService._adjust_unread(student_id, 1, is_student=True)
+            NotificationService._emit_to_user(student_id, notif, is_student=True, count=count)
 
         return notif
 
@@ -118,31 +153,111 @@ class NotificationService:
         priority: int = 2,
         metadata: dict | None = None,
         course_id: int | None = None,
+        student_ids: list[int] | None = None,
     ) -> list[Notification]:
         """
-        Crea la misma notificación para múltiples usuarios.
+        Crea la misma notificación para múltiples usuarios y/o estudiantes.
 
         Útil para: Modo Revisión Final activado (todos los colaboradores),
-        deadline reminder, etc.
+        deadline reminder, etc. Un solo commit para toda la audiencia; para
+        miles de destinatarios desde una request, usar enqueue_bulk().
 
         Returns:
             Lista de Notification creadas (excluye las silenciadas).
         """
-        created: list[Notification] = []
-        for uid in user_ids:
-            notif = NotificationService.create(
-                user_id=uid,
-                type=type,
-                title=title,
-                message=message,
-                url=url,
-                priority=priority,
-                metadata=metadata,
-                course_id=course_id,
+        user_ids = list(dict.fromkeys(uid for uid in user_ids or [] if uid))
+        student_ids = list(dict.fromkeys(sid for sid in student_ids or [] if sid))
+        if user_ids:
+            muted = NotificationService._muted_user_ids(user_ids, type, course_id)
+            user_ids = [uid for uid in user_ids if uid not in muted]
+        if not user_ids and not student_ids:
+            return []
+
+        created_at = datetime.utcnow().replace(microsecond=0)   # DATETIME sin fracción
+        batch_id = uuid.uuid4().hex
+        base = {
+            'type': type, 'title': title[:200], 'message': message, 'url': url,
+            'read': False, 'priority': priority, 'metadata_': metadata or {},
+            'created_at': created_at, 'batch_id': batch_id,
+        }
+        try:
+            for column, ids in (('user_id', user_ids), ('student_id', student_ids)):
+                for i in range(0, len(ids), _BULK_CHUNK):
+                    db.session.execute(
+                        db.insert(Notification),
+                        [{**base, column: rid} for rid in ids[i:i + _BULK_CHUNK]],
+                    )
+            notifs = NotificationService._fetch_inserted(batch_id, base)
+            db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            current_app.logger.error(f"[NotificationService] Error en fan-out de {len(user_ids) + len(student_ids)} notificaciones: {exc}")
+            return []
+
+        for is_student, group in ((False, [n for n in notifs if n.user_id]),
+                                  (True, [n for n in notifs if n.student_id])):
+            if group:
+                ids = [n.student_id if is_student else n.user_id for n in group]
+                counts = NotificationService._bump_unread_counts(ids, is_student)
+                NotificationService._emit_bulk(group, counts, is_student)
+        return notifs
+
+    @staticmethod
+    def enqueue_bulk(
+        user_ids: list[int],
+        type: NotificationType,
+        title: str,
+        message: str,
+        url: str | None = None,
+        priority: int = 2,
+        metadata: dict | None = None,
+        course_id: int | None = None,
+        student_ids: list[int] | None = None,
+    ) -> bool:
+        """
+        create_bulk() fuera de la request: el trabajo va a la cola Redis y lo
+        procesa NotificationFanoutWorker. Sin Redis se ejecuta en línea.
+
+        Returns:
+            True si quedó encolado, False si se ejecutó en línea.
+        """
+        job = {
+            'user_ids': list(user_ids or []), 'student_ids': list(student_ids or []),
+            'type': type.value, 'title': title, 'message': message, 'url': url,
+            'priority': priority, 'metadata': metadata or {}, 'course_id': course_id,
+        }
+        try:
+            queued = redis_client.lpush(_KEY_BULK_QUEUE, json.dumps(job))
+        except Exception as exc:
+            logger.warning(f"[NotificationService] Cola de fan-out no disponible: {exc}")
+            queued = None
+        if queued is None:
+            NotificationService.create_bulk(
+                user_ids, type, title, message, url=url, priority=priority,
+                metadata=metadata, course_id=course_id, student_ids=student_ids,
             )
-            if notif:
-                created.append(notif)
-        return created
+            return False
+        return True
+
+    @staticmethod
+    def _fetch_inserted(batch_id: str, base) -> list[Notification]:
+        """
+        Ids de las filas recién insertadas (MySQL no tiene RETURNING), leídos
+        por el batch_id del fan-out: dos fan-outs del mismo tipo en el mismo
+        segundo no se confunden, y los ids de un INSERT multi-fila no tienen
+        por qué ser consecutivos (innodb_autoinc_lock_mode=2). Se construyen
+        objetos transitorios para to_dict() sin recargarlos de la sesión.
+        """
+        rows = (
+            db.session.query(Notification.id, Notification.user_id, Notification.student_id)
+            .filter(Notification.batch_id == batch_id)
+            .order_by(Notification.id)
+            .all()
+        )
+        return [
+            Notification(id=notif_id, user_id=user_id, student_id=student_id, **base)
+            for notif_id, user_id, student_id in rows
+        ]
 
     # ------------------------------------------------------------------
     # Lectura / estado
@@ -151,65 +266,119 @@ class NotificationService:
     @staticmethod
     def mark_read(notification_id: int, id: int, is_student: bool = False) -> bool:
         """Marca una única notificación como leída."""
-        if is_student:
-            notif = Notification.query.filter_by(id=notification_id, student_id=id).first()
-        else:
-            notif = Notification.query.filter_by(id=notification_id, user_id=id).first()
+        column = Notification.student_id if is_student else Notification.user_id
+        # UPDATE condicional: con dos marcados concurrentes sólo uno cambia la fila
+        updated = db.session.query(Notification).filter(
+            Notification.id == notification_id, column == id, Notification.read == False,  # noqa: E712
+        ).update({'read': True}, synchronize_session=False)
+        db.session.commit()
 
-        if not notif:
-            return False
-        
-        if not notif.read:
-            notif.read = True
-            db.session.commit()
-            NotificationService._invalidate_unread_cache(id, is_student)
-            
-            # Emitir actualización de contador via SocketIO
-            NotificationService._emit_unread_update(id, is_student)
-            
+        if not updated:
+            # Inexistente / ajena (False) o ya leída (True): el contador no cambia
+            return db.session.query(Notification.id).filter(
+                Notification.id == notification_id, column == id,
+            ).first() is not None
+
+        count = NotificationService._adjust_unread(id, -1, is_student)
+        NotificationService._emit_unread_update(id, is_student, count)
         return True
 
     @staticmethod
     def mark_all_read(id: int, is_student: bool = False) -> bool:
         """Marca todas las notificaciones del usuario como leídas."""
-        if is_student:
-             db.session.query(Notification).filter_by(student_id=id, read=False).update({'read': True})
-        else:
-             db.session.query(Notification).filter_by(user_id=id, read=False).update({'read': True})
-        
+        column = Notification.student_id if is_student else Notification.user_id
+        updated = db.session.query(Notification).filter(
+            column == id, Notification.read == False,  # noqa: E712
+        ).update({'read': True}, synchronize_session=False)
         db.session.commit()
-        NotificationService._invalidate_unread_cache(id, is_student)
-        
-        # Emitir actualización de contador via SocketIO
-        NotificationService._emit_unread_update(id, is_student)
+
+        if updated:
+            # -filas marcadas en vez de SET 0: una notificación creada durante
+            # el UPDATE conserva su +1
+            count = NotificationService._adjust_unread(id, -updated, is_student)
+            NotificationService._emit_unread_update(id, is_student, count)
         return True
 
     @staticmethod
     def get_unread_count(id: int, is_student: bool = False) -> int:
         """
-        Retorna el total de notificaciones no leídas del usuario (profe o alumno).
+        Retorna el total de no leídas del usuario (profe o alumno). Lee el
+        contador exacto; si no existe lo siembra con un COUNT(*).
         """
-        prefix = "student" if is_student else "user"
-        cache_key = f"notif:unread:{prefix}:{id}"
-        
+        key = NotificationService._unread_key(id, is_student)
         try:
-            cached = redis_client.get(cache_key)
+            cached = redis_client.get(key)
             if cached is not None:
-                return int(cached)
+                return max(0, int(cached))
         except Exception:
             pass
 
-        if is_student:
-            count = Notification.query.filter_by(student_id=id, read=False).count()
-        else:
-            count = Notification.query.filter_by(user_id=id, read=False).count()
-            
+        count = NotificationService._count_unread_db(id, is_student)
         try:
-            redis_client.setex(cache_key, _UNREAD_CACHE_TTL, count)
+            if not redis_client.set(key, count, nx=True, ex=_UNREAD_TTL):
+                # Otro proceso lo sembró (o ya recibió ajustes): ese valor manda
+                cached = redis_client.get(key)
+                if cached is not None:
+                    return max(0, int(cached))
+            redis_client.sadd(_KEY_UNREAD_TOUCHED, NotificationService._unread_member(id, is_student))
         except Exception:
             pass
         return count
 
+    @staticmethod
+    def reconcile_unread_counts(limit: int = _RECONCILE_BATCH) -> dict:
+        """
+        Compara con MySQL los contadores modificados desde la última pasada.
+        Una diferencia se corrige sólo si se observa igual (mismo valor en
+        Redis y en MySQL) en dos pasadas seguidas: así no se pisa un +1/-1
+        que aún no llegó tras su commit.
+        """
+        report = {'checked': 0, 'suspect': 0, 'fixed': 0}
+        try:
+            members = redis_client.spop(_KEY_UNREAD_TOUCHED, limit) or []
+        except Exception as exc:
+            logger.warning(f"[NotificationService] Reconciliación no disponible: {exc}")
+            return report
+
+        by_prefix: dict[str, list[int]] = {'user': [], 'student': []}
+        for member in members:
+            prefix, _, rid = member.partition(':')
+            if prefix in by_prefix and rid.isdigit():
+                by_prefix[prefix].append(int(rid))
+
+        for prefix, ids in by_prefix.items():
+            if not ids:
+                continue
+            is_student = prefix == 'student'
+            keys = [NotificationService._unread_key(rid, is_student) for rid in ids]
+            members = [NotificationService._unread_member(rid, is_student) for rid in ids]
+            pipe = redis_client.pipeline(transaction=False)
+            for key in keys:
+                pipe.get(key)
+            pipe.hmget(_KEY_UNREAD_SUSPECT, members)
+            results = pipe.execute()
+            values, suspects = results[:-1], results[-1]
+            actual = NotificationService._count_unread_db_many(ids, is_student)
+
+            pipe = redis_client.pipeline(transaction=False)
+            for rid, key, member, value, suspect in zip(ids, keys, members, values, suspects):
+                report['checked'] += 1
+                if value is None or int(value) == actual[rid]:
+                    pipe.hdel(_KEY_UNREAD_SUSPECT, member)
+                    continue
+                observation = f"{value}:{actual[rid]}"
+                if suspect == observation:
+                    if compare_and_set_counter(key, value, actual[rid], _UNREAD_TTL):
+                        report['fixed'] += 1
+                        logger.warning(f"[NotificationService] Contador {member} corregido: {value} → {actual[rid]}")
+                    pipe.hdel(_KEY_UNREAD_SUSPECT, member)
+                else:
+                    report['suspect'] += 1
+                    pipe.hset(_KEY_UNREAD_SUSPECT, member, observation)
+                    pipe.sadd(_KEY_UNREAD_TOUCHED, member)
+            pipe.execute()
+        return report
+
     @staticmethod
     def get_recent(
         id: int,
@@ -329,9 +498,12 @@ class NotificationService:
         pref = UserNotificationPreference.query.filter_by(user_id=user_id).first()
         if not pref:
             return False
+        return NotificationService._pref_mutes(pref, type, course_id)
 
+    @staticmethod
+    def _pref_mutes(pref, type: NotificationType, course_id: int | None, now: datetime | None = None) -> bool:
         # 1. Silencio general temporal
-        if pref.muted_until and datetime.utcnow() < pref.muted_until:
+        if pref.muted_until and (now or datetime.utcnow()) < pref.muted_until:
             return True
 
         # 2. Tipo silenciado
@@ -348,29 +520,144 @@ class NotificationService:
         return False
 
     @staticmethod
-    def _emit_unread_update(id: int, is_student: bool = False) -> None:
+    def _muted_user_ids(user_ids: list[int], type: NotificationType, course_id: int | None = None) -> set[int]:
+        """_is_muted() para muchos usuarios: una query por bloque."""
+        now = datetime.utcnow()
+        muted: set[int] = set()
+        for i in range(0, len(user_ids), _BULK_CHUNK):
+            prefs = UserNotificationPreference.query.filter(
+                UserNotificationPreference.user_id.in_(user_ids[i:i + _BULK_CHUNK])
+            ).all()
+            muted.update(p.user_id for p in prefs if NotificationService._pref_mutes(p, type, course_id, now))
+        return muted
+
+    @staticmethod
+    def _emit_unread_update(id: int, is_student: bool = False, count: int | None = None) -> None:
         """Emite solo el contador de no leídas."""
         prefix = "student" if is_student else "user"
         room_name = f"{prefix}_{id}"
         try:
             from settings.extensions import socketio as sio
-            count = NotificationService.get_unread_count(id, is_student)
+            if count is None:
+                count = NotificationService.get_unread_count(id, is_student)
             sio.emit('notification:count_update', {'count': count}, room=room_name)
         except Exception:
             pass
 
+    # ------------------------------------------------------------------
+    # Contador de no leídas
+    # ------------------------------------------------------------------
+
     @staticmethod
-    def _invalidate_unread_cache(id: int, is_student: bool = False) -> None:
-        """Elimina la clave de caché de no leídas."""
-        prefix = "student" if is_student else "user"
-        cache_key = f"notif:unread:{prefix}:{id}"
+    def _unread_key(id: int, is_student: bool = False) -> str:
+        return _KEY_UNREAD.format(prefix="student" if is_student else "user", id=id)
+
+    @staticmethod
+    def _unread_member(id: int, is_student: bool = False) -> str:
+        return f"{'student' if is_student else 'user'}:{id}"
+
+    @staticmethod
+    def _count_unread_db(id: int, is_student: bool = False) -> int:
+        if is_student:
+            return Notification.query.filter_by(student_id=id, read=False).count()
+        return Notification.query.filter_by(user_id=id, read=False).count()
+
+    @staticmethod
+    def _count_unread_db_many(ids: list[int], is_student: bool = False) -> dict[int, int]:
+        """COUNT(*) de no leídas de muchos destinatarios (GROUP BY)."""
+        column = Notification.student_id if is_student else Notification.user_id
+        counts = dict.fromkeys(ids, 0)
+        for i in range(0, len(ids), _BULK_CHUNK):
+            counts.update(
+                db.session.query(column, db.func.count(Notification.id))
+                .filter(column.in_(ids[i:i + _BULK_CHUNK]), Notification.read == False)  # noqa: E712
+                .group_by(column)
+                .all()
+            )
+        return counts
+
+    @staticmethod
+    def _adjust_unread(id: int, delta: int, is_student: bool = False) -> int | None:
+        """
+        Aplica `delta` al contador tras el commit. Devuelve el valor nuevo, o
+        None si no estaba sembrado (lo sembrará la próxima lectura).
+        """
+        key = NotificationService._unread_key(id, is_student)
         try:
-            redis_client.delete(cache_key)
+            value = adjust_counter(key, delta)
+            if value is False:
+                # Scripts Lua no registrados: invalidar, la próxima lectura re-siembra
+                redis_client.delete(key)
+                value = None
+            redis_client.sadd(_KEY_UNREAD_TOUCHED, NotificationService._unread_member(id, is_student))
+        except Exception:
+            value = None
+        # Negativo sólo si un -1 adelantó a su +1: al badge nunca llega < 0
+        return None if value is None else max(0, int(value))
+
+    @staticmethod
+    def _bump_unread_counts(ids: list[int], is_student: bool = False) -> dict[int, int]:
+        """
+        +1 en el contador de cada destinatario (pipeline); los no sembrados
+        se siembran con un COUNT … GROUP BY, que ya incluye la fila nueva.
+        """
+        keys = [NotificationService._unread_key(rid, is_student) for rid in ids]
+        members = [NotificationService._unread_member(rid, is_student) for rid in ids]
+        values: list = [None] * len(ids)
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            if adjust_counter(keys[0], 1, client=pipe) is not False:
+                for key in keys[1:]:
+                    adjust_counter(key, 1, client=pipe)
+                pipe.sadd(_KEY_UNREAD_TOUCHED, *members)
+                values = pipe.execute()[:len(keys)]
+            else:
+                pipe.delete(*keys)
+                pipe.execute()
         except Exception:
             pass
 
+        counts = {rid: max(0, int(v)) for rid, v in zip(ids, values) if v is not None}
+        missing = [rid for rid, v in zip(ids, values) if v is None]
+        if missing:
+            seeded = NotificationService._count_unread_db_many(missing, is_student)
+            counts.update(seeded)
+            try:
+                pipe = redis_client.pipeline(transaction=False)
+                for rid, count in seeded.items():
+                    pipe.set(NotificationService._unread_key(rid, is_student), count, nx=True, ex=_UNREAD_TTL)
+                pipe.execute()
+            except Exception:
+                pass
+        return counts
+
     @staticmethod
-    def _emit_to_user(id: int, notification: Notification, is_student: bool = False) -> None:
+    def _emit_bulk(notifications: list[Notification], counts: dict[int, int], is_student: bool = False) -> None:
+        """
+        Emite un fan-out: 'notification:new' por room (el id cambia) y un solo
+        'notification:count_update' por valor de contador, a todos sus rooms.
+        """
+        prefix = "student" if is_student else "user"
+        try:
+            from settings.extensions import socketio as sio
+            rooms_by_count: dict[int, list[str]] = {}
+            for notif in notifications:
+                rid = notif.student_id if is_student else notif.user_id
+                room_name = f"{prefix}_{rid}"
+                payload = notif.to_dict()
+                payload['unread_count'] = counts.get(rid, 0)
+                sio.emit('notification:new', payload, room=room_name)
+                rooms_by_count.setdefault(payload['unread_count'], []).append(room_name)
+            for count, rooms in rooms_by_count.items():
+                sio.emit('notification:count_update', {'count': count}, to=rooms)
+            logger.info(f"[NotificationService] Fan-out: {len(notifications)} emits + "
+                        f"{len(rooms_by_count)} count updates ({prefix})")
+        except Exception as exc:
+            current_app.logger.warning(f"[NotificationService] SocketIO fan-out fallido ({prefix}): {exc}")
+
+    @staticmethod
+    def _emit_to_user(id: int, notification: Notification, is_student: bool = False,
+                      count: int | None = None) -> None:
         """
         Emite la notificación vía SocketIO al room personal del usuario/estudiante.
         """
@@ -380,7 +667,7 @@ class NotificationService:
         try:
             from settings.extensions import socketio as sio
             payload = notification.to_dict()
-            payload['unread_count'] = NotificationService.get_unread_count(id, is_student)
+            payload['unread_count'] = count if count is not None else NotificationService.get_unread_count(id, is_student)
             
             logger.info(f"[NotificationService] Emitting 'notification:new' to room '{room_name}' (priority={notification.priority})")
             sio.emit('notification:new', payload, room=room_name)
@@ -395,3 +682,72 @@ class NotificationService:
             current_app.logger.warning(
                 f"[NotificationService] SocketIO emit fallido para {prefix} {id}: {exc}"
             )
+
+
+class NotificationFanoutWorker:
+    """
+    Procesa los trabajos de enqueue_bulk() y, cada _RECONCILE_S, reconcilia
+    los contadores de no leídas (un hilo por proceso).
+    """
+
+    _thread = None
+    _stop_event = threading.Event()
+    _app = None
+
+    @classmethod
+    def start(cls, app):
+        if cls._thread is not None:
+            return
+        cls._app = app
+        cls._stop_event.clear()
+        cls._thread = threading.Thread(target=cls._run_loop, name='NotificationFanoutWorker', daemon=True)
+        cls._thread.start()
+        logger.info('[NotificationService] NotificationFanoutWorker iniciado en segundo plano')
+
+    @classmethod
+    def stop(cls):
+        cls._stop_event.set()
+        if cls._thread:
+            cls._thread.join(timeout=5)
+            cls._thread = None
+
+    @classmethod
+    def _run_loop(cls):
+        last_reconcile = time.monotonic()
+        while not cls._stop_event.is_set():
+            if time.monotonic() - last_reconcile >= _RECONCILE_S:
+                last_reconcile = time.monotonic()
+                cls._reconcile()
+            started = time.monotonic()
+            try:
+                item = redis_client.brpop(_KEY_BULK_QUEUE, timeout=_BULK_POLL_S)
+            except Exception as exc:
+                logger.error(f'[NotificationService] Error leyendo cola de fan-out: {exc}')
+                item = None
+            if not item:
+                # Sin Redis (o con error) brpop vuelve al instante: no girar en vacío
+                if time.monotonic() - started < 1:
+                    cls._stop_event.wait(_BULK_POLL_S)
+                continue
+            try:
+                job = json.loads(item[1])
+                with cls._app.app_context():
+                    created = NotificationService.create_bulk(
+                        job['user_ids'], NotificationType(job['type']), job['title'], job['message'],
+                        url=job.get('url'), priority=job.get('priority', 2),
+                        metadata=job.get('metadata'), course_id=job.get('course_id'),
+                        student_ids=job.get('student_ids'),
+                    )
+                logger.info(f'[NotificationService] Fan-out en segundo plano: {len(created)} notificaciones')
+            except Exception as exc:
+                logger.error(f'[NotificationService] Error procesando fan-out: {exc}')
+
+    @classmethod
+    def _reconcile(cls):
+        try:
+            with cls._app.app_context():
+                report = NotificationService.reconcile_unread_counts()
+            if report['fixed'] or report['suspect']:
+                logger.info(f'[NotificationService] Reconciliación de contadores: {report}')
+        except Exception as exc:
+            logger.error(f'[NotificationService] Error reconciliando contadores: {exc}')
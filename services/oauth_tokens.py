@@ -0,0 +1,337 @@
+"""
+services/oauth_tokens.py
+OAuth tokens of the cloud-storage integrations (User.tokens), decoded and
+cached per worker, with single-flight refresh.
+
+Before, every integration route loaded User.tokens and json.loads-ed it, and
+a request that found the token expired refreshed it on its own: N concurrent
+requests on an expired token meant N refresh calls to the provider and N
+read-modify-write saves of the whole blob, the last one winning (a provider
+connected in between could be lost). Now:
+
+  cache    user_id → decoded tokens, per worker. Entries are validated with
+           one Redis GET of a version counter that every save bumps (instead
+           of a SELECT + json.loads); without Redis they live _CACHE_TTL_S.
+  refresh  ahead of expiry (_REFRESH_AHEAD_S), single-flight on two levels:
+           a per-process lock per (user, provider) for the greenlets of one
+           worker, and a Redis lock across workers. The holder re-reads the
+           row (someone may have refreshed already), calls the provider once
+           and saves; the others wait for the lock to go away and read the
+           new token. While the current token has not actually expired
+           nobody waits: it is used as is and the holder refreshes behind.
+  save     read-modify-write of one provider's entry under SELECT … FOR
+           UPDATE, so saves for different providers of the same user don't
+           overwrite each other.
+
+provider_http is the pooled requests session shared by the token endpoint
+and the provider calls in routes/routes_integrations.py.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import secrets
+import threading
+import time
+from datetime import datetime, timedelta
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+_REFRESH_AHEAD_S = 300
+_CACHE_TTL_S = 60
+_CACHE_MAX = 10_000
+_LOCK_TTL_S = 30
+_WAIT_S = 15
+_HTTP_TIMEOUT = 15
+_WRITE_ATTEMPTS = 3
+_KEY_VERSION = 'oauth:tokens:ver:{user_id}'
+_KEY_LOCK = 'oauth:refresh:{user_id}:{provider}'
+
+
+def _create_session() -> requests.Session:
+    """Sesión HTTP compartida: pool grande (greenlets concurrentes) y reintentos en métodos idempotentes."""
+    sess = requests.Session()
+    retry = Retry(total=3, backoff_factor=1, status_forcelist=[429, 500, 502, 503, 504])
+    adapter = HTTPAdapter(max_retries=retry, pool_connections=8, pool_maxsize=32)
+    sess.mount('http://', adapter)
+    sess.mount('https://', adapter)
+    # Headers para evitar problemas de user-agent
+    sess.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'
+    })
+    return sess
+
+
+provider_http = _create_session()
+
+
+class TokenManager:
+    """Per-user OAuth tokens: {provider: {access_token, refresh_token, expires_at, connected_at}}."""
+
+    _cache: dict = {}                  # user_id -> (version, deadline, tokens)
+    _locks: dict = {}                  # 'user:provider' -> threading.Lock
+    _locks_guard = threading.Lock()
+
+    # ── Reads ─────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def get_all(cls, user_id: int) -> dict:
+        """Decoded tokens of the user (a copy: callers may edit it)."""
+        version = cls._version(user_id)
+        entry = cls._cache.get(user_id)
+        if entry is None or entry[0] != version or time.monotonic() >= entry[1]:
+            entry = cls._remember(user_id, version, cls._load(user_id))
+        return {provider: dict(info) for provider, info in entry[2].items()}
+
+    @classmethod
+    def get(cls, user_id: int, provider: str) -> dict | None:
+        return cls.get_all(user_id).get(provider)
+
+    @staticmethod
+    def _expires_at(token_info: dict):
+        try:
+            return datetime.fromisoformat(token_info['expires_at'])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    @classmethod
+    def is_expired(cls, token_info: dict) -> bool:
+        expires_at = cls._expires_at(token_info)
+        return expires_at is not None and datetime.now() >= expires_at
+
+    @classmethod
+    def needs_refresh(cls, token_info: dict) -> bool:
+        """Expired or expiring within _REFRESH_AHEAD_S (expires_at is local time, as stored)."""
+        expires_at = cls._expires_at(token_info)
+        return expires_at is not None and datetime.now() >= expires_at - timedelta(seconds=_REFRESH_AHEAD_S)
+
+    # ── Writes ────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def set(cls, user_id: int, provider: str, token_info: dict) -> bool:
+        """Store one provider's entry (connect)."""
+        return cls._update(user_id, lambda tokens: tokens.__setitem__(provider, token_info)) is not None
+
+    @classmethod
+    def remove(cls, user_id: int, provider: str) -> bool:
+        """Drop one provider's entry (disconnect)."""
+        return cls._update(user_id, lambda tokens: tokens.pop(provider, None)) is not None
+
+    @classmethod
+    def replace_all(cls, user_id: int, tokens: dict) -> bool:
+        """Overwrite the whole blob (legacy save_user_tokens callers)."""
+        def mutate(current):
+            current.clear()
+            current.update(tokens)
+        return cls._update(user_id, mutate) is not None
+
+    # ── Refresh ───────────────────────────────────────────────────────────────
+
+    @classmethod
+    def refresh(cls, user_id: int, provider: str, config: dict) -> bool:
+        """
+        Make sure (user, provider) has a token that is not about to expire,
+        refreshing it at most once across the cluster. `config` is the
+        provider's OAUTH_CONFIG entry (token_url, client_id, client_secret).
+        True when the stored token is usable afterwards.
+        """
+        from settings.extensions import redis_client
+
+        current = cls.get(user_id, provider)
+        if current is None or not current.get('refresh_token'):
+            return current is not None and not cls.is_expired(current)
+        if not cls.needs_refresh(current):
+            return True
+
+        lock = cls._local_lock(f'{user_id}:{provider}')
+        if not lock.acquire(blocking=False):
+            if not cls.is_expired(current):
+                return True                      # sigue valiendo; otro greenlet lo está renovando
+            lock.acquire()
+        try:
+            current = cls.get(user_id, provider)
+            if current is None:
+                return False
+            if not cls.needs_refresh(current):
+                return True                      # otro greenlet de este worker ya lo hizo
+
+            key = _KEY_LOCK.format(user_id=user_id, provider=provider)
+            owner = secrets.token_hex(8)
+            if not cls._acquire(key, owner):
+                if not cls.is_expired(current):
+                    return True                  # sigue valiendo; el que tiene el lock lo renueva
+                return cls._wait_for(user_id, provider, key)
+            try:
+                current = cls._fresh(user_id).get(provider)
+                if current is None:
+                    return False                 # desconectado mientras tanto
+                if not cls.needs_refresh(current):
+                    return True                  # otro worker ya lo renovó
+                if cls._refresh_now(user_id, provider, current, config):
+                    return True
+                return not cls.is_expired(current)
+            finally:
+                try:
+                    if redis_client.get(key) == owner:
+                        redis_client.delete(key)
+                except Exception:
+                    pass
+        finally:
+            lock.release()
+
+    @classmethod
+    def _refresh_now(cls, user_id: int, provider: str, current: dict, config: dict) -> bool:
+        try:
+            response = provider_http.post(config['token_url'], timeout=_HTTP_TIMEOUT, data={
+                'grant_type': 'refresh_token',
+                'refresh_token': current['refresh_token'],
+                'client_id': config['client_id'],
+                'client_secret': config['client_secret'],
+            })
+            response.raise_for_status()
+            fresh = response.json()
+        except (requests.RequestException, ValueError) as e:
+            logger.warning(f'[OAuthTokens] Error renovando token user={user_id} {provider}: {e}')
+            return False
+
+        def mutate(tokens):
+            entry = tokens.get(provider)
+            if entry is None:
+                return                           # desconectado durante la renovación
+            entry['access_token'] = fresh['access_token']
+            entry['expires_at'] = (datetime.now() + timedelta(seconds=fresh.get('expires_in', 3600))).isoformat()
+            if 'refresh_token' in fresh:
+                entry['refresh_token'] = fresh['refresh_token']
+
+        return cls._update(user_id, mutate) is not None
+
+    @classmethod
+    def _wait_for(cls, user_id: int, provider: str, key: str) -> bool:
+        """Another worker is refreshing an expired token: wait for it to finish."""
+        from settings.extensions import redis_client
+
+        deadline = time.monotonic() + _WAIT_S
+        while time.monotonic() < deadline:
+            time.sleep(0.05)
+            try:
+                if not redis_client.exists(key):
+                    break
+            except Exception:
+                break
+        current = cls._fresh(user_id).get(provider)
+        return current is not None and not cls.is_expired(current)
+
+    @staticmethod
+    def _acquire(key: str, owner: str) -> bool:
+        from settings.extensions import redis_client
+
+        try:
+            if redis_client.set(key, owner, nx=True, ex=_LOCK_TTL_S):
+                return True
+            # Sin Redis (stub → None, ping → None) sólo queda el lock del proceso
+            return not redis_client.ping()
+        except Exception:
+            return True
+
+    @classmethod
+    def _local_lock(cls, key: str) -> threading.Lock:
+        with cls._locks_guard:
+            lock = cls._locks.get(key)
+            if lock is None:
+                lock = cls._locks[key] = threading.Lock()
+            return lock
+
+    # ── Storage ───────────────────────────────────────────────────────────────
+
+    @staticmethod
+    def _version(user_id: int):
+        from settings.extensions import redis_client
+
+        try:
+            return redis_client.get(_KEY_VERSION.format(user_id=user_id))
+        except Exception:
+            return None
+
+    @staticmethod
+    def _load(user_id: int) -> dict:
+        from models.models import User
+        from settings.extensions import db
+
+        try:
+            raw = db.session.execute(db.select(User.tokens).where(User.id == user_id)).scalar()
+            return json.loads(raw) if raw else {}
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f'[OAuthTokens] Error leyendo tokens user={user_id}: {e}')
+            return {}
+
+    @classmethod
+    def _fresh(cls, user_id: int) -> dict:
+        """Tokens straight from the database, refreshing the cache."""
+        version = cls._version(user_id)
+        return cls._remember(user_id, version, cls._load(user_id))[2]
+
+    @classmethod
+    def _remember(cls, user_id: int, version, tokens: dict):
+        entry = (version, time.monotonic() + _CACHE_TTL_S, tokens)
+        cls._cache[user_id] = entry
+        while len(cls._cache) > _CACHE_MAX:
+            cls._cache.pop(next(iter(cls._cache)), None)
+        return entry
+
+    @classmethod
+    def _update(cls, user_id: int, mutate) -> dict | None:
+        """
+        Read-modify-write of the user's tokens under a row lock. `mutate`
+        edits the decoded dict in place. Returns the saved tokens, or None
+        when the user does not exist or the write failed.
+        """
+        from sqlalchemy.exc import OperationalError
+
+        from models.models import User
+        from settings.extensions import db, redis_client
+
+        for attempt in range(_WRITE_ATTEMPTS):
+            try:
+                raw = db.session.execute(
+                    db.select(User.tokens).where(User.id == user_id).with_for_update()
+                ).one_or_none()
+                if raw is None:
+                    db.session.rollback()
+                    logger.warning(f'[OAuthTokens] Usuario {user_id} no encontrado')
+                    return None
+                tokens = json.loads(raw[0]) if raw[0] else {}
+                mutate(tokens)
+                db.session.execute(db.update(User).where(User.id == user_id).values(tokens=json.dumps(tokens)))
+                db.session.commit()
+                break
+            except OperationalError as e:
+                # Deadlock / lock wait (MySQL), "database is locked" (SQLite): se repite
+                db.session.rollback()
+                if attempt + 1 == _WRITE_ATTEMPTS:
+                    logger.error(f'[OAuthTokens] Error guardando tokens user={user_id}: {e}')
+                    return None
+                time.sleep(0.05 * (attempt + 1))
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f'[OAuthTokens] Error guardando tokens user={user_id}: {e}')
+                return None
+
+        # Después del commit: quien lea la versión nueva encuentra ya la fila nueva
+        version = None
+        try:
+            key = _KEY_VERSION.format(user_id=user_id)
+            pipe = redis_client.pipeline()
+            if pipe is not None:
+                pipe.incr(key)
+                pipe.expire(key, 30 * 86400)
+                version = str(pipe.execute()[0])
+        except Exception as e:
+            logger.warning(f'[OAuthTokens] No se pudo publicar la versión user={user_id}: {e}')
+            version = secrets.token_hex(4)   # no coincide con nada: la próxima lectura va a la BD
+        cls._remember(user_id, version, tokens)
+        return tokens
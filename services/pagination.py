@@ -0,0 +1,185 @@
+"""
+services/pagination.py
+Keyset (cursor) pagination shared by the list endpoints.
+
+Offset pagination (`LIMIT n OFFSET k`) makes MySQL read and discard k rows,
+so page 500 costs 500× page 1. Keyset pagination remembers the sort key of
+the last row instead and continues with
+
+    WHERE sort <= :v AND (sort < :v OR id < :id) ORDER BY sort DESC, id DESC
+
+which is an index range scan of `per_page + 1` rows at any depth when a
+composite index (…filters, sort, id) backs the query. `id` breaks ties, so
+the order is total and stable while rows are inserted.
+
+Cursors are opaque to clients: urlsafe base64 of [sort value, id, scope].
+`scope` names the listing (and its sort), so a cursor from one endpoint is
+rejected by another instead of silently returning the wrong rows.
+
+Backwards compatibility: endpoints keep accepting `page`. Without a cursor
+the first page is the same query with OFFSET (page-1)·per_page, and every
+response carries the legacy fields (total, pages, current_page, has_next,
+has_prev) plus `next_cursor`. Requests with a cursor skip the COUNT.
+Listings that used to be unbounded default to LEGACY_LIST_LIMIT rows.
+
+Usage:
+    page = Paginator.paginate(query, Document.updated_at, Document.id,
+                              cursor=request.args.get('cursor'),
+                              page=request.args.get('page', 1, type=int),
+                              per_page=per_page, scope='documents')
+    return jsonify({'documents': [d.to_dict() for d in page.items], **page.meta()})
+"""
+from __future__ import annotations
+
+import base64
+import bisect
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+
+MAX_PER_PAGE = 100
+# Listings that used to return every row (trash, versions, folders, comments,
+# submissions): clients that don't page keep getting the whole list in
+# realistic cases, but one request can no longer load an unbounded set.
+LEGACY_LIST_LIMIT = 500
+
+
+class InvalidCursor(ValueError):
+    """Cursor malformado o emitido por otro listado."""
+
+
+class KeysetPage:
+    """One page of results plus the navigation metadata of the response."""
+
+    def __init__(self, items, next_cursor, per_page, page=None, total=None, has_prev=False):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+        self.page = page
+        self.total = total
+        self.has_prev = has_prev
+
+    @property
+    def has_next(self) -> bool:
+        return self.next_cursor is not None
+
+    @property
+    def pages(self):
+        if self.total is None:
+            return None
+        return -(-self.total // self.per_page) if self.total else 0
+
+    # Same names as flask_sqlalchemy's Pagination, for templates
+    @property
+    def prev_num(self):
+        return self.page - 1 if self.page and self.page > 1 else None
+
+    @property
+    def next_num(self):
+        return self.page + 1 if self.page and self.has_next else None
+
+    def meta(self) -> dict:
+        return {
+            'total':        self.total,
+            'pages':        self.pages,
+            'current_page': self.page,
+            'per_page':     self.per_page,
+            'has_next':     self.has_next,
+            'has_prev':     self.has_prev,
+            'next_cursor':  self.next_cursor,
+        }
+
+
+class Paginator:
+    """Keyset pagination over a (sort column, id column) pair."""
+
+    @staticmethod
+    def encode_cursor(value, row_id: int, scope: str) -> str:
+        if isinstance(value, datetime):
+            value = {'dt': value.isoformat()}
+        raw = json.dumps([value, row_id, scope], separators=(',', ':')).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor: str, scope: str):
+        """Returns (sort value, id); raises InvalidCursor."""
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            value, row_id, cursor_scope = json.loads(raw)
+            if isinstance(value, dict):
+                value = datetime.fromisoformat(value['dt'])
+            row_id = int(row_id)
+        except (ValueError, TypeError, KeyError):
+            raise InvalidCursor('Cursor inválido')
+        if cursor_scope != scope:
+            raise InvalidCursor('Cursor de otro listado')
+        return value, row_id
+
+    @classmethod
+    def paginate(cls, query, sort_col, id_col, *, cursor: str | None = None, page: int = 1,
+                 per_page: int = 20, descending: bool = True, scope: str = '',
+                 count: bool = True, max_per_page: int = MAX_PER_PAGE) -> KeysetPage:
+        """
+        Page `query` by (sort_col, id_col). sort_col must be NOT NULL for the
+        rows of the listing. Without a cursor, `page` selects an offset page
+        (legacy clients); with one, the page that follows it.
+        """
+        per_page = max(1, min(per_page, max_per_page))
+        if descending:
+            ordered = query.order_by(sort_col.desc(), id_col.desc())
+        else:
+            ordered = query.order_by(sort_col.asc(), id_col.asc())
+
+        total = None
+        if cursor:
+            value, row_id = cls.decode_cursor(cursor, scope)
+            if descending:
+                after = and_(sort_col <= value, or_(sort_col < value, id_col < row_id))
+            else:
+                after = and_(sort_col >= value, or_(sort_col > value, id_col > row_id))
+            rows = ordered.filter(after).limit(per_page + 1).all()
+            current_page, has_prev = None, True
+        else:
+            page = max(1, page)
+            if count:
+                total = query.order_by(None).count()
+            rows = ordered.offset((page - 1) * per_page).limit(per_page + 1).all()
+            current_page, has_prev = page, page > 1
+
+        items = rows[:per_page]
+        next_cursor = None
+        if len(rows) > per_page:
+            last = items[-1]
+            next_cursor = cls.encode_cursor(getattr(last, sort_col.key), getattr(last, id_col.key), scope)
+        return KeysetPage(items, next_cursor, per_page, page=current_page, total=total, has_prev=has_prev)
+
+    @classmethod
+    def paginate_list(cls, items: list, key, *, cursor: str | None = None, page: int = 1,
+                      per_page: int = 20, descending: bool = True, scope: str = '',
+                      max_per_page: int = MAX_PER_PAGE) -> KeysetPage:
+        """
+        Same contract and cursors as paginate(), over a list already sorted
+        by `key(item) -> (sort value, id)` — for listings served from a cache.
+        """
+        per_page = max(1, min(per_page, max_per_page))
+        if cursor:
+            bound = cls.decode_cursor(cursor, scope)
+            keys = [key(item) for item in items]
+            if descending:
+                start = next((i for i, k in enumerate(keys) if k < bound), len(items))
+            else:
+                start = bisect.bisect_right(keys, bound)
+            current_page, has_prev = None, True
+        else:
+            page = max(1, page)
+            start = (page - 1) * per_page
+            current_page, has_prev = page, page > 1
+
+        rows = items[start:start + per_page + 1]
+        page_items = rows[:per_page]
+        next_cursor = None
+        if len(rows) > per_page:
+            next_cursor = cls.encode_cursor(*key(page_items[-1]), scope)
+        return KeysetPage(page_items, next_cursor, per_page, page=current_page,
+                          total=None if cursor else len(items), has_prev=has_prev)
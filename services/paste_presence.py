@@ -0,0 +1,253 @@
+"""
+paste_presence.py — Server-side presence check for paste evidence.
+
+Until now the student editor's DocumentSyncWatcher decided which pastes had
+left the document and reported their paste_uuids to /revalidate: one more
+round-trip per edit burst, and evidence stayed active (or was dropped)
+whenever the watcher did not run or its report was forged. Now every save
+recomputes presence on the server:
+
+  - Each PastedInternetContent fragment of the document is normalized
+    (case-folded words) and cut into chunks of _CHUNK_WORDS words; the last
+    chunk is the fragment's final _CHUNK_WORDS words so every chunk has the
+    same weight.
+  - One Aho-Corasick automaton per document over all chunks, on word ids
+    instead of characters: the saved text is scanned once, one step per
+    word, and words no chunk contains reset the automaton.
+  - coverage = % of a fragment's chunks found in the text. A fragment is
+    active while coverage >= _MIN_COVERAGE; removed fragments whose text
+    comes back (undo) are reactivated.
+  - Changed rows (is_active, is_removed, presence_coverage) are written with
+    a single UPDATE ... CASE statement.
+
+The automaton is cached per process and document and only rebuilt when the
+set of fragments changes; the chunks of known fragments are kept, so a new
+paste loads the text of that paste alone. Rows are never deleted (forensic
+trail), which makes the fragment ids a complete cache key.
+
+Usage:
+    PastePresence.on_save(doc.id, delta, doc.content_hash)
+    PastePresence.refresh(doc.id, plain_text, doc.content_hash)
+    PastePresence.refresh_stored(doc)
+"""
+from __future__ import annotations
+
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict, deque
+
+logger = logging.getLogger(__name__)
+
+_CHUNK_WORDS = 8
+_MIN_COVERAGE = 50            # % of chunks that keeps a fragment active
+_CACHE_DOCUMENTS = 256
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+def normalize(text: str) -> list[str]:
+    """Case-folded words of `text`: spacing, punctuation and line breaks do not count."""
+    return _WORD.findall((text or '').casefold())
+
+
+def chunks(words: list[str]) -> list[tuple[str, ...]]:
+    """Consecutive _CHUNK_WORDS-word runs of a fragment (one shorter chunk for short fragments)."""
+    if len(words) <= _CHUNK_WORDS:
+        return [tuple(words)] if words else []
+    out = [tuple(words[i:i + _CHUNK_WORDS]) for i in range(0, len(words) - _CHUNK_WORDS + 1, _CHUNK_WORDS)]
+    if len(words) % _CHUNK_WORDS:
+        out.append(tuple(words[-_CHUNK_WORDS:]))
+    return out
+
+
+class WordAutomaton:
+    """Aho-Corasick automaton whose alphabet is words: patterns are word tuples."""
+
+    def __init__(self, patterns: list[tuple[str, ...]]):
+        self.vocab: dict[str, int] = {}
+        goto: list[dict[int, int]] = [{}]
+        out: list[tuple[int, ...]] = [()]
+        for pid, words in enumerate(patterns):
+            state = 0
+            for word in words:
+                wid = self.vocab.setdefault(word, len(self.vocab))
+                nxt = goto[state].get(wid)
+                if nxt is None:
+                    nxt = goto[state][wid] = len(goto)
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            out[state] += (pid,)
+
+        fail = [0] * len(goto)
+        pending = deque(goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for wid, nxt in goto[state].items():
+                pending.append(nxt)
+                f = fail[state]
+                while f and wid not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(wid, 0)
+                out[nxt] += out[fail[nxt]]
+        self.goto, self.fail, self.out = goto, fail, out
+
+    def scan(self, words: list[str]) -> set[int]:
+        """Ids of the patterns that occur in `words`, in one pass."""
+        vocab, goto, fail, out = self.vocab, self.goto, self.fail, self.out
+        found: set[int] = set()
+        state = 0
+        for word in words:
+            wid = vocab.get(word)
+            if wid is None:
+                state = 0
+                continue
+            while state and wid not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(wid, 0)
+            if out[state]:
+                found.update(out[state])
+        return found
+
+
+class _DocumentIndex:
+    """Chunks and automaton of one document's fragments."""
+
+    def __init__(self, fragment_chunks: dict[int, list[tuple[str, ...]]]):
+        self.fragment_chunks = fragment_chunks
+        patterns: dict[tuple[str, ...], int] = {}
+        self.fragment_patterns = {
+            fid: [patterns.setdefault(chunk, len(patterns)) for chunk in frag]
+            for fid, frag in fragment_chunks.items()
+        }
+        self.automaton = WordAutomaton(list(patterns))
+        self._last: tuple[str | None, set[int]] = (None, set())   # (content_hash, chunks found)
+
+    def coverage(self, text: str, content_hash: str | None = None) -> dict[int, int]:
+        """Fragment id → % of its chunks present in `text` (scan skipped for an already checked hash)."""
+        checked_hash, found = self._last
+        if content_hash is None or content_hash != checked_hash:
+            found = self.automaton.scan(normalize(text))
+            self._last = (content_hash, found)
+        return {
+            fid: round(100 * sum(pid in found for pid in pids) / len(pids))
+            for fid, pids in self.fragment_patterns.items() if pids
+        }
+
+
+class PastePresence:
+    """Recomputes is_active / presence_coverage of paste evidence (see module docstring)."""
+
+    _cache: OrderedDict[int, _DocumentIndex] = OrderedDict()
+    _lock = threading.Lock()
+
+    @classmethod
+    def refresh(cls, doc_id: int, text: str, content_hash: str | None = None) -> dict:
+        """
+        Check the document's fragments against its saved plain text and write
+        the rows whose state changed; commits.
+
+        Returns:
+            {'checked', 'deactivated', 'reactivated', 'coverage': {paste_uuid: %}}
+        """
+        from sqlalchemy import case, update
+
+        from models.paste_evidence import PastedInternetContent as P
+        from settings.extensions import db
+
+        rows = (
+            db.session.query(P.id, P.paste_uuid, P.is_active, P.presence_coverage)
+            .filter(P.document_id == doc_id)
+            .all()
+        )
+        report = {'checked': 0, 'deactivated': 0, 'reactivated': 0, 'coverage': {}}
+        if not rows:
+            return report
+
+        index = cls._index(doc_id, {row.id for row in rows})
+        coverage = index.coverage(text, content_hash)
+        changed = {}
+        for row in rows:
+            pct = coverage.get(row.id)
+            if pct is None:
+                continue        # nothing to look for (no words)
+            active = pct >= _MIN_COVERAGE
+            report['coverage'][row.paste_uuid] = pct
+            if active != row.is_active or pct != row.presence_coverage:
+                changed[row.id] = (active, pct)
+                if active != row.is_active:
+                    report['reactivated' if active else 'deactivated'] += 1
+        report['checked'] = len(report['coverage'])
+
+        if changed:
+            db.session.execute(
+                update(P)
+                .where(P.id.in_(list(changed)))
+                .values(
+                    is_active=case({fid: a for fid, (a, _) in changed.items()}, value=P.id),
+                    is_removed=case({fid: not a for fid, (a, _) in changed.items()}, value=P.id),
+                    presence_coverage=case({fid: pct for fid, (_, pct) in changed.items()}, value=P.id),
+                )
+                .execution_options(synchronize_session=False)
+            )
+            db.session.commit()
+            if report['deactivated'] or report['reactivated']:
+                logger.info('[PastePresence] doc=%s deactivated=%d reactivated=%d',
+                            doc_id, report['deactivated'], report['reactivated'])
+        return report
+
+    @classmethod
+    def on_save(cls, doc_id: int, delta, content_hash: str | None = None) -> None:
+        """refresh() after a save has committed; failures are logged, never raised to the save."""
+        from services.search_index import extract_text
+        from settings.extensions import db
+
+        try:
+            cls.refresh(doc_id, extract_text(delta), content_hash)
+        except Exception as exc:
+            db.session.rollback()
+            logger.warning(f'[PastePresence] Error revalidando doc={doc_id}: {exc}')
+
+    @classmethod
+    def refresh_stored(cls, doc) -> dict | None:
+        """refresh() against the stored content of `doc`; None if the blob is unreadable."""
+        from services.search_index import extract_text
+        from settings.utils import load_from_minio_compressed
+
+        if doc.storage_type == 'minio' and doc.minio_path:
+            delta, _ = load_from_minio_compressed(doc.minio_path)
+            if delta is None:
+                return None
+        else:
+            try:
+                delta = json.loads(doc.content_delta) if doc.content_delta else {}
+            except ValueError:
+                delta = {}
+        return cls.refresh(doc.id, extract_text(delta), doc.content_hash)
+
+    @classmethod
+    def _index(cls, doc_id: int, fragment_ids: set[int]) -> _DocumentIndex:
+        """Cached index of the document, rebuilt when its fragment ids changed."""
+        from models.paste_evidence import PastedInternetContent as P
+        from settings.extensions import db
+
+        with cls._lock:
+            index = cls._cache.get(doc_id)
+            if index is not None:
+                cls._cache.move_to_end(doc_id)
+        if index is not None and index.fragment_chunks.keys() == fragment_ids:
+            return index
+
+        known = {fid: c for fid, c in (index.fragment_chunks.items() if index else ()) if fid in fragment_ids}
+        missing = fragment_ids - known.keys()
+        if missing:
+            for fid, pasted_text in db.session.query(P.id, P.pasted_text).filter(P.id.in_(list(missing))):
+                known[fid] = chunks(normalize(pasted_text))
+        index = _DocumentIndex(known)
+        with cls._lock:
+            cls._cache[doc_id] = index
+            cls._cache.move_to_end(doc_id)
+            while len(cls._cache) > _CACHE_DOCUMENTS:
+                cls._cache.popitem(last=False)
+        return index
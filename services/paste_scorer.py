@@ -3,12 +3,17 @@ paste_scorer.py — Heuristic engine for scoring internet-copy likelihood.
 
 Operates entirely on client-supplied clipboard metadata. Zero external API calls.
 Score range: 0–100. Records with score < 30 are discarded (low-risk noise).
+
+The clipboard HTML (up to 50 KB) is lower-cased once per paste and every
+signal is first looked up as a plain substring of that copy; the regex only
+runs when its literal is there, so pages without links or tracking params
+cost one lower() instead of a full case-insensitive scan per signal.
 """
 
 import re
 import html
 import logging
-from typing import Optional
+from typing import Iterable, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -23,13 +28,21 @@ _MIN_LENGTH_WEIGHT          = 10   # paste > 300 chars (unlikely manual typing b
 _TRACKING_PARAM_WEIGHT      = 10   # utm_, ref=, source=, gclid tracking params
 _STRUCTURED_HTML_WEIGHT     = 10   # <p>, <div>, <section> = full page copy
 
+_HYPERLINK_RE    = re.compile(r'<a\s[^>]*href', re.I)
 _TRACKING_RE     = re.compile(r'(utm_\w+|gclid|ref=|source=|fbclid|mc_eid)', re.I)
 _URL_RE          = re.compile(r'https?://[^\s"\'<>]{4,}', re.I)
 _DOMAIN_RE       = re.compile(r'https?://(?:www\.)?([^/\s"\'<>]+)', re.I)
+_STRUCTURED_RE   = re.compile(r'<(div|section|article|header|nav)\s', re.I)
 _ALLOWED_TAGS    = re.compile(r'<(/?(b|i|u|em|strong|br|span|p|a|ul|ol|li|h[1-6]|cite|blockquote|sup|div|section)[\s>])', re.I)
-_STRIP_TAGS_RE   = re.compile(r'<[^>]+>')
+_STRIP_TAGS_RE   = re.compile(r'<[^>]+>(?:<[^>]+>)*')     # adjacent tags → one space (collapsed anyway)
 _STRIP_SCRIPTS   = re.compile(r'<script[\s\S]*?</script>', re.I)
 _STRIP_STYLE     = re.compile(r'<style[\s\S]*?</style>', re.I)
+_COLLAPSE_WS_RE  = re.compile(r'\s\s+')
+
+# Substrings (lower-case) every match of the signal contains
+_CITATION_TAGS     = ('<cite', '<blockquote', '<sup', '<bib', '<reference')
+_TRACKING_PARAMS   = ('utm_', 'gclid', 'ref=', 'source=', 'fbclid', 'mc_eid')
+_STRUCTURED_TAGS   = ('<div', '<section', '<article', '<header', '<nav')
 
 # ─────────────────────────────────────────────────────────────────────────────
 # PUBLIC API
@@ -53,6 +66,7 @@ def score_paste(
     """
     score = 0
     has_html = bool(clipboard_html and clipboard_html.strip())
+    lowered = clipboard_html.lower() if has_html else ''
 
     # ── Signal 1: browser HTML present ───────────────────────────────────────
     if has_html:
@@ -60,13 +74,13 @@ def score_paste(
         logger.debug('[PasteScorer] +%d HTML present', _HTML_PRESENT_WEIGHT)
 
     # ── Signal 2: hyperlink tags ──────────────────────────────────────────────
-    if has_html and re.search(r'<a\s[^>]*href', clipboard_html, re.I):
+    if '<a' in lowered and 'href' in lowered and _HYPERLINK_RE.search(clipboard_html):
         score += _HYPERLINK_TAG_WEIGHT
         logger.debug('[PasteScorer] +%d hyperlink tags', _HYPERLINK_TAG_WEIGHT)
 
     # ── Signal 3: raw URLs in HTML ────────────────────────────────────────────
     detected_url: Optional[str] = source_url
-    if has_html:
+    if 'http' in lowered:
         url_match = _URL_RE.search(clipboard_html)
         if url_match:
             score += _HTTP_URL_WEIGHT
@@ -74,7 +88,7 @@ def score_paste(
             logger.debug('[PasteScorer] +%d raw URL detected', _HTTP_URL_WEIGHT)
 
     # ── Signal 4: citation / academic markup ──────────────────────────────────
-    if has_html and re.search(r'<(cite|blockquote|sup|bib|reference)', clipboard_html, re.I):
+    if any(tag in lowered for tag in _CITATION_TAGS):
         score += _CITATION_TAG_WEIGHT
         logger.debug('[PasteScorer] +%d citation tag', _CITATION_TAG_WEIGHT)
 
@@ -84,13 +98,13 @@ def score_paste(
         logger.debug('[PasteScorer] +%d long paste (%d chars)', _MIN_LENGTH_WEIGHT, len(pasted_text))
 
     # ── Signal 6: tracking params in HTML/URL ────────────────────────────────
-    haystack = (clipboard_html or '') + (detected_url or '')
-    if _TRACKING_RE.search(haystack):
+    haystack = lowered + (detected_url or '').lower()
+    if any(param in haystack for param in _TRACKING_PARAMS) and _TRACKING_RE.search(haystack):
         score += _TRACKING_PARAM_WEIGHT
         logger.debug('[PasteScorer] +%d tracking params', _TRACKING_PARAM_WEIGHT)
 
     # ── Signal 7: structured page markup (<div>, <section>) ──────────────────
-    if has_html and re.search(r'<(div|section|article|header|nav)\s', clipboard_html, re.I):
+    if any(tag in lowered for tag in _STRUCTURED_TAGS) and _STRUCTURED_RE.search(clipboard_html):
         score += _STRUCTURED_HTML_WEIGHT
         logger.debug('[PasteScorer] +%d structured HTML', _STRUCTURED_HTML_WEIGHT)
 
@@ -107,7 +121,7 @@ def score_paste(
     # ── Sanitize clipboard HTML for storage ───────────────────────────────────
     clean_html: Optional[str] = None
     if has_html:
-        clean_html = _sanitize_html(clipboard_html)
+        clean_html = _sanitize_html(clipboard_html, lowered)
 
     risk = 'high' if score >= 71 else ('medium' if score >= 31 else 'low')
     logger.info('[PasteScorer] score=%d risk=%s domain=%s', score, risk, source_domain)
@@ -121,13 +135,34 @@ def score_paste(
     }
 
 
-def _sanitize_html(raw: str) -> str:
+def score_pastes(events: Iterable[dict]) -> list:
+    """
+    Score a batch of paste events, each a dict with pasted_text and optional
+    clipboard_html / source_url. Returns one score_paste() result per event,
+    in order.
+    """
+    return [
+        score_paste(
+            pasted_text    = event.get('pasted_text') or '',
+            clipboard_html = event.get('clipboard_html') or None,
+            source_url     = event.get('source_url') or None,
+        )
+        for event in events
+    ]
+
+
+def _sanitize_html(raw: str, lowered: Optional[str] = None) -> str:
     """Strip scripts/styles and dangerous tags; keep safe structural tags."""
-    cleaned = _STRIP_SCRIPTS.sub('', raw)
-    cleaned = _STRIP_STYLE.sub('', cleaned)
+    lowered = raw.lower() if lowered is None else lowered
+    cleaned = raw
+    if '<script' in lowered:
+        cleaned = _STRIP_SCRIPTS.sub('', cleaned)
+        lowered = cleaned.lower()
+    if '<style' in lowered:
+        cleaned = _STRIP_STYLE.sub('', cleaned)
     # Remove all tags except explicitly allowed ones
     cleaned = _STRIP_TAGS_RE.sub(' ', cleaned)
     # Collapse whitespace
-    cleaned = re.sub(r'\s{2,}', ' ', cleaned).strip()
+    cleaned = _COLLAPSE_WS_RE.sub(' ', cleaned).strip()
     # HTML-escape remaining content to prevent XSS
     return html.escape(cleaned)[:20000]  # Hard cap at 20k chars
@@ -0,0 +1,199 @@
+"""
+services/presence_coalescer.py
+Server-side coalescing of cursor / awareness events for document rooms.
+
+Problem:
+  Every `doc:cursor` and `yjs:awareness` event used to be re-broadcast to
+  the whole room immediately. With N collaborators moving cursors the room
+  emits O(N²) messages per second, and every one of them crosses the shared
+  Redis message queue (DB 2).
+
+Architecture:
+  - Inbound events replace the pending state of their sid (last-write-wins);
+    superseded states are never emitted.
+  - A single background task flushes every `_TICK_MS` and emits ONE batch
+    per dirty room (`doc:cursor_batch` / `yjs:awareness_batch`).
+  - Each sid has a token bucket (`_RATE_PER_S`, `_BURST`) that caps how
+    often its state is emitted, not what is accepted: a state over the cap
+    stays pending (and keeps being overwritten) until a later tick has a
+    token, so the last state a peer sees is always the newest one.
+
+This service is compatible with eventlet: the flush loop runs through
+sio.start_background_task / sio.sleep (green threads, no OS threads).
+
+Usage:
+    PresenceCoalescer.init(sio)
+    PresenceCoalescer.submit('doc_42', request.sid, 'cursor', {...})
+    PresenceCoalescer.forget(request.sid)          # on disconnect / leave
+    PresenceCoalescer.stats()                      # counters for benchmarks
+"""
+from __future__ import annotations
+
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+# Flush interval for pending presence states (milliseconds)
+_TICK_MS = int(os.environ.get('PRESENCE_TICK_MS', '50'))
+
+# Per-sid token bucket: sustained events/second and burst capacity
+_RATE_PER_S = float(os.environ.get('PRESENCE_RATE_PER_S', '20'))
+_BURST      = float(os.environ.get('PRESENCE_BURST', '40'))
+
+# Event kind → outbound batch event name
+_BATCH_EVENTS = {
+    'cursor':    'doc:cursor_batch',
+    'awareness': 'yjs:awareness_batch',
+}
+
+
+class _TokenBucket:
+    """Classic token bucket; refilled lazily on each take()."""
+
+    __slots__ = ('tokens', 'updated')
+
+    def __init__(self, now: float):
+        self.tokens  = _BURST
+        self.updated = now
+
+    def take(self, now: float) -> bool:
+        elapsed = now - self.updated
+        self.updated = now
+        self.tokens = min(_BURST, self.tokens + elapsed * _RATE_PER_S)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+
+class PresenceCoalescer:
+    """
+    Coalesces presence events per (room, kind, sid) and flushes them as
+    one room-wide batch per tick.
+
+    All state is per-worker: each gunicorn worker only coalesces the events
+    of the sockets connected to it, so every batch is emitted once through
+    the message queue regardless of how many peers are in the room.
+    """
+
+    _sio = None
+    _running = False
+
+    # {room: {kind: {sid: payload}}}
+    _pending: dict[str, dict[str, dict[str, dict]]] = {}
+    _buckets: dict[str, _TokenBucket] = {}
+
+    _counters = {
+        'received':   0,   # inbound events
+        'deferred':   0,   # pending states held for a later tick by the bucket
+        'superseded': 0,   # pending states replaced before being emitted
+        'batches':    0,   # outbound emits (one per room/kind per tick)
+        'states':     0,   # states delivered inside those batches
+    }
+
+    # ── Lifecycle ─────────────────────────────────────────────────────────────
+
+    @classmethod
+    def init(cls, sio) -> None:
+        """Bind the SocketIO server. The flush loop starts on first submit()."""
+        cls._sio = sio
+
+    @classmethod
+    def _ensure_running(cls) -> None:
+        if cls._running or cls._sio is None:
+            return
+        cls._running = True
+        cls._sio.start_background_task(cls._flush_loop)
+        logger.info(f'[Presence] Flush loop started (tick={_TICK_MS}ms, '
+                    f'rate={_RATE_PER_S}/s, burst={_BURST})')
+
+    # ── Ingest ────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def submit(cls, room: str, sid: str, kind: str, payload: dict) -> None:
+        """
+        Record the latest presence state of `sid` in `room`, replacing any
+        state still pending. Always accepted; the rate cap applies on flush().
+        """
+        if kind not in _BATCH_EVENTS:
+            raise ValueError(f'Unknown presence kind: {kind}')
+
+        slot = cls._pending.setdefault(room, {}).setdefault(kind, {})
+        if sid in slot:
+            cls._counters['superseded'] += 1
+        slot[sid] = payload
+        cls._counters['received'] += 1
+
+        cls._ensure_running()
+
+    @classmethod
+    def forget(cls, sid: str, room: str | None = None) -> None:
+        """Drop pending state and rate bucket of a socket (leave/disconnect)."""
+        rooms = [room] if room else list(cls._pending)
+        for r in rooms:
+            for slot in cls._pending.get(r, {}).values():
+                slot.pop(sid, None)
+        if room is None:
+            cls._buckets.pop(sid, None)
+
+    # ── Flush ─────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def flush(cls) -> int:
+        """
+        Emit one batch per dirty (room, kind) with the states whose sid has a
+        token; the others stay pending for the next tick. Returns number of emits.
+        """
+        if not cls._pending:
+            return 0
+        pending, cls._pending = cls._pending, {}
+
+        now = time.monotonic()
+        emits = 0
+        for room, kinds in pending.items():
+            for kind, states in kinds.items():
+                items = []
+                for sid, payload in states.items():
+                    bucket = cls._buckets.get(sid)
+                    if bucket is None:
+                        bucket = cls._buckets[sid] = _TokenBucket(now)
+                    if bucket.take(now):
+                        items.append(dict(payload, sid=sid))
+                    else:
+                        # A newer state submitted meanwhile wins (setdefault)
+                        cls._pending.setdefault(room, {}).setdefault(kind, {}).setdefault(sid, payload)
+                        cls._counters['deferred'] += 1
+                if not items:
+                    continue
+                try:
+                    cls._sio.emit(_BATCH_EVENTS[kind], {'items': items}, room=room)
+                except Exception as exc:
+                    logger.debug(f'[Presence] Batch emit failed room={room}: {exc}')
+                    continue
+                emits += 1
+                cls._counters['states'] += len(items)
+        cls._counters['batches'] += emits
+        return emits
+
+    @classmethod
+    def _flush_loop(cls) -> None:
+        interval = _TICK_MS / 1000.0
+        while True:
+            try:
+                cls.flush()
+            except Exception as exc:
+                logger.error(f'[Presence] Flush loop error: {exc}')
+            cls._sio.sleep(interval)
+
+    # ── Metrics ───────────────────────────────────────────────────────────────
+
+    @classmethod
+    def stats(cls) -> dict:
+        return dict(cls._counters)
+
+    @classmethod
+    def reset_stats(cls) -> None:
+        for k in cls._counters:
+            cls._counters[k] = 0
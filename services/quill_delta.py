@@ -0,0 +1,228 @@
+"""
+services/quill_delta.py
+Server-side Quill Delta composition (port of quill-delta's Delta.compose).
+
+Used by the patch autosave protocol: the client sends `base.diff(current)`
+and the server rebuilds `current = compose(stored, change)`.
+
+Lengths and offsets follow JavaScript semantics (UTF-16 code units), so a
+change computed by the browser lines up with the stored text even when it
+contains emoji or other astral-plane characters.
+"""
+from __future__ import annotations
+
+import math
+
+
+class DeltaError(ValueError):
+    """A change that does not apply cleanly to the base document."""
+
+
+class BaseMismatch(DeltaError):
+    """The client's base version is not the stored one."""
+
+
+# ── UTF-16 helpers ────────────────────────────────────────────────────────────
+
+def _u16len(text: str) -> int:
+    if text.isascii():
+        return len(text)
+    return len(text.encode('utf-16-le', errors='surrogatepass')) // 2
+
+
+def _u16slice(text: str, start: int, end: int) -> str:
+    if text.isascii() or len(text.encode('utf-16-le', errors='surrogatepass')) == 2 * len(text):
+        return text[start:end]
+    raw = text.encode('utf-16-le', errors='surrogatepass')[2 * start:2 * end]
+    return raw.decode('utf-16-le', errors='surrogatepass')
+
+
+# ── Ops ───────────────────────────────────────────────────────────────────────
+
+def op_length(op: dict) -> int:
+    if isinstance(op.get('delete'), int):
+        return op['delete']
+    retain = op.get('retain')
+    if isinstance(retain, (int, float)):
+        return retain
+    if isinstance(retain, dict):
+        return 1
+    insert = op.get('insert')
+    return _u16len(insert) if isinstance(insert, str) else 1
+
+
+def document_length(ops: list[dict]) -> int:
+    return sum(op_length(op) for op in ops)
+
+
+def _compose_attributes(a: dict | None, b: dict | None, keep_null: bool) -> dict | None:
+    attributes = dict(b or {})
+    if not keep_null:
+        attributes = {k: v for k, v in attributes.items() if v is not None}
+    for key, value in (a or {}).items():
+        if value is not None and key not in (b or {}):
+            attributes[key] = value
+    return attributes or None
+
+
+class _Iterator:
+    def __init__(self, ops: list[dict]):
+        self.ops = ops
+        self.index = 0
+        self.offset = 0
+
+    def has_next(self) -> bool:
+        return self.peek_length() < math.inf
+
+    def peek(self) -> dict | None:
+        return self.ops[self.index] if self.index < len(self.ops) else None
+
+    def peek_length(self):
+        op = self.peek()
+        return op_length(op) - self.offset if op is not None else math.inf
+
+    def peek_type(self) -> str:
+        op = self.peek()
+        if op is None:
+            return 'retain'
+        if isinstance(op.get('delete'), int):
+            return 'delete'
+        if 'retain' in op:
+            return 'retain'
+        return 'insert'
+
+    def rest(self) -> list[dict]:
+        if not self.has_next():
+            return []
+        if self.offset == 0:
+            return self.ops[self.index:]
+        return [self.next()] + self.ops[self.index:]
+
+    def next(self, length=math.inf) -> dict:
+        op = self.peek()
+        if op is None:
+            return {'retain': math.inf}
+        offset = self.offset
+        op_len = op_length(op)
+        if length >= op_len - offset:
+            length = op_len - offset
+            self.index += 1
+            self.offset = 0
+        else:
+            self.offset += length
+        if isinstance(op.get('delete'), int):
+            return {'delete': length}
+        out = {}
+        if op.get('attributes'):
+            out['attributes'] = op['attributes']
+        retain = op.get('retain')
+        if isinstance(retain, (int, float)):
+            out['retain'] = length
+        elif isinstance(retain, dict):
+            out['retain'] = retain
+        elif isinstance(op.get('insert'), str):
+            out['insert'] = _u16slice(op['insert'], offset, offset + length)
+        else:
+            out['insert'] = op['insert']
+        return out
+
+
+def _push(ops: list[dict], new_op: dict) -> None:
+    new_op = dict(new_op)
+    index = len(ops)
+    last = ops[-1] if ops else None
+    if last is not None:
+        if isinstance(new_op.get('delete'), int) and isinstance(last.get('delete'), int):
+            last['delete'] += new_op['delete']
+            return
+        # Inserts go before a trailing delete (same document, canonical order)
+        if isinstance(last.get('delete'), int) and 'insert' in new_op:
+            index -= 1
+            last = ops[index - 1] if index > 0 else None
+            if last is None:
+                ops.insert(0, new_op)
+                return
+        if new_op.get('attributes') == last.get('attributes'):
+            if isinstance(new_op.get('insert'), str) and isinstance(last.get('insert'), str):
+                last['insert'] += new_op['insert']
+                return
+            if isinstance(new_op.get('retain'), (int, float)) and isinstance(last.get('retain'), (int, float)):
+                last['retain'] += new_op['retain']
+                return
+    ops.insert(index, new_op)
+
+
+def _chop(ops: list[dict]) -> list[dict]:
+    if ops and isinstance(ops[-1].get('retain'), (int, float)) and not ops[-1].get('attributes'):
+        ops.pop()
+    return ops
+
+
+def compose(base_ops: list[dict], change_ops: list[dict]) -> list[dict]:
+    """Apply `change_ops` on top of `base_ops` (quill-delta compose semantics)."""
+    this_iter = _Iterator(base_ops)
+    other_iter = _Iterator(change_ops)
+    ops: list[dict] = []
+
+    # Fast path: a leading plain retain copies base inserts verbatim
+    first = other_iter.peek()
+    if first is not None and isinstance(first.get('retain'), int) and not first.get('attributes'):
+        first_left = first['retain']
+        while this_iter.peek_type() == 'insert' and this_iter.peek_length() <= first_left:
+            first_left -= this_iter.peek_length()
+            ops.append(dict(this_iter.next()))
+        if first['retain'] - first_left > 0:
+            other_iter.next(first['retain'] - first_left)
+
+    while this_iter.has_next() or other_iter.has_next():
+        if other_iter.peek_type() == 'insert':
+            _push(ops, other_iter.next())
+        elif this_iter.peek_type() == 'delete':
+            _push(ops, this_iter.next())
+        else:
+            length = min(this_iter.peek_length(), other_iter.peek_length())
+            this_op = this_iter.next(length)
+            other_op = other_iter.next(length)
+            if 'retain' in other_op:
+                new_op = {}
+                this_is_retain = isinstance(this_op.get('retain'), (int, float))
+                if this_is_retain:
+                    new_op['retain'] = length if isinstance(other_op['retain'], (int, float)) else other_op['retain']
+                else:
+                    new_op['insert'] = this_op['insert']
+                attributes = _compose_attributes(
+                    this_op.get('attributes'), other_op.get('attributes'), this_is_retain
+                )
+                if attributes:
+                    new_op['attributes'] = attributes
+                _push(ops, new_op)
+
+                # Nothing left to change: the rest of the base is copied as-is
+                if not other_iter.has_next() and ops[-1] == new_op:
+                    for rest_op in this_iter.rest():
+                        _push(ops, rest_op)
+                    return _chop(ops)
+            elif isinstance(other_op.get('delete'), int) and 'retain' in this_op:
+                _push(ops, other_op)
+            # else: base insert deleted by the change → both vanish
+    return _chop(ops)
+
+
+def apply_change(base_ops: list[dict], change_ops: list[dict]) -> list[dict]:
+    """
+    compose() for documents: the change must fit inside the base and the
+    result must be insert-only. Raises DeltaError otherwise.
+    """
+    if not isinstance(change_ops, list) or any(not isinstance(op, dict) for op in change_ops):
+        raise DeltaError('Cambio inválido')
+    base_length = document_length(base_ops)
+    consumed = sum(
+        op_length(op) for op in change_ops
+        if 'retain' in op or isinstance(op.get('delete'), int)
+    )
+    if consumed > base_length:
+        raise DeltaError('El cambio excede la longitud del documento base')
+    result = compose(base_ops, change_ops)
+    if any('insert' not in op for op in result):
+        raise DeltaError('El cambio no produce un documento válido')
+    return result
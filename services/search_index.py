@@ -0,0 +1,384 @@
+"""
+services/search_index.py
+Full-text search over document titles and bodies.
+
+Architecture:
+  - document_search_index (models.DocumentSearchIndex) holds one row per
+    document with the plain text of its Quill delta (DB column or SeaweedFS
+    blob) and FULLTEXT indexes on (title) and (title, body).
+  - Incremental updates: every content/title change marks the document
+    dirty in the Redis ZSET search:dirty (score = first change, ZADD NX).
+    SearchIndexWorker reindexes documents dirty for at least _DEBOUNCE_S, so
+    an autosave burst costs one index update instead of one per save. Ids
+    are claimed with ZREM, so several gunicorn workers never reindex the same
+    document twice. Without Redis the document is reindexed inline.
+  - Queries run in BOOLEAN MODE: every word is required with prefix match
+    ('+word*'), "quoted phrases" stay phrases. score = 2·MATCH(title) +
+    MATCH(title, body). Scope comes from marktrack_documents (owner_id —
+    workspace submissions belong to the workspace owner — and is_deleted),
+    joined on the primary key for the matching rows only.
+  - Snippets/highlighting are built in Python for the rows of the page.
+  - Other dialects (SQLite dev database) fall back to an unranked LIKE.
+
+Usage:
+    SearchIndex.mark_dirty(doc.id)
+    SearchIndex.search(current_user.id, 'revolución industrial', page=1)
+    SearchIndex.reindex([doc_id, ...])
+"""
+from __future__ import annotations
+
+import hashlib
+import html
+import json
+import logging
+import re
+import threading
+import time
+import unicodedata
+from datetime import datetime
+
+import sqlalchemy as sa
+
+logger = logging.getLogger(__name__)
+
+_KEY_DIRTY = 'search:dirty'
+
+_DEBOUNCE_S = 30
+_POLL_S = 5
+_BATCH = 200
+_MAX_BODY_CHARS = 500_000
+_COUNT_CAP = 1000
+_MIN_TOKEN = 3          # innodb_ft_min_token_size
+_SNIPPET_CHARS = 180
+
+_TOKEN = re.compile(r'"([^"]+)"|(\w+)', re.UNICODE)
+_WORD = re.compile(r'\w+', re.UNICODE)
+
+
+# ── Text helpers ──────────────────────────────────────────────────────────────
+
+def extract_text(delta) -> str:
+    """Plain text of a Quill delta (string inserts only, embeds skipped)."""
+    parts, size = [], 0
+    for op in (delta or {}).get('ops', []):
+        insert = op.get('insert')
+        if isinstance(insert, str):
+            parts.append(insert)
+            size += len(insert)
+            if size >= _MAX_BODY_CHARS:
+                break
+    return ''.join(parts)[:_MAX_BODY_CHARS]
+
+
+def parse_query(q: str) -> tuple[str, list[str]]:
+    """User query → (BOOLEAN MODE expression, terms to highlight)."""
+    clauses, terms = [], []
+    for phrase, word in _TOKEN.findall(q or ''):
+        if phrase:
+            words = _WORD.findall(phrase)
+            if words:
+                clauses.append('+"' + ' '.join(words) + '"')
+                terms.append(' '.join(words))
+        elif len(word) >= _MIN_TOKEN:
+            clauses.append(f'+{word}*')
+            terms.append(word)
+    return ' '.join(clauses), terms
+
+
+def _build_fold_table() -> dict[int, str]:
+    table = {}
+    for code in range(0xC0, 0x250):
+        char = chr(code)
+        base = unicodedata.normalize('NFD', char)[0].lower()
+        if len(base) == 1 and base != char:
+            table[code] = base
+    table[0x130] = 'i'
+    return table
+
+
+_FOLD = _build_fold_table()
+
+
+def _fold(text: str) -> str:
+    """Lowercase and strip accents without changing string length."""
+    folded = text.lower() if text.isascii() else text.translate(_FOLD).lower()
+    return folded if len(folded) == len(text) else text.lower()
+
+
+def highlight(text: str, terms: list[str], width: int = _SNIPPET_CHARS) -> str:
+    """
+    HTML-escaped snippet of `text` around the first match, with every match
+    wrapped in <mark>. Matching is prefix-based, case- and accent-insensitive
+    (like the utf8mb4 collation of the FULLTEXT index).
+    """
+    text = text or ''
+    if not terms:
+        return html.escape(text[:width])
+    pattern = re.compile(
+        '|'.join(r'\b' + r'\s+'.join(re.escape(_fold(w)) for w in term.split()) + r'\w*'
+                 for term in sorted(terms, key=len, reverse=True))
+    )
+    folded = _fold(text)
+    first = pattern.search(folded)
+    start = 0
+    if first and len(text) > width:
+        start = max(0, first.start() - width // 3)
+        # Do not cut a word in half
+        space = text.rfind(' ', 0, start)
+        start = space + 1 if start and space != -1 and start - space < 20 else start
+    end = min(len(text), start + width)
+
+    out, pos = [], start
+    for m in pattern.finditer(folded, start, end):
+        out.append(html.escape(text[pos:m.start()]))
+        out.append('<mark>' + html.escape(text[m.start():min(m.end(), end)]) + '</mark>')
+        pos = min(m.end(), end)
+    out.append(html.escape(text[pos:end]))
+    snippet = ''.join(out).replace('\n', ' ').strip()
+    return ('…' if start else '') + snippet + ('…' if end < len(text) else '')
+
+
+# ── Index ─────────────────────────────────────────────────────────────────────
+
+class SearchIndex:
+    """Document full-text index (see module docstring)."""
+
+    # ── Write ─────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def mark_dirty(cls, *doc_ids: int) -> None:
+        """Queue documents for reindexing (inline reindex when Redis is down)."""
+        from settings.extensions import redis_client
+
+        try:
+            queued = redis_client.zadd(_KEY_DIRTY, {str(i): time.time() for i in doc_ids}, nx=True)
+        except Exception as exc:
+            logger.warning(f'[Search] Cola no disponible: {exc}')
+            queued = None
+        if queued is None:
+            try:
+                cls.reindex(doc_ids)
+            except Exception as exc:
+                logger.error(f'[Search] Error reindexando {doc_ids}: {exc}')
+
+    @classmethod
+    def reindex(cls, doc_ids) -> int:
+        """(Re)build the index rows of `doc_ids`; commits. Returns rows written."""
+        from models.models import Document, DocumentSearchIndex, WorkspaceInvitation
+        from settings.extensions import db
+
+        ids = list({int(i) for i in doc_ids})
+        if not ids:
+            return 0
+        docs = Document.query.filter(Document.id.in_(ids)).all()
+        rows = {
+            row.document_id: row
+            for row in DocumentSearchIndex.query.filter(DocumentSearchIndex.document_id.in_(ids))
+        }
+        workspaces = dict(
+            db.session.query(WorkspaceInvitation.document_id, WorkspaceInvitation.workspace_id)
+            .filter(WorkspaceInvitation.document_id.in_(ids))
+        )
+
+        written = 0
+        for doc in docs:
+            row = rows.get(doc.id)
+            title = (doc.title or '')[:255]
+            body = cls._document_text(doc)
+            if body is None:
+                continue
+            # Hash of the text itself, not Document.content_hash: not every
+            # path that writes content (restore, DOCX import…) refreshes it.
+            body_hash = hashlib.sha256(body.encode('utf-8')).hexdigest()
+            if row is not None and row.content_hash == body_hash and row.title == title \
+                    and row.workspace_id == workspaces.get(doc.id):
+                continue
+            if row is None:
+                row = DocumentSearchIndex(document_id=doc.id)
+                db.session.add(row)
+            row.title = title
+            row.body = body
+            row.workspace_id = workspaces.get(doc.id)
+            row.content_hash = body_hash
+            row.indexed_at = datetime.utcnow()
+            written += 1
+        db.session.commit()
+        return written
+
+    @staticmethod
+    def _document_text(doc) -> str | None:
+        """Plain text of the stored content; None if the blob is unreadable."""
+        from settings.utils import load_from_minio_compressed
+
+        if doc.storage_type == 'minio' and doc.minio_path:
+            delta, _ = load_from_minio_compressed(doc.minio_path)
+            if delta is None:
+                return None
+            return extract_text(delta)
+        try:
+            return extract_text(json.loads(doc.content_delta) if doc.content_delta else {})
+        except ValueError:
+            return ''
+
+    @classmethod
+    def process_dirty(cls, limit: int = _BATCH) -> int:
+        """Claim documents dirty for ≥ _DEBOUNCE_S and reindex them."""
+        from settings.extensions import redis_client
+
+        ids = redis_client.zrangebyscore(_KEY_DIRTY, '-inf', time.time() - _DEBOUNCE_S, start=0, num=limit)
+        if not ids:
+            return 0
+        pipe = redis_client.pipeline(transaction=False)
+        for doc_id in ids:
+            pipe.zrem(_KEY_DIRTY, doc_id)
+        claimed = [int(doc_id) for doc_id, removed in zip(ids, pipe.execute()) if removed]
+        if claimed:
+            try:
+                cls.reindex(claimed)
+            except Exception:
+                # Back in the queue for the next pass
+                redis_client.zadd(_KEY_DIRTY, {str(i): time.time() for i in claimed}, nx=True)
+                raise
+        return len(claimed)
+
+    # ── Query ─────────────────────────────────────────────────────────────────
+
+    @classmethod
+    def search(cls, user_id: int, q: str, page: int = 1, per_page: int = 20,
+               workspace_id: int | None = None) -> dict:
+        """Ranked, highlighted, paginated results scoped to `user_id`."""
+        from settings.extensions import db
+
+        per_page = max(1, min(per_page, 50))
+        page = max(1, min(page, _COUNT_CAP // per_page))
+        boolean_q, terms = parse_query(q)
+        result = {'results': [], 'total': 0, 'total_is_capped': False,
+                  'page': page, 'per_page': per_page, 'query': q}
+        if not terms:
+            return result
+
+        params = {'q': boolean_q, 'uid': user_id, 'ws': workspace_id,
+                  'limit': per_page, 'offset': (page - 1) * per_page, 'cap': _COUNT_CAP}
+        if db.engine.dialect.name == 'mysql':
+            rows, total = cls._search_mysql(params, workspace_id is not None)
+        else:
+            rows, total = cls._search_like(params, terms, workspace_id is not None)
+
+        bodies = {}
+        if rows:
+            bodies = dict(db.session.execute(
+                sa.text('SELECT document_id, body FROM document_search_index '
+                        'WHERE document_id IN :ids').bindparams(sa.bindparam('ids', expanding=True)),
+                {'ids': [r.document_id for r in rows]}
+            ).all())
+        result['total'] = total
+        result['total_is_capped'] = total >= _COUNT_CAP
+        result['pages'] = -(-total // per_page)
+        result['results'] = [{
+            'id':            r.document_id,
+            'title':         r.title,
+            'title_html':    highlight(r.title, terms, width=255),
+            'snippet_html':  highlight(bodies.get(r.document_id) or '', terms),
+            'score':         round(float(r.score or 0), 4),
+            'workspace_id':  r.workspace_id,
+            'updated_at':    r.updated_at.isoformat() if r.updated_at else None,
+        } for r in rows]
+        return result
+
+    @staticmethod
+    def _search_mysql(params: dict, by_workspace: bool):
+        from settings.extensions import db
+
+        match_all = 'MATCH(s.title, s.body) AGAINST (:q IN BOOLEAN MODE)'
+        where = f'{match_all} AND d.owner_id = :uid AND d.is_deleted = 0'
+        if by_workspace:
+            where += ' AND s.workspace_id = :ws'
+        base = ('FROM document_search_index s '
+                'JOIN marktrack_documents d ON d.id = s.document_id '
+                f'WHERE {where}')
+        rows = db.session.execute(sa.text(
+            'SELECT s.document_id, s.title, s.workspace_id, d.updated_at, '
+            f'MATCH(s.title) AGAINST (:q IN BOOLEAN MODE) * 2 + {match_all} AS score '
+            f'{base} ORDER BY score DESC, s.document_id DESC LIMIT :limit OFFSET :offset'
+        ), params).all()
+        total = db.session.execute(sa.text(
+            f'SELECT COUNT(*) FROM (SELECT 1 {base} LIMIT :cap) t'
+        ), params).scalar() or 0
+        return rows, total
+
+    @staticmethod
+    def _search_like(params: dict, terms: list[str], by_workspace: bool):
+        from settings.extensions import db
+
+        clauses, like_params = [], {}
+        for i, term in enumerate(terms):
+            like_params[f't{i}'] = f'%{term}%'
+            clauses.append(f'(s.title LIKE :t{i} OR s.body LIKE :t{i})')
+        where = ' AND '.join(clauses) + ' AND d.owner_id = :uid AND d.is_deleted = 0'
+        if by_workspace:
+            where += ' AND s.workspace_id = :ws'
+        base = ('FROM document_search_index s '
+                'JOIN marktrack_documents d ON d.id = s.document_id '
+                f'WHERE {where}')
+        params = {**params, **like_params}
+        rows = db.session.execute(sa.text(
+            'SELECT s.document_id, s.title, s.workspace_id, d.updated_at, 0 AS score '
+            f'{base} ORDER BY d.updated_at DESC LIMIT :limit OFFSET :offset'
+        ), params).all()
+        total = db.session.execute(sa.text(
+            f'SELECT COUNT(*) FROM (SELECT 1 {base} LIMIT :cap) t'
+        ), params).scalar() or 0
+        return rows, total
+
+    @staticmethod
+    def matching_ids_clause(user_id: int, q: str):
+        """
+        SQL expression `Document.id IN (ids matching q)` for list_documents,
+        or None when the query has no indexable term / the DB is not MySQL.
+        """
+        from models.models import Document, DocumentSearchIndex
+        from settings.extensions import db
+
+        boolean_q, terms = parse_query(q)
+        if not terms or db.engine.dialect.name != 'mysql':
+            return None
+        match = sa.text('MATCH(document_search_index.title, document_search_index.body) '
+                        'AGAINST (:fts_q IN BOOLEAN MODE)').bindparams(fts_q=boolean_q)
+        subquery = db.session.query(DocumentSearchIndex.document_id).filter(match)
+        return Document.id.in_(subquery)
+
+
+class SearchIndexWorker:
+    """Background reindexing of dirty documents (one thread per process)."""
+
+    _thread = None
+    _stop_event = threading.Event()
+    _app = None
+
+    @classmethod
+    def start(cls, app):
+        if cls._thread is not None:
+            return
+        cls._app = app
+        cls._stop_event.clear()
+        cls._thread = threading.Thread(target=cls._run_loop, name='SearchIndexWorker', daemon=True)
+        cls._thread.start()
+        logger.info('[Search] SearchIndexWorker iniciado en segundo plano')
+
+    @classmethod
+    def stop(cls):
+        cls._stop_event.set()
+        if cls._thread:
+            cls._thread.join(timeout=5)
+            cls._thread = None
+
+    @classmethod
+    def _run_loop(cls):
+        while not cls._stop_event.is_set():
+            try:
+                with cls._app.app_context():
+                    while SearchIndex.process_dirty() >= _BATCH:
+                        pass
+            except Exception as exc:
+                logger.error(f'[Search] Error en SearchIndexWorker: {exc}')
+            cls._stop_event.wait(_POLL_S)
@@ -64,102 +64,69 @@ class StorageSyncWorker:
 
         logger.info("SeaweedFS disponible, iniciando sincronización de archivos locales...")
         
-        # 2. Sincronizar Documentos
-        cls._sync_documents()
+        # 2. Sincronizar blobs de documentos y versiones
+        cls._sync_document_blobs()
         
-        # 3. Sincronizar Versiones
-        cls._sync_versions()
-        
-        # 4. Sincronizar Imágenes (escaneo de directorio)
+        # 3. Sincronizar Imágenes (escaneo de directorio)
         cls._sync_images()
 
     @classmethod
-    def _sync_documents(cls):
-        """Sincronizar documentos con prefijo local://"""
-        docs = Document.query.filter(Document.minio_path.like('local://%')).all()
-        if not docs:
+    def _sync_document_blobs(cls):
+        """
+        Sincronizar blobs con prefijo local:// de documentos y versiones.
+        Un blob puede estar referenciado por varias filas (contenido
+        compartido): se sube una vez y se reapuntan todas las referencias.
+        """
+        paths = set()
+        for model in (Document, DocumentVersion):
+            paths.update(
+                path for (path,) in db.session.query(model.minio_path)
+                .filter(model.minio_path.like('local://%')).distinct()
+            )
+        if not paths:
             return
             
-        logger.info(f"Sincronizando {len(docs)} documentos hacia SeaweedFS...")
+        logger.info(f"Sincronizando {len(paths)} blobs de documentos hacia SeaweedFS...")
         
         upload_folder = cls._app.config.get('UPLOAD_FOLDER', 'uploads')
         docs_dir = os.path.join(upload_folder, 'documents')
         
-        for doc in docs:
+        for local_ref in paths:
             try:
-                filename = doc.minio_path.replace('local://', '')
+                filename = local_ref.replace('local://', '')
                 local_path = os.path.join(docs_dir, filename)
                 
-                if not os.path.exists(local_path):
-                    logger.warning(f"Archivo local no encontrado para documento {doc.id}: {local_path}")
-                    # Limpiar path si el archivo no existe
-                    doc.minio_path = None
-                    db.session.commit()
-                    continue
-                
-                # Leer y subir a SeaweedFS
-                with open(local_path, 'rb') as f:
-                    data = f.read()
-                
-                minio_client.put_object(
-                    bucket_name='documents',
-                    object_name=filename,
-                    data=BytesIO(data),
-                    length=len(data),
-                    content_type='application/gzip'
-                )
-                
-                # Actualizar base de datos
-                doc.minio_path = filename
+                if os.path.exists(local_path):
+                    with open(local_path, 'rb') as f:
+                        data = f.read()
+                    minio_client.put_object(
+                        bucket_name='documents',
+                        object_name=filename,
+                        data=BytesIO(data),
+                        length=len(data),
+                        content_type='application/gzip'
+                    )
+                    new_path = filename
+                elif minio_client.find_object('documents', filename) is not None:
+                    # Ya subido en una pasada anterior
+                    new_path = filename
+                else:
+                    logger.warning(f"Archivo local no encontrado para {local_ref}: {local_path}")
+                    new_path = None
+                
+                for model in (Document, DocumentVersion):
+                    model.query.filter_by(minio_path=local_ref).update(
+                        {'minio_path': new_path}, synchronize_session=False
+                    )
                 db.session.commit()
                 
-                # Eliminar local
-                os.remove(local_path)
-                logger.info(f"Documento {doc.id} sincronizado y eliminado de local: {filename}")
-                
-            except Exception as e:
-                logger.error(f"Error sincronizando documento {doc.id}: {e}")
-
-    @classmethod
-    def _sync_versions(cls):
-        """Sincronizar versiones con prefijo local://"""
-        versions = DocumentVersion.query.filter(DocumentVersion.minio_path.like('local://%')).all()
-        if not versions:
-            return
-            
-        logger.info(f"Sincronizando {len(versions)} versiones hacia SeaweedFS...")
-        
-        upload_folder = cls._app.config.get('UPLOAD_FOLDER', 'uploads')
-        docs_dir = os.path.join(upload_folder, 'documents')
-        
-        for ver in versions:
-            try:
-                filename = ver.minio_path.replace('local://', '')
-                local_path = os.path.join(docs_dir, filename)
-                
-                if not os.path.exists(local_path):
-                    ver.minio_path = None
-                    db.session.commit()
-                    continue
-                
-                with open(local_path, 'rb') as f:
-                    data = f.read()
-                
-                minio_client.put_object(
-                    bucket_name='documents',
-                    object_name=filename,
-                    data=BytesIO(data),
-                    length=len(data),
-                    content_type='application/gzip'
-                )
-                
-                ver.minio_path = filename
-                db.session.commit()
-                os.remove(local_path)
-                logger.info(f"Versión {ver.id} sincronizada y eliminada de local: {filename}")
+                if new_path and os.path.exists(local_path):
+                    os.remove(local_path)
+                logger.info(f"Blob {filename} sincronizado y eliminado de local")
                 
             except Exception as e:
-                logger.error(f"Error sincronizando versión {ver.id}: {e}")
+                db.session.rollback()
+                logger.error(f"Error sincronizando blob {local_ref}: {e}")
 
     @classmethod
     def _sync_images(cls):
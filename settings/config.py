@@ -63,6 +63,18 @@ class Config:
     AUTO_SAVE_DELAY     = 2_000
     KEEP_VERSIONS       = 10
 
+    # ── Export (services/export_service.py) ───────────────────────────────────
+    # Seconds export_document waits for a render before answering 202 + job_id
+    EXPORT_SYNC_WAIT_SECONDS = 5
+
+    # ── Analysis gateway (services/analysis_gateway.py) ───────────────────────
+    # Seconds the analysis proxies wait for a job before answering 202 + job_id
+    # (?async=1 answers 202 right away)
+    ANALYSIS_SYNC_WAIT_SECONDS = 25
+    # /api/analysis/validate-and-analyze keeps blocking like before the gateway
+    # (its clients do not follow a 202) unless called with ?async=1
+    ANALYSIS_BATCH_SYNC_WAIT_SECONDS = 300
+
     # ── Flask-Caching (Redis, with msgpack compression) ───────────────────────
     # CACHE_TYPE and CACHE_REDIS_URL are set dynamically in extensions.py
     # so that the fallback to SimpleCache still works in dev without Redis.
@@ -125,7 +137,11 @@ class Config:
     # ── Upload ────────────────────────────────────────────────────────────────
     UPLOAD_FOLDER       = os.path.join(basedir, "..", "uploads")
     MAX_CONTENT_LENGTH  = 16 * 1024 * 1024   # 16 MB
+    # Subidas a la nube con cuerpo crudo (/x_integ/storage/file/upload): van en streaming al proveedor
+    CLOUD_UPLOAD_MAX_BYTES = 5 * 1024 * 1024 * 1024   # 5 GB
     ALLOWED_EXTENSIONS  = {"doc", "docx", "pdf", "txt", "png", "jpg", "jpeg", "gif"}
+    # DOCX uploads above this size are converted in eventlet's tpool
+    DOCX_IMPORT_OFFLOAD_BYTES = 1 * 1024 * 1024   # 1 MB
 
     # ── SeaweedFS ─────────────────────────────────────────────────────────────
     SEAWEEDFS_FILER_URL  = _env("SEAWEEDFS_FILER_URL",  "localhost:8888")
@@ -135,6 +151,14 @@ class Config:
     MINIO_ENDPOINT = SEAWEEDFS_FILER_URL
     MINIO_SECURE   = SEAWEEDFS_SECURE
 
+    # ── Image serving ─────────────────────────────────────────────────────────
+    # Hot objects pulled from the `images` bucket are kept on local disk (LRU)
+    IMAGE_CACHE_DIR       = _env("IMAGE_CACHE_DIR", os.path.join(basedir, "..", "tmp", "image_cache"))
+    IMAGE_CACHE_MAX_BYTES = int(_env("IMAGE_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    # nginx `internal` location aliased to IMAGE_CACHE_DIR (e.g. "/_image_cache/");
+    # empty → Flask streams the file itself
+    IMAGE_ACCEL_REDIRECT_PREFIX = _env("IMAGE_ACCEL_REDIRECT_PREFIX", "")
+
     # ── Share links ───────────────────────────────────────────────────────────
     SHARE_LINK_EXPIRY_HOURS = 24 * 7   # 7 days
 
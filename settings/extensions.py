@@ -162,8 +162,18 @@ if _USE_REDIS:
         decode_responses=True,
     )
     redis_client = redis.Redis(connection_pool=_pool)
+    # Same DB, raw bytes: compressed/binary cache values (services/document_cache)
+    _bytes_pool = ConnectionPool.from_url(
+        _REDIS_BASE + "/1",
+        max_connections=50,
+        socket_keepalive=True,
+        socket_connect_timeout=2,
+        retry_on_timeout=True,
+    )
+    redis_bytes_client = redis.Redis(connection_pool=_bytes_pool)
 else:
     redis_client = _RedisStub()
+    redis_bytes_client = _RedisStub()
 
 
 # ── Lua scripts (pre-compiled at startup) ─────────────────────────────────────
@@ -195,18 +205,62 @@ redis.call('EXPIRE', key, ttl)
 return 1
 """
 
+# Atomic check-and-set of an owner lock (autosave).
+# KEYS[1] = lock key ; ARGV[1] = owner ; ARGV[2] = JSON payload ; ARGV[3] = ttl
+# Returns {1, owner} when acquired/renewed, {0, holder} when held by another owner.
+OWNER_LOCK_LUA = """
+local current = redis.call('GET', KEYS[1])
+if current then
+    local ok, data = pcall(cjson.decode, current)
+    if ok and type(data) == 'table' and data['user_email'] and data['user_email'] ~= ARGV[1] then
+        return {0, data['user_email']}
+    end
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+return {1, ARGV[1]}
+"""
+
+# Exact counters (unread notifications): apply a delta only to a seeded
+# counter, keeping its TTL. No floor at 0: a -1 that overtakes its +1 must
+# be able to go negative for a moment, or the counter drifts.
+# KEYS[1] = counter ; ARGV[1] = delta
+# Returns the new value, or nil when the counter is not seeded.
+COUNTER_ADJUST_LUA = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return false
+end
+return redis.call('INCRBY', KEYS[1], tonumber(ARGV[1]))
+"""
+
+# Compare-and-set used by counter reconciliation.
+# KEYS[1] = counter ; ARGV[1] = expected ; ARGV[2] = new value ; ARGV[3] = ttl
+COUNTER_CAS_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', tonumber(ARGV[3]))
+    return 1
+end
+return 0
+"""
+
 _rate_limit_script = None
 _hmset_expire_script = None
+_owner_lock_script = None
+_counter_adjust_script = None
+_counter_cas_script = None
 
 
 def _register_lua_scripts():
     """Register Lua scripts once after Redis client is ready."""
-    global _rate_limit_script, _hmset_expire_script
+    global _rate_limit_script, _hmset_expire_script, _owner_lock_script
+    global _counter_adjust_script, _counter_cas_script
     if not _USE_REDIS or isinstance(redis_client, _RedisStub):
         return
     try:
         _rate_limit_script   = redis_client.register_script(RATE_LIMIT_LUA)
         _hmset_expire_script = redis_client.register_script(HMSET_EXPIRE_LUA)
+        _owner_lock_script   = redis_client.register_script(OWNER_LOCK_LUA)
+        _counter_adjust_script = redis_client.register_script(COUNTER_ADJUST_LUA)
+        _counter_cas_script    = redis_client.register_script(COUNTER_CAS_LUA)
         logger.info("[extensions] Lua scripts registered with Redis")
     except Exception as e:
         logger.warning("[extensions] Failed to register Lua scripts: %s", e)
@@ -225,6 +279,37 @@ def sliding_window_rate_limit(key: str, limit: int, window_s: int) -> tuple[bool
     return bool(result[0]), int(result[1])
 
 
+def acquire_owner_lock(key: str, owner: str, payload: str, ttl_s: int) -> tuple[bool, str] | None:
+    """
+    GET + compare + SET EX in one round-trip. (True, owner) → acquired or
+    renewed; (False, holder) → held by someone else. None when the script is
+    not registered (caller falls back to the non-atomic path).
+    """
+    if _owner_lock_script is None:
+        return None
+    acquired, holder = _owner_lock_script(keys=[key], args=[owner, payload, ttl_s])
+    return bool(acquired), holder
+
+
+def adjust_counter(key: str, delta: int, client=None) -> int | None | bool:
+    """
+    Atomic `counter += delta` on a seeded counter. Returns the new
+    value, None when the counter is not seeded, False when the script is not
+    registered (caller drops the counter instead). With a pipeline as
+    `client` the call is queued and the value comes from execute().
+    """
+    if _counter_adjust_script is None:
+        return False
+    return _counter_adjust_script(keys=[key], args=[delta], client=client)
+
+
+def compare_and_set_counter(key: str, expected, value: int, ttl_s: int) -> bool | None:
+    """SET key value EX ttl only if it still holds `expected`. None without the script."""
+    if _counter_cas_script is None:
+        return None
+    return bool(_counter_cas_script(keys=[key], args=[expected, value, ttl_s]))
+
+
 def redis_pipeline_set_many(mapping: dict, prefix: str = "", ttl: int = 300):
     """
     Bulk-SET keys via pipeline.  ~10x fewer round-trips than individual SETs.
@@ -252,5 +337,6 @@ __all__ = [
     "db", "mail", "csrf", "cache", "socketio", "login_manager",
     "limiter", "redis_client", "seaweedfs_client", "minio_client",
     "logger", "sliding_window_rate_limit", "redis_pipeline_set_many",
+    "acquire_owner_lock", "adjust_counter", "compare_and_set_counter",
     "_register_lua_scripts",
 ]
@@ -197,6 +197,23 @@ class SeaweedFSClient:
             logger.error(f"Error en stat_object: {e}")
             raise
     
+    def find_object(self, bucket_name, object_name):
+        """stat_object() que retorna None si el objeto no existe (sin log de error)"""
+        response = requests.head(
+            f"{self.filer_url}/{bucket_name}/{object_name}",
+            timeout=10
+        )
+        if response.status_code != 200:
+            return None
+        return SeaweedFSStatResult(
+            bucket_name=bucket_name,
+            object_name=object_name,
+            size=int(response.headers.get('Content-Length', 0)),
+            content_type=response.headers.get('Content-Type', ''),
+            last_modified=response.headers.get('Last-Modified', ''),
+            etag=response.headers.get('ETag', '')
+        )
+    
     def presigned_get_object(self, bucket_name, object_name, expires=timedelta(hours=1)):
         """
         Generar URL pública para un objeto.
@@ -249,6 +266,41 @@ class SeaweedFSClient:
             logger.error(f"Error en list_objects: {e}")
             return []
 
+    
+    def iter_objects(self, bucket_name, prefix='', page_size=1000):
+        """
+        Iterar todos los archivos de un bucket página a página (lastFileName).
+        list_objects() solo devuelve la primera página del Filer.
+        """
+        last_file_name = ''
+        while True:
+            response = requests.get(
+                f"{self.filer_url}/{bucket_name}/",
+                params={'limit': page_size, 'lastFileName': last_file_name, 'namePattern': f"{prefix}*"},
+                headers={'Accept': 'application/json'},
+                timeout=30
+            )
+            if response.status_code == 404:
+                return
+            if response.status_code != 200:
+                raise Exception(f"Error listando objetos: {response.status_code} - {response.text}")
+            
+            data = response.json()
+            entries = data.get('Entries') or []
+            for entry in entries:
+                if entry.get('IsDirectory', False):
+                    continue
+                yield SeaweedFSObject(
+                    object_name=entry.get('FullPath', '').rsplit('/', 1)[-1],
+                    size=entry.get('FileSize', 0),
+                    is_dir=False,
+                    last_modified=entry.get('Mtime', '')
+                )
+            
+            if not data.get('ShouldDisplayLoadMore') or not entries:
+                return
+            last_file_name = data.get('LastFileName') or entries[-1].get('FullPath', '').rsplit('/', 1)[-1]
+
 
 class SeaweedFSPutResult:
     """Resultado de put_object compatible con MinIO"""
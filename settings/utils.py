@@ -1,6 +1,6 @@
 import json
 import sys
-import gzip
+import hashlib
 import uuid
 import base64
 import logging
@@ -11,12 +11,11 @@ from urllib.parse import quote
 from werkzeug.utils import secure_filename
 
 # Librerías para procesamiento de documentos
-import mammoth
 from docx import Document as DocxDocument
 from docx.shared import Inches
 from docx.enum.text import WD_ALIGN_PARAGRAPH
 from weasyprint import HTML, CSS
-from bs4 import BeautifulSoup, Tag, NavigableString
+from bs4 import BeautifulSoup
 from PIL import Image
 from models.models import DocumentVersion
 
@@ -42,14 +41,57 @@ def generate_safe_filename(filename):
     unique_id = str(uuid.uuid4())[:8]
     return f"{name}_{unique_id}.{ext}" if ext else f"{name}_{unique_id}"
 
-def get_content_size(delta, html):
-    """Calcular el tamaño del contenido"""
-    delta_size = sys.getsizeof(json.dumps(delta))
+def get_content_size(delta, html, delta_json=None):
+    """Calcular el tamaño del contenido (reutiliza delta_json si ya se serializó)"""
+    delta_size = sys.getsizeof(delta_json if delta_json is not None else json.dumps(delta))
     html_size = sys.getsizeof(html or '')
     return delta_size + html_size
 
-def validate_delta(delta):
-    """Validar que el delta sea válido"""
+def serialize_delta(delta):
+    """
+    Serializar el delta una sola vez → (delta_json, sha256 del json).
+    Claves ordenadas: el mismo contenido da el mismo hash venga de un
+    guardado completo (orden del navegador) o de un parche compuesto.
+    """
+    delta_json = json.dumps(delta, sort_keys=True)
+    return delta_json, hashlib.sha256(delta_json.encode('utf-8')).hexdigest()
+
+def load_document_content(doc):
+    """
+    (delta, html) guardados del documento. Usa el cache de Redis solo si
+    corresponde al content_hash actual; si no, DB o SeaweedFS.
+    """
+    if doc.content_hash:
+        cached = get_cached_document(doc.id)
+        if cached and cached.get('content_hash') == doc.content_hash:
+            return cached['delta'], cached['html']
+    
+    if doc.storage_type == 'minio' and doc.minio_path:
+        delta, html = load_from_minio_compressed(doc.minio_path)
+        if delta is not None:
+            return delta, html
+    delta = json.loads(doc.content_delta) if doc.content_delta else {"ops": [{"insert": "\n"}]}
+    return delta, doc.content_html or ''
+
+def apply_delta_change(doc, change, base_hash):
+    """
+    Autosave por parches: compone `change` (delta de Quill calculado por el
+    cliente como base.diff(actual)) con el contenido guardado.
+    Retorna (delta, html_guardado). Lanza BaseMismatch si la base del
+    cliente no es la versión guardada y DeltaError si el cambio no aplica.
+    """
+    from services.quill_delta import BaseMismatch, DeltaError, apply_change
+    
+    if not doc.content_hash or base_hash != doc.content_hash:
+        raise BaseMismatch('Versión base desactualizada')
+    if not isinstance(change, dict) or not isinstance(change.get('ops'), list):
+        raise DeltaError("El cambio debe contener 'ops'")
+    
+    delta, html = load_document_content(doc)
+    return {'ops': apply_change(delta.get('ops', []), change['ops'])}, html
+
+def validate_delta(delta, delta_json=None):
+    """Validar que el delta sea válido (reutiliza delta_json si ya se serializó)"""
     if not isinstance(delta, dict):
         return False, "Delta debe ser un objeto JSON"
     
@@ -57,7 +99,7 @@ def validate_delta(delta):
         return False, "Delta debe contener 'ops'"
     
     # Verificar tamaño máximo
-    if len(json.dumps(delta)) > current_app.config['MAX_DOCUMENT_SIZE']:
+    if len(delta_json if delta_json is not None else json.dumps(delta)) > current_app.config['MAX_DOCUMENT_SIZE']:
         return False, f"Documento excede tamaño máximo ({current_app.config['MAX_DOCUMENT_SIZE']} bytes)"
     
     return True, "Válido"
@@ -73,6 +115,7 @@ def extract_and_upload_images(delta):
         return delta
     
     ops = delta.get('ops', [])
+    uploaded = {}  # data URI → URL (la misma imagen pegada varias veces)
     
     for op in ops:
         if isinstance(op.get('insert'), dict):
@@ -82,57 +125,68 @@ def extract_and_upload_images(delta):
                 # Si es base64, subir a Minio
                 if isinstance(image_data, str) and image_data.startswith('data:image'):
                     try:
-                        # Extraer datos base64
-                        header, base64_data = image_data.split(',', 1)
-                        image_bytes = base64.b64decode(base64_data)
-                        
-                        # Generar nombre único
-                        image_id = str(uuid.uuid4())
-                        file_ext = 'png'  # Por defecto
-                        if 'jpeg' in header or 'jpg' in header:
-                            file_ext = 'jpg'
-                        elif 'gif' in header:
-                            file_ext = 'gif'
-                        elif 'webp' in header:
-                            file_ext = 'webp'
-                        
-                        filename = f"{image_id}.{file_ext}"
-                        
-                        # Optimizar imagen si es necesario
-                        optimized_bytes = optimize_image(image_bytes, file_ext)
-                        
-                        # Intentar subir a SeaweedFS
-                        try:
-                            minio_client.put_object(
-                                bucket_name='images',
-                                object_name=filename,
-                                data=BytesIO(optimized_bytes),
-                                length=len(optimized_bytes),
-                                content_type=f'image/{file_ext}'
-                            )
-                            logger.info(f"Imagen subida a SeaweedFS: {filename}")
-                        except Exception as minio_err:
-                            logger.warning(f"SeaweedFS no disponible para imagen, usando almacenamiento local: {minio_err}")
-                            
-                            # Almacenamiento local fallback
-                            import os
-                            upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-                            images_dir = os.path.join(upload_folder, 'images')
-                            os.makedirs(images_dir, exist_ok=True)
-                            
-                            local_path = os.path.join(images_dir, filename)
-                            with open(local_path, 'wb') as f:
-                                f.write(optimized_bytes)
-                            logger.info(f"Imagen guardada localmente: {local_path}")
+                        if image_data not in uploaded:
+                            # Extraer datos base64
+                            header, base64_data = image_data.split(',', 1)
+                            image_bytes = base64.b64decode(base64_data)
+                            uploaded[image_data] = upload_image_bytes(image_bytes, image_ext_from_mime(header))
                         
                         # Reemplazar en delta con URL
-                        op['insert']['image'] = f"/document_bp/api/image/{filename}"
+                        op['insert']['image'] = uploaded[image_data]
                         
                     except Exception as e:
                         logger.error(f"Error subiendo imagen: {e}")
     
     return delta
 
+def image_ext_from_mime(content_type):
+    """Extensión de archivo para un content-type / cabecera data-URI de imagen"""
+    content_type = content_type or ''
+    if 'jpeg' in content_type or 'jpg' in content_type:
+        return 'jpg'
+    if 'gif' in content_type:
+        return 'gif'
+    if 'webp' in content_type:
+        return 'webp'
+    return 'png'
+
+def upload_image_bytes(image_bytes, file_ext):
+    """
+    Guardar bytes de imagen en el almacén por contenido (services/image_store).
+    Una imagen ya conocida no se optimiza ni se sube de nuevo.
+    Retorna la URL pública servida por document_bp.serve_image.
+    """
+    from services.image_store import ImageStore
+    return ImageStore.store(image_bytes, file_ext)
+
+def put_image_object(filename, data, file_ext):
+    """Subir un objeto al bucket 'images' con fallback a almacenamiento local"""
+    try:
+        minio_client.put_object(
+            bucket_name='images',
+            object_name=filename,
+            data=BytesIO(data),
+            length=len(data),
+            content_type=f'image/{file_ext}'
+        )
+        logger.info(f"Imagen subida a SeaweedFS: {filename}")
+    except Exception as minio_err:
+        logger.warning(f"SeaweedFS no disponible para imagen, usando almacenamiento local: {minio_err}")
+        
+        # Almacenamiento local fallback
+        import os
+        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
+        images_dir = os.path.join(upload_folder, 'images')
+        os.makedirs(images_dir, exist_ok=True)
+        
+        local_path = os.path.join(images_dir, filename)
+        with open(local_path, 'wb') as f:
+            f.write(data)
+        logger.info(f"Imagen guardada localmente: {local_path}")
+        
+        from services.image_cache import LocalImageIndex
+        LocalImageIndex.register(filename, local_path)
+
 def optimize_image(image_bytes, format_ext, max_size=(1920, 1920), quality=85):
     """Optimizar imagen para reducir tamaño"""
     try:
@@ -167,45 +221,13 @@ def optimize_image(image_bytes, format_ext, max_size=(1920, 1920), quality=85):
         return image_bytes
 
 def save_to_minio_compressed(delta, html):
-    """Guardar contenido comprimido en SeaweedFS con fallback local"""
-    content = {
-        'delta': delta,
-        'html': html,
-        'timestamp': datetime.utcnow().isoformat(),
-        'version': '1.0'
-    }
-    
-    json_content = json.dumps(content, ensure_ascii=False)
-    compressed = gzip.compress(json_content.encode('utf-8'))
-    
-    filename = f"doc_{uuid.uuid4()}.json.gz"
-    
-    try:
-        # Intentar subir a SeaweedFS
-        minio_client.put_object(
-            bucket_name='documents',
-            object_name=filename,
-            data=BytesIO(compressed),
-            length=len(compressed),
-            content_type='application/gzip'
-        )
-        logger.info(f"Documento guardado en SeaweedFS: {filename}")
-        return filename
-    except Exception as e:
-        logger.warning(f"SeaweedFS no disponible, usando almacenamiento local: {e}")
-        
-        # Almacenamiento local fallback
-        import os
-        upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-        documents_dir = os.path.join(upload_folder, 'documents')
-        os.makedirs(documents_dir, exist_ok=True)
-        
-        local_path = os.path.join(documents_dir, filename)
-        with open(local_path, 'wb') as f:
-            f.write(compressed)
-        
-        logger.info(f"Documento guardado localmente: {local_path}")
-        return f"local://{filename}"
+    """
+    Guardar contenido comprimido en SeaweedFS con fallback local.
+    Blob direccionado por contenido (services/document_blobs): el mismo
+    contenido se guarda una sola vez; los huérfanos los elimina el GC.
+    """
+    from services.document_blobs import DocumentBlobStore
+    return DocumentBlobStore.put(delta, html)
 
 def load_from_minio_compressed(filename):
     """Cargar contenido comprimido desde SeaweedFS o almacenamiento local"""
@@ -230,8 +252,9 @@ def load_from_minio_compressed(filename):
             compressed_data = response.read()
             logger.info(f"Documento cargado desde SeaweedFS: {filename}")
         
-        # Descomprimir
-        json_content = gzip.decompress(compressed_data).decode('utf-8')
+        # Descomprimir (gzip legado o formato versionado con zstd, autodetectado)
+        from services.document_blobs import DocumentBlobStore
+        json_content = DocumentBlobStore.decode(compressed_data).decode('utf-8')
         content = json.loads(json_content)
         
         return content.get('delta', {}), content.get('html', '')
@@ -240,133 +263,29 @@ def load_from_minio_compressed(filename):
         logger.error(f"Error cargando desde almacenamiento (file: {filename}): {e}")
         return None, None
 
-def process_docx_upload(file_path):
-    """Procesar archivo DOCX subido y convertir a formato Quill, incluyendo imágenes"""
-    try:
-        with open(file_path, 'rb') as docx_file:
-            result = mammoth.convert_to_html(
-                docx_file,
-                convert_image=mammoth.images.inline(convert_image_to_base64)
-            )
-
-            html_content = result.value
-
-            # Warnings de Mammoth
-            if result.messages:
-                for message in result.messages:
-                    logger.warning(f"Mammoth warning: {message}")
+def process_docx_upload(file_path, offload=False):
+    """
+    Procesar archivo DOCX subido y convertir a formato Quill, incluyendo imágenes.
 
-        processed_html = process_html_for_quill(html_content)
-        delta = html_to_basic_delta(processed_html)
+    `file_path` puede ser una ruta o un stream (p.ej. FileStorage.stream).
+    Las imágenes se suben al bucket 'images' durante la conversión (sin
+    base64) y el delta se construye en una sola pasada sobre el árbol de
+    mammoth — ver services/docx_import.py.
+    """
+    from services.docx_import import import_docx
+    try:
+        if isinstance(file_path, str):
+            with open(file_path, 'rb') as docx_file:
+                delta, html = import_docx(docx_file, offload=offload)
+        else:
+            delta, html = import_docx(file_path, offload=offload)
 
-        return delta, processed_html, None
+        return delta, html, None
 
     except Exception as e:
         logger.error(f"Error procesando DOCX: {e}")
         return None, None, str(e)
 
-def convert_image_to_base64(image):
-    """
-    Convertir imágenes DOCX a base64 para incrustar en HTML.
-    Mammoth pasa un objeto Image con método open() y content_type.
-    """
-    with image.open() as image_bytes:
-        import base64
-        encoded = base64.b64encode(image_bytes.read()).decode('utf-8')
-        return {"src": f"data:{image.content_type};base64,{encoded}"}
-
-def process_html_for_quill(html_content):
-    """Procesar HTML para que sea compatible con Quill"""
-    if not html_content:
-        return ""
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-
-    for element in soup.find_all(True):
-        style = element.get('style', '')
-        if 'text-align: center' in style:
-            element['class'] = element.get('class', []) + ['ql-align-center']
-        elif 'text-align: right' in style:
-            element['class'] = element.get('class', []) + ['ql-align-right']
-        elif 'text-align: justify' in style:
-            element['class'] = element.get('class', []) + ['ql-align-justify']
-
-        if element.get('style'):
-            del element['style']
-
-    return str(soup)
-
-def html_to_basic_delta(html_content):
-    """Convertir HTML procesado a Delta para Quill, incluyendo imágenes"""
-    if not html_content:
-        return {"ops": [{"insert": "\n"}]}
-
-    soup = BeautifulSoup(html_content, 'html.parser')
-    ops = []
-
-    def process_element(node):
-        if isinstance(node, NavigableString):
-            text = str(node)
-            if text:
-                ops.append({"insert": text})
-            return
-        if not isinstance(node, Tag):
-            return
-
-        if node.name == 'p':
-            text = node.get_text()
-            attributes = {}
-            classes = node.get('class', [])
-            if 'ql-align-center' in classes:
-                attributes['align'] = 'center'
-            elif 'ql-align-right' in classes:
-                attributes['align'] = 'right'
-            elif 'ql-align-justify' in classes:
-                attributes['align'] = 'justify'
-
-            if text.strip():
-                ops.append({"insert": text})
-                if attributes:
-                    ops.append({"insert": "\n", "attributes": attributes})
-                else:
-                    ops.append({"insert": "\n"})
-
-        elif node.name in ['h1','h2','h3','h4','h5','h6']:
-            level = int(node.name[1])
-            text = node.get_text()
-            if text.strip():
-                ops.append({"insert": text})
-                ops.append({"insert": "\n", "attributes": {"header": level}})
-
-        elif node.name in ['strong','b']:
-            text = node.get_text()
-            if text.strip():
-                ops.append({"insert": text, "attributes": {"bold": True}})
-        elif node.name in ['em','i']:
-            text = node.get_text()
-            if text.strip():
-                ops.append({"insert": text, "attributes": {"italic": True}})
-        elif node.name == 'u':
-            text = node.get_text()
-            if text.strip():
-                ops.append({"insert": text, "attributes": {"underline": True}})
-
-        elif node.name == 'img':
-            src = node.get('src')
-            if src:
-                ops.append({"insert": {"image": src}})
-
-        for child in node.children:
-            process_element(child)
-
-    for el in soup.contents:
-        process_element(el)
-
-    if not ops or ops[-1].get('insert') != '\n':
-        ops.append({"insert": "\n"})
-
-    return {"ops": ops}
-
 def create_version_backup(document):
     """Crear respaldo de versión del documento"""
     
@@ -382,21 +301,7 @@ def create_version_backup(document):
                 .limit(version_count - max_versions + 1).all()
             
             for old_version in oldest_versions:
-                if old_version.minio_path:
-                    try:
-                        if old_version.minio_path and old_version.minio_path.startswith('local://'):
-                            # Eliminar archivo local
-                            import os
-                            real_filename = old_version.minio_path.replace('local://', '')
-                            upload_folder = current_app.config.get('UPLOAD_FOLDER', 'uploads')
-                            local_path = os.path.join(upload_folder, 'documents', real_filename)
-                            if os.path.exists(local_path):
-                                os.remove(local_path)
-                                logger.info(f"Archivo local eliminado (versión antigua): {real_filename}")
-                        else:
-                            minio_client.remove_object('documents', old_version.minio_path)
-                    except Exception as remove_err:
-                        logger.error(f"Error eliminando objeto de versión fija: {remove_err}")
+                # Su blob (si tenía) puede estar compartido: lo elimina el GC
                 db.session.delete(old_version)
         
         # Crear nueva versión
@@ -685,23 +590,19 @@ def export_to_docx(html_content, title="Documento"):
 
 # Funciones de Redis para cache y sesiones
 def cache_document(doc_id, data, expire_time=300):
-    """Cachear documento en Redis"""
+    """Cachear documento en Redis (codec binario por campo, ver services/document_cache)"""
     try:
-        cache_key = f"document:{doc_id}"
-        redis_client.setex(cache_key, expire_time, json.dumps(data))
-        return True
+        from services.document_cache import DocumentCache
+        return DocumentCache.put(doc_id, data, ttl=expire_time)
     except Exception as e:
         logger.error(f"Error cacheando documento: {e}")
         return False
 
-def get_cached_document(doc_id):
-    """Obtener documento del cache"""
+def get_cached_document(doc_id, fields=('delta', 'html')):
+    """Obtener documento del cache: metadatos + solo los campos pedidos"""
     try:
-        cache_key = f"document:{doc_id}"
-        cached_data = redis_client.get(cache_key)
-        if cached_data:
-            return json.loads(cached_data)
-        return None
+        from services.document_cache import DocumentCache
+        return DocumentCache.get(doc_id, fields)
     except Exception as e:
         logger.error(f"Error obteniendo documento del cache: {e}")
         return None
@@ -709,13 +610,48 @@ def get_cached_document(doc_id):
 def invalidate_document_cache(doc_id):
     """Invalidar cache de documento"""
     try:
-        cache_key = f"document:{doc_id}"
-        redis_client.delete(cache_key)
+        from services.document_cache import DocumentCache
+        DocumentCache.invalidate(doc_id)
         return True
     except Exception as e:
         logger.error(f"Error invalidando cache: {e}")
         return False
 
+def document_etag(doc, *extra):
+    """
+    ETag fuerte de un documento: (id, version_number, updated_at,
+    content_hash, title) + extras que afecten a la representación (campos
+    pedidos, estado del workspace…). updated_at cambia en cualquier UPDATE
+    de la fila (onupdate), pero DATETIME de MySQL va a segundo y los
+    autosaves no suben version_number: dos guardados en el mismo segundo
+    se distinguen por content_hash / title.
+    """
+    parts = [doc.id, doc.version_number or 0, doc.updated_at.isoformat() if doc.updated_at else '',
+             doc.content_hash or '', doc.title or '', *extra]
+    return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+def page_etag(doc, *extra):
+    """
+    ETag de una página HTML de documento. Incluye una ventana de 30 min: la
+    página embebe un token CSRF (WTF_CSRF_TIME_LIMIT = 1h) que no debe
+    reutilizarse desde la caché del navegador cuando esté por caducar.
+    """
+    window = int(datetime.utcnow().timestamp() // 1800)
+    return document_etag(doc, *extra, window)
+
+def not_modified_response(etag):
+    """304 si If-None-Match coincide con `etag`; None si hay que generar la respuesta"""
+    if not request.if_none_match.contains(etag):
+        return None
+    response = current_app.response_class(status=304)
+    return with_etag(response, etag)
+
+def with_etag(response, etag):
+    """ETag + revalidación obligatoria (el navegador guarda, pero siempre pregunta)"""
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 def set_autosave_lock(doc_id, user_email, lock_time=30):
     """Establecer bloqueo para auto-guardado"""
     try:
@@ -742,6 +678,31 @@ def get_autosave_lock(doc_id):
         logger.error(f"Error obteniendo bloqueo de auto-guardado: {e}")
         return None
 
+def acquire_autosave_lock(doc_id, user_email, lock_time=30):
+    """
+    Tomar o renovar el bloqueo de auto-guardado en un solo paso atómico
+    (script Lua). Retorna (adquirido, email_del_titular).
+    """
+    try:
+        from .extensions import acquire_owner_lock
+        lock_data = json.dumps({
+            'user_email': user_email,
+            'timestamp': datetime.utcnow().isoformat()
+        })
+        result = acquire_owner_lock(f"autosave_lock:{doc_id}", user_email, lock_data, lock_time)
+        if result is not None:
+            return result
+    except Exception as e:
+        logger.error(f"Error adquiriendo bloqueo de auto-guardado: {e}")
+        return True, user_email
+    
+    # Script no registrado (p. ej. servidor de desarrollo): GET + SETEX
+    existing_lock = get_autosave_lock(doc_id)
+    if existing_lock and existing_lock.get('user_email') != user_email:
+        return False, existing_lock.get('user_email')
+    set_autosave_lock(doc_id, user_email, lock_time)
+    return True, user_email
+
 # Funciones de email
 def send_share_notification_email(recipient_email, document_title, shared_by_email, share_url, message=None):
     """Enviar notificación de documento compartido"""
@@ -158,6 +158,19 @@ function setupSocketSync() {
         }
     });
 
+    // ── Receive coalesced awareness batch (one per server tick) ──────────
+    socket.on('yjs:awareness_batch', function (data) {
+        if (!data || !data.items || !awareness) return;
+        data.items.forEach(function (item) {
+            if (!item.awareness || item.sid === socket.id) return; // skip own echo
+            try {
+                applyAwarenessUpdate(awareness, base64ToUint8Array(item.awareness), 'remote');
+            } catch (e) {
+                console.warn('[CollabSync] Failed to apply awareness batch item:', e);
+            }
+        });
+    });
+
     // ── Send local updates to server ─────────────────────────────────────
     ydoc.on('update', function (update, origin) {
         if (origin === 'remote') return; // don't echo remote updates
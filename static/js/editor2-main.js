@@ -10,6 +10,10 @@
         let saveTimeout;
         let documents = [];
         let isSaving = false;
+        // Último contenido confirmado por el servidor (base del autosave por parches)
+        let lastSaved = null;
+        const HTML_REFRESH_EVERY = 10;   // parches sin html entre refrescos del html
+        const EXPORT_POLL_MAX = 120;     // consultas (1 s) a un export pendiente
         let isSharedDocument = false;
         let sharedDocumentInfo = null;
         let currentUserEmail = 'anonymous';
@@ -166,6 +170,7 @@
                 }
                 
                 currentDocumentId = data.id;
+                lastSaved = null;
                 sharedDocumentInfo = data.share_info;
                 
                 document.getElementById('documentTitle').value = data.title;
@@ -237,6 +242,7 @@
                 
                 const data = await response.json();
                 currentDocumentId = data.id;
+                lastSaved = null;
                 
                 activeEditor.setContents([]);
                 document.getElementById('documentTitle').value = data.title;
@@ -256,7 +262,7 @@
             }
         }
 
-        async function saveDocument(showFeedback = true, isAutosave = false) {
+        async function saveDocument(showFeedback = true, isAutosave = false, options = {}) {
             if (!currentDocumentId || isSaving || isReadonly()) return;
             
             try {
@@ -275,25 +281,68 @@
                 
                 const html = Object.keys(editors).map(k => editors[k].root.innerHTML).join('');
                 const title = document.getElementById('documentTitle').value || 'Sin título';
+                const Delta = Quill.import('delta');
+                const current = new Delta(fullDelta.ops);
+                const fullBody = {
+                    delta: fullDelta,
+                    html: html,
+                    title: title,
+                    user_email: currentUserEmail,
+                    is_autosave: isAutosave
+                };
                 
-                const response = await fetch(`/api/document/${currentDocumentId}/save`, {
-                    method: 'POST',
-                    headers: { 'Content-Type': 'application/json' },
-                    body: JSON.stringify({
-                        delta: fullDelta,
-                        html: html,
+                // Autosave: enviar solo el cambio respecto a la última versión guardada
+                let body = fullBody;
+                let patchCount = 0;
+                if (isAutosave && lastSaved && lastSaved.hash) {
+                    const change = lastSaved.delta.diff(current);
+                    patchCount = lastSaved.patchCount + 1;
+                    // forceHtml: el html del servidor debe quedar al día (export, cierre)
+                    const htmlBehind = lastSaved.patchCount > 0 || change.ops.length > 0;
+                    const sendHtml = (options.forceHtml && htmlBehind) || patchCount % HTML_REFRESH_EVERY === 0;
+                    if (!change.ops.length && title === lastSaved.title && !sendHtml) {
+                        updateStatus('saved', 'Auto-guardado');
+                        return;
+                    }
+                    body = {
+                        change: { ops: change.ops },
+                        base_hash: lastSaved.hash,
                         title: title,
                         user_email: currentUserEmail,
-                        is_autosave: isAutosave
-                    })
+                        is_autosave: true
+                    };
+                    if (sendHtml) body.html = html;
+                }
+                
+                const post = payload => fetch(`/api/document/${currentDocumentId}/save`, {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify(payload),
+                    keepalive: !!options.keepalive
                 });
                 
-                if (!response.ok) {
-                    const errorData = await response.json();
+                let response = await post(body);
+                let errorData = response.ok ? null : await response.json();
+                
+                if (errorData && body !== fullBody && errorData.code === 'base_mismatch') {
+                    // Base desactualizada (otra pestaña/usuario guardó): guardado completo
+                    body = fullBody;
+                    patchCount = 0;
+                    response = await post(body);
+                    errorData = response.ok ? null : await response.json();
+                }
+                
+                if (errorData) {
                     throw new Error(errorData.error || 'Error guardando');
                 }
                 
                 const data = await response.json();
+                lastSaved = {
+                    delta: current,
+                    hash: data.content_hash,
+                    title: title,
+                    patchCount: 'html' in body ? 0 : patchCount   // parches desde el último html
+                };
                 
                 updateStatus('saved', isAutosave ? 'Auto-guardado' : 'Guardado');
                 
@@ -314,11 +363,19 @@
             }
         }
 
+        // Los autosaves por parches no llevan html: antes de exportar y al
+        // ocultar/cerrar la pestaña se envía el html actual
+        function flushHtml(keepalive = false) {
+            if (!currentDocumentId || isSaving || isReadonly()) return Promise.resolve();
+            clearTimeout(saveTimeout);
+            return saveDocument(false, true, { forceHtml: true, keepalive: keepalive });
+        }
+
         async function loadDocument(docId) {
             try {
                 showLoading('Cargando documento...');
                 
-                const response = await fetch(`/api/document/${docId}/load?user_email=${currentUserEmail}`);
+                const response = await fetch(`/api/document/${docId}/load?user_email=${currentUserEmail}&fields=delta`);
                 
                 if (!response.ok) {
                     const error = await response.json();
@@ -328,6 +385,7 @@
                 const data = await response.json();
                 
                 currentDocumentId = docId;
+                lastSaved = null;
                 document.getElementById('documentTitle').value = data.title;
                 
                 if (data.delta && data.delta.ops) {
@@ -464,6 +522,11 @@
             try {
                 showLoading(`Exportando a ${format.toUpperCase()}...`);
                 
+                while (isSaving) {
+                    await new Promise(function (r) { setTimeout(r, 100); });
+                }
+                await flushHtml();
+                
                 const response = await fetch(`/api/document/${currentDocumentId}/export/${format}?user_email=${currentUserEmail}`);
                 
                 if (!response.ok) {
@@ -471,7 +534,21 @@
                     throw new Error(error.error || 'Error exportando documento');
                 }
                 
-                const data = await response.json();
+                let data = await response.json();
+                
+                // Render largo: el servidor devuelve 202 + job_id → consultar estado
+                let attempts = 0;
+                while (data.status === 'pending') {
+                    if (++attempts > EXPORT_POLL_MAX) {
+                        throw new Error('La exportación está tardando demasiado; inténtalo más tarde');
+                    }
+                    await new Promise(function (r) { setTimeout(r, 1000); });
+                    const poll = await fetch(data.status_url || `/api/export/${data.job_id}`);
+                    data = await poll.json();
+                    if (!poll.ok || data.status === 'error') {
+                        throw new Error(data.error || 'Error exportando documento');
+                    }
+                }
                 
                 const link = document.createElement('a');
                 link.href = data.download_url;
@@ -761,6 +838,14 @@
             }
         });
 
+        document.addEventListener('visibilitychange', function() {
+            if (document.visibilityState === 'hidden') flushHtml(true);
+        });
+
+        window.addEventListener('beforeunload', function() {
+            flushHtml(true);
+        });
+
         // === INIT ===
         document.addEventListener('DOMContentLoaded', () => {
             editors[1] = createQuillEditor('editor-1');
@@ -42,6 +42,8 @@
     let hasWordLimit  = false;
     let wordLimit     = 0;
     let isSaving      = false;
+    let lastSaved     = null;   // base of patch autosaves: { delta, hash, patchCount }
+    const HTML_REFRESH_EVERY = 10;
     let saveTimeout   = null;
     let documentLoaded = false;
 
@@ -336,20 +338,47 @@
                 return;
             }
 
-            const res  = await fetch(`/invite/${TOKEN}/document`, {
+            const Delta   = Quill.import('delta');
+            const current = new Delta(delta.ops);
+            const metricsPayload = window.typingMetrics ? window.typingMetrics.getMetrics() : null;
+            const fullBody = {
+                delta,
+                html,
+                is_autosave: !manual,
+                is_final:    isFinal,
+                metrics:     metricsPayload
+            };
+
+            // Autosaves send only the change against the last confirmed version
+            let body = fullBody;
+            let patchCount = 0;
+            if (!manual && !isFinal && lastSaved && lastSaved.hash) {
+                patchCount = lastSaved.patchCount + 1;
+                body = {
+                    change:      { ops: lastSaved.delta.diff(current).ops },
+                    base_hash:   lastSaved.hash,
+                    is_autosave: true,
+                    is_final:    false,
+                    metrics:     metricsPayload
+                };
+                if (patchCount % HTML_REFRESH_EVERY === 0) body.html = html;
+            }
+
+            const put = payload => fetch(`/invite/${TOKEN}/document`, {
                 method:  'PUT',
                 headers: { 'Content-Type': 'application/json' },
-                body:    JSON.stringify({ 
-                    delta, 
-                    html, 
-                    is_autosave: !manual,
-                    is_final:    isFinal,
-                    metrics: window.typingMetrics ? window.typingMetrics.getMetrics() : null
-                }),
+                body:    JSON.stringify(payload),
             });
-            const data = await res.json();
+
+            let data = await (await put(body)).json();
+            if (!data.success && body !== fullBody && data.code === 'base_mismatch') {
+                body = fullBody;
+                patchCount = 0;
+                data = await (await put(body)).json();
+            }
 
             if (!data.success) throw new Error(data.error || 'Save failed');
+            lastSaved = { delta: current, hash: data.content_hash, patchCount };
 
             _setSaveStatus('check-circle', manual ? 'Saved' : 'Auto-saved');
             const lastSaved = document.getElementById('lastSaved');
@@ -23,6 +23,19 @@
         return { color: '#EF4444', cls: 'score-low', label: 'High Probability' };
     }
 
+    /**
+     * Analysis still running on the server (202 + status_url): poll until it
+     * finishes and return the final Response.
+     */
+    async function awaitAnalysis(resp) {
+        while (resp.status === 202) {
+            const job = await resp.json();
+            await new Promise(r => setTimeout(r, 1500));
+            resp = await fetch(job.status_url || `/api/analysis/jobs/${job.job_id}`);
+        }
+        return resp;
+    }
+
     function wordCount(text) {
         const t = (text || '').trim();
         return t ? t.split(/\s+/).length : 0;
@@ -64,7 +77,7 @@
 
             try {
                 // 3. Send to backend proxy
-                const resp = await fetch('/api/ai/analyze', {
+                const resp = await awaitAnalysis(await fetch('/api/ai/analyze', {
                     method: 'POST',
                     headers: {
                         'Content-Type': 'application/json',
@@ -74,7 +87,7 @@
                         text: text,
                         plugins: ['ai_detection', 'citation_check', 'stylometric_analysis'],
                     }),
-                });
+                }));
 
                 if (!resp.ok) {
                     const errBody = await resp.json().catch(() => ({}));
@@ -57,22 +57,32 @@
     }
 
     // ── API calls ─────────────────────────────────────────────────────────────
+    // 202 + status_url: the analysis is still running server-side → poll it
+    async function awaitAnalysis(resp) {
+        while (resp.status === 202) {
+            const job = await resp.json();
+            await new Promise(r => setTimeout(r, 1500));
+            resp = await fetch(job.status_url || `/api/analysis/jobs/${job.job_id}`);
+        }
+        return resp;
+    }
+
     async function analyzeAIDetection(imageUrl) {
-        const resp = await fetch('/api/media/ai-detection', {
+        const resp = await awaitAnalysis(await fetch('/api/media/ai-detection', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json', 'X-CSRFToken': CSRF() },
             body: JSON.stringify({ image_url: imageUrl }),
-        });
+        }));
         if (!resp.ok) throw new Error(`AI-detection HTTP ${resp.status}`);
         return resp.json();
     }
 
     async function analyzePlagiarism(imageUrl) {
-        const resp = await fetch('/api/media/plagiarism', {
+        const resp = await awaitAnalysis(await fetch('/api/media/plagiarism', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json', 'X-CSRFToken': CSRF() },
             body: JSON.stringify({ image_url: imageUrl, similarity_threshold: 0.85 }),
-        });
+        }));
         if (!resp.ok) throw new Error(`Plagiarism HTTP ${resp.status}`);
         return resp.json();
     }
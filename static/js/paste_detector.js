@@ -7,8 +7,9 @@
  * Architecture:
  *   - 6-layer intercept system (see below)
  *   - Heuristic scoring mirroring backend paste_scorer.py
- *   - DocumentSyncWatcher: debounced diff that marks fragments inactive
+ *   - Presence of pasted text is rechecked server-side on every save
  *   - All API calls fire-and-forget (no await blocking the UX)
+ *   - Paste events are buffered and posted in batches to register-pastes
  *
  * Layers:
  *   1. Quill clipboard module override (highest priority)
@@ -26,26 +27,27 @@
     // CONFIG
     // ─────────────────────────────────────────────────────────────────────────
     const CFG = {
-        ENDPOINT_REGISTER:   '/api/plagiarism/register-paste',
-        ENDPOINT_REVALIDATE: '/api/plagiarism/revalidate',
+        ENDPOINT_REGISTER:   '/api/plagiarism/register-pastes',
         MIN_PASTE_CHARS:     30,       // Ignore tiny pastes (single words)
-        SYNC_DEBOUNCE_MS:    4000,     // Wait after text-change before diff scan
         MAX_TEXT_CHARS:      10000,
         MAX_HTML_CHARS:      50000,
         RETRY_BOOT_MS:       800,      // Retry delay for early init
         MAX_BOOT_RETRIES:    20,
+        FLUSH_DELAY_MS:      1500,     // Paste events are buffered and sent in batches
+        MAX_BATCH_EVENTS:    50,       // Server-side cap per register-pastes call
+        MAX_BATCH_CHARS:     60000,    // fetch keepalive bodies are limited to 64 KB
     };
 
     // ─────────────────────────────────────────────────────────────────────────
     // STATE
     // ─────────────────────────────────────────────────────────────────────────
     let _documentId      = null;
-    let _pasteMap        = new Map();   // paste_uuid → pasted_text
-    let _syncTimer       = null;
     let _initialized     = false;
     let _bootRetries     = 0;
-    let _lastTextSnapshot = '';         // for delta-based paste detection
     let _csrfToken       = null;
+    let _pendingPastes   = [];          // events waiting for the next batch
+    let _pendingChars    = 0;
+    let _flushTimer      = null;
 
     // ─────────────────────────────────────────────────────────────────────────
     // INIT — poll until Quill + documentId are ready
@@ -93,7 +95,12 @@
         _layer4_beforeInput(quill);
         _layer5_deltaAnalysis(quill);
         _layer6_dragDrop(quill);
-        _installSyncWatcher(quill);
+
+        // Send what is still buffered before the tab goes away
+        window.addEventListener('pagehide', _flushPastes);
+        document.addEventListener('visibilitychange', function () {
+            if (document.visibilityState === 'hidden') _flushPastes();
+        });
     }
     // ─────────────────────────────────────────────────────────────────────────
     // LAYER 2 — quill.root paste event (DOM)
@@ -153,10 +160,6 @@
             if (insertedText.length >= CFG.MIN_PASTE_CHARS) {
                 _handlePasteData({ text: insertedText, html: '', layer: 5 });
             }
-
-            // Update snapshot for sync watcher
-            _lastTextSnapshot = _getFullText(quill);
-            _scheduleSyncWatcher();
         });
     }
 
@@ -193,13 +196,11 @@
         // if (score < 30) return;   // Mirror backend threshold
 
         const pasteUUID = _uuid4();
-        _pasteMap.set(pasteUUID, text);
 
         // Extract URL from HTML for richer data
         const sourceUrl = _extractUrl(html);
 
-        _fireAndForget(CFG.ENDPOINT_REGISTER, {
-            document_id:    _documentId,
+        _queuePaste({
             pasted_text:    text,
             clipboard_html: html.slice(0, CFG.MAX_HTML_CHARS),
             source_url:     sourceUrl,
@@ -207,6 +208,33 @@
         });
     }
 
+    // ─────────────────────────────────────────────────────────────────────────
+    // PASTE BATCHING — one register-pastes call per burst of pastes
+    // ─────────────────────────────────────────────────────────────────────────
+    function _queuePaste(event) {
+        const size = event.pasted_text.length + event.clipboard_html.length + 200;
+        if (_pendingPastes.length && _pendingChars + size > CFG.MAX_BATCH_CHARS) _flushPastes();
+
+        _pendingPastes.push(event);
+        _pendingChars += size;
+        if (_pendingPastes.length >= CFG.MAX_BATCH_EVENTS) {
+            _flushPastes();
+        } else if (!_flushTimer) {
+            _flushTimer = setTimeout(_flushPastes, CFG.FLUSH_DELAY_MS);
+        }
+    }
+
+    function _flushPastes() {
+        clearTimeout(_flushTimer);
+        _flushTimer = null;
+        if (_pendingPastes.length === 0) return;
+
+        const events = _pendingPastes;
+        _pendingPastes = [];
+        _pendingChars  = 0;
+        _fireAndForget(CFG.ENDPOINT_REGISTER, { document_id: _documentId, events });
+    }
+
     // ─────────────────────────────────────────────────────────────────────────
     // CLIENT-SIDE HEURISTIC SCORE (mirrors paste_scorer.py signals)
     // ─────────────────────────────────────────────────────────────────────────
@@ -225,66 +253,9 @@
         return Math.min(score, 100);
     }
 
-    // ─────────────────────────────────────────────────────────────────────────
-    // DOCUMENT SYNC WATCHER
-    // Diffs current text against stored pastes; deactivates removed fragments.
-    // ─────────────────────────────────────────────────────────────────────────
-    function _installSyncWatcher(quill) {
-        // Initial snapshot
-        _lastTextSnapshot = _getFullText(quill);
-    }
-
-    function _scheduleSyncWatcher() {
-        clearTimeout(_syncTimer);
-        _syncTimer = setTimeout(_runSyncDiff, CFG.SYNC_DEBOUNCE_MS);
-    }
-
-    function _runSyncDiff() {
-        if (_pasteMap.size === 0) return;
-
-        const currentText = _lastTextSnapshot;
-        const removedUUIDs    = [];
-        const stillPresent    = [];
-
-        for (const [uuid, pastedText] of _pasteMap.entries()) {
-            // Use first 200 chars as the search anchor (avoid false-positives from edits)
-            const anchor = pastedText.slice(0, 200).trim();
-            if (currentText.includes(anchor)) {
-                stillPresent.push(uuid);
-            } else {
-                removedUUIDs.push(uuid);
-                _pasteMap.delete(uuid);
-            }
-        }
-
-        if (removedUUIDs.length > 0) {
-            _fireAndForget(CFG.ENDPOINT_REVALIDATE, {
-                document_id:   _documentId,
-                removed_uuids: removedUUIDs,
-                still_present: stillPresent,
-            });
-        }
-    }
-
     // ─────────────────────────────────────────────────────────────────────────
     // UTILITIES
     // ─────────────────────────────────────────────────────────────────────────
-    function _getFullText(quill) {
-        try {
-            const pagination = window.quillPagination;
-            if (pagination && typeof pagination.exportContent === 'function') {
-                const exp = pagination.exportContent();
-                if (exp?.delta?.ops) {
-                    return exp.delta.ops
-                        .filter(op => typeof op.insert === 'string')
-                        .map(op => op.insert)
-                        .join('');
-                }
-            }
-            return quill.getText() || '';
-        } catch (_) { return ''; }
-    }
-
     function _extractUrl(html) {
         if (!html) return null;
         
@@ -354,9 +325,8 @@
 
     // Expose for debugging in dev console only
     window._PasteDetectorDebug = {
-        getMap:   () => _pasteMap,
         getScore: _clientScore,
-        runDiff:  _runSyncDiff,
+        flush:    _flushPastes,
     };
 
 })();
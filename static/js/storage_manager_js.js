@@ -1478,15 +1478,15 @@ class StorageManager {
 
         for (const file of files) {
             try {
-                const formData = new FormData();
-                formData.append('file', file);
-                if (this.cloudFolderId) {
-                    formData.append('parent_id', this.cloudFolderId);
-                }
-
-                const response = await fetch(`/x_integ/storage/file/upload/${this.currentStorage}`, {
+                // Archivo como cuerpo crudo: el servidor lo reenvía al proveedor en streaming
+                const params = this.cloudFolderId ? `?parent_id=${encodeURIComponent(this.cloudFolderId)}` : '';
+                const response = await fetch(`/x_integ/storage/file/upload/${this.currentStorage}${params}`, {
                     method: 'POST',
-                    body: formData
+                    headers: {
+                        'Content-Type': 'application/octet-stream',
+                        'X-File-Name': encodeURIComponent(file.name)
+                    },
+                    body: file
                 });
 
                 const result = await response.json();
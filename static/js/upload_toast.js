@@ -504,17 +504,11 @@ class UploadToast {
             // Use cloud upload endpoint - matches route: /storage/file/upload/<provider>
             uploadEndpoint = `/x_integ/storage/file/upload/${activeProvider}`;
 
-            // For cloud uploads, recreate FormData with correct field name 'file'
-            const cloudFormData = new FormData();
-            cloudFormData.append('file', fileObj.file);
-
-            // Add parent_id (folder) if we're in a subfolder
+            // Cloud uploads send the file as the raw body (streamed to the provider);
+            // parent_id (folder) goes in the query string if we're in a subfolder
             if (window.storageManager && window.storageManager.cloudFolderId) {
-                cloudFormData.append('parent_id', window.storageManager.cloudFolderId);
+                uploadEndpoint += `?parent_id=${encodeURIComponent(window.storageManager.cloudFolderId)}`;
             }
-
-            // Replace formData reference for cloud upload
-            fileObj.formData = cloudFormData;
         }
 
         const xhr = new XMLHttpRequest();
@@ -554,8 +548,13 @@ class UploadToast {
         };
 
         xhr.open('POST', uploadEndpoint, true);
-        // Use cloudFormData for cloud uploads, otherwise use the standard formData
-        xhr.send(useCloudUpload && fileObj.formData ? fileObj.formData : formData);
+        if (useCloudUpload) {
+            xhr.setRequestHeader('Content-Type', 'application/octet-stream');
+            xhr.setRequestHeader('X-File-Name', encodeURIComponent(fileObj.file.name));
+            xhr.send(fileObj.file);
+        } else {
+            xhr.send(formData);
+        }
     }
 
     handleUploadError(fileObj, message) {